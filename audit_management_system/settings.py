@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 import os
 from pathlib import Path
 
+from main_app.database_registry import LazyDatabases
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -43,6 +45,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'main_app.middleware.RequestMetricsMiddleware',  # View latency for /metrics
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -74,7 +77,7 @@ WSGI_APPLICATION = 'audit_management_system.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
+DATABASES = LazyDatabases({
     "default": {
         "ENGINE": "django.db.backends.mysql",
         "NAME": "audit_management_system",
@@ -83,431 +86,49 @@ DATABASES = {
         "HOST": "localhost",
         "PORT": "3306",
     },
-    'DAPDAT': {
-        'ENGINE': 'mssql',
-        'NAME': 'INFDAT',
-        'USER': 'sa',  # os.environ.get('DATABASE_USER'),
-        'PASSWORD': 'Admin123',
-        'HOST': 'localhost',
-        'PORT': '1433',
-        'OPTIONS': {
-            'driver': 'ODBC Driver 17 for SQL Server',
-        },
-    },
-    '340ESN': {
-        'ENGINE': 'mssql',
-        'NAME': '340ESN',
-        'USER': 'sa',  # os.environ.get('DATABASE_USER'),
-        'PASSWORD': 'Admin123',
-        'HOST': 'localhost',
-        'PORT': '1433',
-        'OPTIONS': {
-            'driver': 'ODBC Driver 17 for SQL Server',
-        },
-    },
-    '330DRP': {
-        'ENGINE': 'mssql',
-        'NAME': '330DRP',
-        'USER': 'sa',  # os.environ.get('DATABASE_USER'),
-        'PASSWORD': 'Admin123',
-        'HOST': 'localhost',
-        'PORT': '1433',
-        'OPTIONS': {
-            'driver': 'ODBC Driver 17 for SQL Server',
-        },
-    },
-    '320SAM': {
-        'ENGINE': 'mssql',
-        'NAME': '320SAM',
-        'USER': 'sa',  # os.environ.get('DATABASE_USER'),
-        'PASSWORD': 'Admin123',
-        'HOST': 'localhost',
-        'PORT': '1433',
-        'OPTIONS': {
-            'driver': 'ODBC Driver 17 for SQL Server',
-        },
-    },
-    '310GAV': {
-        'ENGINE': 'mssql',
-        'NAME': '310GAV',
-        'USER': 'sa',  # os.environ.get('DATABASE_USER'),
-        'PASSWORD': 'Admin123',
-        'HOST': 'localhost',
-        'PORT': '1433',
-        'OPTIONS': {
-            'driver': 'ODBC Driver 17 for SQL Server',
-        },
-    },
-    '300CHZ': {
-        'ENGINE': 'mssql',
-        'NAME': '300CHZ',
-        'USER': 'sa',  # os.environ.get('DATABASE_USER'),
-        'PASSWORD': 'Admin123',
-        'HOST': 'localhost',
-        'PORT': '1433',
-        'OPTIONS': {
-            'driver': 'ODBC Driver 17 for SQL Server',
-        },
-    },
-    '291A2C': {
-        'ENGINE': 'mssql',
-        'NAME': '291A2C',
-        'USER': 'sa',  # os.environ.get('DATABASE_USER'),
-        'PASSWORD': 'Admin123',
-        'HOST': 'localhost',
-        'PORT': '1433',
-        'OPTIONS': {
-            'driver': 'ODBC Driver 17 for SQL Server',
-        },
-    },
-    '281DOD': {
-        'ENGINE': 'mssql',
-        'NAME': '281DOD',
-        'USER': 'sa',  # os.environ.get('DATABASE_USER'),
-        'PASSWORD': 'Admin123',
-        'HOST': 'localhost',
-        'PORT': '1433',
-        'OPTIONS': {
-            'driver': 'ODBC Driver 17 for SQL Server',
-        },
-    },
-    '270TBP': {
-        'ENGINE': 'mssql',
-        'NAME': '270TBP',
-        'USER': 'sa',  # os.environ.get('DATABASE_USER'),
-        'PASSWORD': 'Admin123',
-        'HOST': 'localhost',
-        'PORT': '1433',
-        'OPTIONS': {
-            'driver': 'ODBC Driver 17 for SQL Server',
-        },
-    },
-    '260TBO': {
-        'ENGINE': 'mssql',
-        'NAME': '260TBO',
-        'USER': 'sa',  # os.environ.get('DATABASE_USER'),
-        'PASSWORD': 'Admin123',
-        'HOST': 'localhost',
-        'PORT': '1433',
-        'OPTIONS': {
-            'driver': 'ODBC Driver 17 for SQL Server',
-        },
-    },
-    '250FAT': {
-        'ENGINE': 'mssql',
-        'NAME': '250FAT',
-        'USER': 'sa',  # os.environ.get('DATABASE_USER'),
-        'PASSWORD': 'Admin123',
-        'HOST': 'localhost',
-        'PORT': '1433',
-        'OPTIONS': {
-            'driver': 'ODBC Driver 17 for SQL Server',
-        },
-    },
-    '240MAL': {
-        'ENGINE': 'mssql',
-        'NAME': '240MAL',
-        'USER': 'sa',  # os.environ.get('DATABASE_USER'),
-        'PASSWORD': 'Admin123',
-        'HOST': 'localhost',
-        'PORT': '1433',
-        'OPTIONS': {
-            'driver': 'ODBC Driver 17 for SQL Server',
-        },
-    },
-    '230HIV': {
-        'ENGINE': 'mssql',
-        'NAME': '230HIV',
-        'USER': 'sa',  # os.environ.get('DATABASE_USER'),
-        'PASSWORD': 'Admin123',
-        'HOST': 'localhost',
-        'PORT': '1433',
-        'OPTIONS': {
-            'driver': 'ODBC Driver 17 for SQL Server',
-        },
-    },
-    '010CDC': {
-        'ENGINE': 'mssql',
-        'NAME': '010CDC',
-        'USER': 'sa',  # os.environ.get('DATABASE_USER'),
-        'PASSWORD': 'Admin123',
-        'HOST': 'localhost',
-        'PORT': '1433',
-        'OPTIONS': {
-            'driver': 'ODBC Driver 17 for SQL Server',
-        },
-    },
-    '011CDC': {
-        'ENGINE': 'mssql',
-        'NAME': '011CDC',
-        'USER': 'sa',  # os.environ.get('DATABASE_USER'),
-        'PASSWORD': 'Admin123',
-        'HOST': 'localhost',
-        'PORT': '1433',
-        'OPTIONS': {
-            'driver': 'ODBC Driver 17 for SQL Server',
-        },
-    },
-    '020CDC': {
-        'ENGINE': 'mssql',
-        'NAME': '020CDC',
-        'USER': 'sa',  # os.environ.get('DATABASE_USER'),
-        'PASSWORD': 'Admin123',
-        'HOST': 'localhost',
-        'PORT': '1433',
-        'OPTIONS': {
-            'driver': 'ODBC Driver 17 for SQL Server',
-        },
-    },
-    '025ACF': {
-        'ENGINE': 'mssql',
-        'NAME': '025ACF',
-        'USER': 'sa',
-        'PASSWORD': 'Admin123',
-        'HOST': 'localhost',
-        'PORT': '1433',
-        'OPTIONS': {
-            'driver': 'ODBC Driver 17 for SQL Server',
-        },
-    },
-    '030CLM': {
-        'ENGINE': 'mssql',
-        'NAME': '030CLM',
-        'USER': 'sa',  # os.environ.get('DATABASE_USER'),
-        'PASSWORD': 'Admin123',
-        'HOST': 'localhost',
-        'PORT': '1433',
-        'OPTIONS': {
-            'driver': 'ODBC Driver 17 for SQL Server',
-        },
-    },
-    '031CLM': {
-        'ENGINE': 'mssql',
-        'NAME': '031CLM',
-        'USER': 'sa',  # os.environ.get('DATABASE_USER'),
-        'PASSWORD': 'Admin123',
-        'HOST': 'localhost',
-        'PORT': '1433',
-        'OPTIONS': {
-            'driver': 'ODBC Driver 17 for SQL Server',
-        },
-    },
-    '040EAA': {
-        'ENGINE': 'mssql',
-        'NAME': '040EAA',
-        'USER': 'sa',  # os.environ.get('DATABASE_USER'),
-        'PASSWORD': 'Admin123',
-        'HOST': 'localhost',
-        'PORT': '1433',
-        'OPTIONS': {
-            'driver': 'ODBC Driver 17 for SQL Server',
-        },
-    },
-    '050NHQ': {
-        'ENGINE': 'mssql',
-        'NAME': '050NHQ',
-        'USER': 'sa',  # os.environ.get('DATABASE_USER'),
-        'PASSWORD': 'Admin123',
-        'HOST': 'localhost',
-        'PORT': '1433',
-        'OPTIONS': {
-            'driver': 'ODBC Driver 17 for SQL Server',
-        },
-    },
-    '060PND': {
-        'ENGINE': 'mssql',
-        'NAME': '060PND',
-        'USER': 'sa',  # os.environ.get('DATABASE_USER'),
-        'PASSWORD': 'Admin123',
-        'HOST': 'localhost',
-        'PORT': '1433',
-        'OPTIONS': {
-            'driver': 'ODBC Driver 17 for SQL Server',
-        },
-    },
-    '070YIA': {
-        'ENGINE': 'mssql',
-        'NAME': '070YIA',
-        'USER': 'sa',  # os.environ.get('DATABASE_USER'),
-        'PASSWORD': 'Admin123',
-        'HOST': 'localhost',
-        'PORT': '1433',
-        'OPTIONS': {
-            'driver': 'ODBC Driver 17 for SQL Server',
-        },
-    },
-    '090CAD': {
-        'ENGINE': 'mssql',
-        'NAME': '090CAD',
-        'USER': 'sa',  # os.environ.get('DATABASE_USER'),
-        'PASSWORD': 'Admin123',
-        'HOST': 'localhost',
-        'PORT': '1433',
-        'OPTIONS': {
-            'driver': 'ODBC Driver 17 for SQL Server',
-        },
-    },
-    '100CAK': {
-        'ENGINE': 'mssql',
-        'NAME': '100CAK',
-        'USER': 'sa',  # os.environ.get('DATABASE_USER'),
-        'PASSWORD': 'Admin123',
-        'HOST': 'localhost',
-        'PORT': '1433',
-        'OPTIONS': {
-            'driver': 'ODBC Driver 17 for SQL Server',
-        },
-    },
-    '110CWF': {
-        'ENGINE': 'mssql',
-        'NAME': '110CWF',
-        'USER': 'sa',  # os.environ.get('DATABASE_USER'),
-        'PASSWORD': 'Admin123',
-        'HOST': 'localhost',
-        'PORT': '1433',
-        'OPTIONS': {
-            'driver': 'ODBC Driver 17 for SQL Server',
-        },
-    }, '120CCM': {
-        'ENGINE': 'mssql',
-        'NAME': '120CCM',
-        'USER': 'sa',  # os.environ.get('DATABASE_USER'),
-        'PASSWORD': 'Admin123',
-        'HOST': 'localhost',
-        'PORT': '1433',
-        'OPTIONS': {
-            'driver': 'ODBC Driver 17 for SQL Server',
-        },
-    }, '280DOD': {
-        'ENGINE': 'mssql',
-        'NAME': '280DOD',
-        'USER': 'sa',  # os.environ.get('DATABASE_USER'),
-        'PASSWORD': 'Admin123',
-        'HOST': 'localhost',
-        'PORT': '1433',
-        'OPTIONS': {
-            'driver': 'ODBC Driver 17 for SQL Server',
-        },
-    }, '290A2C': {
-        'ENGINE': 'mssql',
-        'NAME': '280DOD',
-        'USER': 'sa',  # os.environ.get('DATABASE_USER'),
-        'PASSWORD': 'Admin123',
-        'HOST': 'localhost',
-        'PORT': '1433',
-        'OPTIONS': {
-            'driver': 'ODBC Driver 17 for SQL Server',
-        },
-    },
-    '130CAM': {
-        'ENGINE': 'mssql',
-        'NAME': '130CAM',
-        'USER': 'sa',  # os.environ.get('DATABASE_USER'),
-        'PASSWORD': 'Admin123',
-        'HOST': 'localhost',
-        'PORT': '1433',
-        'OPTIONS': {
-            'driver': 'ODBC Driver 17 for SQL Server',
-        },
-    },
-    '140CAM': {
-        'ENGINE': 'mssql',
-        'NAME': '140CAM',
-        'USER': 'sa',  # os.environ.get('DATABASE_USER'),
-        'PASSWORD': 'Admin123',
-        'HOST': 'localhost',
-        'PORT': '1433',
-        'OPTIONS': {
-            'driver': 'ODBC Driver 17 for SQL Server',
-        },
-    },
-    '150CTM': {
-        'ENGINE': 'mssql',
-        'NAME': '150CTM',
-        'USER': 'sa',  # os.environ.get('DATABASE_USER'),
-        'PASSWORD': 'Admin123',
-        'HOST': 'localhost',
-        'PORT': '1433',
-        'OPTIONS': {
-            'driver': 'ODBC Driver 17 for SQL Server',
-        },
-    },
-    '160MCE': {
-        'ENGINE': 'mssql',
-        'NAME': '160MCE',
-        'USER': 'sa',  # os.environ.get('DATABASE_USER'),
-        'PASSWORD': 'Admin123',
-        'HOST': 'localhost',
-        'PORT': '1433',
-        'OPTIONS': {
-            'driver': 'ODBC Driver 17 for SQL Server',
-        },
-    },
-    '170SOH': {
-        'ENGINE': 'mssql',
-        'NAME': '170SOH',
-        'USER': 'sa',  # os.environ.get('DATABASE_USER'),
-        'PASSWORD': 'Admin123',
-        'HOST': 'localhost',
-        'PORT': '1433',
-        'OPTIONS': {
-            'driver': 'ODBC Driver 17 for SQL Server',
-        },
-    },
-    '180HRC': {
-        'ENGINE': 'mssql',
-        'NAME': '180HRC',
-        'USER': 'sa',  # os.environ.get('DATABASE_USER'),
-        'PASSWORD': 'Admin123',
-        'HOST': 'localhost',
-        'PORT': '1433',
-        'OPTIONS': {
-            'driver': 'ODBC Driver 17 for SQL Server',
-        },
-    },
-    '190KMH': {
-        'ENGINE': 'mssql',
-        'NAME': '190KMH',
-        'USER': 'sa',  # os.environ.get('DATABASE_USER'),
-        'PASSWORD': 'Admin123',
-        'HOST': 'localhost',
-        'PORT': '1433',
-        'OPTIONS': {
-            'driver': 'ODBC Driver 17 for SQL Server',
-        },
-    },
-    '200YFC': {
-        'ENGINE': 'mssql',
-        'NAME': '200YFC',
-        'USER': 'sa',  # os.environ.get('DATABASE_USER'),
-        'PASSWORD': 'Admin123',
-        'HOST': 'localhost',
-        'PORT': '1433',
-        'OPTIONS': {
-            'driver': 'ODBC Driver 17 for SQL Server',
-        },
-    },
-    '210FCN': {
-        'ENGINE': 'mssql',
-        'NAME': '210FCN',
-        'USER': 'sa',  # os.environ.get('DATABASE_USER'),
-        'PASSWORD': 'Admin123',
-        'HOST': 'localhost',
-        'PORT': '1433',
-        'OPTIONS': {
-            'driver': 'ODBC Driver 17 for SQL Server',
-        },
-    },
-    '220FCS': {
-        'ENGINE': 'mssql',
-        'NAME': '220FCS',
-        'USER': 'sa',  # os.environ.get('DATABASE_USER'),
-        'PASSWORD': 'Admin123',
-        'HOST': 'localhost',
-        'PORT': '1433',
-        'OPTIONS': {
-            'driver': 'ODBC Driver 17 for SQL Server',
-        },
+})
+
+# Pooled ODBC connections for the Sage aliases (see main_app/connection_pool.py);
+# a single alias can override these with a 'POOL' dict in its DATABASES entry
+DB_POOL_CONFIG = {
+    'ENABLED': True,
+    'MAX_SIZE': 10,  # Connections per alias
+    'MAX_PER_SERVER': 40,  # Connections per SQL Server host across all its aliases
+    'MAX_IDLE_SECONDS': 300,  # Idle connections older than this are closed
+    'ACQUIRE_TIMEOUT_SECONDS': 30,  # Wait for a free connection before giving up
+    'PRE_PING': True,  # Check pooled connections with SELECT 1 before reuse
+}
+
+# Statement timeouts and circuit breakers of the Sage aliases (see main_app/db_guard.py);
+# a single alias can override these with a 'GUARD' dict in its DATABASES entry, or its
+# DatabaseMapping.statement_timeout
+DB_GUARD_CONFIG = {
+    'STATEMENT_TIMEOUT_SECONDS': 120,  # Statements running longer are interrupted on the server
+    'REQUEST_TIMEOUT_SECONDS': 15,  # Budget of the Sage statements behind one dashboard stats lookup
+    'CONNECT_TIMEOUT_SECONDS': 15,  # ODBC login timeout, so an unreachable server fails fast
+    'FAILURE_THRESHOLD': 3,  # Consecutive connection failures or timeouts that open an alias's circuit
+    'COOLOFF_SECONDS': 60,  # An open circuit rejects calls this long before letting a probe through
+}
+
+# Prometheus metrics of this process at /metrics (see main_app/metrics.py)
+METRICS_CONFIG = {
+    'ENABLED': True,
+    'BEARER_TOKEN': None,  # Scrapers send "Authorization: Bearer <token>"; without one only staff sessions can read
+}
+
+# Connection settings shared by every Sage 300 company database. The aliases
+# themselves come from DatabaseMapping (sql_server_db) and are resolved lazily
+# on first use; a mapping can override NAME, HOST and PORT
+# (see main_app/database_registry.py)
+SAGE_DATABASE_DEFAULTS = {
+    'ENGINE': 'main_app.db_backends.pooled_mssql' if DB_POOL_CONFIG['ENABLED'] else 'main_app.db_backends.guarded_mssql',
+    'USER': 'sa',  # os.environ.get('DATABASE_USER'),
+    'PASSWORD': 'Admin123',
+    'HOST': 'localhost',
+    'PORT': '1433',
+    'OPTIONS': {
+        'driver': 'ODBC Driver 17 for SQL Server',
+        'connection_timeout': DB_GUARD_CONFIG['CONNECT_TIMEOUT_SECONDS'],
     },
 }
 
@@ -519,9 +140,27 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 SYNC_CONFIG = {
     'INTERVAL_MINUTES': 5,
     'MAX_WORKERS': 5,
+    'USE_ASYNCIO': False,  # Drive per-period queries from one event loop (MAX_WORKERS = global limit)
+    'MAX_WORKERS_PER_SERVER': 4,  # Queries in flight per SQL Server host when USE_ASYNCIO is on; Celery sync tasks per host
+    'HOST_SLOT_RETRY_SECONDS': 15,  # A Celery sync task retries this much later while its SQL Server host is at its limit
+    'HOST_SLOT_MAX_RETRIES': 40,  # ...and fails its project or period after this many retries
     'TIMEOUT_MINUTES': 10,
-    'LOCK_TIMEOUT_MINUTES': 15,
+    'PROJECT_TIMEOUT_SECONDS': 300,  # A project sync's statements are cancelled past this (None: no limit)
+    'LEASE_TTL_SECONDS': 120,  # Per-project sync leases expire this long after their last renewal
     'MAX_CONSECUTIVE_FAILURES': 3,
+    'INCREMENTAL': False,  # Only pull Sage rows changed since the last committed watermarks
+    'BATCHED_PERIODS': False,  # Full syncs aggregate all periods of a project in one grouped query
+    'SKIP_UNCHANGED_PERIODS': False,  # Per-period syncs skip periods whose glpost/document fingerprint is unchanged
+    'LOAD_BATCH_SIZE': 500,  # bulk_create batch size for SupportingDocument/SupportingDocumentFile
+    'STREAM_CHUNK_SIZE': 2000,  # glpost rows fetched per round-trip when streaming scans
+    'GLPOST_REPLICA': False,  # Refresh the local glpost_replica table during each project sync
+    'READ_FROM_REPLICA': False,  # Serve stats and GL listings from glpost_replica instead of Sage
+    'ADAPTIVE_SCHEDULING': False,  # Sync the most active projects first each tick; dormant ones back off
+    'SCHEDULE_TIME_BUDGET_SECONDS': None,  # Project-seconds of sync work per tick (None: 80% of interval x MAX_WORKERS)
+    'SCHEDULE_MAX_BACKOFF_MINUTES': 120,  # Longest a project without changes waits between syncs
+    'RESUME_INTERRUPTED_RUNS': False,  # Finish the unfinished work units of a crashed or failed run first
+    'PROFILE_MEMORY': False,  # Record per-stage peak memory of project syncs with tracemalloc (slows syncs down)
+    'ENEBA_PIPELINE_INTERVAL_MINUTES': None,  # Run the attachment + comment pipeline this often (None: not scheduled)
     'ALERT_EMAIL': 'seriterkunda@mupuma.co.zm',
 }
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend',
@@ -0,0 +1,66 @@
+"""
+Settings for the offline benchmarks: the default database and every Sage
+company are SQLite files under BENCHMARK_DATA_DIR, so no MySQL or SQL Server
+is touched.
+
+    export DJANGO_SETTINGS_MODULE=audit_management_system.settings_benchmark
+    python manage.py generate_sage_dataset --rows 100000 --companies 3
+    python manage.py benchmark_sync --output before.json
+    python manage.py benchmark_dashboards --output dashboards.json
+
+Set BENCHMARK_MYSQL_DATABASE to keep the default database in that (scratch)
+database of the local MySQL server instead; the Sage companies stay SQLite.
+"""
+from audit_management_system.settings import *  # noqa: F401,F403
+
+BENCHMARK_DATA_DIR = Path(os.environ.get('BENCHMARK_DATA_DIR', BASE_DIR / 'benchmark_data'))
+
+# Production-like request handling: no per-connection query log
+DEBUG = False
+ALLOWED_HOSTS = ['localhost', 'testserver']
+
+if os.environ.get('BENCHMARK_MYSQL_DATABASE'):
+    DATABASES = LazyDatabases({
+        "default": {
+            "ENGINE": "django.db.backends.mysql",
+            "NAME": os.environ['BENCHMARK_MYSQL_DATABASE'],
+            "USER": os.environ.get('BENCHMARK_MYSQL_USER', 'root'),
+            "PASSWORD": os.environ.get('BENCHMARK_MYSQL_PASSWORD', ''),
+            "HOST": os.environ.get('BENCHMARK_MYSQL_HOST', 'localhost'),
+            "PORT": os.environ.get('BENCHMARK_MYSQL_PORT', '3306'),
+        },
+    })
+else:
+    DATABASES = LazyDatabases({
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": str(BENCHMARK_DATA_DIR / 'default.sqlite3'),
+            # Concurrent syncs write here from several threads; IMMEDIATE transactions wait
+            # out the timeout for the write lock instead of failing on a read-to-write upgrade
+            "OPTIONS": {"timeout": 30, "transaction_mode": "IMMEDIATE"},
+        },
+    })
+
+# Generated companies map to their SQLite file through DatabaseMapping.database_name
+SAGE_DATABASE_DEFAULTS = {
+    'ENGINE': 'django.db.backends.sqlite3',
+    'HOST': '',
+    'PORT': '',
+    'OPTIONS': {'timeout': 30},
+}
+
+# Per-endpoint budgets of benchmark_dashboards: p95 latency in milliseconds and
+# statements per request; a case over either fails the run. --budgets FILE
+# overrides them with a JSON file of the same shape. Sized for the default seed
+# (60 projects, 2000 glpost rows each): the query counts just above today's,
+# the latencies about twice today's on a developer laptop.
+DASHBOARD_BENCHMARK_BUDGETS = {
+    'project_dashboard_api': {'p95_ms': 2000, 'max_queries': 250},
+    'project_dashboard_api_period': {'p95_ms': 250, 'max_queries': 70},
+    'projects_data_api': {'p95_ms': 5000, 'max_queries': 250},
+    'projects_data_api_period': {'p95_ms': 2500, 'max_queries': 70},
+    'admin_home_api': {'p95_ms': 10000, 'max_queries': 1000},
+    'project_report_view': {'p95_ms': 3000, 'max_queries': 500},
+    'project_report_excel': {'p95_ms': 90000, 'max_queries': 2800},
+    'project_report_pdf': {'p95_ms': 110000, 'max_queries': 11500},
+}
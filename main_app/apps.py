@@ -5,6 +5,20 @@ class MainAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'main_app'
 
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from django.db.models.signals import post_delete, post_save
+
+        from .database_registry import evict_mapping_alias
+        from .metrics import install_query_timer
+        from .models import DatabaseMapping
+
+        # Changed or removed company mappings are re-resolved on next use
+        post_save.connect(evict_mapping_alias, sender=DatabaseMapping)
+        post_delete.connect(evict_mapping_alias, sender=DatabaseMapping)
+        # Per-alias statement latency for /metrics
+        connection_created.connect(install_query_timer)
+
     """def ready(self):
         # Import and start scheduler when Django starts
         from . import sync_tasks
@@ -0,0 +1,94 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+def server_key(alias):
+    """Identify the SQL Server instance behind a database alias (HOST:PORT)"""
+    db_settings = settings.DATABASES.get(alias, {})
+    return f"{db_settings.get('HOST') or 'localhost'}:{db_settings.get('PORT') or ''}"
+
+
+class AsyncExtractionEngine:
+    """
+    Keeps many blocking database calls in flight from a single event loop.
+
+    Every call runs on a worker thread only for as long as the call itself
+    takes, gated by a global semaphore and a per-server semaphore, so a slow
+    company database can hold at most per_server_limit slots instead of a
+    thread for its whole sync.
+
+    The engine is driver-agnostic: run() accepts any callable, and the
+    server of an alias is resolved by server_resolver (HOST:PORT from
+    settings.DATABASES by default), so it can be exercised with SQLite
+    aliases or fake callables.
+    """
+
+    def __init__(self, global_limit=20, per_server_limit=4, server_resolver=server_key):
+        self.global_limit = global_limit
+        self.per_server_limit = per_server_limit
+        self.server_resolver = server_resolver
+        self._executor = None
+        self._global_semaphore = None
+        self._server_semaphores = {}
+        self.stats = {'calls': 0, 'failed': 0, 'max_in_flight': 0}
+        self._in_flight = 0
+
+    async def run(self, alias, func, *args, **kwargs):
+        """Run func(*args, **kwargs) on a worker thread within the limits for alias"""
+        server = self.server_resolver(alias)
+        semaphore = self._server_semaphores.setdefault(server, asyncio.Semaphore(self.per_server_limit))
+
+        async with self._global_semaphore, semaphore:
+            self._in_flight += 1
+            self.stats['calls'] += 1
+            self.stats['max_in_flight'] = max(self.stats['max_in_flight'], self._in_flight)
+            try:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self._executor, lambda: func(*args, **kwargs))
+            except Exception:
+                self.stats['failed'] += 1
+                raise
+            finally:
+                self._in_flight -= 1
+
+    def run_all(self, coroutine_factory):
+        """
+        Run coroutine_factory(engine) to completion on a fresh event loop and return its result.
+        """
+        async def main():
+            self._global_semaphore = asyncio.Semaphore(self.global_limit)
+            self._server_semaphores = {}
+            return await coroutine_factory(self)
+
+        self._executor = ThreadPoolExecutor(max_workers=self.global_limit, thread_name_prefix='async-sync')
+        try:
+            return asyncio.run(main())
+        finally:
+            self._close_worker_connections()
+            self._executor.shutdown(wait=True)
+            self._executor = None
+            logger.info(
+                f"Async engine finished: {self.stats['calls']} calls, {self.stats['failed']} failed, "
+                f"max {self.stats['max_in_flight']} in flight"
+            )
+
+    def _close_worker_connections(self):
+        """Close the database connections opened on every worker thread"""
+        # The barrier holds each task until all have started, so every worker thread runs exactly one
+        barrier = threading.Barrier(self.global_limit)
+
+        def close_connections(_):
+            connections.close_all()
+            try:
+                barrier.wait(timeout=30)
+            except threading.BrokenBarrierError:
+                pass
+
+        list(self._executor.map(close_connections, range(self.global_limit)))
@@ -0,0 +1,355 @@
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(Exception):
+    """No pooled connection became available within the acquire timeout"""
+
+
+def server_of(settings_dict):
+    """Identify the database server behind a connection's settings (HOST:PORT)"""
+    return f"{settings_dict.get('HOST') or 'localhost'}:{settings_dict.get('PORT') or ''}"
+
+
+class ConnectionPool:
+    """
+    Bounded pool of raw DB-API connections for one database alias.
+
+    Idle connections are reused most-recently-released first, closed once idle
+    for longer than max_idle_seconds, and pinged before being handed out when
+    pre_ping is on. New connections also need a slot from the server limiter
+    shared by every alias on the same server.
+    """
+
+    def __init__(self, alias, server, limiter, max_size=10, max_idle_seconds=300,
+                 acquire_timeout=30, pre_ping=True):
+        self.alias = alias
+        self.server = server
+        self.limiter = limiter
+        self.max_size = max_size
+        self.max_idle_seconds = max_idle_seconds
+        self.acquire_timeout = acquire_timeout
+        self.pre_ping = pre_ping
+
+        self.closed = False  # Set when the alias is evicted; released connections are then closed
+        self._idle = deque()  # (connection, released_at)
+        self._size = 0  # open connections, idle or checked out
+        self._condition = threading.Condition()
+        self.stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'wait_seconds': 0.0,
+            'creations': 0,
+            'evictions': 0,
+            'ping_failures': 0,
+            'discards': 0,
+        }
+
+    def acquire(self, factory):
+        """Check out a healthy connection, creating one with factory() when the pool has room"""
+        deadline = time.monotonic() + self.acquire_timeout
+        waited = False
+        wait_started = None
+
+        while True:
+            with self._condition:
+                self._evict_idle_locked()
+                connection = self._idle.pop()[0] if self._idle else None
+                can_create = connection is None and self._size < self.max_size
+                if connection is not None or can_create:
+                    self._size += can_create
+                    self.stats['checkouts'] += 1
+                    if waited:
+                        self.stats['wait_seconds'] += time.monotonic() - wait_started
+                else:
+                    if not waited:
+                        waited = True
+                        wait_started = time.monotonic()
+                        self.stats['waits'] += 1
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolTimeout(
+                            f"No connection to {self.alias} available within {self.acquire_timeout}s "
+                            f"({self.max_size} in use)"
+                        )
+                    self._condition.wait(remaining)
+                    continue
+
+            if connection is not None:
+                if not self.pre_ping or self._ping(connection):
+                    return connection
+                # The server dropped it; free its slot and try again
+                with self._condition:
+                    self.stats['ping_failures'] += 1
+                self._discard(connection)
+                continue
+
+            try:
+                connection = self._create(factory, deadline)
+            except Exception:
+                with self._condition:
+                    self._size -= 1
+                    self._condition.notify()
+                raise
+            with self._condition:
+                self.stats['creations'] += 1
+            return connection
+
+    def release(self, connection, discard=False):
+        """Return a checked-out connection, or close it when discard is set"""
+        # A sibling alias waiting for a server slot needs this connection closed, not idled
+        discard = discard or self.closed or self.limiter.waiting > 0
+        if discard:
+            with self._condition:
+                self.stats['discards'] += 1
+            self._discard(connection)
+            return
+
+        with self._condition:
+            self._idle.append((connection, time.monotonic()))
+            self._condition.notify()
+
+    def evict_idle(self, max_idle_seconds=None):
+        """Close idle connections unused for max_idle_seconds (all idle ones with 0)"""
+        with self._condition:
+            return self._evict_idle_locked(max_idle_seconds)
+
+    def close_all(self):
+        """Close every idle connection; checked-out ones are closed when released with discard"""
+        return self.evict_idle(0)
+
+    def snapshot(self):
+        """Current counters and occupancy of the pool"""
+        with self._condition:
+            return {
+                **self.stats,
+                'wait_seconds': round(self.stats['wait_seconds'], 3),
+                'server': self.server,
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'max_size': self.max_size,
+            }
+
+    def _create(self, factory, deadline):
+        """Open a new connection within the server limit"""
+        if not self.limiter.acquire(deadline):
+            raise PoolTimeout(f"Connection limit for server {self.server} reached")
+        try:
+            return factory()
+        except Exception:
+            self.limiter.release()
+            raise
+
+    def _discard(self, connection):
+        """Close a connection and give its pool and server slots back"""
+        try:
+            connection.close()
+        except Exception:
+            pass
+        self.limiter.release()
+        with self._condition:
+            self._size -= 1
+            self._condition.notify()
+
+    def _evict_idle_locked(self, max_idle_seconds=None):
+        """Close idle connections past their idle limit; the oldest sit at the left of the deque"""
+        max_idle_seconds = self.max_idle_seconds if max_idle_seconds is None else max_idle_seconds
+        cutoff = time.monotonic() - max_idle_seconds
+        evicted = 0
+        while self._idle and self._idle[0][1] <= cutoff:
+            connection, _ = self._idle.popleft()
+            try:
+                connection.close()
+            except Exception:
+                pass
+            self.limiter.release()
+            self._size -= 1
+            evicted += 1
+        if evicted:
+            self.stats['evictions'] += evicted
+            self._condition.notify(evicted)
+        return evicted
+
+    @staticmethod
+    def _ping(connection):
+        """Cheap round-trip to check the server still holds the connection open"""
+        try:
+            cursor = connection.cursor()
+            try:
+                cursor.execute('SELECT 1')
+                cursor.fetchall()
+            finally:
+                cursor.close()
+            return True
+        except Exception:
+            return False
+
+
+class ServerLimiter:
+    """
+    Caps the connections open against one database server across all its aliases.
+
+    When the server is full, idle connections of sibling aliases are evicted to
+    make room before waiting, and connections released while anyone waits are
+    closed rather than idled.
+    """
+
+    def __init__(self, server, max_connections, registry):
+        self.server = server
+        self.max_connections = max_connections
+        self.registry = registry
+        self._open = 0
+        self.waiting = 0
+        self._condition = threading.Condition()
+        self.stats = {'waits': 0}
+
+    def acquire(self, deadline):
+        with self._condition:
+            if self._open < self.max_connections:
+                self._open += 1
+                return True
+
+        # Idle connections elsewhere on this server are cheaper to drop than to wait for
+        self.registry.evict_idle_on_server(self.server)
+
+        with self._condition:
+            if self._open >= self.max_connections:
+                self.stats['waits'] += 1
+                self.waiting += 1
+                try:
+                    while self._open >= self.max_connections:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            return False
+                        self._condition.wait(remaining)
+                finally:
+                    self.waiting -= 1
+            self._open += 1
+            return True
+
+    def release(self):
+        with self._condition:
+            self._open -= 1
+            self._condition.notify()
+
+    def snapshot(self):
+        with self._condition:
+            return {'open': self._open, 'waiting': self.waiting, 'max_connections': self.max_connections, **self.stats}
+
+
+class PoolRegistry:
+    """Process-wide registry of one ConnectionPool per alias and one ServerLimiter per server"""
+
+    def __init__(self):
+        self._pools = {}
+        self._limiters = {}
+        self._lock = threading.Lock()
+
+    def get_pool(self, alias, settings_dict):
+        """Pool for alias, created from its settings on first use"""
+        pool = self._pools.get(alias)
+        if pool is not None:
+            return pool
+
+        with self._lock:
+            pool = self._pools.get(alias)
+            if pool is None:
+                config = self._config(settings_dict)
+                server = server_of(settings_dict)
+                limiter = self._limiters.get(server)
+                if limiter is None:
+                    limiter = ServerLimiter(server, config['MAX_PER_SERVER'], self)
+                    self._limiters[server] = limiter
+                pool = ConnectionPool(
+                    alias, server, limiter,
+                    max_size=config['MAX_SIZE'],
+                    max_idle_seconds=config['MAX_IDLE_SECONDS'],
+                    acquire_timeout=config['ACQUIRE_TIMEOUT_SECONDS'],
+                    pre_ping=config['PRE_PING'],
+                )
+                self._pools[alias] = pool
+            return pool
+
+    def discard_pool(self, alias):
+        """Forget the pool of an alias, closing its idle connections now and the rest on release"""
+        with self._lock:
+            pool = self._pools.pop(alias, None)
+        if pool is None:
+            return
+        pool.closed = True
+        pool.close_all()
+
+    def evict_idle_on_server(self, server):
+        """Close every idle connection held for aliases on server"""
+        return sum(pool.close_all() for pool in list(self._pools.values()) if pool.server == server)
+
+    def evict_idle(self):
+        """Close idle connections past their idle limit in every pool"""
+        return sum(pool.evict_idle() for pool in list(self._pools.values()))
+
+    def stats(self):
+        """Per-alias pool counters and per-server occupancy"""
+        return {
+            'pools': {alias: pool.snapshot() for alias, pool in list(self._pools.items())},
+            'servers': {server: limiter.snapshot() for server, limiter in list(self._limiters.items())},
+        }
+
+    @staticmethod
+    def _config(settings_dict):
+        from django.conf import settings
+
+        config = {
+            'MAX_SIZE': 10,
+            'MAX_PER_SERVER': 40,
+            'MAX_IDLE_SECONDS': 300,
+            'ACQUIRE_TIMEOUT_SECONDS': 30,
+            'PRE_PING': True,
+        }
+        config.update(getattr(settings, 'DB_POOL_CONFIG', {}))
+        # Per-alias overrides, e.g. DATABASES['X']['POOL'] = {'MAX_SIZE': 2}
+        config.update(settings_dict.get('POOL', {}))
+        return config
+
+
+pool_registry = PoolRegistry()
+
+
+def pool_stats():
+    """Statistics of every connection pool in this process"""
+    return pool_registry.stats()
+
+
+class PooledDatabaseWrapperMixin:
+    """
+    Makes a Django DatabaseWrapper check raw connections out of the alias pool
+    instead of opening one per thread, and hand them back on close().
+
+    Django still closes connections at the end of each request (CONN_MAX_AGE=0)
+    and worker threads call connections.close_all(), which now returns the
+    connection to the pool rather than tearing down the ODBC session.
+    """
+
+    def get_new_connection(self, conn_params):
+        # Remember the pool, so the connection goes back where it came from even if the alias is evicted
+        self._pool = pool_registry.get_pool(self.alias, self.settings_dict)
+        return self._pool.acquire(lambda: super(PooledDatabaseWrapperMixin, self).get_new_connection(conn_params))
+
+    def _close(self):
+        if self.connection is None:
+            return
+
+        pool = self._pool
+        # Closed inside atomic(): Django keeps its reference until the block exits, so it cannot be shared
+        discard = self.in_atomic_block
+        if not discard:
+            try:
+                # Never hand an open transaction to the next borrower
+                self.connection.rollback()
+            except Exception:
+                discard = True
+        pool.release(self.connection, discard=discard)
@@ -0,0 +1,228 @@
+"""
+Latency benchmark of the dashboards and reports over the synthetic Sage
+companies of main_app/sage_dataset.py.
+
+seed_dashboard_data generates one company per project and runs the syncs the
+scheduler would, so SupportingDocument, SupportingDocumentFile, Comments,
+ProjectPeriodStats and the glpost replica hold what a live install would.
+DashboardBenchmark then requests every case through the Django test client,
+logged in as a superuser, and reports per case:
+
+    p50_ms, p95_ms, max_ms   request latency over the timed iterations
+    queries                  most statements one request issued, over all aliases
+    queries_by_alias         statements per alias of the last request
+    statuses                 response status counts
+
+Statements are counted by the query timers of main_app/metrics.py, so the
+threads a view starts are included. A case whose p95 or query count exceeds
+its budget (settings.DASHBOARD_BENCHMARK_BUDGETS) is listed under violations.
+"""
+import math
+import platform
+import statistics
+import time
+from collections import Counter, namedtuple
+
+import django
+from django.conf import settings
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from audit_management_system.settings import SYNC_CONFIG
+from main_app.metrics import query_seconds
+from main_app.models import CustomUser, Project, ProjectPeriodStats
+from main_app.sage_dataset import SageDatasetGenerator, load_manifest
+from main_app.services import TransactionSyncService
+from main_app.sync_benchmark import _git_commit, reset_local_state
+from transactions.models import Comments, GlpostReplica, SupportingDocument, SupportingDocumentFile
+from transactions.services import CommentSyncService, ProjectSyncService
+
+BENCHMARK_USERNAME = 'benchmark'
+
+# url_args: None, 'project_id' or 'project_name' of the sampled project.
+# iterations caps the timed requests of cases too slow for the default count.
+DashboardCase = namedtuple('DashboardCase', ('name', 'url_name', 'url_args', 'params', 'ajax', 'iterations'))
+
+
+def _current_period():
+    today = timezone.localdate()
+    return {'fiscal_year': str(today.year), 'fiscal_period': str(today.month).zfill(2)}
+
+
+def dashboard_cases():
+    """Every benchmarked endpoint; the period cases filter on the current fiscal period"""
+    period = _current_period()
+    return (
+        # project_dashboard_api has no URL of its own: full_project_dashboard serves it to AJAX requests
+        DashboardCase('project_dashboard_api', 'main_app:view_project_dashboard', None, {}, True, None),
+        DashboardCase('project_dashboard_api_period', 'main_app:view_project_dashboard', None, period, True, None),
+        DashboardCase('projects_data_api', 'main_app:projects_data_api', None, {}, False, None),
+        DashboardCase('projects_data_api_period', 'main_app:projects_data_api', None, period, False, None),
+        # Runs the scheduled sync of every project and a project sync on every request
+        DashboardCase('admin_home_api', 'transactions:project_dashboard', 'project_name', {}, False, 3),
+        DashboardCase('project_report_view', 'reports:project_report', 'project_id', {}, False, None),
+        # The exports query per document and per batch, tens of seconds each at 2000 rows per company
+        DashboardCase('project_report_excel', 'reports:project_report_excel', 'project_id', {}, False, 3),
+        DashboardCase('project_report_pdf', 'reports:project_report_pdf', 'project_id', {}, False, 3),
+    )
+
+
+CASE_NAMES = tuple(case.name for case in dashboard_cases())
+
+
+def seed_dashboard_data(projects=60, rows=2000, seed=42):
+    """
+    Generate one Sage company per project, covering last and this fiscal year,
+    and fill the local tables from them with the scheduler's syncs.
+
+    Returns:
+        The dataset manifest, with the local row counts under 'local_counts'
+    """
+    manifest = SageDatasetGenerator(
+        settings.BENCHMARK_DATA_DIR, rows=rows, companies=projects, years=2, seed=seed,
+        first_year=timezone.localdate().year - 1
+    ).generate()
+
+    reset_local_state()
+    ProjectSyncService(extraction_mode='bulk', load_mode='bulk').sync_transactions(None)
+    # The benchmark reads stats from the replica, whether or not syncs refresh it by default
+    glpost_replica = SYNC_CONFIG.get('GLPOST_REPLICA', False)
+    SYNC_CONFIG['GLPOST_REPLICA'] = True
+    try:
+        TransactionSyncService().sync_all_projects(use_threading=False, incremental=False, batched_periods=True)
+    finally:
+        SYNC_CONFIG['GLPOST_REPLICA'] = glpost_replica
+    CommentSyncService().sync()
+
+    manifest['local_counts'] = local_counts()
+    return manifest
+
+
+def local_counts():
+    return {
+        'projects': Project.objects.count(),
+        'supporting_documents': SupportingDocument.objects.count(),
+        'supporting_document_files': SupportingDocumentFile.objects.count(),
+        'comments': Comments.objects.count(),
+        'period_stats': ProjectPeriodStats.objects.count(),
+        'glpost_replica': GlpostReplica.objects.count(),
+    }
+
+
+def _percentile(values, percent):
+    """Nearest-rank percentile"""
+    ordered = sorted(values)
+    return ordered[max(math.ceil(percent / 100 * len(ordered)) - 1, 0)]
+
+
+class DashboardBenchmark:
+    """Request the dashboard and report endpoints and check them against their budgets"""
+
+    def __init__(self, iterations=20, warmup=1, cases=CASE_NAMES, budgets=None):
+        self.iterations = iterations
+        self.warmup = warmup
+        self.cases = [case for case in dashboard_cases() if case.name in cases]
+        self.budgets = settings.DASHBOARD_BENCHMARK_BUDGETS if budgets is None else budgets
+
+    def run(self):
+        """
+        Returns:
+            The benchmark report: environment, dataset, per-case measurements and budget violations
+        """
+        client = Client(raise_request_exception=False)
+        user, _ = CustomUser.objects.get_or_create(
+            username=BENCHMARK_USERNAME, defaults={'is_staff': True, 'is_superuser': True}
+        )
+        client.force_login(user)
+        # The first generated project; every company has the same shape
+        project = Project.objects.get(project_name=SageDatasetGenerator.project_name(1))
+
+        # The generated companies are SQLite, which the SQL Server raw SQL of
+        # the realtime stats cannot run on; the replica path is portable
+        read_from_replica = SYNC_CONFIG.get('READ_FROM_REPLICA', False)
+        SYNC_CONFIG['READ_FROM_REPLICA'] = True
+        try:
+            results = {case.name: self.measure_case(client, case, project) for case in self.cases}
+        finally:
+            SYNC_CONFIG['READ_FROM_REPLICA'] = read_from_replica
+
+        return {
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': settings.DATABASES['default']['ENGINE'],
+            'dataset': load_manifest(settings.BENCHMARK_DATA_DIR),
+            'local_counts': local_counts(),
+            'config': {
+                'iterations': self.iterations,
+                'warmup': self.warmup,
+                'project': project.project_name,
+                'read_from_replica': True,
+            },
+            'cases': results,
+            'violations': self.check_budgets(results),
+        }
+
+    def measure_case(self, client, case, project):
+        url = reverse(case.url_name, args=[getattr(project, case.url_args)] if case.url_args else None)
+        headers = {'X-Requested-With': 'XMLHttpRequest'} if case.ajax else {}
+        iterations = min(self.iterations, case.iterations or self.iterations)
+
+        for _ in range(self.warmup):
+            client.get(url, case.params, headers=headers)
+
+        measurements = [self.measure(client, url, case.params, headers) for _ in range(iterations)]
+        latencies = [measurement['ms'] for measurement in measurements]
+        return {
+            'url': url,
+            'params': case.params,
+            'iterations': iterations,
+            'p50_ms': round(_percentile(latencies, 50), 1),
+            'p95_ms': round(_percentile(latencies, 95), 1),
+            'max_ms': round(max(latencies), 1),
+            'mean_ms': round(statistics.mean(latencies), 1),
+            'queries': max(measurement['queries'] for measurement in measurements),
+            'queries_by_alias': measurements[-1]['queries_by_alias'],
+            'response_bytes': measurements[-1]['bytes'],
+            'statuses': dict(Counter(measurement['status'] for measurement in measurements)),
+        }
+
+    @staticmethod
+    def measure(client, url, params, headers):
+        """Latency, statements per alias, status and size of one request"""
+        queries_before = query_seconds.snapshot()
+
+        started = time.perf_counter()
+        response = client.get(url, params, headers=headers)
+        content = b''.join(response.streaming_content) if response.streaming else response.content
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        queries = {}
+        for (alias,), (count, _) in query_seconds.snapshot().items():
+            before_count = queries_before.get((alias,), (0, 0.0))[0]
+            if count > before_count:
+                queries[alias] = count - before_count
+
+        return {
+            'ms': elapsed_ms,
+            'queries': sum(queries.values()),
+            'queries_by_alias': queries,
+            'status': response.status_code,
+            'bytes': len(content),
+        }
+
+    def check_budgets(self, results):
+        """Every case over its p95_ms or max_queries budget; cases without a budget always pass"""
+        violations = []
+        for name, result in results.items():
+            budget = self.budgets.get(name, {})
+            if budget.get('p95_ms') is not None and result['p95_ms'] > budget['p95_ms']:
+                violations.append(
+                    {'case': name, 'metric': 'p95_ms', 'value': result['p95_ms'], 'budget': budget['p95_ms']}
+                )
+            if budget.get('max_queries') is not None and result['queries'] > budget['max_queries']:
+                violations.append(
+                    {'case': name, 'metric': 'queries', 'value': result['queries'], 'budget': budget['max_queries']}
+                )
+        return violations
@@ -0,0 +1,175 @@
+import copy
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class LazyDatabases(dict):
+    """
+    settings.DATABASES that resolves the Sage company aliases from DatabaseMapping.
+
+    The statically configured aliases ('default') behave like a plain dict. Any
+    other alias is looked up in DatabaseMapping on first use, built from
+    settings.SAGE_DATABASE_DEFAULTS and cached, so a process only configures the
+    companies it actually touches and a new company needs no redeploy.
+    Unknown aliases are remembered for NEGATIVE_CACHE_SECONDS so repeated misses
+    do not query the mapping table every time.
+    """
+
+    NEGATIVE_CACHE_SECONDS = 60
+
+    def __init__(self, static_databases):
+        super().__init__(static_databases)
+        self.static_aliases = frozenset(static_databases)
+        self._missing = {}  # alias -> monotonic time of the failed lookup
+        self._lock = threading.RLock()
+
+    def __contains__(self, alias):
+        return super().__contains__(alias) or self._resolve(alias) is not None
+
+    def __getitem__(self, alias):
+        try:
+            return super().__getitem__(alias)
+        except KeyError:
+            entry = self._resolve(alias)
+            if entry is None:
+                raise
+            return entry
+
+    def get(self, alias, default=None):
+        try:
+            return self[alias]
+        except KeyError:
+            return default
+
+    def __iter__(self):
+        # Snapshot, so connections.all() never sees the dict change size mid-iteration
+        return iter(list(super().keys()))
+
+    def resolved_aliases(self):
+        """Aliases resolved from DatabaseMapping so far"""
+        return [alias for alias in self if alias not in self.static_aliases]
+
+    def evict(self, alias):
+        """Drop a resolved alias so its next use re-reads DatabaseMapping"""
+        if alias in self.static_aliases:
+            return False
+
+        with self._lock:
+            self._missing.pop(alias, None)
+            if not super().__contains__(alias):
+                return False
+            super().__delitem__(alias)
+
+        _release_alias(alias)
+        logger.info(f"Evicted database alias {alias}")
+        return True
+
+    def evict_stale(self):
+        """
+        Evict resolved aliases whose mapping was deactivated, deleted or changed.
+
+        Returns:
+            List of evicted aliases
+        """
+        from main_app.models import DatabaseMapping
+
+        current = {
+            mapping.sql_server_db: mapping
+            for mapping in DatabaseMapping.objects.filter(
+                sql_server_db__in=self.resolved_aliases(), is_active=True
+            )
+        }
+
+        evicted = []
+        for alias in self.resolved_aliases():
+            mapping = current.get(alias)
+            if mapping is None or self._settings_changed(super().get(alias), mapping):
+                if self.evict(alias):
+                    evicted.append(alias)
+        return evicted
+
+    def _resolve(self, alias):
+        """Build, cache and return the settings of alias, or None when it is not a mapped company"""
+        if not isinstance(alias, str):
+            return None
+
+        with self._lock:
+            entry = super().get(alias)
+            if entry is not None:
+                return entry
+
+            missed_at = self._missing.get(alias)
+            if missed_at is not None and time.monotonic() - missed_at < self.NEGATIVE_CACHE_SECONDS:
+                return None
+
+            from django.apps import apps
+            if not apps.ready:
+                return None
+
+            from main_app.models import DatabaseMapping
+
+            mapping = DatabaseMapping.objects.filter(sql_server_db=alias, is_active=True).first()
+            if mapping is None:
+                self._missing[alias] = time.monotonic()
+                return None
+
+            entry = build_database_settings(mapping)
+            super().__setitem__(alias, entry)
+            self._missing.pop(alias, None)
+
+        logger.info(f"Resolved database alias {alias} -> {entry['HOST']}:{entry['PORT']}/{entry['NAME']}")
+        return entry
+
+    @staticmethod
+    def _settings_changed(entry, mapping):
+        expected = build_database_settings(mapping)
+        return any(entry.get(key) != expected.get(key) for key in ('ENGINE', 'NAME', 'HOST', 'PORT', 'GUARD'))
+
+
+def build_database_settings(mapping):
+    """Complete DATABASES entry for a DatabaseMapping, with Django's connection defaults applied"""
+    from django.conf import settings
+    from django.db import DEFAULT_DB_ALIAS, connections
+
+    entry = copy.deepcopy(settings.SAGE_DATABASE_DEFAULTS)
+    entry['NAME'] = mapping.database_name or mapping.sql_server_db
+    if mapping.host:
+        entry['HOST'] = mapping.host
+    if mapping.port:
+        entry['PORT'] = mapping.port
+    if mapping.statement_timeout:
+        entry['GUARD'] = {**entry.get('GUARD', {}), 'STATEMENT_TIMEOUT_SECONDS': mapping.statement_timeout}
+
+    # Same defaults Django fills in for statically configured databases
+    connections.configure_settings({DEFAULT_DB_ALIAS: {}, mapping.sql_server_db: entry})
+    return entry
+
+
+def _release_alias(alias):
+    """Close this thread's connection and the pooled connections of an evicted alias"""
+    from django.db import connections
+
+    from main_app.connection_pool import pool_registry
+    from main_app.db_guard import breaker_registry
+
+    # Other threads keep their open connection until they close it at the end of their work
+    if hasattr(connections._connections, alias):
+        try:
+            connections[alias].close()
+        except Exception as e:
+            logger.warning(f"Error closing connection {alias}: {str(e)}")
+        delattr(connections._connections, alias)
+
+    pool_registry.discard_pool(alias)
+    breaker_registry.discard(alias)
+
+
+def evict_mapping_alias(sender, instance, **kwargs):
+    """DatabaseMapping post_save/post_delete receiver: forget the alias so it is re-resolved"""
+    from django.conf import settings
+
+    if isinstance(settings.DATABASES, LazyDatabases):
+        settings.DATABASES.evict(instance.sql_server_db)
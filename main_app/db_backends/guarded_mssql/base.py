@@ -0,0 +1,7 @@
+from mssql.base import DatabaseWrapper as MssqlDatabaseWrapper
+
+from main_app.db_guard import GuardedDatabaseWrapperMixin
+
+
+class DatabaseWrapper(GuardedDatabaseWrapperMixin, MssqlDatabaseWrapper):
+    """mssql-django backend behind the alias's circuit breaker and statement timeout, without pooling"""
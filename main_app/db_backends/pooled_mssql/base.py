@@ -0,0 +1,8 @@
+from mssql.base import DatabaseWrapper as MssqlDatabaseWrapper
+
+from main_app.connection_pool import PooledDatabaseWrapperMixin
+from main_app.db_guard import GuardedDatabaseWrapperMixin
+
+
+class DatabaseWrapper(GuardedDatabaseWrapperMixin, PooledDatabaseWrapperMixin, MssqlDatabaseWrapper):
+    """mssql-django backend drawing its ODBC connections from the per-alias pool, behind the alias's circuit breaker"""
@@ -0,0 +1,416 @@
+"""
+Statement timeouts, cooperative cancellation and circuit breakers for the Sage aliases.
+
+Every statement on a guarded connection runs under a deadline: the alias's
+statement timeout, shortened to whatever is left of the cancellation token
+the calling thread works under. A single watchdog thread interrupts the
+statement on the server when the deadline passes or the token is cancelled.
+
+Each alias has a circuit breaker. After FAILURE_THRESHOLD consecutive
+connection failures or timeouts it opens, and every call to the alias fails
+at once with CircuitOpen for COOLOFF_SECONDS. A single probe is then let
+through: success closes the breaker, failure reopens it. Breakers are per
+process.
+"""
+import heapq
+import itertools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from django.db.utils import InterfaceError, OperationalError
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpen(Exception):
+    """The alias's circuit breaker is open; the database is not called until its cool-off ends"""
+
+
+class StatementCancelled(Exception):
+    """The statement or the work it belongs to was cancelled"""
+
+
+class StatementTimeout(StatementCancelled):
+    """The statement ran past its deadline and was interrupted"""
+
+
+def guard_config(settings_dict=None):
+    """DB_GUARD_CONFIG with the per-alias overrides of a DATABASES entry applied"""
+    from django.conf import settings
+
+    config = {
+        'STATEMENT_TIMEOUT_SECONDS': 120,
+        'REQUEST_TIMEOUT_SECONDS': 15,
+        'FAILURE_THRESHOLD': 3,
+        'COOLOFF_SECONDS': 60,
+    }
+    config.update(getattr(settings, 'DB_GUARD_CONFIG', {}))
+    # Per-alias overrides, e.g. DATABASES['X']['GUARD'] = {'STATEMENT_TIMEOUT_SECONDS': 30}
+    config.update((settings_dict or {}).get('GUARD', {}))
+    return config
+
+
+class CancellationToken:
+    """
+    Cancellation signal for a unit of work, optionally with a deadline.
+
+    A token is cancelled explicitly, when its deadline passes or when its
+    parent is cancelled, so cancelling a run's token cancels every project
+    token created under it.
+    """
+
+    DEADLINE_EXCEEDED = 'deadline exceeded'
+
+    def __init__(self, timeout_seconds=None, parent=None):
+        self.deadline = time.monotonic() + timeout_seconds if timeout_seconds else None
+        self.parent = parent
+        self._reason = None
+
+    def cancel(self, reason='cancelled'):
+        if self._reason is None:
+            self._reason = reason
+        # In-flight statements are interrupted by the watchdog
+        watchdog.wake()
+
+    @property
+    def reason(self):
+        """Why the token is cancelled, or None while it is not"""
+        if self._reason is not None:
+            return self._reason
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            return self.DEADLINE_EXCEEDED
+        return self.parent.reason if self.parent is not None else None
+
+    @property
+    def cancelled(self):
+        return self.reason is not None
+
+    def remaining(self):
+        """Seconds until the nearest deadline of this token and its parents, or None"""
+        remaining = self.deadline - time.monotonic() if self.deadline is not None else None
+        parent_remaining = self.parent.remaining() if self.parent is not None else None
+        if remaining is None or (parent_remaining is not None and parent_remaining < remaining):
+            return parent_remaining
+        return remaining
+
+    def raise_if_cancelled(self):
+        reason = self.reason
+        if reason is not None:
+            raise StatementCancelled(reason)
+
+
+_local = threading.local()
+
+
+def current_token():
+    """Cancellation token the calling thread works under, or None"""
+    return getattr(_local, 'token', None)
+
+
+@contextmanager
+def cancellation_scope(token):
+    """Run the block, and every guarded statement in it, under token"""
+    previous = current_token()
+    _local.token = token
+    try:
+        yield token
+    finally:
+        _local.token = previous
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker of one database alias"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, alias, failure_threshold=3, cooloff_seconds=60):
+        self.alias = alias
+        self.failure_threshold = failure_threshold
+        self.cooloff_seconds = cooloff_seconds
+
+        self.state = self.CLOSED
+        self.failures = 0  # Consecutive failures
+        self.opened_at = None  # monotonic
+        self.last_error = None
+        self.last_failure_at = None  # wall clock, for display
+        self._probing = False
+        self._lock = threading.Lock()
+        self.stats = {'failures': 0, 'rejected': 0, 'trips': 0}
+
+    def before_call(self):
+        """Let a call through, or raise CircuitOpen while the breaker is open"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.cooloff_seconds:
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self.state == self.HALF_OPEN and not self._probing:
+                # One probe at a time decides whether the alias is back
+                self._probing = True
+                return
+            self.stats['rejected'] += 1
+            retry_in = max(self.cooloff_seconds - (time.monotonic() - self.opened_at), 0)
+        raise CircuitOpen(
+            f"Database {self.alias} is unavailable after {self.failures} consecutive failures "
+            f"(retry in {retry_in:.0f}s): {self.last_error}"
+        )
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info(f"Circuit for database {self.alias} closed")
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self, error):
+        with self._lock:
+            self.failures += 1
+            self.stats['failures'] += 1
+            self.last_error = str(error)
+            self.last_failure_at = time.time()
+            self._probing = False
+            if self.state == self.HALF_OPEN or (
+                    self.state == self.CLOSED and self.failures >= self.failure_threshold):
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self.stats['trips'] += 1
+                logger.warning(
+                    f"Circuit for database {self.alias} opened for {self.cooloff_seconds}s after "
+                    f"{self.failures} consecutive failures: {self.last_error}"
+                )
+
+    def snapshot(self):
+        with self._lock:
+            retry_in = None
+            if self.state == self.OPEN:
+                retry_in = round(max(self.cooloff_seconds - (time.monotonic() - self.opened_at), 0), 1)
+            return {
+                **self.stats,
+                'state': self.state,
+                'consecutive_failures': self.failures,
+                'last_error': self.last_error,
+                'last_failure_at': self.last_failure_at,
+                'retry_in_seconds': retry_in,
+            }
+
+
+class BreakerRegistry:
+    """Process-wide registry of one CircuitBreaker per alias"""
+
+    def __init__(self):
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def get(self, alias, settings_dict=None):
+        """Breaker of alias, created from its settings on first use"""
+        breaker = self._breakers.get(alias)
+        if breaker is not None:
+            return breaker
+
+        with self._lock:
+            breaker = self._breakers.get(alias)
+            if breaker is None:
+                if settings_dict is None:
+                    from django.conf import settings
+                    settings_dict = settings.DATABASES.get(alias, {})
+                config = guard_config(settings_dict)
+                breaker = CircuitBreaker(alias, config['FAILURE_THRESHOLD'], config['COOLOFF_SECONDS'])
+                self._breakers[alias] = breaker
+            return breaker
+
+    def discard(self, alias):
+        """Forget the breaker of alias, so changed settings start from a closed breaker"""
+        with self._lock:
+            self._breakers.pop(alias, None)
+
+    def is_available(self, alias):
+        breaker = self._breakers.get(alias)
+        if breaker is None:
+            return True
+        with breaker._lock:
+            return breaker.state != CircuitBreaker.OPEN or \
+                time.monotonic() - breaker.opened_at >= breaker.cooloff_seconds
+
+    def states(self, include_closed=False):
+        """Snapshot of every breaker, or of those not closed"""
+        snapshots = {alias: breaker.snapshot() for alias, breaker in list(self._breakers.items())}
+        if include_closed:
+            return snapshots
+        return {alias: snapshot for alias, snapshot in snapshots.items() if snapshot['state'] != CircuitBreaker.CLOSED}
+
+
+breaker_registry = BreakerRegistry()
+
+
+def breaker_states(include_closed=False):
+    """Circuit breaker state per alias (only the open and half-open ones unless include_closed)"""
+    return breaker_registry.states(include_closed)
+
+
+def is_available(alias):
+    """False while the alias's breaker is open and cooling off; does not claim the half-open probe"""
+    return breaker_registry.is_available(alias)
+
+
+class StatementWatchdog:
+    """One daemon thread interrupting guarded statements past their deadline or cancelled"""
+
+    def __init__(self):
+        self._inflight = {}  # id -> (deadline, token, interrupt)
+        self._deadlines = []  # heap of (deadline, id)
+        self._fired = {}  # id -> 'timeout' | 'cancelled'
+        self._ids = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def watch(self, interrupt, deadline, token):
+        """Register a running statement; returns the handle to unwatch it with"""
+        with self._condition:
+            handle = next(self._ids)
+            self._inflight[handle] = (deadline, token, interrupt)
+            if deadline is not None:
+                heapq.heappush(self._deadlines, (deadline, handle))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='db-guard-watchdog', daemon=True)
+                self._thread.start()
+            self._condition.notify()
+            return handle
+
+    def unwatch(self, handle):
+        """Stop watching a statement; returns why it was interrupted, or None"""
+        with self._condition:
+            self._inflight.pop(handle, None)
+            return self._fired.pop(handle, None)
+
+    def wake(self):
+        """Re-check cancellations now, e.g. after a token was cancelled"""
+        with self._condition:
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                now = time.monotonic()
+                due = []
+                for handle, (deadline, token, interrupt) in list(self._inflight.items()):
+                    if token is not None and token.cancelled:
+                        due.append((handle, 'cancelled', interrupt))
+                    elif deadline is not None and deadline <= now:
+                        due.append((handle, 'timeout', interrupt))
+                for handle, reason, _ in due:
+                    del self._inflight[handle]
+                    self._fired[handle] = reason
+
+                while self._deadlines and self._deadlines[0][1] not in self._inflight:
+                    heapq.heappop(self._deadlines)
+                if not due:
+                    if not self._inflight:
+                        self._condition.wait()
+                        continue
+                    wait = self._deadlines[0][0] - now if self._deadlines else 1.0
+                    # Token deadlines pass without a wake-up, so look again at least every second
+                    self._condition.wait(min(wait, 1.0))
+                    continue
+
+            for handle, reason, interrupt in due:
+                try:
+                    interrupt()
+                except Exception as e:
+                    logger.warning(f"Could not interrupt statement ({reason}): {str(e)}")
+
+
+watchdog = StatementWatchdog()
+
+
+def _interrupt(connection, cursor):
+    """Cancel the statement running on a connection from another thread"""
+    raw_connection = connection.connection
+    if hasattr(raw_connection, 'interrupt'):
+        raw_connection.interrupt()  # sqlite3
+    else:
+        cursor.cursor.cancel()  # pyodbc: SQLCancel on the running statement
+
+
+class StatementGuard:
+    """
+    execute_wrapper of a guarded alias: breaker check, deadline and outcome bookkeeping.
+
+    Only the execute call is guarded; fetching the rows of a streamed result
+    happens outside it.
+    """
+
+    CONNECTION_ERRORS = (OperationalError, InterfaceError)
+
+    def __init__(self, alias, settings_dict):
+        self.alias = alias
+        self.timeout = guard_config(settings_dict)['STATEMENT_TIMEOUT_SECONDS']
+        self.breaker = breaker_registry.get(alias, settings_dict)
+
+    def __call__(self, execute, sql, params, many, context):
+        token = current_token()
+        if token is not None:
+            token.raise_if_cancelled()
+        self.breaker.before_call()
+
+        timeout = self.timeout
+        remaining = token.remaining() if token is not None else None
+        if remaining is not None and (timeout is None or remaining < timeout):
+            timeout = max(remaining, 0)
+        deadline = time.monotonic() + timeout if timeout is not None else None
+
+        handle = watchdog.watch(lambda: _interrupt(context['connection'], context['cursor']), deadline, token)
+        try:
+            result = execute(sql, params, many, context)
+        except self.CONNECTION_ERRORS as e:
+            fired = watchdog.unwatch(handle)
+            if fired is not None and token is not None and token.cancelled and \
+                    token.reason != CancellationToken.DEADLINE_EXCEEDED:
+                # Cancelled for the work it belongs to, not for anything the server did
+                raise StatementCancelled(f"Statement on {self.alias} cancelled: {token.reason}") from e
+            self.breaker.record_failure(e)
+            if fired is not None:
+                raise StatementTimeout(f"Statement on {self.alias} exceeded {timeout:.1f}s") from e
+            raise
+        except Exception:
+            # The server answered, e.g. with a SQL error
+            watchdog.unwatch(handle)
+            self.breaker.record_success()
+            raise
+
+        watchdog.unwatch(handle)
+        self.breaker.record_success()
+        return result
+
+
+class GuardedDatabaseWrapperMixin:
+    """
+    Puts a Django DatabaseWrapper behind its alias's circuit breaker and statement guard.
+
+    Opening a connection is refused while the breaker is open and counts as a
+    failure when the server cannot be reached; every statement goes through a
+    StatementGuard.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.execute_wrappers.append(StatementGuard(self.alias, self.settings_dict))
+
+    def get_new_connection(self, conn_params):
+        token = current_token()
+        if token is not None:
+            token.raise_if_cancelled()
+        breaker = breaker_registry.get(self.alias, self.settings_dict)
+        breaker.before_call()
+        try:
+            connection = super().get_new_connection(conn_params)
+        except self.Database.Error as e:
+            breaker.record_failure(e)
+            raise
+        breaker.record_success()
+        return connection
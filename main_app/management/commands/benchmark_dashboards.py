@@ -0,0 +1,121 @@
+import json
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from main_app.dashboard_benchmark import CASE_NAMES, DashboardBenchmark, seed_dashboard_data
+from main_app.management.commands.generate_sage_dataset import require_benchmark_settings, row_count
+from main_app.sage_dataset import load_manifest
+
+
+class Command(BaseCommand):
+    help = ('Benchmark the dashboard and report endpoints (p50/p95 latency, queries per request) against the '
+            'generated Sage companies; fails when a case exceeds its budget')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--projects',
+            type=int,
+            default=60,
+            help='Projects to seed, one generated Sage company each'
+        )
+        parser.add_argument(
+            '--rows',
+            type=row_count,
+            default=2000,
+            help='glpost rows per seeded company, e.g. 2000 or 10k'
+        )
+        parser.add_argument(
+            '--skip-seed',
+            action='store_true',
+            help='Reuse the data of an earlier run instead of generating and syncing it again'
+        )
+        parser.add_argument(
+            '--case',
+            choices=CASE_NAMES,
+            nargs='+',
+            default=list(CASE_NAMES),
+            help='Cases to run'
+        )
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=20,
+            help='Timed requests per case (the slowest cases are capped lower)'
+        )
+        parser.add_argument(
+            '--warmup',
+            type=int,
+            default=1,
+            help='Untimed requests per case before the timed ones'
+        )
+        parser.add_argument(
+            '--budgets',
+            type=str,
+            help='JSON file of per-case budgets ({"case": {"p95_ms": ..., "max_queries": ...}}) '
+                 'instead of DASHBOARD_BENCHMARK_BUDGETS'
+        )
+        parser.add_argument(
+            '--output',
+            type=str,
+            help='Write the JSON report to this file'
+        )
+        parser.add_argument(
+            '--json',
+            action='store_true',
+            help='Print the JSON report instead of the summary table'
+        )
+
+    def handle(self, *args, **options):
+        require_benchmark_settings()
+
+        budgets = None
+        if options['budgets']:
+            with open(options['budgets']) as budgets_file:
+                budgets = json.load(budgets_file)
+
+        if options['skip_seed']:
+            if load_manifest(settings.BENCHMARK_DATA_DIR) is None:
+                raise CommandError('No dataset found; run without --skip-seed first')
+        else:
+            settings.BENCHMARK_DATA_DIR.mkdir(parents=True, exist_ok=True)
+            call_command('migrate', verbosity=0)
+            manifest = seed_dashboard_data(projects=options['projects'], rows=options['rows'])
+            counts = manifest['local_counts']
+            self.stdout.write(
+                f"Seeded {counts['projects']} projects: {counts['supporting_documents']} supporting documents, "
+                f"{counts['supporting_document_files']} files, {counts['comments']} comments"
+            )
+
+        report = DashboardBenchmark(
+            iterations=options['iterations'],
+            warmup=options['warmup'],
+            cases=options['case'],
+            budgets=budgets,
+        ).run()
+
+        output = json.dumps(report, indent=2, default=str)
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                output_file.write(output)
+            self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
+
+        if options['json']:
+            self.stdout.write(output)
+        else:
+            over_budget = {violation['case'] for violation in report['violations']}
+            for name, case in report['cases'].items():
+                statuses = ', '.join(f'{status} x{count}' for status, count in sorted(case['statuses'].items()))
+                style = self.style.ERROR if name in over_budget or max(case['statuses']) >= 500 else self.style.SUCCESS
+                self.stdout.write(style(
+                    f"{name:<30} p50 {case['p50_ms']:>8.1f} ms  p95 {case['p95_ms']:>8.1f} ms  "
+                    f"{case['queries']:>5} queries  [{statuses}]"
+                ))
+
+        if report['violations']:
+            for violation in report['violations']:
+                self.stderr.write(
+                    f"{violation['case']}: {violation['metric']} {violation['value']} over budget {violation['budget']}"
+                )
+            raise CommandError(f"{len(report['violations'])} budget(s) exceeded")
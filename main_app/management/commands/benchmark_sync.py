@@ -0,0 +1,97 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from main_app.management.commands.generate_sage_dataset import require_benchmark_settings
+from main_app.sage_dataset import load_manifest
+from main_app.sync_benchmark import SCENARIOS, SyncBenchmark, compare_reports
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the syncs against the generated Sage companies and report wall time, queries and memory as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scenario',
+            choices=SCENARIOS,
+            nargs='+',
+            default=list(SCENARIOS),
+            help='Scenarios to run (in pipeline order; later ones sync from what earlier ones loaded)'
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=1,
+            help='Repetitions from a cold start; wall times are reported as the median'
+        )
+        parser.add_argument(
+            '--extraction-mode',
+            choices=['row', 'bulk'],
+            default='bulk',
+            help='ProjectSyncService extraction mode'
+        )
+        parser.add_argument(
+            '--load-mode',
+            choices=['row', 'bulk'],
+            default='bulk',
+            help='ProjectSyncService load mode'
+        )
+        parser.add_argument(
+            '--max-workers',
+            type=int,
+            default=1,
+            help='sync_all_projects threads (SQLite serialises the writes)'
+        )
+        parser.add_argument(
+            '--no-memory',
+            action='store_true',
+            help='Skip the extra traced pass that measures peak memory'
+        )
+        parser.add_argument(
+            '--output',
+            type=str,
+            help='Write the JSON report to this file'
+        )
+        parser.add_argument(
+            '--compare',
+            type=str,
+            help='JSON report of an earlier run (e.g. another commit) to compare against'
+        )
+
+    def handle(self, *args, **options):
+        require_benchmark_settings()
+        if load_manifest(settings.BENCHMARK_DATA_DIR) is None:
+            raise CommandError('No dataset found; run generate_sage_dataset first')
+
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as baseline_file:
+                baseline = json.load(baseline_file)
+
+        report = SyncBenchmark(
+            repeat=options['repeat'],
+            scenarios=options['scenario'],
+            extraction_mode=options['extraction_mode'],
+            load_mode=options['load_mode'],
+            max_workers=options['max_workers'],
+            trace_memory=not options['no_memory'],
+        ).run()
+
+        output = json.dumps(report, indent=2, default=str)
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                output_file.write(output)
+            self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
+        else:
+            self.stdout.write(output)
+
+        if baseline is not None:
+            for row in compare_reports(report, baseline):
+                ratio = row['wall_ratio']
+                style = self.style.ERROR if ratio and ratio > 1.1 else self.style.SUCCESS
+                self.stdout.write(style(
+                    f"{row['scenario']:<18} {row['baseline_wall_seconds']:.3f}s -> {row['wall_seconds']:.3f}s "
+                    f"({ratio}x), queries {row['baseline_queries']} -> {row['queries']}, "
+                    f"peak {row['baseline_peak_memory_kb']} -> {row['peak_memory_kb']} KB"
+                ))
@@ -0,0 +1,163 @@
+import json
+import random
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+
+from main_app.services import _aggregate_unsupported
+
+
+def legacy_unsupported_totals(current_transactions, supported_batch_entry_pairs):
+    """The per-key rescan _get_aggregated_data used before the single-pass aggregation (reference only)"""
+    unsupported_transaction_keys = []
+    unsupported_transaction_amounts = []
+
+    for trans in current_transactions:
+        trans_key = (trans['batchnbr'], trans['entrynbr'])
+        if trans_key not in supported_batch_entry_pairs:
+            unsupported_transaction_keys.append({
+                'acctid': trans['acctid'],
+                'fiscalyr': trans['fiscalyr'],
+                'fiscalperd': trans['fiscalperd'],
+                'srcecurn': trans['srcecurn'],
+                'srceledger': trans['srceledger'],
+                'srcetype': trans['srcetype'],
+                'postingseq': trans['postingseq'],
+                'cntdetail': trans['cntdetail']
+            })
+            unsupported_transaction_amounts.append(trans['transamt'])
+
+    unsupported_batch_entry_combinations = set()
+    unsupported_total_amount = Decimal('0')
+
+    for i, key in enumerate(unsupported_transaction_keys):
+        matching_trans = next(
+            trans for trans in current_transactions
+            if all(trans[k] == v for k, v in key.items())
+        )
+        unsupported_batch_entry_combinations.add(
+            (matching_trans['batchnbr'], matching_trans['entrynbr'])
+        )
+        unsupported_total_amount += Decimal(str(unsupported_transaction_amounts[i]))
+
+    return len(unsupported_batch_entry_combinations), unsupported_total_amount
+
+
+class Command(BaseCommand):
+    help = 'Compare the legacy and single-pass unsupported-transaction aggregation on synthetic glpost rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            type=int,
+            nargs='+',
+            default=[10000, 100000, 1000000],
+            help='Numbers of glpost rows to benchmark'
+        )
+        parser.add_argument(
+            '--supported-ratio',
+            type=float,
+            default=0.5,
+            help='Fraction of batch/entry pairs that are supported'
+        )
+        parser.add_argument(
+            '--legacy-limit',
+            type=int,
+            default=10000,
+            help='Largest size the quadratic legacy scan is actually run at; larger sizes are extrapolated'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=42,
+            help='Random seed for the synthetic rows'
+        )
+        parser.add_argument(
+            '--json',
+            action='store_true',
+            help='Print the results as JSON'
+        )
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        results = []
+        legacy_reference = None  # (rows, seconds) of the largest measured legacy run
+
+        for size in sorted(options['sizes']):
+            rows, supported_pairs = self.generate_rows(rng, size, options['supported_ratio'])
+
+            started = time.perf_counter()
+            new_count, new_value = _aggregate_unsupported(
+                ((row['batchnbr'], row['entrynbr'], row['transamt']) for row in rows), supported_pairs
+            )
+            new_seconds = time.perf_counter() - started
+
+            result = {
+                'rows': size,
+                'single_pass_seconds': round(new_seconds, 4),
+                'unsupported_count': new_count,
+                'unsupported_value': str(new_value),
+            }
+
+            if size <= options['legacy_limit']:
+                started = time.perf_counter()
+                legacy_count, legacy_value = legacy_unsupported_totals(rows, supported_pairs)
+                legacy_seconds = time.perf_counter() - started
+                legacy_reference = (size, legacy_seconds)
+                result['legacy_seconds'] = round(legacy_seconds, 4)
+                result['legacy_estimated'] = False
+                result['results_match'] = (legacy_count, legacy_value) == (new_count, new_value)
+            elif legacy_reference:
+                # The legacy scan is quadratic in the number of rows
+                reference_rows, reference_seconds = legacy_reference
+                result['legacy_seconds'] = round(reference_seconds * (size / reference_rows) ** 2, 1)
+                result['legacy_estimated'] = True
+
+            if result.get('legacy_seconds') and new_seconds:
+                result['speedup'] = round(result['legacy_seconds'] / new_seconds, 1)
+
+            results.append(result)
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        for result in results:
+            legacy = result.get('legacy_seconds')
+            legacy_text = 'n/a' if legacy is None else (
+                f"{legacy:.2f}s{' (estimated)' if result['legacy_estimated'] else ''}"
+            )
+            self.stdout.write(
+                f"{result['rows']:>9} rows: single-pass {result['single_pass_seconds']:.3f}s, "
+                f"legacy {legacy_text}, speedup {result.get('speedup', 'n/a')}x"
+            )
+            if result.get('results_match') is False:
+                self.stdout.write(self.style.ERROR(f"  Results differ at {result['rows']} rows"))
+
+    def generate_rows(self, rng, size, supported_ratio):
+        """Synthetic glpost values() rows with a few detail lines per batch/entry"""
+        rows = []
+        supported_pairs = set()
+        entry = 0
+        while len(rows) < size:
+            entry += 1
+            batchnbr = str(entry // 100).zfill(6)
+            entrynbr = str(entry % 100).zfill(5)
+            if rng.random() < supported_ratio:
+                supported_pairs.add((batchnbr, entrynbr))
+            for detail in range(min(rng.randint(1, 4), size - len(rows))):
+                rows.append({
+                    'batchnbr': batchnbr,
+                    'entrynbr': entrynbr,
+                    'acctid': f'{6000 + detail}-100',
+                    'fiscalyr': '2025',
+                    'fiscalperd': str(rng.randint(1, 12)).zfill(2),
+                    'srcecurn': 'ZMW',
+                    'srceledger': 'EN',
+                    'srcetype': 'EV',
+                    'postingseq': Decimal(entry),
+                    'cntdetail': Decimal(detail + 1),
+                    'transamt': Decimal(rng.randint(100, 1000000)) / 100,
+                })
+        return rows, supported_pairs
@@ -0,0 +1,97 @@
+import argparse
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from main_app.sage_dataset import SageDatasetGenerator
+
+
+def row_count(value):
+    """Row counts like 10000, 10k or 1M"""
+    multipliers = {'k': 1000, 'm': 1000000}
+    try:
+        if value[-1].lower() in multipliers:
+            return int(float(value[:-1]) * multipliers[value[-1].lower()])
+        return int(value)
+    except (ValueError, IndexError):
+        raise argparse.ArgumentTypeError(f'invalid row count: {value}')
+
+
+def require_benchmark_settings():
+    """Refuse to run against anything but the benchmark databases (SQLite, or a local MySQL scratch database)"""
+    if getattr(settings, 'BENCHMARK_DATA_DIR', None) is None or connection.vendor not in ('sqlite', 'mysql'):
+        raise CommandError(
+            'Benchmarks replace local sync data; run them with '
+            'DJANGO_SETTINGS_MODULE=audit_management_system.settings_benchmark'
+        )
+
+
+class Command(BaseCommand):
+    help = 'Generate synthetic Sage 300 companies (glpost, ENPJD, ENEBA) in SQLite for the sync benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows',
+            type=row_count,
+            default=10000,
+            help='glpost rows per company, e.g. 10k, 100k or 1M'
+        )
+        parser.add_argument(
+            '--companies',
+            type=int,
+            default=1,
+            help='Number of Sage companies, one project each'
+        )
+        parser.add_argument(
+            '--years',
+            type=int,
+            default=2,
+            help='Fiscal years the postings are spread over'
+        )
+        parser.add_argument(
+            '--attachment-ratio',
+            type=float,
+            default=0.8,
+            help='Fraction of expense items with ENEBA attachments'
+        )
+        parser.add_argument(
+            '--note-ratio',
+            type=float,
+            default=0.3,
+            help='Fraction of expense items with an ENEBA note'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=42,
+            help='Random seed; the same parameters always generate the same data'
+        )
+
+    def handle(self, *args, **options):
+        require_benchmark_settings()
+        settings.BENCHMARK_DATA_DIR.mkdir(parents=True, exist_ok=True)
+        call_command('migrate', verbosity=0)
+
+        generator = SageDatasetGenerator(
+            settings.BENCHMARK_DATA_DIR,
+            rows=options['rows'],
+            companies=options['companies'],
+            years=options['years'],
+            attachment_ratio=options['attachment_ratio'],
+            note_ratio=options['note_ratio'],
+            seed=options['seed'],
+        )
+        manifest = generator.generate()
+
+        for company in manifest['company_counts']:
+            self.stdout.write(
+                f"{company['alias']} ({company['project']}): {company['glpost']} glpost, {company['enpjd']} ENPJD, "
+                f"{company['eneba']} ENEBA rows; {company['expense_documents']} expense documents, "
+                f"{company['supported_documents']} with attachments, {company['notes']} notes"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {manifest['companies']} companies in {manifest['seconds']:.1f}s under "
+            f"{settings.BENCHMARK_DATA_DIR}"
+        ))
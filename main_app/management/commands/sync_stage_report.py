@@ -0,0 +1,61 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from main_app.sync_profiler import stage_report
+
+
+class Command(BaseCommand):
+    help = 'Show the slowest projects and sync stages over a time window'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours',
+            type=float,
+            default=24,
+            help='Length of the window, ending now'
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=10,
+            help='Number of slowest projects to show'
+        )
+        parser.add_argument(
+            '--project',
+            type=str,
+            help='Only report this project'
+        )
+        parser.add_argument(
+            '--json',
+            action='store_true',
+            help='Print the report as JSON'
+        )
+
+    def handle(self, *args, **options):
+        report = stage_report(hours=options['hours'], limit=options['limit'], project_name=options['project'])
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        if not report['projects']:
+            self.stdout.write(self.style.WARNING(f"No sync stage timings in the last {options['hours']:g} hours"))
+            return
+
+        self.stdout.write(self.style.SUCCESS(f"Slowest projects since {report['since']}:"))
+        for project in report['projects']:
+            memory = f", peak {project['peak_memory_kb']} KB" if project['peak_memory_kb'] is not None else ''
+            self.stdout.write(
+                f"  {project['project']}: {project['seconds']:.2f}s over {project['syncs']} syncs "
+                f"({project['avg_seconds']:.2f}s avg), {project['queries']} queries, {project['rows']} rows{memory}; "
+                f"slowest stage {project['slowest_stage']}"
+            )
+
+        self.stdout.write(self.style.SUCCESS("Stages:"))
+        for stage in report['stages']:
+            memory = f", peak {stage['peak_memory_kb']} KB" if stage['peak_memory_kb'] is not None else ''
+            self.stdout.write(
+                f"  {stage['stage']:<10} {stage['seconds']:.2f}s total, {stage['avg_seconds']:.3f}s avg, "
+                f"{stage['max_seconds']:.3f}s max, {stage['queries']} queries, {stage['rows']} rows{memory}"
+            )
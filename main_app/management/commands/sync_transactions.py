@@ -1,6 +1,16 @@
-from django.core.management.base import BaseCommand
+import tracemalloc
 
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from main_app.connection_pool import pool_stats
+from main_app.db_guard import breaker_states
+from main_app.models import SyncMetrics
 from main_app.services import TransactionSyncService
+from main_app.sync_leases import SyncLeaseManager
+from main_app.sync_manifest import SyncRunManifest
+from main_app.sync_profiler import ensure_memory_tracing
+from main_app.sync_scheduler import AdaptiveSyncScheduler
 
 
 class Command(BaseCommand):
@@ -28,31 +38,181 @@ class Command(BaseCommand):
             action='store_true',
             help='Disable threading and run sequentially'
         )
+        parser.add_argument(
+            '--incremental',
+            action='store_true',
+            help='Only pull rows changed since the last committed watermarks'
+        )
+        parser.add_argument(
+            '--batched-periods',
+            action='store_true',
+            help='Compute all periods of a project in one grouped query per database'
+        )
+        parser.add_argument(
+            '--asyncio',
+            action='store_true',
+            help='Use the asyncio extraction engine (--threads becomes the global query limit)'
+        )
+        parser.add_argument(
+            '--per-server',
+            type=int,
+            default=None,
+            help='Maximum queries in flight per SQL Server host with --asyncio'
+        )
+        parser.add_argument(
+            '--adaptive',
+            action='store_true',
+            help='Only sync the projects the adaptive scheduler picks (hottest first, within the time budget)'
+        )
+        parser.add_argument(
+            '--time-budget',
+            type=float,
+            default=None,
+            help='Project-seconds of sync work the adaptive scheduler may schedule'
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='Resume the latest interrupted sync run, syncing only its unfinished projects and periods'
+        )
+        parser.add_argument(
+            '--resume-run',
+            type=int,
+            default=None,
+            help='Resume the sync run (SyncMetrics id) with this id'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=None,
+            help='Rows fetched per round-trip when streaming glpost scans'
+        )
+        parser.add_argument(
+            '--profile-memory',
+            action='store_true',
+            help='Record the peak memory of each sync stage (slows the sync down)'
+        )
 
     def handle(self, *args, **options):
-        service = TransactionSyncService()
+        if options['project'] or options['database']:
+            if options['adaptive']:
+                raise CommandError(
+                    '--adaptive schedules every project; it cannot be combined with --project or --database'
+                )
+            if not TransactionSyncService.active_mappings(options['project'], options['database']).exists():
+                raise CommandError('No active database mapping matches --project/--database')
+
+        if options['profile_memory'] and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        else:
+            ensure_memory_tracing()
+
+        interrupted = None
+        if options['resume_run']:
+            try:
+                interrupted = SyncRunManifest(SyncMetrics.objects.get(pk=options['resume_run']))
+            except SyncMetrics.DoesNotExist:
+                raise CommandError(f"Sync run {options['resume_run']} does not exist")
+        elif options['resume']:
+            interrupted = SyncRunManifest.find_interrupted()
+            if interrupted is None:
+                self.stdout.write("No interrupted sync run to resume")
+                return
+
+        # The run every project and period is checkpointed against
+        run = SyncMetrics.objects.create(started_at=timezone.now(), status='running')
+        if interrupted is not None:
+            manifest = interrupted.resume_in(run)
+            self.stdout.write(f"Resuming sync run {interrupted.run.pk}: {manifest.progress()}")
+        else:
+            manifest = SyncRunManifest(run)
+
+        try:
+            # Projects a scheduled run is syncing right now are skipped rather than synced twice
+            with SyncLeaseManager() as leases:
+                results = self.sync(leases, manifest, options)
+        except Exception as e:
+            run.status = 'failed'
+            run.error_message = str(e)
+            run.completed_at = timezone.now()
+            run.save()
+            raise
+
+        run.completed_at = timezone.now()
+        run.execution_time = (run.completed_at - run.started_at).total_seconds()
+        run.successful_count = sum(1 for r in results if r['success'])
+        run.failed_count = sum(1 for r in results if not r['success'] and not r.get('skipped'))
+        run.skipped_count = sum(1 for r in results if r.get('skipped'))
+        run.total_projects = run.successful_count + run.failed_count
+        run.status = 'completed'
+        run.save()
+
+    def sync(self, leases, manifest, options):
+        service = TransactionSyncService(chunk_size=options['chunk_size'], leases=leases, manifest=manifest)
 
         self.stdout.write("Starting sync for all projects...")
         use_threading = not options['no_threading']
 
-        results = service.sync_all_projects(
-            use_threading=use_threading,
-            max_workers=options['threads']
-        )
+        if options['adaptive'] and not (options['resume'] or options['resume_run']):
+            results, decisions = service.sync_adaptive(
+                use_threading=use_threading,
+                max_workers=options['threads'],
+                incremental=options['incremental'],
+                batched_periods=options['batched_periods'],
+                scheduler=AdaptiveSyncScheduler(time_budget_seconds=options['time_budget'])
+            )
+            for decision in decisions:
+                self.stdout.write(
+                    f"  {decision['decision']:<10} {decision['project']} ({decision['database']}): "
+                    f"priority {decision['priority']}, ~{decision['estimated_seconds']}s"
+                )
+        else:
+            results = service.sync_all_projects(
+                use_threading=use_threading,
+                max_workers=options['threads'],
+                incremental=options['incremental'],
+                batched_periods=options['batched_periods'],
+                use_asyncio=options['asyncio'],
+                per_server_limit=options['per_server'],
+                project_name=options['project'],
+                sql_server_db=options['database']
+            )
 
         # Report results
-        successful = sum(1 for r in results if r['success'])
-        failed = len(results) - successful
+        skipped = [r for r in results if r.get('skipped')]
+        synced = [r for r in results if not r.get('skipped')]
+        successful = sum(1 for r in synced if r['success'])
+        failed = len(synced) - successful
 
         self.stdout.write(
             self.style.SUCCESS(f"Sync completed: {successful} successful, {failed} failed")
         )
+        for result in skipped:
+            self.stdout.write(self.style.WARNING(f"  Skipped {result['project']}: {result['error']}"))
+
+        for alias, stats in pool_stats()['pools'].items():
+            self.stdout.write(
+                f"  {alias}: {stats['checkouts']} checkouts, {stats['creations']} connections created, "
+                f"{stats['waits']} waits ({stats['wait_seconds']}s)"
+            )
+        for project_name, stages in service.stage_profiles.items():
+            self.stdout.write(f"  {project_name}: " + ", ".join(
+                f"{name} {stage['seconds']:.2f}s ({stage['total_queries']} queries, {stage['rows']} rows)"
+                for name, stage in stages.items()
+            ))
+        for alias, breaker in breaker_states().items():
+            self.stdout.write(self.style.WARNING(
+                f"  {alias}: circuit {breaker['state']} after {breaker['consecutive_failures']} consecutive failures "
+                f"({breaker['rejected']} calls rejected): {breaker['last_error']}"
+            ))
 
         # Show failed projects
         if failed > 0:
             self.stdout.write("\nFailed projects:")
-            for result in results:
+            for result in synced:
                 if not result['success']:
                     self.stdout.write(
                         self.style.ERROR(f"  - {result['project']} ({result['database']})")
                     )
+
+        return results
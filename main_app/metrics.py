@@ -0,0 +1,281 @@
+"""
+In-process performance metrics, exposed in the Prometheus text format at /metrics.
+
+Counters, gauges and histograms live in one process-wide registry. Updating
+one takes a lock held for a dict update only, so they are safe to bump from
+sync threads and request threads alike. The values are per process: every
+web worker, scheduler and sync process keeps its own and serves only those.
+
+    audit_sync_project_duration_seconds   project sync wall time, by project and sync mode
+    audit_sync_projects_total             project syncs by project, mode and outcome
+    audit_sync_rows_total                 rows read and written by project syncs, by project and stage
+    audit_sync_skipped_total              projects and periods a sync did not run, by reason
+    audit_sync_run_duration_seconds       whole sync runs, by final status
+    audit_db_query_duration_seconds       statement latency by database alias
+    audit_db_query_errors_total           failed statements by database alias
+    audit_dashboard_stats_cache_total     Project.get_stats lookups of ProjectPeriodStats, by result
+    audit_dashboard_stats_cache_hit_ratio share of those lookups served from ProjectPeriodStats
+    audit_http_request_duration_seconds   view latency by URL name, method and status
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _format_labels(names, values):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Metric:
+    """A named metric with fixed label names; values are kept per label combination"""
+
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def samples(self):
+        """(suffix, label names, label values, value) of every series"""
+        with self._lock:
+            values = list(self._values.items())
+        return [('', self.labelnames, key, value) for key, value in sorted(values)]
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for suffix, names, key, value in self.samples():
+            lines.append(f'{self.name}{suffix}{_format_labels(names, key)} {_format_value(value)}')
+        return lines
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Gauge(Metric):
+    """A gauge set by its callers, or computed by function() at scrape time when given"""
+
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), function=None):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def samples(self):
+        if self.function is None:
+            return super().samples()
+        value = self.function()
+        return [] if value is None else [('', (), (), value)]
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                # Per-bucket counts (not cumulative) with a final +Inf bucket, then sum
+                series = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels):
+        with self._lock:
+            series = self._values.get(self._key(labels))
+            return sum(series[:-1]) if series is not None else 0
+
+    def snapshot(self):
+        """{label values: (observations, sum)} of every series"""
+        with self._lock:
+            return {key: (sum(series[:-1]), series[-1]) for key, series in self._values.items()}
+
+    def samples(self):
+        with self._lock:
+            values = [(key, list(series)) for key, series in self._values.items()]
+
+        samples = []
+        bucket_names = self.labelnames + ('le',)
+        for key, series in sorted(values):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series[:-1]):
+                cumulative += count
+                samples.append(('_bucket', bucket_names, key + (_format_value(bound),), cumulative))
+            samples.append(('_sum', self.labelnames, key, series[-1]))
+            samples.append(('_count', self.labelnames, key, cumulative))
+        return samples
+
+
+class MetricsRegistry:
+    """The metrics of this process, rendered in registration order"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def clear(self):
+        """Reset every series; the metrics stay registered"""
+        for metric in list(self._metrics.values()):
+            metric.clear()
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+def counter(name, documentation, labelnames=()):
+    return registry.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name, documentation, labelnames=(), function=None):
+    return registry.register(Gauge(name, documentation, labelnames, function))
+
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return registry.register(Histogram(name, documentation, labelnames, buckets))
+
+
+sync_project_seconds = histogram(
+    'audit_sync_project_duration_seconds', 'Wall time of project syncs.', ('project', 'mode'),
+    buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800),
+)
+sync_projects = counter(
+    'audit_sync_projects_total', 'Project syncs by outcome.', ('project', 'mode', 'result'),
+)
+sync_rows = counter(
+    'audit_sync_rows_total', 'Rows read and written by project syncs.', ('project', 'stage'),
+)
+sync_skipped = counter(
+    'audit_sync_skipped_total', 'Projects and periods a sync left alone.', ('reason',),
+)
+sync_run_seconds = histogram(
+    'audit_sync_run_duration_seconds', 'Wall time of whole sync runs.', ('status',),
+    buckets=(5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600),
+)
+query_seconds = histogram(
+    'audit_db_query_duration_seconds', 'Statement latency by database alias.', ('alias',),
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 120),
+)
+query_errors = counter(
+    'audit_db_query_errors_total', 'Statements that raised, by database alias.', ('alias',),
+)
+stats_cache = counter(
+    'audit_dashboard_stats_cache_total',
+    'Project.get_stats lookups of ProjectPeriodStats: hit, stale (older than an hour), miss, '
+    'or uncached (no single period requested).', ('result',),
+)
+
+
+def _stats_cache_hit_ratio():
+    hits = stats_cache.value(result='hit')
+    lookups = hits + stats_cache.value(result='stale') + stats_cache.value(result='miss')
+    return hits / lookups if lookups else None
+
+
+stats_cache_hit_ratio = gauge(
+    'audit_dashboard_stats_cache_hit_ratio',
+    'Share of single-period dashboard stats lookups served from ProjectPeriodStats.', function=_stats_cache_hit_ratio,
+)
+request_seconds = histogram(
+    'audit_http_request_duration_seconds', 'View latency by URL name.', ('view', 'method', 'status'),
+)
+
+
+class QueryTimer:
+    """Django execute wrapper timing every statement of its connection into query_seconds"""
+
+    def __init__(self, alias):
+        self.alias = alias
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        except Exception:
+            query_errors.inc(alias=self.alias)
+            raise
+        finally:
+            query_seconds.observe(time.perf_counter() - started, alias=self.alias)
+
+
+def install_query_timer(sender, connection, **kwargs):
+    """connection_created receiver: time the connection's statements, once per DatabaseWrapper"""
+    if any(isinstance(wrapper, QueryTimer) for wrapper in connection.execute_wrappers):
+        return
+    # First, so it is the outermost wrapper and the execute_wrapper() blocks
+    # that may be open on the connection still pop their own wrapper
+    connection.execute_wrappers.insert(0, QueryTimer(connection.alias))
@@ -0,0 +1,26 @@
+import time
+
+from .metrics import request_seconds
+
+
+class RequestMetricsMiddleware:
+    """Time every request into audit_http_request_duration_seconds, labelled with its URL name"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        status = 500
+        try:
+            response = self.get_response(request)
+            status = response.status_code
+            return response
+        finally:
+            match = request.resolver_match
+            request_seconds.observe(
+                time.perf_counter() - started,
+                view=match.view_name if match is not None else 'unresolved',
+                method=request.method,
+                status=status,
+            )
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0004_delete_fiscalperiodfilter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('table_name', models.CharField(choices=[('glpost', 'GLPOST'), ('ENPJD', 'ENPJD'), ('ENEBA', 'ENEBA')], max_length=20)),
+                ('audtdate', models.DecimalField(decimal_places=0, default=0, max_digits=9)),
+                ('audttime', models.DecimalField(decimal_places=0, default=0, max_digits=9)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='main_app.project')),
+            ],
+            options={
+                'db_table': 'sync_watermarks',
+                'unique_together': {('project', 'table_name')},
+            },
+        ),
+    ]
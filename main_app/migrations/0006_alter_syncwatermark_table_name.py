@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0005_syncwatermark'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='syncwatermark',
+            name='table_name',
+            field=models.CharField(choices=[('glpost', 'GLPOST'), ('ENPJD', 'ENPJD'), ('ENEBA', 'ENEBA'), ('glpost_replica', 'GLPOST replica')], max_length=20),
+        ),
+    ]
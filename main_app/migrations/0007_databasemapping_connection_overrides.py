@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:40
+
+from django.db import migrations, models
+
+# Aliases whose database name differed from the alias in the former hardcoded DATABASES
+DATABASE_NAMES = {
+    'DAPDAT': 'INFDAT',
+    '290A2C': '280DOD',
+}
+
+
+def set_database_names(apps, schema_editor):
+    DatabaseMapping = apps.get_model('main_app', 'DatabaseMapping')
+    for alias, database_name in DATABASE_NAMES.items():
+        DatabaseMapping.objects.filter(sql_server_db=alias, database_name='').update(database_name=database_name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0006_alter_syncwatermark_table_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='databasemapping',
+            name='database_name',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='databasemapping',
+            name='host',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='databasemapping',
+            name='port',
+            field=models.CharField(blank=True, default='', max_length=10),
+        ),
+        migrations.RunPython(set_database_names, migrations.RunPython.noop),
+    ]
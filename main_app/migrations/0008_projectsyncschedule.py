@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0007_databasemapping_connection_overrides'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='syncmetrics',
+            name='deferred_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='syncmetrics',
+            name='schedule',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='syncmetrics',
+            name='scheduled_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='ProjectSyncSchedule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('priority', models.FloatField(default=0)),
+                ('change_rate', models.FloatField(default=0)),
+                ('avg_sync_seconds', models.FloatField(blank=True, null=True)),
+                ('last_change_count', models.IntegerField(blank=True, null=True)),
+                ('idle_streak', models.IntegerField(default=0)),
+                ('last_synced_at', models.DateTimeField(blank=True, null=True)),
+                ('next_due_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('mapping', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='sync_schedule', to='main_app.databasemapping')),
+            ],
+            options={
+                'db_table': 'project_sync_schedules',
+                'ordering': ['-priority'],
+            },
+        ),
+    ]
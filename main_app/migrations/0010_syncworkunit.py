@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0009_synclease'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='syncmetrics',
+            name='resumed_from',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='resumed_by', to='main_app.syncmetrics'),
+        ),
+        migrations.CreateModel(
+            name='SyncWorkUnit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('project_name', models.CharField(max_length=255)),
+                ('sql_server_db', models.CharField(max_length=100)),
+                ('fiscal_year', models.CharField(blank=True, default='', max_length=4)),
+                ('fiscal_period', models.CharField(blank=True, default='', max_length=2)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('attempts', models.IntegerField(default=0)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('error_message', models.TextField(blank=True, null=True)),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='work_units', to='main_app.syncmetrics')),
+            ],
+            options={
+                'db_table': 'sync_work_units',
+                'indexes': [models.Index(fields=['run', 'status'], name='sync_work_u_run_id_7af20b_idx')],
+                'unique_together': {('run', 'project_name', 'fiscal_year', 'fiscal_period')},
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0010_syncworkunit'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='synclog',
+            name='periods_skipped',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='ProjectPeriodFingerprint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fiscal_year', models.CharField(max_length=4)),
+                ('fiscal_period', models.CharField(max_length=2)),
+                ('gl_row_count', models.IntegerField(default=0)),
+                ('gl_amount_sum', models.DecimalField(decimal_places=3, default=0, max_digits=19)),
+                ('gl_checksum', models.BigIntegerField(blank=True, null=True)),
+                ('gl_last_audit', models.DecimalField(blank=True, decimal_places=0, max_digits=18, null=True)),
+                ('supported_count', models.IntegerField(default=0)),
+                ('supported_value', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('supported_updated_at', models.DateTimeField(blank=True, null=True)),
+                ('calculated_at', models.DateTimeField(auto_now=True)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='main_app.project')),
+            ],
+            options={
+                'db_table': 'project_period_fingerprints',
+                'unique_together': {('project', 'fiscal_year', 'fiscal_period')},
+            },
+        ),
+    ]
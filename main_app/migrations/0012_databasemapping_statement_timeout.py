@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0011_projectperiodfingerprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='databasemapping',
+            name='statement_timeout',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
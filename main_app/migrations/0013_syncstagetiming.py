@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0012_databasemapping_statement_timeout'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncStageTiming',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stage', models.CharField(max_length=20)),
+                ('seconds', models.FloatField()),
+                ('calls', models.IntegerField(default=0)),
+                ('queries', models.IntegerField(default=0)),
+                ('query_counts', models.JSONField(default=dict)),
+                ('rows', models.IntegerField(default=0)),
+                ('peak_memory_kb', models.IntegerField(blank=True, null=True)),
+                ('recorded_at', models.DateTimeField(auto_now_add=True)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='main_app.project')),
+                ('run', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stage_timings', to='main_app.syncmetrics')),
+                ('sync_log', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stage_timings', to='main_app.synclog')),
+            ],
+            options={
+                'db_table': 'sync_stage_timings',
+                'indexes': [models.Index(fields=['recorded_at', 'stage'], name='sync_stage__recorde_7449ae_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0013_syncstagetiming'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='projectsyncschedule',
+            name='failure_streak',
+            field=models.IntegerField(default=0),
+        ),
+    ]
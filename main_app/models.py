@@ -2,8 +2,12 @@ from decimal import Decimal
 
 from django.db import models, connections
 from django.contrib.auth.models import AbstractUser
-from django.db.models import Sum
+from django.db.models import Count, Exists, OuterRef, Sum
 import logging
+
+from audit_management_system.settings import SYNC_CONFIG
+from main_app.db_guard import CancellationToken, cancellation_scope, guard_config, is_available
+from main_app.metrics import stats_cache
 logger = logging.getLogger(__name__)
 
 class CustomUser(AbstractUser):
@@ -34,6 +38,13 @@ class SyncMetrics(models.Model):
         ('failed', 'Failed'),
         ('skipped', 'Skipped'),
     ], default='running')
+    skipped_count = models.IntegerField(default=0)  # Projects left to a concurrent run holding their lease
+    # Interrupted run whose unfinished work units this run picked up
+    resumed_from = models.ForeignKey('self', null=True, blank=True, on_delete=models.SET_NULL, related_name='resumed_by')
+    # Adaptive scheduling: projects synced this run, and those left for a later run
+    scheduled_count = models.IntegerField(default=0)
+    deferred_count = models.IntegerField(default=0)
+    schedule = models.JSONField(null=True, blank=True)  # [{project, database, priority, decision}]
 
     class Meta:
         ordering = ['-started_at']
@@ -77,15 +88,21 @@ class Project(models.Model):
                 # Use cached stats if they're recent (within last hour)
                 from django.utils import timezone
                 if (timezone.now() - cached_stats.last_calculated).seconds < 3600:
+                    stats_cache.inc(result='hit')
                     return {
                         'supported_count': cached_stats.supported_transactions_number,
                         'unsupported_count': cached_stats.unsupported_transactions_number,
                         'supported_value': cached_stats.supported_transactions_value,
                         'unsupported_value': cached_stats.unsupported_transactions_value,
                         'total_count': cached_stats.supported_transactions_number + cached_stats.unsupported_transactions_number,
+                        'unavailable': False,
                     }
+                stats_cache.inc(result='stale')
             except ProjectPeriodStats.DoesNotExist:
-                pass
+                stats_cache.inc(result='miss')
+        else:
+            # Stats across periods are not kept in ProjectPeriodStats
+            stats_cache.inc(result='uncached')
 
         # Fall back to real-time calculation using the same logic as sync function
         return self._calculate_real_time_stats(fiscal_year, fiscal_period)
@@ -115,6 +132,10 @@ class Project(models.Model):
         unsupported_count, unsupported_value = self._get_unsupported_stats(
             fiscal_year, fiscal_period, supporting_docs_filter
         )
+        # Sage could not be read: the unsupported figures count as zero but are flagged, not passed off as valid
+        unavailable = unsupported_count is None
+        if unavailable:
+            unsupported_count, unsupported_value = 0, Decimal('0')
 
         return {
             'supported_count': supported_count,
@@ -122,10 +143,14 @@ class Project(models.Model):
             'supported_value': supported_value,
             'unsupported_value': unsupported_value,
             'total_count': supported_count + unsupported_count,
+            'unavailable': unavailable,
         }
 
     def _get_unsupported_stats(self, fiscal_year, fiscal_period, supporting_docs_filter):
-        """Get unsupported transaction stats from glpost table using composite keys - Raw SQL version"""
+        """Get unsupported transaction stats from glpost table using composite keys - Raw SQL version
+
+        Returns (None, None) when the Sage database is unavailable or the query fails.
+        """
         try:
             # Get the database mapping for this project
             from .models import DatabaseMapping  # Adjust import as needed
@@ -138,6 +163,17 @@ class Project(models.Model):
             # If no mapping found, return zeros
             return 0, Decimal('0')
 
+        if SYNC_CONFIG.get('READ_FROM_REPLICA', False):
+            return self._get_unsupported_stats_from_replica(
+                sql_server_db, fiscal_year, fiscal_period, supporting_docs_filter
+            )
+
+        # A database whose circuit is open would only hold the request up
+        if not is_available(sql_server_db):
+            logger.warning(f"Skipping unsupported stats for project {self.project_name}: "
+                           f"database {sql_server_db} is unavailable")
+            return None, None
+
         # Get list of supported batch/entry pairs for exclusion (composite keys)
         from transactions.models import SupportingDocument  # Adjust import as needed
         supported_batch_entry_pairs = list(
@@ -159,100 +195,96 @@ class Project(models.Model):
             base_conditions.append("FISCALPERD = %s")
             base_params.append(fiscal_period)
 
-        # Exclude supported batch-entry combinations using composite key
+        where_clause = " AND ".join(base_conditions)
+
+        # Exclude supported batch-entry combinations with an anti-join on a session temp table,
+        # so the statement text stays the same whatever the number of supported pairs
+        exclusion_clause = ""
         if supported_batch_entry_pairs:
-            # For large datasets, use LEFT JOIN with VALUES for better performance
-            if len(supported_batch_entry_pairs) > 100:
-                # Create VALUES clause for supported pairs
-                values_list = []
-                for batch_nbr, entry_nbr in supported_batch_entry_pairs:
-                    values_list.append(f"({batch_nbr}, {entry_nbr})")
-
-                supported_pairs_values = "VALUES " + ", ".join(values_list)
-
-                where_clause = " AND ".join(base_conditions)
-
-                # Modified queries using LEFT JOIN for exclusion
-                unsupported_count_query = f"""
-                    SELECT COUNT(*)
-                    FROM (
-                        SELECT DISTINCT g.BATCHNBR, g.ENTRYNBR
-                        FROM [{company_id}].dbo.glpost g
-                        LEFT JOIN ({supported_pairs_values}) AS supported(batch_val, entry_val)
-                            ON g.BATCHNBR = supported.batch_val AND g.ENTRYNBR = supported.entry_val
-                        WHERE {where_clause} AND supported.batch_val IS NULL AND SRCELEDGER='EN' AND SRCETYPE='EV'
-                    ) AS distinct_combinations
-                """
-
-                unsupported_value_query = f"""
-                    SELECT COALESCE(SUM(g.transamt), 0)
-                    FROM [{company_id}].dbo.glpost g
-                    LEFT JOIN ({supported_pairs_values}) AS supported(batch_val, entry_val)
-                        ON g.BATCHNBR = supported.batch_val AND g.ENTRYNBR = supported.entry_val
-                    WHERE {where_clause} AND supported.batch_val IS NULL AND SRCELEDGER='EN' AND SRCETYPE='EV'
-                """
-            else:
-                # For smaller datasets, use NOT EXISTS or OR conditions
-                composite_conditions = []
-                for batch_nbr, entry_nbr in supported_batch_entry_pairs:
-                    composite_conditions.append("(BATCHNBR = %s AND ENTRYNBR = %s)")
-                    base_params.extend([batch_nbr, entry_nbr])
-
-                # Combine all conditions with OR and wrap with NOT
-                exclusion_clause = "NOT (" + " OR ".join(composite_conditions) + ")"
-                base_conditions.append(exclusion_clause)
-
-                where_clause = " AND ".join(base_conditions)
-
-                unsupported_count_query = f"""
-                    SELECT COUNT(*)
-                    FROM (
-                        SELECT DISTINCT BATCHNBR, ENTRYNBR
-                        FROM [{company_id}].dbo.glpost
-                        WHERE {where_clause} AND SRCELEDGER='EN' AND SRCETYPE='EV'
-                    ) AS distinct_combinations
-                """
-
-                unsupported_value_query = f"""
-                    SELECT COALESCE(SUM(transamt), 0)
-                    FROM [{company_id}].dbo.glpost
-                    WHERE {where_clause} AND SRCELEDGER='EN' AND SRCETYPE='EV'
-                """
-        else:
-            # No supported pairs - all transactions are unsupported
-            where_clause = " AND ".join(base_conditions)
-
-            unsupported_count_query = f"""
-                SELECT COUNT(*)
-                FROM (
-                    SELECT DISTINCT BATCHNBR, ENTRYNBR
-                    FROM [{company_id}].dbo.glpost
-                    WHERE {where_clause} AND SRCELEDGER='EN' AND SRCETYPE='EV'
-                ) AS distinct_combinations
-            """
-
-            unsupported_value_query = f"""
-                SELECT COALESCE(SUM(transamt), 0)
-                FROM [{company_id}].dbo.glpost
-                WHERE {where_clause} AND SRCELEDGER='EN' AND SRCETYPE='EV'
-            """
+            exclusion_clause = """
+                AND NOT EXISTS (
+                    SELECT 1 FROM #supported_pairs s
+                    WHERE s.BATCHNBR = g.BATCHNBR AND s.ENTRYNBR = g.ENTRYNBR
+                )"""
+
+        # Count and value of the unsupported batch-entry combinations in one pass
+        unsupported_stats_query = f"""
+            SELECT COUNT(*), COALESCE(SUM(entry_total), 0)
+            FROM (
+                SELECT g.BATCHNBR, g.ENTRYNBR, SUM(g.transamt) AS entry_total
+                FROM [{company_id}].dbo.glpost g
+                WHERE {where_clause} AND SRCELEDGER='EN' AND SRCETYPE='EV'{exclusion_clause}
+                GROUP BY g.BATCHNBR, g.ENTRYNBR
+            ) AS unsupported_combinations
+        """
 
         try:
             connection = connections[sql_server_db]
-            with connection.cursor() as cursor:
-                # Execute count query
-                cursor.execute(unsupported_count_query, base_params)
-                unsupported_count = cursor.fetchone()[0] or 0
-
-                # Execute value query
-                cursor.execute(unsupported_value_query, base_params)
-                unsupported_value = Decimal(str(cursor.fetchone()[0] or 0))
-
-            return unsupported_count, unsupported_value
+            request_timeout = guard_config(connection.settings_dict)['REQUEST_TIMEOUT_SECONDS']
+            with cancellation_scope(CancellationToken(request_timeout)), connection.cursor() as cursor:
+                if supported_batch_entry_pairs:
+                    self._load_supported_pairs(cursor, company_id, supported_batch_entry_pairs)
+                try:
+                    cursor.execute(unsupported_stats_query, base_params)
+                    unsupported_count, unsupported_value = cursor.fetchone()
+                finally:
+                    if supported_batch_entry_pairs:
+                        cursor.execute("DROP TABLE #supported_pairs")
+
+            return unsupported_count or 0, Decimal(str(unsupported_value or 0))
 
         except Exception as e:
             logger.error(f"Error calculating unsupported stats for project {self.project_name}: {str(e)}")
-            return 0, Decimal('0')
+            return None, None
+
+    def _get_unsupported_stats_from_replica(self, sql_server_db, fiscal_year, fiscal_period, supporting_docs_filter):
+        """Get unsupported transaction stats from the local glpost replica, anti-joined in MySQL"""
+        from transactions.models import GlpostReplica, SupportingDocument  # Adjust import as needed
+        supported_docs = SupportingDocument.objects.filter(
+            **supporting_docs_filter,
+            supported=True,
+            batchnbr=OuterRef('batchnbr'),
+            entrynbr=OuterRef('entrynbr')
+        )
+
+        gl_queryset = GlpostReplica.objects.filter(
+            source_db=sql_server_db,
+            companyid=sql_server_db,
+            transamt__gt=0, srceledger='EN', srcetype='EV'
+        )
+        if fiscal_year:
+            gl_queryset = gl_queryset.filter(fiscalyr=fiscal_year)
+        if fiscal_period:
+            gl_queryset = gl_queryset.filter(fiscalperd=fiscal_period)
+
+        # Count and value of the unsupported batch-entry combinations in one query
+        totals = gl_queryset.exclude(Exists(supported_docs)).values('batchnbr', 'entrynbr').annotate(
+            entry_total=Sum('transamt')
+        ).aggregate(count=Count('batchnbr'), total=Sum('entry_total'))
+
+        return totals['count'] or 0, Decimal(str(totals['total'] or 0))
+
+    @staticmethod
+    def _load_supported_pairs(cursor, company_id, supported_batch_entry_pairs):
+        """Bulk-load supported (batchnbr, entrynbr) pairs into the #supported_pairs session temp table"""
+        # Copy the glpost column types and collation so the anti-join compares like with like
+        cursor.execute(
+            "IF OBJECT_ID('tempdb..#supported_pairs') IS NOT NULL DROP TABLE #supported_pairs"
+        )
+        cursor.execute(
+            f"SELECT TOP 0 BATCHNBR, ENTRYNBR INTO #supported_pairs FROM [{company_id}].dbo.glpost"
+        )
+
+        # SQL Server allows 1000 rows per VALUES list and 2100 parameters per statement
+        chunk_size = 1000
+        for start in range(0, len(supported_batch_entry_pairs), chunk_size):
+            chunk = supported_batch_entry_pairs[start:start + chunk_size]
+            placeholders = ", ".join(["(%s, %s)"] * len(chunk))
+            params = [value for pair in chunk for value in pair]
+            cursor.execute(f"INSERT INTO #supported_pairs (BATCHNBR, ENTRYNBR) VALUES {placeholders}", params)
+
+        cursor.execute("CREATE CLUSTERED INDEX ix_supported_pairs ON #supported_pairs (BATCHNBR, ENTRYNBR)")
+
     @property
     def supported_transactions_number(self):
         """Get number of supported transactions across all periods"""
@@ -286,6 +318,32 @@ class ProjectPeriodStats(models.Model):
         ]
 
 
+class ProjectPeriodFingerprint(models.Model):
+    """
+    Fingerprint of the inputs of one ProjectPeriodStats row, taken when it was last calculated.
+
+    The gl_* fields summarise the period's glpost rows on SQL Server and the
+    supported_* fields its supported SupportingDocuments; while both are
+    unchanged the period's stats cannot have changed and its recalculation is
+    skipped.
+    """
+    class Meta:
+        db_table = 'project_period_fingerprints'
+        unique_together = ['project', 'fiscal_year', 'fiscal_period']
+
+    project = models.ForeignKey(Project, on_delete=models.CASCADE)
+    fiscal_year = models.CharField(max_length=4)
+    fiscal_period = models.CharField(max_length=2)
+    gl_row_count = models.IntegerField(default=0)
+    gl_amount_sum = models.DecimalField(max_digits=19, decimal_places=3, default=0)
+    gl_checksum = models.BigIntegerField(null=True, blank=True)  # CHECKSUM_AGG over the glpost keys
+    gl_last_audit = models.DecimalField(max_digits=18, decimal_places=0, null=True, blank=True)  # AUDTDATE * 10^8 + AUDTTIME (HHMMSSss)
+    supported_count = models.IntegerField(default=0)
+    supported_value = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    supported_updated_at = models.DateTimeField(null=True, blank=True)
+    calculated_at = models.DateTimeField(auto_now=True)
+
+
 class SyncLog(models.Model):
     class Meta:
         db_table = 'sync_logs'
@@ -299,19 +357,160 @@ class SyncLog(models.Model):
         ('failed', 'Failed')
     ])
     records_processed = models.IntegerField(default=0)
+    periods_skipped = models.IntegerField(default=0)  # Periods whose fingerprint had not changed
     error_message = models.TextField(null=True, blank=True)
 
     def __str__(self):
         return f"{self.project.project_name} - {self.sync_started}"
 
 
+class SyncStageTiming(models.Model):
+    """
+    Time, queries, rows and peak memory of one stage of one project sync
+    (see main_app/sync_profiler.py).
+
+    Stage times are exclusive, so the stages of a sync add up to its duration.
+    """
+    class Meta:
+        db_table = 'sync_stage_timings'
+        indexes = [models.Index(fields=['recorded_at', 'stage'])]
+
+    sync_log = models.ForeignKey(SyncLog, on_delete=models.CASCADE, related_name='stage_timings')
+    run = models.ForeignKey(SyncMetrics, null=True, blank=True, on_delete=models.SET_NULL, related_name='stage_timings')
+    project = models.ForeignKey(Project, on_delete=models.CASCADE)
+    stage = models.CharField(max_length=20)  # extract, transform, load, stats or other
+    seconds = models.FloatField()
+    calls = models.IntegerField(default=0)  # Times the stage was entered
+    queries = models.IntegerField(default=0)
+    query_counts = models.JSONField(default=dict)  # {alias: queries}
+    rows = models.IntegerField(default=0)
+    peak_memory_kb = models.IntegerField(null=True, blank=True)  # Only recorded with PROFILE_MEMORY on
+    recorded_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.project_id} {self.stage}: {self.seconds:.3f}s"
+
+
+class SyncWatermark(models.Model):
+    """
+    Highest Sage AUDTDATE/AUDTTIME already loaded for one project table.
+    Advanced in the same transaction as the load it covers.
+    """
+    class Meta:
+        db_table = 'sync_watermarks'
+        unique_together = ['project', 'table_name']
+
+    project = models.ForeignKey(Project, on_delete=models.CASCADE)
+    table_name = models.CharField(max_length=20, choices=[
+        ('glpost', 'GLPOST'),
+        ('ENPJD', 'ENPJD'),
+        ('ENEBA', 'ENEBA'),
+        ('glpost_replica', 'GLPOST replica'),
+    ])
+    audtdate = models.DecimalField(max_digits=9, decimal_places=0, default=0)
+    audttime = models.DecimalField(max_digits=9, decimal_places=0, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.project.project_name} - {self.table_name} @ {self.audtdate}/{self.audttime}"
+
+
 class DatabaseMapping(models.Model):
     class Meta:
         db_table = 'database_mappings'
 
     project_name = models.CharField(max_length=255)
-    sql_server_db = models.CharField(max_length=100)
+    sql_server_db = models.CharField(max_length=100)  # Database alias, also the Sage company ID
+    # Connection overrides for the alias; blank values fall back to SAGE_DATABASE_DEFAULTS
+    database_name = models.CharField(max_length=100, blank=True, default='')  # Defaults to sql_server_db
+    host = models.CharField(max_length=255, blank=True, default='')
+    port = models.CharField(max_length=10, blank=True, default='')
+    statement_timeout = models.PositiveIntegerField(null=True, blank=True)  # Seconds; defaults to DB_GUARD_CONFIG
     is_active = models.BooleanField(default=True)
 
     def __str__(self):
         return f"{self.project_name} -> {self.sql_server_db}"
+
+
+class ProjectSyncSchedule(models.Model):
+    """
+    Adaptive scheduling state of one project (see main_app/sync_scheduler.py).
+
+    change_rate and avg_sync_seconds are exponentially weighted averages over
+    past syncs; idle_streak counts consecutive syncs that found no Sage changes
+    and failure_streak consecutive failed syncs, and both drive the back-off of
+    next_due_at.
+    """
+    class Meta:
+        db_table = 'project_sync_schedules'
+        ordering = ['-priority']
+
+    mapping = models.OneToOneField(DatabaseMapping, on_delete=models.CASCADE, related_name='sync_schedule')
+    priority = models.FloatField(default=0)
+    change_rate = models.FloatField(default=0)  # Changed Sage rows per hour
+    avg_sync_seconds = models.FloatField(null=True, blank=True)
+    last_change_count = models.IntegerField(null=True, blank=True)
+    idle_streak = models.IntegerField(default=0)
+    failure_streak = models.IntegerField(default=0)
+    last_synced_at = models.DateTimeField(null=True, blank=True)
+    next_due_at = models.DateTimeField(null=True, blank=True)  # None = due now
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.mapping.project_name} (priority {self.priority:.2f})"
+
+
+class SyncLease(models.Model):
+    """
+    Time-limited claim of one sync run on a unit of work, usually a project.
+
+    A lease is free once expires_at has passed, so a crashed worker never blocks
+    the project for longer than one lease TTL; live holders renew it (see
+    main_app/sync_leases.py).
+    """
+    class Meta:
+        db_table = 'sync_leases'
+
+    key = models.CharField(max_length=255, unique=True)
+    owner = models.CharField(max_length=100, blank=True, default='')  # host:pid:run of the holder
+    acquired_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.key} -> {self.owner or 'free'} until {self.expires_at}"
+
+
+class SyncWorkUnit(models.Model):
+    """
+    One unit of work in a sync run's manifest: a project, or one fiscal period of
+    a project (fiscal_year and fiscal_period blank for the project itself).
+
+    A run that dies leaves its unfinished units behind, so the next run can resume
+    it instead of starting over (see main_app/sync_manifest.py).
+    """
+    class Meta:
+        db_table = 'sync_work_units'
+        unique_together = ['run', 'project_name', 'fiscal_year', 'fiscal_period']
+        indexes = [
+            models.Index(fields=['run', 'status']),
+        ]
+
+    run = models.ForeignKey(SyncMetrics, on_delete=models.CASCADE, related_name='work_units')
+    project_name = models.CharField(max_length=255)
+    sql_server_db = models.CharField(max_length=100)
+    fiscal_year = models.CharField(max_length=4, blank=True, default='')
+    fiscal_period = models.CharField(max_length=2, blank=True, default='')
+    status = models.CharField(max_length=20, choices=[
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ], default='pending')
+    attempts = models.IntegerField(default=0)
+    started_at = models.DateTimeField(null=True, blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    error_message = models.TextField(null=True, blank=True)
+
+    def __str__(self):
+        period = f" FY {self.fiscal_year} P {self.fiscal_period}" if self.fiscal_year else ''
+        return f"Run {self.run_id}: {self.project_name}{period} ({self.status})"
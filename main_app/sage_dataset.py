@@ -0,0 +1,323 @@
+"""
+Synthetic Sage 300 companies for measuring syncs without a Sage server.
+
+SageDatasetGenerator writes glpost, ENPJD and ENEBA tables shaped like a Sage
+300 expense company into one SQLite file per company, and registers each
+company as a Project with a DatabaseMapping whose database_name is the file,
+so the syncs resolve it like any other company. It is meant to run under
+audit_management_system.settings_benchmark.
+
+Each company's glpost holds about `rows` lines spread over `years` fiscal years:
+
+    - balanced journal entries, 20 to a batch: 1-3 debit lines and one credit line
+    - EXPENSE_SHARE of the entries are EN/EV expense postings with a document
+      reference in JNLDTLREF; the others are GL/JE journals the syncs skip
+    - ENPJD_SHARE of the expense documents have ENPJD lines, 1-3 items each
+    - attachment_ratio of the ENPJD items have 1-3 ENEBA attachments
+    - note_ratio of the ENPJD items carry a note on an ENEBA row
+
+The data is derived from the seed alone, so the same parameters always give
+the same companies.
+"""
+import json
+import logging
+import os
+import random
+import time
+from decimal import Decimal
+from pathlib import Path
+
+from django.db import connections, models, transaction
+from django.utils import timezone
+
+from main_app.models import CustomUser, DatabaseMapping, Project
+from transactions.models import Eneba, Enpjd, Glpost
+
+logger = logging.getLogger(__name__)
+
+EXPENSE_ACCOUNTS = ('6010', '6020', '6110', '6150', '6200', '6310', '6420', '6500')
+GL_ACCOUNTS = ('1100', '1200', '4000', '4100', '5000')
+CREDIT_ACCOUNT = '2100'
+DEPARTMENTS = ('100', '200', '300', '400')
+DESCRIPTIONS = (
+    'Fuel', 'Per diem', 'Air ticket', 'Accommodation', 'Stationery', 'Vehicle service',
+    'Airtime', 'Workshop venue', 'Consultancy fees', 'Courier',
+)
+NOTES = (
+    'Receipt attached', 'Approved by project manager', 'Awaiting original invoice',
+    'Partial payment', 'Reallocated from admin budget', 'Query raised with finance',
+)
+
+
+class _TableWriter:
+    """Buffered executemany inserts of whole rows into one Sage table"""
+
+    def __init__(self, connection, model, chunk_size, **constants):
+        fields = model._meta.local_concrete_fields
+        self.names = [field.name for field in fields]
+        self.defaults = {
+            field.name: '' if isinstance(field, models.CharField) else 0
+            for field in fields
+        }
+        self.defaults.update(constants)
+        quote = connection.ops.quote_name
+        self.sql = (
+            f'INSERT INTO {quote(model._meta.db_table)} ({", ".join(quote(field.column) for field in fields)}) '
+            f'VALUES ({", ".join(["%s"] * len(fields))})'
+        )
+        self.connection = connection
+        self.chunk_size = chunk_size
+        self.count = 0
+        self._pending = []
+
+    def __len__(self):
+        return self.count + len(self._pending)
+
+    def add(self, **values):
+        row = {**self.defaults, **values}
+        self._pending.append([row[name] for name in self.names])
+        if len(self._pending) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self._pending:
+            with self.connection.cursor() as cursor:
+                cursor.executemany(self.sql, self._pending)
+            self.count += len(self._pending)
+            self._pending = []
+
+
+class SageDatasetGenerator:
+    """Generate synthetic Sage companies as SQLite files and register them as projects"""
+
+    EXPENSE_SHARE = 0.7
+    ENPJD_SHARE = 0.95
+    ENTRIES_PER_BATCH = 20
+    INSERT_CHUNK_SIZE = 5000
+    MANIFEST_NAME = 'dataset.json'
+
+    # Sage indexes the syncs' lookups rely on, besides the primary keys
+    INDEXES = {
+        Glpost: (('fiscalyr', 'fiscalperd'), ('jnldtlref',), ('audtdate', 'audttime')),
+        Enpjd: (('iddoc',), ('cntbtch', 'cntitem')),
+        Eneba: (('audtdate', 'audttime'),),
+    }
+
+    def __init__(self, data_dir, rows=10000, companies=1, years=2, attachment_ratio=0.8, note_ratio=0.3,
+                 seed=42, first_year=2024):
+        self.data_dir = Path(data_dir)
+        self.rows = rows
+        self.companies = companies
+        self.years = years
+        self.attachment_ratio = attachment_ratio
+        self.note_ratio = note_ratio
+        self.seed = seed
+        self.first_year = first_year
+
+    @staticmethod
+    def company_alias(index):
+        # Also the Sage company ID, which is at most 8 characters
+        return f'BENCH{index:03d}'
+
+    @staticmethod
+    def project_name(index):
+        return f'Benchmark {index:03d}'
+
+    def generate(self):
+        """
+        Write every company and register it; previously generated companies are replaced.
+
+        Returns:
+            The dataset manifest: the parameters and the row counts of each company
+        """
+        os.makedirs(self.data_dir, exist_ok=True)
+        CustomUser.objects.get_or_create(username='sysadmin')
+
+        started = time.perf_counter()
+        companies = []
+        for index in range(1, self.companies + 1):
+            companies.append(self.generate_company(index))
+
+        # Companies of an earlier, larger dataset
+        for mapping in DatabaseMapping.objects.filter(sql_server_db__startswith='BENCH', is_active=True).exclude(
+                sql_server_db__in=[company['alias'] for company in companies]):
+            mapping.is_active = False
+            mapping.save()
+
+        manifest = {
+            'rows': self.rows,
+            'companies': self.companies,
+            'years': self.years,
+            'attachment_ratio': self.attachment_ratio,
+            'note_ratio': self.note_ratio,
+            'seed': self.seed,
+            'generated_at': timezone.now().isoformat(),
+            'seconds': round(time.perf_counter() - started, 2),
+            'company_counts': companies,
+        }
+        with open(self.data_dir / self.MANIFEST_NAME, 'w') as manifest_file:
+            json.dump(manifest, manifest_file, indent=2)
+        return manifest
+
+    def generate_company(self, index):
+        """Write one company's SQLite file and register its project and mapping"""
+        alias = self.company_alias(index)
+        path = self.data_dir / f'{alias.lower()}.sqlite3'
+
+        # Saving the mapping forgets any connection to a previous file of this company
+        project, _ = Project.objects.get_or_create(
+            project_name=self.project_name(index),
+            defaults={'description': f'Synthetic Sage company {alias}'}
+        )
+        mapping, _ = DatabaseMapping.objects.get_or_create(project_name=project.project_name, sql_server_db=alias)
+        if path.exists():
+            os.remove(path)
+        mapping.database_name = str(path)
+        mapping.is_active = True
+        mapping.save()
+
+        connection = connections[alias]
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode = MEMORY')
+            cursor.execute('PRAGMA synchronous = OFF')
+        self._create_tables(connection)
+
+        started = time.perf_counter()
+        with transaction.atomic(using=alias):
+            counts = self._write_company(connection, alias, random.Random(f'{self.seed}-{index}'))
+        connection.close()
+
+        logger.info(
+            f"Generated {alias}: {counts['glpost']} glpost, {counts['enpjd']} ENPJD, {counts['eneba']} ENEBA rows "
+            f"in {time.perf_counter() - started:.1f}s"
+        )
+        return {'alias': alias, 'project': project.project_name, 'path': str(path), **counts}
+
+    def _create_tables(self, connection):
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            for model in (Glpost, Enpjd, Eneba):
+                table = model._meta.db_table
+                columns = [
+                    f'{quote(field.column)} {field.db_type(connection)} NOT NULL'
+                    for field in model._meta.local_concrete_fields
+                ]
+                # The models name a single primary key column; the Sage tables' keys are composite
+                key = [model._meta.get_field(name).column for name in model._meta.unique_together[0]]
+                columns.append(f'PRIMARY KEY ({", ".join(quote(column) for column in key)})')
+                cursor.execute(f'CREATE TABLE {quote(table)} ({", ".join(columns)})')
+
+                for number, fields in enumerate(self.INDEXES[model], start=1):
+                    index_columns = ', '.join(quote(model._meta.get_field(name).column) for name in fields)
+                    cursor.execute(f'CREATE INDEX {quote(f"{table}_bench_{number}")} ON {quote(table)} ({index_columns})')
+
+    def _write_company(self, connection, alias, rng):
+        glposts = _TableWriter(
+            connection, Glpost, self.INSERT_CHUNK_SIZE,
+            srcecurn='ZMW', audtuser='ADMIN', audtorg=alias[:6], companyid=alias, scurndec='2',
+            hcurncode='ZMW', ratetype='SP', scurncode='ZMW', convrate=1, datemtchcd='3', rateoper='1', drilapp='EN',
+        )
+        enpjds = _TableWriter(
+            connection, Enpjd, self.INSERT_CHUNK_SIZE,
+            typebtch='EV', cntseqence=1, audtuser='ADMIN', audtorg=alias[:6], drcr='D', accttype=1, posted=1,
+            srcetype='EV', sourcurr='ZMW', ratetype='SP', rate=1,
+        )
+        enebas = _TableWriter(connection, Eneba, self.INSERT_CHUNK_SIZE, audtuser='ADMIN', audtorg=alias[:6])
+
+        counts = {'entries': 0, 'expense_documents': 0, 'supported_documents': 0, 'notes': 0}
+        entry = 0
+        while len(glposts) < self.rows:
+            batch, entry_in_batch = divmod(entry, self.ENTRIES_PER_BATCH)
+            batch += 1
+            fiscal_year = self.first_year + rng.randrange(self.years)
+            fiscal_period = rng.randint(1, 12)
+            posted_on = fiscal_year * 10000 + fiscal_period * 100 + rng.randint(1, 28)
+            audit_time = rng.randrange(6, 20) * 1000000 + rng.randrange(60) * 10000 + rng.randrange(60) * 100
+            expense = rng.random() < self.EXPENSE_SHARE
+            reference = f'EXP{entry + 1:09d}' if expense else ''
+
+            header = {
+                'fiscalyr': str(fiscal_year),
+                'fiscalperd': str(fiscal_period).zfill(2),
+                'srceledger': 'EN' if expense else 'GL',
+                'srcetype': 'EV' if expense else 'JE',
+                'postingseq': batch,
+                'audtdate': posted_on,
+                'audttime': audit_time,
+                'jrnldate': posted_on,
+                'docdate': posted_on,
+                'batchnbr': str(batch).zfill(6),
+                'entrynbr': str(entry_in_batch + 1).zfill(5),
+                'jnldtlref': reference,
+            }
+            description = rng.choice(DESCRIPTIONS)
+            accounts = EXPENSE_ACCOUNTS if expense else GL_ACCOUNTS
+            amounts = [Decimal(rng.randint(5000, 2500000)).scaleb(-2) for _ in range(rng.randint(1, 3))]
+            lines = [(f'{rng.choice(accounts)}-{rng.choice(DEPARTMENTS)}', amount) for amount in amounts]
+            lines.append((f'{CREDIT_ACCOUNT}-100', -sum(amounts)))
+            for line, (account, amount) in enumerate(lines, start=1):
+                glposts.add(
+                    acctid=account, cntdetail=entry_in_batch * 10 + line, transnbr=line * 10,
+                    jnldtldesc=description, transamt=amount, scurnamt=amount, rptamt=amount, **header
+                )
+
+            if expense:
+                counts['expense_documents'] += 1
+                if rng.random() < self.ENPJD_SHARE:
+                    supported, notes = self._write_document(
+                        enpjds, enebas, rng, batch, entry_in_batch, reference, fiscal_year, fiscal_period,
+                        posted_on, audit_time, amounts
+                    )
+                    counts['supported_documents'] += supported
+                    counts['notes'] += notes
+
+            entry += 1
+
+        for writer in (glposts, enpjds, enebas):
+            writer.flush()
+        counts['entries'] = entry
+        counts.update(glpost=glposts.count, enpjd=enpjds.count, eneba=enebas.count)
+        return counts
+
+    def _write_document(self, enpjds, enebas, rng, batch, entry_in_batch, reference, fiscal_year, fiscal_period,
+                        posted_on, audit_time, amounts):
+        """ENPJD items of an expense document and their ENEBA rows; returns (has attachments, notes written)"""
+        employee = f'EMP{rng.randint(1, 400):04d}'
+        supported = False
+        notes = 0
+        for item, amount in enumerate(amounts, start=1):
+            cntitem = entry_in_batch * 10 + item
+            enpjds.add(
+                postseqnce=batch, cntbtch=batch, cntitem=cntitem, iddoc=reference, fiscy=fiscal_year,
+                fiscperd=fiscal_period, cntline=1, audtdate=posted_on, audttime=audit_time, idemp=employee,
+                idexpctl=rng.choice(EXPENSE_ACCOUNTS), amtextndhc=amount, amtextndtc=amount,
+                glref=reference, gldesc=reference, datebus=posted_on, entryseq=item,
+            )
+
+            attachments = rng.randint(1, 3) if rng.random() < self.attachment_ratio else 0
+            note = rng.choice(NOTES) if rng.random() < self.note_ratio else ''
+            for docline in range(1, attachments + 1):
+                docname = f'{reference}-{item}-{docline}.pdf'
+                enebas.add(
+                    cntbtch=batch, cntitem=cntitem, docline=docline, audtdate=posted_on, audttime=audit_time,
+                    docname=docname, docpath=f'\\\\fileserver\\expenses\\{reference}\\{docname}',
+                    notes=note if docline == 1 else '', cntline=1,
+                )
+            if note and not attachments:
+                # A note without an attachment is an ENEBA row without a document
+                enebas.add(
+                    cntbtch=batch, cntitem=cntitem, docline=1, audtdate=posted_on, audttime=audit_time,
+                    notes=note, cntline=1,
+                )
+            supported = supported or attachments > 0
+            notes += 1 if note else 0
+        return supported, notes
+
+
+def load_manifest(data_dir):
+    """The manifest of the dataset generated in data_dir, or None"""
+    path = Path(data_dir) / SageDatasetGenerator.MANIFEST_NAME
+    if not path.exists():
+        return None
+    with open(path) as manifest_file:
+        return json.load(manifest_file)
@@ -1,13 +1,27 @@
+import asyncio
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from django.conf import settings
 from django.db import connections, transaction
-from django.db.models import Sum
+from django.db.models import (
+    Aggregate, BigIntegerField, Count, DecimalField, ExpressionWrapper, F, Max, Q, Sum
+)
 from django.utils import timezone
 from decimal import Decimal
 from typing import Dict, List, Optional, Tuple
 import logging
 
-from main_app.models import DatabaseMapping, Project, SyncLog, ProjectPeriodStats
-from transactions.models import SupportingDocument, Glpost
+from audit_management_system.settings import SYNC_CONFIG
+from main_app.async_engine import AsyncExtractionEngine
+from main_app.database_registry import LazyDatabases
+from main_app.db_guard import CancellationToken, StatementCancelled, cancellation_scope, current_token
+from main_app.metrics import sync_skipped
+from main_app.models import DatabaseMapping, Project, SyncLog, ProjectPeriodFingerprint, ProjectPeriodStats
+from main_app.sync_leases import LeaseHeld, project_lease_key
+from main_app.sync_profiler import add_rows, in_stage, profile_rows, profiled_sync, sync_stage, track_sync_log
+from main_app.sync_scheduler import AdaptiveSyncScheduler
+from transactions.models import SupportingDocument
+from transactions.projections import columns
+from transactions.services import GlpostReplicaService, ProjectSyncService, glpost_queryset
 
 logger = logging.getLogger(__name__)
 
@@ -17,7 +31,8 @@ def _get_aggregated_data(
         project_name: str,
         fiscal_year: Optional[str] = None,
         fiscal_period_start: Optional[str] = None,
-        fiscal_period_end: Optional[str] = None
+        fiscal_period_end: Optional[str] = None,
+        chunk_size: int = 2000
 ) -> Dict:
     """Get aggregated transaction data using SupportingDocument table for supported transactions
     and glpost table for unsupported transactions
@@ -28,6 +43,7 @@ def _get_aggregated_data(
         fiscal_year: Filter by specific fiscal year (e.g., '2024')
         fiscal_period_start: Start of fiscal period range (e.g., '01')
         fiscal_period_end: End of fiscal period range (e.g., '12')
+        chunk_size: Rows fetched per round-trip when streaming glpost
 
     Returns:
         Dict containing aggregated transaction data
@@ -64,28 +80,29 @@ def _get_aggregated_data(
         supported=True
     )
 
-    supported_count = supported_docs.count()
-    supported_value = supported_docs.aggregate(
-        total=Sum('transaction_value')
-    )['total'] or Decimal('0')
+    with sync_stage('extract'):
+        supported_count = supported_docs.count()
+        supported_value = supported_docs.aggregate(
+            total=Sum('transaction_value')
+        )['total'] or Decimal('0')
 
-    #print(f"Supported transactions for {project_name} (FY: {fiscal_year}): {supported_count} transactions, ${supported_value}")
+        #print(f"Supported transactions for {project_name} (FY: {fiscal_year}): {supported_count} transactions, ${supported_value}")
 
-    # Get list of supported batch/entry pairs for exclusion from unsupported calculation
-    supported_batch_entry_pairs = set(
-        SupportingDocument.objects.filter(
-            **supporting_docs_filter,
-            supported=True
-        ).values_list('batchnbr', 'entrynbr').distinct()
-    )
+        # Get list of supported batch/entry pairs for exclusion from unsupported calculation
+        supported_batch_entry_pairs = set(
+            SupportingDocument.objects.filter(
+                **supporting_docs_filter,
+                supported=True
+            ).values_list('batchnbr', 'entrynbr').distinct()
+        )
 
     #print(f"Supported batch/entry pairs for exclusion: {supported_batch_entry_pairs}")
 
     # Calculate unsupported transactions from glpost table using Django ORM
     company_id = mapping.sql_server_db
 
-    # Build base queryset for glpost table
-    gl_queryset = Glpost.objects.using(sql_server_db).filter(
+    # Build base queryset for glpost table (or its local replica)
+    gl_queryset = glpost_queryset(sql_server_db).filter(
         companyid=company_id,
         transamt__gt=0, srceledger='EN'  # Only positive amounts
     )
@@ -104,59 +121,24 @@ def _get_aggregated_data(
 
     # Calculate unsupported transactions using composite key exclusion
     if supported_batch_entry_pairs:
-        # Get all current transactions with their composite keys
-        current_transactions = gl_queryset.values('batchnbr', 'entrynbr', 'acctid', 'fiscalyr',
-                                                  'fiscalperd', 'srcecurn', 'srceledger', 'srcetype',
-                                                  'postingseq', 'cntdetail', 'transamt')
-
-        # Filter out supported transactions in Python
-        unsupported_transaction_keys = []
-        unsupported_transaction_amounts = []
-
-        for trans in current_transactions:
-            trans_key = (trans['batchnbr'], trans['entrynbr'])
-            if trans_key not in supported_batch_entry_pairs:
-                # Store the composite primary key for filtering
-                unsupported_transaction_keys.append({
-                    'acctid': trans['acctid'],
-                    'fiscalyr': trans['fiscalyr'],
-                    'fiscalperd': trans['fiscalperd'],
-                    'srcecurn': trans['srcecurn'],
-                    'srceledger': trans['srceledger'],
-                    'srcetype': trans['srcetype'],
-                    'postingseq': trans['postingseq'],
-                    'cntdetail': trans['cntdetail']
-                })
-                unsupported_transaction_amounts.append(trans['transamt'])
-
-        # Count distinct batch-entry combinations for unsupported transactions
-        unsupported_batch_entry_combinations = set()
-        unsupported_total_amount = Decimal('0')
-
-        for i, key in enumerate(unsupported_transaction_keys):
-            # Find the corresponding transaction to get batch/entry info
-            matching_trans = next(
-                trans for trans in current_transactions
-                if all(trans[k] == v for k, v in key.items())
-            )
-            unsupported_batch_entry_combinations.add(
-                (matching_trans['batchnbr'], matching_trans['entrynbr'])
+        # Stream the glpost slice once, projected to the three columns the aggregation needs
+        rows = gl_queryset.values_list(*columns('glpost', 'stats')).iterator(chunk_size=chunk_size)
+        with sync_stage('transform'):
+            unsupported_count, unsupported_value = _aggregate_unsupported(
+                profile_rows('extract', rows), supported_batch_entry_pairs
             )
-            unsupported_total_amount += Decimal(str(unsupported_transaction_amounts[i]))
-
-        unsupported_count = len(unsupported_batch_entry_combinations)
-        unsupported_value = unsupported_total_amount
 
     else:
-        # If no supported documents, all transactions are unsupported
-        # Count distinct batch-entry combinations
-        distinct_combinations = gl_queryset.values('batchnbr', 'entrynbr').distinct()
-        unsupported_count = distinct_combinations.count()
-
-        # Sum all transaction amounts
-        unsupported_value = gl_queryset.aggregate(
-            total=Sum('transamt')
-        )['total'] or Decimal('0')
+        with sync_stage('extract'):
+            # If no supported documents, all transactions are unsupported
+            # Count distinct batch-entry combinations
+            distinct_combinations = gl_queryset.values('batchnbr', 'entrynbr').distinct()
+            unsupported_count = distinct_combinations.count()
+
+            # Sum all transaction amounts
+            unsupported_value = gl_queryset.aggregate(
+                total=Sum('transamt')
+            )['total'] or Decimal('0')
 
     #print(f"Unsupported transactions for {project_name} (FY: {fiscal_year}): {unsupported_count} transactions, ${unsupported_value}")
 
@@ -168,21 +150,462 @@ def _get_aggregated_data(
     }
 
 
+def _aggregate_unsupported(rows, supported_batch_entry_pairs) -> Tuple[int, Decimal]:
+    """Single-pass keyed aggregation of unsupported glpost rows
+
+    Args:
+        rows: Iterable of (batchnbr, entrynbr, transamt) tuples, consumed once
+        supported_batch_entry_pairs: Set of supported (batchnbr, entrynbr) keys
+
+    Returns:
+        Tuple of (distinct unsupported batch/entry combinations, total unsupported amount)
+    """
+    unsupported_batch_entry_combinations = set()
+    unsupported_total_amount = Decimal('0')
+
+    for batchnbr, entrynbr, transamt in rows:
+        trans_key = (batchnbr, entrynbr)
+        if trans_key not in supported_batch_entry_pairs:
+            unsupported_batch_entry_combinations.add(trans_key)
+            if not isinstance(transamt, Decimal):
+                transamt = Decimal(str(transamt))
+            unsupported_total_amount += transamt
+
+    return len(unsupported_batch_entry_combinations), unsupported_total_amount
+
+
+def _get_aggregated_data_by_period(
+        sql_server_db: str,
+        project_name: str,
+        fiscal_combinations: Optional[List[Tuple[str, str]]] = None,
+        chunk_size: int = 2000
+) -> Dict[Tuple[str, str], Dict]:
+    """Get the aggregated transaction data of many fiscal periods of a project at once
+
+    Same figures as calling _get_aggregated_data once per period, but from one grouped
+    SupportingDocument query and one grouped glpost query, merged in memory.
+
+    Args:
+        sql_server_db: The database alias/name in Django's settings
+        project_name: The name of the project to sync
+        fiscal_combinations: (fiscal_year, fiscal_period) pairs to aggregate; defaults to
+            every period the project has supporting documents for
+        chunk_size: Rows fetched per round-trip when streaming the grouped glpost rows
+
+    Returns:
+        Dict mapping (fiscal_year, fiscal_period) to the aggregated transaction data
+    """
+    try:
+        mapping = DatabaseMapping.objects.get(
+            project_name=project_name,
+            sql_server_db=sql_server_db,
+            is_active=True
+        )
+    except DatabaseMapping.DoesNotExist:
+        logger.error(f"No active database mapping found for project {project_name} in database {sql_server_db}")
+        return {}
+
+    # One grouped MySQL query: documents per period and batch/entry, split by support status
+    document_groups = (
+        SupportingDocument.objects.filter(project__project_name=project_name)
+        .values_list('fiscal_year', 'fiscal_period', 'batchnbr', 'entrynbr', 'supported')
+        .annotate(documents=Count('pk'), total=Sum('transaction_value'))
+        .order_by()
+    )
+
+    known_periods = set()
+    supported_totals = {}
+    supported_pairs = {}
+    with sync_stage('transform'):
+        for fiscal_year, fiscal_period, batchnbr, entrynbr, supported, documents, total in profile_rows(
+                'extract', document_groups):
+            period = (fiscal_year, fiscal_period)
+            known_periods.add(period)
+            if supported:
+                count, value = supported_totals.get(period, (0, Decimal('0')))
+                supported_totals[period] = (count + documents, value + (total or Decimal('0')))
+                supported_pairs.setdefault(period, set()).add((batchnbr, entrynbr))
+
+    periods = set(fiscal_combinations) if fiscal_combinations is not None else known_periods
+    if not periods:
+        return {}
+
+    # One grouped SQL Server query: one row per period and batch/entry with its total amount
+    gl_groups = (
+        glpost_queryset(sql_server_db).filter(
+            companyid=mapping.sql_server_db,
+            transamt__gt=0, srceledger='EN',  # Only positive amounts
+            fiscalyr__in={fiscal_year for fiscal_year, _ in periods},
+            fiscalperd__in={fiscal_period for _, fiscal_period in periods}
+        )
+        .values_list('fiscalyr', 'fiscalperd', 'batchnbr', 'entrynbr')
+        .annotate(total=Sum('transamt'))
+        .order_by()
+    )
+
+    unsupported_totals = {}
+    with sync_stage('transform'):
+        for fiscal_year, fiscal_period, batchnbr, entrynbr, total in profile_rows(
+                'extract', gl_groups.iterator(chunk_size=chunk_size)):
+            period = (fiscal_year, fiscal_period)
+            if period not in periods or (batchnbr, entrynbr) in supported_pairs.get(period, ()):
+                continue
+            if not isinstance(total, Decimal):
+                total = Decimal(str(total))
+            count, value = unsupported_totals.get(period, (0, Decimal('0')))
+            unsupported_totals[period] = (count + 1, value + total)
+
+    results = {}
+    for period in sorted(periods):
+        supported_count, supported_value = supported_totals.get(period, (0, Decimal('0')))
+        unsupported_count, unsupported_value = unsupported_totals.get(period, (0, Decimal('0')))
+        results[period] = {
+            'supported_transactions_number': supported_count,
+            'supported_transactions_value': supported_value,
+            'unsupported_transactions_number': unsupported_count,
+            'unsupported_transactions_value': unsupported_value
+        }
+    return results
+
+
+class ChecksumAgg(Aggregate):
+    """
+    Order-independent checksum of the given columns over a group of rows.
+
+    CHECKSUM_AGG(CHECKSUM(...)) on SQL Server and BIT_XOR(CRC32(CONCAT_WS(...)))
+    on MySQL (the glpost replica). Other backends return NULL, leaving change
+    detection to the row count, amount sum and audit stamp of the fingerprint.
+    """
+    function = 'CHECKSUM_AGG'
+    template = '%(function)s(CHECKSUM(%(expressions)s))'
+    output_field = BigIntegerField()
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return super().as_sql(
+            compiler, connection,
+            function='BIT_XOR', template="%(function)s(CRC32(CONCAT_WS(',', %(expressions)s)))",
+            **extra_context
+        )
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return 'NULL', []
+
+
+# glpost columns identifying a posting and its amount; any edit changes the checksum
+FINGERPRINT_COLUMNS = ('batchnbr', 'entrynbr', 'acctid', 'postingseq', 'cntdetail', 'transamt', 'audtdate', 'audttime')
+
+
+def _get_period_fingerprints(
+        sql_server_db: str,
+        project_name: str,
+        fiscal_combinations: List[Tuple[str, str]]
+) -> Dict[Tuple[str, str], Dict]:
+    """Fingerprint the inputs of each period's stats, computed server-side
+
+    One grouped glpost query (row count, amount sum, CHECKSUM_AGG over the posting
+    keys and the latest audit stamp per period) and one grouped SupportingDocument
+    query (count, value and last update of the supported documents per period),
+    over the same rows _get_aggregated_data reads.
+
+    Returns:
+        Dict mapping (fiscal_year, fiscal_period) to ProjectPeriodFingerprint field values
+    """
+    periods = set(fiscal_combinations)
+    fingerprints = {
+        period: {
+            'gl_row_count': 0,
+            'gl_amount_sum': Decimal('0'),
+            'gl_checksum': None,
+            'gl_last_audit': None,
+            'supported_count': 0,
+            'supported_value': Decimal('0'),
+            'supported_updated_at': None,
+        }
+        for period in periods
+    }
+    if not periods:
+        return fingerprints
+
+    gl_groups = (
+        glpost_queryset(sql_server_db).filter(
+            companyid=sql_server_db,
+            transamt__gt=0, srceledger='EN',
+            fiscalyr__in={fiscal_year for fiscal_year, _ in periods},
+            fiscalperd__in={fiscal_period for _, fiscal_period in periods}
+        )
+        .values_list('fiscalyr', 'fiscalperd')
+        .annotate(
+            rows=Count('*'),
+            amount=Sum('transamt'),
+            checksum=ChecksumAgg(*FINGERPRINT_COLUMNS),
+            # AUDTTIME is HHMMSSss, eight digits, so the date is shifted past all of them
+            last_audit=Max(ExpressionWrapper(
+                F('audtdate') * 100000000 + F('audttime'), output_field=DecimalField(max_digits=18, decimal_places=0)
+            ))
+        )
+        .order_by()
+    )
+    for fiscal_year, fiscal_period, rows, amount, checksum, last_audit in gl_groups:
+        period = (fiscal_year, fiscal_period)
+        if period in fingerprints:
+            fingerprints[period].update({
+                'gl_row_count': rows,
+                'gl_amount_sum': amount or Decimal('0'),
+                'gl_checksum': checksum,
+                'gl_last_audit': last_audit,
+            })
+
+    supported_groups = (
+        SupportingDocument.objects.filter(project__project_name=project_name, supported=True)
+        .values_list('fiscal_year', 'fiscal_period')
+        .annotate(documents=Count('pk'), value=Sum('transaction_value'), updated_at=Max('updated_at'))
+        .order_by()
+    )
+    for fiscal_year, fiscal_period, documents, value, updated_at in supported_groups:
+        period = (fiscal_year, fiscal_period)
+        if period in fingerprints:
+            fingerprints[period].update({
+                'supported_count': documents,
+                'supported_value': value or Decimal('0'),
+                'supported_updated_at': updated_at,
+            })
+
+    return fingerprints
+
+
+def _raise_if_cancelled():
+    """Raise StatementCancelled once the calling thread's cancellation token is cancelled
+
+    Per-period handlers call it before moving on: past the project's deadline, or
+    once the run is cancelled, every remaining period would fail the same way.
+    """
+    token = current_token()
+    if token is not None:
+        token.raise_if_cancelled()
+
+
+class _CancellableEngine:
+    """An AsyncExtractionEngine whose calls run under one project's cancellation token on their worker threads"""
+
+    def __init__(self, engine, token):
+        self.engine = engine
+        self.token = token
+
+    async def run(self, alias, func, *args, **kwargs):
+        def cancellable_call():
+            with cancellation_scope(self.token):
+                return func(*args, **kwargs)
+        return await self.engine.run(alias, cancellable_call)
+
+
 class TransactionSyncService:
-    def __init__(self):
+    def __init__(self, chunk_size=None, leases=None, manifest=None):
         self.mysql_db = 'default'  # Your MySQL database alias
-
-    def sync_all_projects(self, use_threading=True, max_workers=5):
-        """Sync all projects from all SQL Server databases for all fiscal years and periods"""
-        logger.info("Starting comprehensive sync for all projects across all fiscal years and periods")
+        # SyncLeaseManager of the run; with one, projects leased by a concurrent run are skipped
+        self.leases = leases
+        # SyncRunManifest of the run; with one, progress is checkpointed and completed work skipped
+        self.manifest = manifest
+        # Rows fetched per round-trip when streaming glpost scans
+        self.chunk_size = chunk_size or SYNC_CONFIG.get('STREAM_CHUNK_SIZE', 2000)
+        # Per-project number of changed Sage rows seen by the last incremental sync
+        self.change_counts = {}
+        # Per-project stage timings of the last sync (see main_app/sync_profiler.py)
+        self.stage_profiles = {}
+        # Parent of every project's cancellation token; cancel() stops the run's in-flight statements
+        self.cancellation = CancellationToken()
+
+    def sync_all_projects(self, use_threading=True, max_workers=5, incremental=False, use_asyncio=False,
+                          per_server_limit=None, batched_periods=False, project_name=None, sql_server_db=None):
+        """Sync all projects from all SQL Server databases for all fiscal years and periods
+
+        With project_name or sql_server_db only the active mappings of that project or
+        that SQL Server database are synced.
+
+        With incremental=True only Sage rows changed since each project's watermarks are
+        pulled, and only the fiscal periods they touch are recomputed.
+
+        With batched_periods=True a full sync computes all periods of a project in one
+        grouped SQL Server query and one grouped MySQL query, and upserts the
+        ProjectPeriodStats rows in one batch, instead of querying period by period.
+
+        With use_asyncio=True the per-period queries of every project are driven by an
+        AsyncExtractionEngine: max_workers becomes the global limit on queries in flight and
+        per_server_limit caps the queries in flight against any one SQL Server.
+
+        With a SyncLeaseManager (leases), each project is synced only while this run
+        holds its lease; projects another run is syncing come back with skipped=True.
+
+        With a SyncRunManifest (manifest), every project (and, for comprehensive syncs,
+        every period) is checkpointed; units the manifest already has completed, e.g.
+        when resuming an interrupted run, are skipped.
+
+        Each project sync gets PROJECT_TIMEOUT_SECONDS, after which its Sage statements
+        are cancelled, so a slow or unreachable database cannot hold a worker, or the
+        asyncio event loop, for the whole run.
+        """
+        sync_func = self._checkpointed(self._select_sync_func(incremental, batched_periods))
 
         # Get all active database mappings
+        mappings = self.active_mappings(project_name, sql_server_db)
+        self._evict_stale_aliases()
+        if self.manifest is not None:
+            mappings = self.manifest.track(mappings)
+
+        if use_asyncio:
+            engine = AsyncExtractionEngine(
+                global_limit=max_workers,
+                per_server_limit=per_server_limit or SYNC_CONFIG.get('MAX_WORKERS_PER_SERVER', 4)
+            )
+            return self._sync_with_asyncio(list(mappings), engine, sync_func)
+        elif use_threading:
+            return self._sync_with_threading(mappings, max_workers, self._cancellable(self._leased(sync_func)))
+        else:
+            return self._sync_sequential(mappings, self._cancellable(self._leased(sync_func)))
+
+    def sync_adaptive(self, use_threading=True, max_workers=5, incremental=True, batched_periods=False,
+                      scheduler=None):
+        """Sync only the projects the AdaptiveSyncScheduler picks for this tick
+
+        The hottest projects run first within the scheduler's time budget; the rest
+        are deferred or backed off, and every project's schedule is updated from
+        the outcome. Incremental syncs feed the change rate the scheduler ranks by.
+
+        Returns:
+            Tuple of (sync results, scheduling decisions)
+        """
+        scheduler = scheduler or AdaptiveSyncScheduler()
+        sync_func = self._select_sync_func(incremental, batched_periods)
+        self._evict_stale_aliases()
+
+        self.change_counts = {}
+        started = timezone.now()
+        scheduled, decisions = scheduler.plan(started)
+        mappings = [schedule.mapping for schedule in scheduled]
+        if self.manifest is not None:
+            mappings = self.manifest.track(mappings)
+
+        timed_sync = self._cancellable(self._leased(scheduler.timed(self._checkpointed(sync_func))))
+        if use_threading:
+            results = self._sync_with_threading(mappings, max_workers, timed_sync)
+        else:
+            results = self._sync_sequential(mappings, timed_sync)
+
+        scheduler.record(scheduled, results, self.change_counts, started)
+        for decision in decisions:
+            if decision['decision'] != 'scheduled':
+                sync_skipped.inc(reason=decision['decision'])
+        return results, decisions
+
+    @staticmethod
+    def active_mappings(project_name=None, sql_server_db=None):
+        """Active DatabaseMappings, optionally only those of one project or one SQL Server database"""
         mappings = DatabaseMapping.objects.filter(is_active=True)
+        if project_name:
+            mappings = mappings.filter(project_name=project_name)
+        if sql_server_db:
+            mappings = mappings.filter(sql_server_db=sql_server_db)
+        return mappings
+
+    def _leased(self, sync_func):
+        """Wrap a project sync so it only runs while this run holds the project's lease"""
+        if self.leases is None:
+            return sync_func
+
+        def leased_sync(project_name, sql_server_db):
+            with self.leases.hold(project_lease_key(project_name)):
+                return sync_func(project_name, sql_server_db)
+        return leased_sync
+
+    def _checkpointed(self, sync_func):
+        """Wrap a project sync so its work unit in the run manifest follows its progress"""
+        if self.manifest is None:
+            return sync_func
+
+        def checkpointed_sync(project_name, sql_server_db):
+            self.manifest.start_project(project_name)
+            try:
+                result = sync_func(project_name, sql_server_db)
+            except Exception as e:
+                self.manifest.finish_project(project_name, False, str(e))
+                raise
+            # A project given up on its cancellation token records why
+            token = current_token()
+            self.manifest.finish_project(
+                project_name, bool(result), None if result or token is None else token.reason
+            )
+            return result
+        # The asyncio path recognises comprehensive syncs by their function
+        checkpointed_sync.__wrapped__ = sync_func
+        return checkpointed_sync
+
+    def _cancellable(self, sync_func):
+        """Wrap a project sync so its Sage statements run under a token bounded by PROJECT_TIMEOUT_SECONDS"""
+        def cancellable_sync(project_name, sql_server_db):
+            token = CancellationToken(SYNC_CONFIG.get('PROJECT_TIMEOUT_SECONDS'), parent=self.cancellation)
+            with cancellation_scope(token):
+                result = sync_func(project_name, sql_server_db)
+            self._raise_if_given_up(result, token)
+            return result
+        return cancellable_sync
+
+    @staticmethod
+    def _raise_if_given_up(result, token):
+        """Raise StatementCancelled for a project that failed because its token was cancelled
+
+        Every sync path reports such a project as failed with the token's reason,
+        e.g. 'deadline exceeded', instead of a bare failure.
+        """
+        if not result and token.cancelled:
+            raise StatementCancelled(token.reason)
+
+    def cancel(self, reason='sync cancelled'):
+        """Cancel the run: in-flight Sage statements are interrupted and later ones fail at once"""
+        logger.info(f"Cancelling sync run: {reason}")
+        self.cancellation.cancel(reason)
+
+    @staticmethod
+    def _project_failed(mapping, error):
+        """Result of a project whose sync raised"""
+        logger.error(f"Exception for {mapping.project_name}: {str(error)}")
+        return {
+            'project': mapping.project_name,
+            'database': mapping.sql_server_db,
+            'success': False,
+            'error': str(error)
+        }
 
-        if use_threading:
-            return self._sync_with_threading(mappings, max_workers)
+    @staticmethod
+    def _lease_skipped(mapping, error):
+        """Result of a project left to the concurrent run holding its lease"""
+        logger.info(f"Skipping {mapping.project_name}: {str(error)}")
+        sync_skipped.inc(reason='lease_held')
+        return {
+            'project': mapping.project_name,
+            'database': mapping.sql_server_db,
+            'success': False,
+            'skipped': True,
+            'error': str(error)
+        }
+
+    def _select_sync_func(self, incremental, batched_periods):
+        """Per-project sync function of the requested sync mode"""
+        if incremental:
+            logger.info("Starting incremental sync for all projects")
+            return self.sync_single_project_incremental
+        elif batched_periods:
+            logger.info("Starting batched comprehensive sync for all projects across all fiscal years and periods")
+            return self.sync_single_project_batched
         else:
-            return self._sync_sequential(mappings)
+            logger.info("Starting comprehensive sync for all projects across all fiscal years and periods")
+            return self.sync_single_project_comprehensive
+
+    @staticmethod
+    def _evict_stale_aliases():
+        """Aliases whose mapping changed since they were resolved reconnect with the new settings"""
+        if isinstance(settings.DATABASES, LazyDatabases):
+            evicted = settings.DATABASES.evict_stale()
+            if evicted:
+                logger.info(f"Evicted stale database aliases: {', '.join(evicted)}")
 
     def sync_all_projects_current(self, use_threading=True, max_workers=5):
         """Sync all projects from all SQL Server databases for all fiscal years and periods"""
@@ -196,6 +619,7 @@ class TransactionSyncService:
         else:
             return self._sync_sequential_current(mappings)
 
+    @profiled_sync
     def sync_single_project_comprehensive(self, project_name: str, sql_server_db: str):
         """Sync a single project for all available fiscal years and periods"""
         logger.info(f"Starting comprehensive sync for project {project_name} from {sql_server_db}")
@@ -215,35 +639,62 @@ class TransactionSyncService:
                 status='running',
                 sync_started=timezone.now()
             )
+            track_sync_log(sync_log)
 
             total_records = 0
             successful_periods = 0
 
             try:
+                self._refresh_glpost_replica(project_name)
+
+                # Closed periods rarely change; only recalculate those whose inputs did
+                fiscal_combinations, fingerprints, skipped_periods = self._changed_periods(
+                    project_obj, sql_server_db, fiscal_combinations
+                )
+                sync_log.periods_skipped = skipped_periods
+
+                # Periods already completed by the interrupted run this one resumes
+                completed_periods = set()
+                if self.manifest is not None:
+                    completed_periods = self.manifest.track_periods(project_name, sql_server_db, fiscal_combinations)
+
                 # Sync each fiscal year/period combination
                 for fiscal_year, fiscal_period in fiscal_combinations:
+                    if (fiscal_year, fiscal_period) in completed_periods:
+                        continue
+
                     try:
                         logger.info(f"Syncing {project_name} for FY {fiscal_year}, Period {fiscal_period}")
 
                         # Get data for this specific period
                         aggregated_data = _get_aggregated_data(
-                            sql_server_db, project_name, fiscal_year, fiscal_period, fiscal_period
+                            sql_server_db, project_name, fiscal_year, fiscal_period, fiscal_period,
+                            chunk_size=self.chunk_size
                         )
                         # Update ProjectPeriodStats
                         self._update_project_period_stats(
                             project_name, fiscal_year, fiscal_period, aggregated_data
                         )
+                        self._save_period_fingerprint(
+                            project_obj, fiscal_year, fiscal_period, fingerprints.get((fiscal_year, fiscal_period))
+                        )
 
                         period_total = (aggregated_data['supported_transactions_number'] +
                                         aggregated_data['unsupported_transactions_number'])
                         total_records += period_total
                         successful_periods += 1
+                        if self.manifest is not None:
+                            self.manifest.finish_period(project_name, fiscal_year, fiscal_period, True)
 
                         logger.info(
                             f"Successfully synced {project_name} FY {fiscal_year} Period {fiscal_period}: {period_total} transactions")
 
                     except Exception as e:
                         logger.error(f"Error syncing {project_name} FY {fiscal_year} Period {fiscal_period}: {str(e)}")
+                        if self.manifest is not None:
+                            self.manifest.finish_period(project_name, fiscal_year, fiscal_period, False, str(e))
+                        # A cancelled project fails as a whole, rather than completing without its periods
+                        _raise_if_cancelled()
                         continue
 
                 # Update project sync status
@@ -259,7 +710,8 @@ class TransactionSyncService:
                 sync_log.save(using=self.mysql_db)
 
                 logger.info(
-                    f"Successfully completed comprehensive sync for {project_name}: {total_records} total transactions across {successful_periods} periods")
+                    f"Successfully completed comprehensive sync for {project_name}: {total_records} total transactions across {successful_periods} periods, "
+                    f"{skipped_periods} unchanged periods skipped")
                 return True
 
             except Exception as e:
@@ -276,6 +728,170 @@ class TransactionSyncService:
             logger.error(f"Error in comprehensive sync for {project_name}: {str(e)}")
             return False
 
+    def sync_single_period(self, project_name: str, sql_server_db: str, fiscal_year: str, fiscal_period: str):
+        """Recalculate one fiscal period of a project, the unit of a per-period fanned-out sync
+
+        The period is skipped when its fingerprint is unchanged. The project's SyncLog,
+        sync status and glpost replica are left to whoever coordinates the periods.
+
+        Returns:
+            Dict with success, the number of transactions counted and whether the period was unchanged
+        """
+        period = (fiscal_year, fiscal_period)
+        try:
+            project_obj = Project.objects.using(self.mysql_db).get(project_name=project_name)
+            changed, fingerprints, _ = self._changed_periods(project_obj, sql_server_db, [period])
+
+            records = 0
+            if changed:
+                aggregated_data = _get_aggregated_data(
+                    sql_server_db, project_name, fiscal_year, fiscal_period, fiscal_period,
+                    chunk_size=self.chunk_size
+                )
+                self._update_project_period_stats(project_name, fiscal_year, fiscal_period, aggregated_data)
+                self._save_period_fingerprint(project_obj, fiscal_year, fiscal_period, fingerprints.get(period))
+                records = (aggregated_data['supported_transactions_number'] +
+                           aggregated_data['unsupported_transactions_number'])
+                logger.info(f"Successfully synced {project_name} FY {fiscal_year} Period {fiscal_period}: {records} transactions")
+
+        except Exception as e:
+            logger.error(f"Error syncing {project_name} FY {fiscal_year} Period {fiscal_period}: {str(e)}")
+            if self.manifest is not None:
+                self.manifest.finish_period(project_name, fiscal_year, fiscal_period, False, str(e))
+            return {'success': False, 'records': 0, 'unchanged': False, 'error': str(e)}
+
+        if self.manifest is not None:
+            self.manifest.finish_period(project_name, fiscal_year, fiscal_period, True)
+        return {'success': True, 'records': records, 'unchanged': not changed}
+
+    @profiled_sync
+    def sync_single_project_batched(self, project_name: str, sql_server_db: str):
+        """
+        Sync a single project for all fiscal years and periods in a constant number of round-trips.
+
+        SKIP_UNCHANGED_PERIODS does not apply here: every period is aggregated by the
+        same grouped query, and fingerprinting them would be another grouped query over
+        the same rows, so skipping periods saves no Sage work.
+        """
+        logger.info(f"Starting batched comprehensive sync for project {project_name} from {sql_server_db}")
+
+        try:
+            project_obj = Project.objects.using(self.mysql_db).get(project_name=project_name)
+            sync_log = SyncLog.objects.using(self.mysql_db).create(
+                project=project_obj,
+                status='running',
+                sync_started=timezone.now()
+            )
+            track_sync_log(sync_log)
+
+            try:
+                self._refresh_glpost_replica(project_name)
+                period_data = _get_aggregated_data_by_period(
+                    sql_server_db, project_name, chunk_size=self.chunk_size
+                )
+                if not period_data:
+                    logger.warning(f"No fiscal combinations found for project {project_name}")
+
+                self._bulk_update_project_period_stats(project_obj, period_data)
+
+                total_records = sum(
+                    aggregated_data['supported_transactions_number'] +
+                    aggregated_data['unsupported_transactions_number']
+                    for aggregated_data in period_data.values()
+                )
+                self._finish_sync_log(project_obj, sync_log, total_records)
+
+                logger.info(
+                    f"Successfully completed batched sync for {project_name}: {total_records} total transactions across {len(period_data)} periods")
+                return True
+
+            except Exception as e:
+                self._finish_sync_log(project_obj, sync_log, 0, str(e))
+                raise
+
+        except Exception as e:
+            logger.error(f"Error in batched sync for {project_name}: {str(e)}")
+            return False
+
+    @profiled_sync
+    def sync_single_project_incremental(self, project_name: str, sql_server_db: str):
+        """Sync a single project from the Sage rows changed since its last committed watermarks"""
+        logger.info(f"Starting incremental sync for project {project_name} from {sql_server_db}")
+
+        try:
+            project_obj = Project.objects.using(self.mysql_db).get(project_name=project_name)
+            sync_started = timezone.now()
+            sync_log = SyncLog.objects.using(self.mysql_db).create(
+                project=project_obj,
+                status='running',
+                sync_started=sync_started
+            )
+            track_sync_log(sync_log)
+
+            try:
+                project_service = ProjectSyncService(
+                    extraction_mode='bulk',
+                    load_mode='bulk',
+                    batch_size=SYNC_CONFIG.get('LOAD_BATCH_SIZE', 500),
+                    chunk_size=self.chunk_size
+                )
+                synced_count = project_service.sync_incremental(project_name=project_name)
+                # Activity signal for the adaptive scheduler
+                self.change_counts[project_name] = project_service.changed_rows.get(project_name, 0)
+                self._refresh_glpost_replica(project_name)
+                fiscal_combinations = set(project_service.touched_periods.get(project_name, set()))
+
+                # Local changes (uploads, support status) since the previous sync also move the stats
+                if project_obj.last_synced:
+                    fiscal_combinations.update(
+                        SupportingDocument.objects.filter(
+                            project=project_obj,
+                            updated_at__gte=project_obj.last_synced
+                        ).values_list('fiscal_year', 'fiscal_period').distinct()
+                    )
+
+                period_data = {}
+                if fiscal_combinations:
+                    period_data = _get_aggregated_data_by_period(
+                        sql_server_db, project_name, sorted(fiscal_combinations), chunk_size=self.chunk_size
+                    )
+                    self._bulk_update_project_period_stats(project_obj, period_data)
+
+                total_records = sum(
+                    aggregated_data['supported_transactions_number'] +
+                    aggregated_data['unsupported_transactions_number']
+                    for aggregated_data in period_data.values()
+                )
+
+                # Use the start time so changes made while this sync ran are picked up next time
+                project_obj.last_synced = sync_started
+                project_obj.sync_status = 'completed'
+                project_obj.save(using=self.mysql_db)
+
+                sync_log.status = 'completed'
+                sync_log.sync_completed = timezone.now()
+                sync_log.records_processed = total_records
+                sync_log.save(using=self.mysql_db)
+
+                logger.info(
+                    f"Successfully completed incremental sync for {project_name}: {synced_count} new transactions, "
+                    f"{len(fiscal_combinations)} periods recalculated")
+                return True
+
+            except Exception as e:
+                sync_log.status = 'failed'
+                sync_log.error_message = str(e)
+                sync_log.save(using=self.mysql_db)
+
+                project_obj.sync_status = 'error'
+                project_obj.save(using=self.mysql_db)
+                raise
+
+        except Exception as e:
+            logger.error(f"Error in incremental sync for {project_name}: {str(e)}")
+            return False
+
+    @profiled_sync
     def sync_single_project_current_period(self, project_name: str, sql_server_db: str):
         """Sync a single project for the current fiscal year and period only"""
         logger.info(f"Starting comprehensive sync for project {project_name} from {sql_server_db}")
@@ -298,16 +914,19 @@ class TransactionSyncService:
                 status='running',
                 sync_started=timezone.now()
             )
+            track_sync_log(sync_log)
 
             total_records = 0
             successful_periods = 0
 
             try:
+                self._refresh_glpost_replica(project_name)
                 logger.info(f"Syncing {project_name} for FY {fiscal_year}, Period {fiscal_period}")
 
                 # Get data for this specific period
                 aggregated_data = _get_aggregated_data(
-                    sql_server_db, project_name, fiscal_year, fiscal_period, fiscal_period
+                    sql_server_db, project_name, fiscal_year, fiscal_period, fiscal_period,
+                    chunk_size=self.chunk_size
                 )
                 print(aggregated_data)
                 # Update ProjectPeriodStats
@@ -353,6 +972,20 @@ class TransactionSyncService:
             logger.error(f"Error in comprehensive sync for {project_name}: {str(e)}")
             return False
 
+    @in_stage('load')
+    def _refresh_glpost_replica(self, project_name: str):
+        """Pull the project's glpost changes into the local replica before its stats are recomputed"""
+        if not SYNC_CONFIG.get('GLPOST_REPLICA', False):
+            return
+
+        try:
+            GlpostReplicaService(batch_size=SYNC_CONFIG.get('LOAD_BATCH_SIZE', 500)).refresh(project_name)
+        except Exception as e:
+            _raise_if_cancelled()
+            # A stale replica only delays the dashboards; the sync itself carries on
+            logger.error(f"Error refreshing glpost replica for {project_name}: {str(e)}")
+
+    @in_stage('extract')
     def _get_fiscal_combinations(self, project_name: str) -> List[Tuple[str, str]]:
         """Get all unique fiscal year/period combinations for a project"""
         """Get all unique fiscal year/period combinations for a project"""
@@ -363,6 +996,7 @@ class TransactionSyncService:
             .order_by('fiscal_year', 'fiscal_period')
         )
 
+    @in_stage('stats')
     @transaction.atomic(using='default')
     def _update_project_period_stats(self, project_name: str, fiscal_year: str,
                                      fiscal_period: str, aggregated_data: Dict):
@@ -391,18 +1025,61 @@ class TransactionSyncService:
             }
         )
 
+        add_rows('stats', 1)
         action = "Created" if created else "Updated"
         logger.info(f"{action} ProjectPeriodStats for {project_name} FY {fiscal_year} Period {fiscal_period}")
 
-    def _sync_with_threading(self, mappings, max_workers):
+    @in_stage('stats')
+    @transaction.atomic(using='default')
+    def _bulk_update_project_period_stats(self, project_obj, period_data: Dict[Tuple[str, str], Dict]):
+        """Upsert the ProjectPeriodStats rows of many periods of a project in one batch"""
+        if not period_data:
+            return
+
+        now = timezone.now()
+        period_stats = [
+            ProjectPeriodStats(
+                project=project_obj,
+                fiscal_year=fiscal_year,
+                fiscal_period=fiscal_period,
+                last_calculated=now,
+                **aggregated_data
+            )
+            for (fiscal_year, fiscal_period), aggregated_data in period_data.items()
+        ]
+
+        add_rows('stats', len(period_stats))
+
+        # MySQL upserts on any unique key and rejects an explicit conflict target
+        unique_fields = None
+        if connections[self.mysql_db].features.supports_update_conflicts_with_target:
+            unique_fields = ['project', 'fiscal_year', 'fiscal_period']
+
+        ProjectPeriodStats.objects.using(self.mysql_db).bulk_create(
+            period_stats,
+            update_conflicts=True,
+            unique_fields=unique_fields,
+            update_fields=[
+                'supported_transactions_number',
+                'supported_transactions_value',
+                'unsupported_transactions_number',
+                'unsupported_transactions_value',
+                'last_calculated'
+            ]
+        )
+        logger.info(f"Upserted ProjectPeriodStats for {project_obj.project_name}: {len(period_stats)} periods")
+
+    def _sync_with_threading(self, mappings, max_workers, sync_func=None):
         """Sync multiple projects concurrently"""
         results = []
+        sync_func = sync_func or self.sync_single_project_comprehensive
 
         with ThreadPoolExecutor(max_workers=max_workers) as executor:
             # Submit sync tasks
             future_to_mapping = {
                 executor.submit(
-                    self.sync_single_project_comprehensive,
+                    self._run_and_release_connections,
+                    sync_func,
                     mapping.project_name,
                     mapping.sql_server_db
                 ): mapping
@@ -419,17 +1096,252 @@ class TransactionSyncService:
                         'database': mapping.sql_server_db,
                         'success': result
                     })
+                except LeaseHeld as e:
+                    results.append(self._lease_skipped(mapping, e))
                 except Exception as e:
-                    logger.error(f"Exception for {mapping.project_name}: {str(e)}")
-                    results.append({
-                        'project': mapping.project_name,
-                        'database': mapping.sql_server_db,
-                        'success': False,
-                        'error': str(e)
-                    })
+                    results.append(self._project_failed(mapping, e))
 
         return results
 
+    @staticmethod
+    def _run_and_release_connections(sync_func, *args):
+        """Run one project sync on a worker thread, then hand its connections back to the pools"""
+        try:
+            return sync_func(*args)
+        finally:
+            connections.close_all()
+
+    def _sync_with_asyncio(self, mappings, engine, sync_func=None):
+        """Sync multiple projects from one event loop, bounded globally and per SQL Server"""
+        sync_func = sync_func or self.sync_single_project_comprehensive
+        # Checkpointed syncs wrap the per-project function
+        project_sync = getattr(sync_func, '__wrapped__', sync_func)
+
+        async def sync_project(engine, mapping):
+            if project_sync == self.sync_single_project_comprehensive:
+                return await self._sync_project_comprehensive_async(engine, mapping)
+            # Incremental and batched syncs are already a handful of set-based queries per project
+            return await engine.run(mapping.sql_server_db, sync_func, mapping.project_name, mapping.sql_server_db)
+
+        async def sync_mapping(engine, mapping):
+            lease_key = project_lease_key(mapping.project_name)
+            timeout = SYNC_CONFIG.get('PROJECT_TIMEOUT_SECONDS')
+            token = CancellationToken(timeout, parent=self.cancellation)
+            try:
+                if self.leases is not None and not await engine.run(self.mysql_db, self.leases.acquire, lease_key):
+                    raise LeaseHeld(f"{lease_key} is being synced by another run")
+                try:
+                    result = await asyncio.wait_for(sync_project(_CancellableEngine(engine, token), mapping), timeout)
+                except asyncio.TimeoutError:
+                    # Stop waiting now; the token interrupts the statement still running on the worker thread
+                    token.cancel(CancellationToken.DEADLINE_EXCEEDED)
+                    raise StatementCancelled(CancellationToken.DEADLINE_EXCEEDED)
+                finally:
+                    if self.leases is not None:
+                        await engine.run(self.mysql_db, self.leases.release, lease_key)
+                self._raise_if_given_up(result, token)
+                return {
+                    'project': mapping.project_name,
+                    'database': mapping.sql_server_db,
+                    'success': result
+                }
+            except LeaseHeld as e:
+                return self._lease_skipped(mapping, e)
+            except Exception as e:
+                return self._project_failed(mapping, e)
+
+        async def sync_mappings(engine):
+            return list(await asyncio.gather(*(sync_mapping(engine, mapping) for mapping in mappings)))
+
+        # Resolve every alias's server up front: LazyDatabases reads DatabaseMapping, which
+        # the ORM refuses to do on the event loop thread
+        for mapping in mappings:
+            engine.server_resolver(mapping.sql_server_db)
+
+        return engine.run_all(sync_mappings)
+
+    async def _sync_project_comprehensive_async(self, engine, mapping):
+        """Async counterpart of sync_single_project_comprehensive: every period is its own query unit"""
+        project_name = mapping.project_name
+        sql_server_db = mapping.sql_server_db
+        logger.info(f"Starting comprehensive sync for project {project_name} from {sql_server_db}")
+
+        if self.manifest is not None:
+            await engine.run(self.mysql_db, self.manifest.start_project, project_name)
+        try:
+            result = await self._sync_project_periods_async(engine, project_name, sql_server_db)
+        except asyncio.CancelledError:
+            # Past PROJECT_TIMEOUT_SECONDS; the unit would otherwise be left running
+            if self.manifest is not None:
+                await engine.run(
+                    self.mysql_db, self.manifest.finish_project, project_name, False, CancellationToken.DEADLINE_EXCEEDED
+                )
+            raise
+        if self.manifest is not None:
+            await engine.run(self.mysql_db, self.manifest.finish_project, project_name, result)
+        return result
+
+    async def _sync_project_periods_async(self, engine, project_name, sql_server_db):
+        """Sync the periods of one project, skipping unchanged ones and those the run manifest already completed"""
+        fiscal_combinations = await engine.run(self.mysql_db, self._get_fiscal_combinations, project_name)
+        if not fiscal_combinations:
+            logger.warning(f"No fiscal combinations found for project {project_name}")
+            return True
+
+        project_obj, sync_log = await engine.run(self.mysql_db, self._start_sync_log, project_name)
+
+        try:
+            await engine.run(sql_server_db, self._refresh_glpost_replica, project_name)
+            fiscal_combinations, fingerprints, skipped_periods = await engine.run(
+                sql_server_db, self._changed_periods, project_obj, sql_server_db, fiscal_combinations
+            )
+            sync_log.periods_skipped = skipped_periods
+
+            if self.manifest is not None:
+                # Periods already completed by the interrupted run this one resumes
+                completed_periods = await engine.run(
+                    self.mysql_db, self.manifest.track_periods, project_name, sql_server_db, fiscal_combinations
+                )
+                fiscal_combinations = [period for period in fiscal_combinations if period not in completed_periods]
+
+            period_results = await asyncio.gather(*(
+                engine.run(
+                    sql_server_db, _get_aggregated_data,
+                    sql_server_db, project_name, fiscal_year, fiscal_period, fiscal_period,
+                    chunk_size=self.chunk_size
+                )
+                for fiscal_year, fiscal_period in fiscal_combinations
+            ), return_exceptions=True)
+
+            total_records = 0
+            successful_periods = 0
+            for (fiscal_year, fiscal_period), aggregated_data in zip(fiscal_combinations, period_results):
+                if isinstance(aggregated_data, Exception):
+                    logger.error(
+                        f"Error syncing {project_name} FY {fiscal_year} Period {fiscal_period}: {str(aggregated_data)}")
+                    if self.manifest is not None:
+                        await engine.run(
+                            self.mysql_db, self.manifest.finish_period,
+                            project_name, fiscal_year, fiscal_period, False, str(aggregated_data)
+                        )
+                    # A cancelled project fails as a whole, rather than completing without its periods
+                    await engine.run(self.mysql_db, _raise_if_cancelled)
+                    continue
+
+                await engine.run(
+                    self.mysql_db, self._update_project_period_stats,
+                    project_name, fiscal_year, fiscal_period, aggregated_data
+                )
+                await engine.run(
+                    self.mysql_db, self._save_period_fingerprint,
+                    project_obj, fiscal_year, fiscal_period, fingerprints.get((fiscal_year, fiscal_period))
+                )
+                total_records += (aggregated_data['supported_transactions_number'] +
+                                  aggregated_data['unsupported_transactions_number'])
+                successful_periods += 1
+                if self.manifest is not None:
+                    await engine.run(
+                        self.mysql_db, self.manifest.finish_period, project_name, fiscal_year, fiscal_period, True
+                    )
+
+            await engine.run(
+                self.mysql_db, self._finish_sync_log, project_obj, sync_log, total_records
+            )
+            logger.info(
+                f"Successfully completed comprehensive sync for {project_name}: {total_records} total transactions across {successful_periods} periods, "
+                f"{skipped_periods} unchanged periods skipped")
+            return True
+
+        except asyncio.CancelledError:
+            # Past PROJECT_TIMEOUT_SECONDS: close the SyncLog before the project is given up
+            await engine.run(
+                self.mysql_db, self._finish_sync_log, project_obj, sync_log, 0, CancellationToken.DEADLINE_EXCEEDED
+            )
+            raise
+        except Exception as e:
+            await engine.run(self.mysql_db, self._finish_sync_log, project_obj, sync_log, 0, str(e))
+            logger.error(f"Error in comprehensive sync for {project_name}: {str(e)}")
+            return False
+
+    @in_stage('extract')
+    def _changed_periods(self, project_obj, sql_server_db: str, fiscal_combinations):
+        """Drop the periods whose stats inputs are unchanged since they were last calculated
+
+        Returns:
+            Tuple of (periods to recalculate, fresh fingerprints by period, number of periods skipped)
+        """
+        if not SYNC_CONFIG.get('SKIP_UNCHANGED_PERIODS', False):
+            return list(fiscal_combinations), {}, 0
+
+        fingerprints = _get_period_fingerprints(sql_server_db, project_obj.project_name, fiscal_combinations)
+        stored = {
+            (fingerprint.fiscal_year, fingerprint.fiscal_period): fingerprint
+            for fingerprint in ProjectPeriodFingerprint.objects.using(self.mysql_db).filter(project=project_obj)
+        }
+        calculated = set(
+            ProjectPeriodStats.objects.using(self.mysql_db).filter(project=project_obj)
+            .values_list('fiscal_year', 'fiscal_period')
+        )
+
+        changed = [
+            period for period in fiscal_combinations
+            if period not in calculated or period not in stored or any(
+                getattr(stored[period], field) != value for field, value in fingerprints[period].items()
+            )
+        ]
+        skipped = len(fiscal_combinations) - len(changed)
+        if skipped:
+            logger.info(f"Skipping {skipped} unchanged periods of {project_obj.project_name}")
+            sync_skipped.inc(skipped, reason='unchanged_period')
+            # Their stats were just confirmed current; without a fresh last_calculated
+            # Project.get_stats would treat them as stale and recalculate them live
+            unchanged = Q()
+            for fiscal_year, fiscal_period in set(fiscal_combinations) - set(changed):
+                unchanged |= Q(fiscal_year=fiscal_year, fiscal_period=fiscal_period)
+            ProjectPeriodStats.objects.using(self.mysql_db).filter(unchanged, project=project_obj).update(
+                last_calculated=timezone.now()
+            )
+        return changed, fingerprints, skipped
+
+    @in_stage('stats')
+    def _save_period_fingerprint(self, project_obj, fiscal_year: str, fiscal_period: str, fingerprint: Optional[Dict]):
+        """Remember the fingerprint a period's stats were just calculated from"""
+        if fingerprint is None:
+            return
+        ProjectPeriodFingerprint.objects.using(self.mysql_db).update_or_create(
+            project=project_obj,
+            fiscal_year=fiscal_year,
+            fiscal_period=fiscal_period,
+            defaults=fingerprint
+        )
+
+    def _start_sync_log(self, project_name: str):
+        """Open a running SyncLog for a project"""
+        project_obj = Project.objects.using(self.mysql_db).get(project_name=project_name)
+        sync_log = SyncLog.objects.using(self.mysql_db).create(
+            project=project_obj,
+            status='running',
+            sync_started=timezone.now()
+        )
+        track_sync_log(sync_log)
+        return project_obj, sync_log
+
+    def _finish_sync_log(self, project_obj, sync_log, total_records, error_message=None):
+        """Close a SyncLog and record the outcome on the project"""
+        if error_message:
+            sync_log.status = 'failed'
+            sync_log.error_message = error_message
+            project_obj.sync_status = 'error'
+        else:
+            sync_log.status = 'completed'
+            sync_log.sync_completed = timezone.now()
+            sync_log.records_processed = total_records
+            project_obj.last_synced = timezone.now()
+            project_obj.sync_status = 'completed'
+
+        sync_log.save(using=self.mysql_db)
+        project_obj.save(using=self.mysql_db)
+
     def _sync_with_threading_current(self, mappings, max_workers):
         """Sync multiple projects concurrently"""
         results = []
@@ -438,6 +1350,7 @@ class TransactionSyncService:
             # Submit sync tasks
             future_to_mapping = {
                 executor.submit(
+                    self._run_and_release_connections,
                     self.sync_single_project_current_period,
                     mapping.project_name,
                     mapping.sql_server_db
@@ -466,15 +1379,23 @@ class TransactionSyncService:
 
         return results
 
-    def _sync_sequential(self, mappings):
+    def _sync_sequential(self, mappings, sync_func=None):
         """Sync projects one by one"""
         results = []
+        sync_func = sync_func or self.sync_single_project_comprehensive
 
         for mapping in mappings:
-            result = self.sync_single_project_comprehensive(
-                mapping.project_name,
-                mapping.sql_server_db
-            )
+            try:
+                result = sync_func(
+                    mapping.project_name,
+                    mapping.sql_server_db
+                )
+            except LeaseHeld as e:
+                results.append(self._lease_skipped(mapping, e))
+                continue
+            except StatementCancelled as e:
+                results.append(self._project_failed(mapping, e))
+                continue
             results.append({
                 'project': mapping.project_name,
                 'database': mapping.sql_server_db,
@@ -0,0 +1,222 @@
+"""
+Sync benchmark over the synthetic Sage companies of main_app/sage_dataset.py.
+
+Each repetition starts from empty local sync tables and runs the syncs in the
+order the scheduler would:
+
+    project_sync       ProjectSyncService.sync_transactions for every project
+    sync_all_projects  TransactionSyncService.sync_all_projects (period stats, glpost replica)
+    sync_comments      CommentSyncService.sync, what the sync_comments command runs
+
+Every scenario reports wall time, the statements issued per database alias
+(counted by the query timers of main_app/metrics.py, so threads are included)
+and its peak traced memory. tracemalloc slows Python down several times, so
+the peaks come from one extra traced pass and the timed passes run untraced.
+The report is plain JSON, so the reports of two commits can be compared with
+compare_reports.
+"""
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+
+import django
+from django.conf import settings
+from django.db import connection
+
+from audit_management_system.settings import SYNC_CONFIG
+from main_app.metrics import query_seconds
+from main_app.models import (
+    Project, ProjectPeriodFingerprint, ProjectPeriodStats, ProjectSyncSchedule, SyncLease, SyncLog, SyncMetrics,
+    SyncStageTiming, SyncWatermark, SyncWorkUnit,
+)
+from main_app.sage_dataset import load_manifest
+from main_app.services import TransactionSyncService
+from main_app.sync_profiler import reset_traced_peak, traced_peak
+from transactions.models import Comments, GlpostReplica, SupportingDocument, SupportingDocumentFile
+from transactions.services import CommentSyncService, ProjectSyncService
+
+SCENARIOS = ('project_sync', 'sync_all_projects', 'sync_comments')
+
+# Children before parents, so the deletes never trip a foreign key
+LOCAL_SYNC_MODELS = (
+    Comments, SupportingDocumentFile, SupportingDocument, GlpostReplica, ProjectPeriodStats,
+    ProjectPeriodFingerprint, SyncWatermark, SyncLease, ProjectSyncSchedule, SyncStageTiming, SyncLog,
+    SyncWorkUnit, SyncMetrics,
+)
+
+
+def reset_local_state():
+    """Empty the local tables the syncs fill, so every repetition starts cold"""
+    # MySQL checks the self-reference row by row
+    SyncMetrics.objects.update(resumed_from=None)
+    with connection.cursor() as cursor:
+        for model in LOCAL_SYNC_MODELS:
+            cursor.execute(f'DELETE FROM {connection.ops.quote_name(model._meta.db_table)}')
+    Project.objects.update(last_synced=None, sync_status='pending')
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class SyncBenchmark:
+    """Run the sync scenarios against the generated companies and collect their measurements"""
+
+    def __init__(self, repeat=1, scenarios=SCENARIOS, extraction_mode='bulk', load_mode='bulk', incremental=None,
+                 batched_periods=None, max_workers=1, trace_memory=True):
+        self.repeat = repeat
+        self.scenarios = [name for name in SCENARIOS if name in scenarios]
+        self.extraction_mode = extraction_mode
+        self.load_mode = load_mode
+        self.incremental = SYNC_CONFIG.get('INCREMENTAL', False) if incremental is None else incremental
+        self.batched_periods = (
+            SYNC_CONFIG.get('BATCHED_PERIODS', False) if batched_periods is None else batched_periods
+        )
+        self.max_workers = max_workers
+        self.trace_memory = trace_memory
+
+    def run(self):
+        """
+        Returns:
+            The benchmark report: environment, dataset, configuration and per-scenario measurements
+        """
+        runs = {name: [] for name in self.scenarios}
+        for _ in range(self.repeat):
+            reset_local_state()
+            for name in self.scenarios:
+                runs[name].append(self.measure(getattr(self, f'_run_{name}')))
+
+        peaks = {}
+        if self.trace_memory:
+            started_tracing = not tracemalloc.is_tracing()
+            if started_tracing:
+                tracemalloc.start()
+            try:
+                reset_local_state()
+                for name in self.scenarios:
+                    peaks[name] = self.measure_memory(getattr(self, f'_run_{name}'))
+            finally:
+                if started_tracing:
+                    tracemalloc.stop()
+
+        return {
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'dataset': load_manifest(settings.BENCHMARK_DATA_DIR),
+            'config': {
+                'extraction_mode': self.extraction_mode,
+                'load_mode': self.load_mode,
+                'incremental': self.incremental,
+                'batched_periods': self.batched_periods,
+                'max_workers': self.max_workers,
+                'stream_chunk_size': SYNC_CONFIG.get('STREAM_CHUNK_SIZE'),
+                'load_batch_size': SYNC_CONFIG.get('LOAD_BATCH_SIZE'),
+                'glpost_replica': SYNC_CONFIG.get('GLPOST_REPLICA', False),
+                'repeat': self.repeat,
+                'trace_memory': self.trace_memory,
+            },
+            'scenarios': {
+                name: {**self._summarise(measurements), 'peak_memory_kb': peaks.get(name)}
+                for name, measurements in runs.items()
+            },
+        }
+
+    def measure(self, func):
+        """Wall time and statements per alias of one call of func"""
+        queries_before = query_seconds.snapshot()
+
+        started = time.perf_counter()
+        result = func()
+        wall_seconds = time.perf_counter() - started
+
+        queries_after = query_seconds.snapshot()
+        queries = {}
+        query_time = {}
+        for (alias,), (count, total) in queries_after.items():
+            before_count, before_total = queries_before.get((alias,), (0, 0.0))
+            if count > before_count:
+                queries[alias] = count - before_count
+                query_time[alias] = round(total - before_total, 4)
+
+        return {
+            'wall_seconds': wall_seconds,
+            'queries': sum(queries.values()),
+            'queries_by_alias': queries,
+            'query_seconds_by_alias': query_time,
+            'result': result,
+        }
+
+    @staticmethod
+    def measure_memory(func):
+        """Peak traced memory of one call of func above what was allocated before it, in KB"""
+        reset_traced_peak()
+        memory_base = tracemalloc.get_traced_memory()[0]
+        func()
+        return (traced_peak() - memory_base) // 1024
+
+    @staticmethod
+    def _summarise(measurements):
+        """The median wall time over the repetitions; the counts of the last one"""
+        walls = [measurement['wall_seconds'] for measurement in measurements]
+        return {
+            **measurements[-1],
+            'wall_seconds': round(statistics.median(walls), 4),
+            'wall_seconds_runs': [round(wall, 4) for wall in walls],
+        }
+
+    def _run_project_sync(self):
+        service = ProjectSyncService(
+            extraction_mode=self.extraction_mode, load_mode=self.load_mode,
+            batch_size=SYNC_CONFIG.get('LOAD_BATCH_SIZE', 500), chunk_size=SYNC_CONFIG.get('STREAM_CHUNK_SIZE', 2000)
+        )
+        return {'synced': service.sync_transactions(None)}
+
+    def _run_sync_all_projects(self):
+        results = TransactionSyncService().sync_all_projects(
+            use_threading=self.max_workers > 1, max_workers=self.max_workers,
+            incremental=self.incremental, batched_periods=self.batched_periods
+        )
+        return {
+            'projects': len(results),
+            'successful': sum(1 for result in results if result.get('success', False)),
+        }
+
+    def _run_sync_comments(self):
+        service = CommentSyncService()
+        created = service.sync()
+        return {'created': created, 'glposts': service.stats.get('glposts', 0)}
+
+
+def compare_reports(report, baseline):
+    """
+    Per-scenario change from baseline to report.
+
+    Returns:
+        List of dicts with the scenario, both wall times and their ratio, and both query counts
+    """
+    comparison = []
+    for name, scenario in report['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(name)
+        if previous is None:
+            continue
+        comparison.append({
+            'scenario': name,
+            'wall_seconds': scenario['wall_seconds'],
+            'baseline_wall_seconds': previous['wall_seconds'],
+            'wall_ratio': round(scenario['wall_seconds'] / previous['wall_seconds'], 3)
+            if previous['wall_seconds'] else None,
+            'queries': scenario['queries'],
+            'baseline_queries': previous['queries'],
+            'peak_memory_kb': scenario['peak_memory_kb'],
+            'baseline_peak_memory_kb': previous['peak_memory_kb'],
+        })
+    return comparison
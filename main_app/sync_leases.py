@@ -0,0 +1,156 @@
+import logging
+import os
+import socket
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.db import connections
+from django.db.models import Q
+from django.utils import timezone
+
+from audit_management_system.settings import SYNC_CONFIG
+from main_app.models import SyncLease
+
+logger = logging.getLogger(__name__)
+
+
+class LeaseHeld(Exception):
+    """The lease is held by another sync run"""
+
+
+class SyncLeaseManager:
+    """
+    Database-backed leases held by one sync run.
+
+    Every claim is a single conditional UPDATE on the sync_leases row, so runs in
+    different processes or on different hosts never hold the same key at once.
+    While any lease is held a heartbeat thread renews them every third of the
+    TTL; if the process dies they expire and another run can take the work over.
+
+    Use as a context manager so the heartbeat is stopped and every lease
+    released at the end of the run:
+
+        with SyncLeaseManager() as leases:
+            with leases.hold('project:P1'):
+                ...
+    """
+
+    def __init__(self, ttl_seconds=None, owner=None):
+        self.ttl = timedelta(seconds=ttl_seconds or SYNC_CONFIG.get('LEASE_TTL_SECONDS', 120))
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._held = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._heartbeat = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def acquire(self, key):
+        """Claim key if it is free, expired or already ours; returns whether we hold it"""
+        now = timezone.now()
+        # Make sure the row exists, so the claim itself can be one atomic UPDATE
+        SyncLease.objects.bulk_create([SyncLease(key=key, expires_at=now)], ignore_conflicts=True)
+        claimed = SyncLease.objects.filter(
+            Q(expires_at__lte=now) | Q(owner=self.owner), key=key
+        ).update(owner=self.owner, acquired_at=now, expires_at=now + self.ttl)
+
+        if not claimed:
+            return False
+
+        with self._lock:
+            self._held.add(key)
+            self._start_heartbeat()
+        return True
+
+    def acquire_any(self, keys):
+        """Claim the first free key of keys, e.g. one of a server's slots; returns it, or None when all are held"""
+        for key in keys:
+            if self.acquire(key):
+                return key
+        return None
+
+    def release(self, key):
+        """Give up key so the next run can claim it straight away"""
+        with self._lock:
+            self._held.discard(key)
+        SyncLease.objects.filter(key=key, owner=self.owner).update(owner='', expires_at=timezone.now())
+
+    def renew(self):
+        """Push back the expiry of every held lease; leases taken over by another run are dropped"""
+        with self._lock:
+            held = set(self._held)
+        if not held:
+            return set()
+
+        now = timezone.now()
+        SyncLease.objects.filter(key__in=held, owner=self.owner).update(expires_at=now + self.ttl)
+        kept = set(SyncLease.objects.filter(key__in=held, owner=self.owner).values_list('key', flat=True))
+
+        lost = held - kept
+        if lost:
+            logger.warning(f"Sync leases {sorted(lost)} expired and were taken over by another run")
+            with self._lock:
+                self._held -= lost
+        return kept
+
+    @contextmanager
+    def hold(self, key):
+        """Hold key for the duration of the block, raising LeaseHeld if another run has it"""
+        if not self.acquire(key):
+            raise LeaseHeld(f"{key} is being synced by another run")
+        try:
+            yield
+        finally:
+            self.release(key)
+
+    def held(self):
+        with self._lock:
+            return set(self._held)
+
+    def close(self):
+        """Stop renewing and release every lease still held"""
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+            self._heartbeat = None
+        for key in self.held():
+            self.release(key)
+
+    def _start_heartbeat(self):
+        """Start the renewal thread on first use (caller holds self._lock)"""
+        if self._heartbeat is not None or self._stop.is_set():
+            return
+        self._heartbeat = threading.Thread(target=self._renew_forever, name='sync-lease-heartbeat', daemon=True)
+        self._heartbeat.start()
+
+    def _renew_forever(self):
+        interval = self.ttl.total_seconds() / 3
+        try:
+            while not self._stop.wait(interval):
+                try:
+                    self.renew()
+                except Exception as e:
+                    logger.error(f"Error renewing sync leases: {str(e)}")
+        finally:
+            connections.close_all()
+
+
+def project_lease_key(project_name):
+    return f"project:{project_name}"
+
+
+def host_slot_keys(server, slots=None):
+    """
+    Lease keys of the sync slots of one SQL Server host (HOST:PORT).
+
+    A sync holding one of them may query the server; with all of them held,
+    the host already has SYNC_CONFIG['MAX_WORKERS_PER_SERVER'] syncs running.
+    """
+    slots = slots or SYNC_CONFIG.get('MAX_WORKERS_PER_SERVER', 4)
+    return [f"host:{server}:{slot}" for slot in range(slots)]
@@ -0,0 +1,152 @@
+import logging
+from datetime import timedelta
+
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from audit_management_system.settings import SYNC_CONFIG
+from main_app.models import SyncMetrics, SyncWorkUnit
+
+logger = logging.getLogger(__name__)
+
+UNFINISHED = ('pending', 'running', 'failed')
+
+
+class SyncRunManifest:
+    """
+    Checkpoints of one SyncMetrics run: a work unit per project, plus one per fiscal
+    period for syncs that work period by period.
+
+    Every unit is marked running, completed or failed as the sync goes, so when
+    a run crashes or times out the next one can resume it: projects and periods
+    already completed are skipped and only the unfinished ones are synced again.
+    A project counts as completed only once all its period units are.
+    """
+
+    def __init__(self, run):
+        self.run = run
+
+    @classmethod
+    def find_interrupted(cls, stale_after=None):
+        """
+        Manifest of the latest run that stopped with unfinished units, if any.
+
+        A run is interrupted when it failed, or is still marked running long after
+        TIMEOUT_MINUTES (its process died). Runs older than the last completed run
+        are not resumed; that run already covered their work. Neither are runs
+        already resumed, whose units now belong to the run that resumed them.
+        """
+        stale_after = stale_after or timedelta(minutes=SYNC_CONFIG['TIMEOUT_MINUTES'])
+        runs = SyncMetrics.objects.filter(
+            Q(status='failed') | Q(status='running', started_at__lt=timezone.now() - stale_after),
+            work_units__status__in=UNFINISHED, resumed_by__isnull=True
+        )
+
+        last_completed = SyncMetrics.objects.filter(status='completed').values_list('started_at', flat=True).first()
+        if last_completed is not None:
+            runs = runs.filter(started_at__gt=last_completed)
+
+        run = runs.order_by('-started_at').first()
+        return cls(run) if run is not None else None
+
+    def resume_in(self, new_run):
+        """
+        Hand the work of this run over to new_run, closing this run if it never finished.
+
+        The units are copied onto new_run, completed ones as they are and unfinished
+        ones back to pending, so the new run checkpoints against its own units.
+
+        Returns:
+            The manifest of new_run
+        """
+        SyncWorkUnit.objects.bulk_create([
+            SyncWorkUnit(
+                run=new_run, project_name=unit.project_name, sql_server_db=unit.sql_server_db,
+                fiscal_year=unit.fiscal_year, fiscal_period=unit.fiscal_period, attempts=unit.attempts,
+                **(
+                    {'status': 'completed', 'started_at': unit.started_at, 'completed_at': unit.completed_at}
+                    if unit.status == 'completed' else {'error_message': unit.error_message}
+                )
+            )
+            for unit in SyncWorkUnit.objects.filter(run=self.run)
+        ], ignore_conflicts=True)
+
+        if self.run.status == 'running':
+            self.run.status = 'failed'
+            self.run.completed_at = timezone.now()
+            self.run.error_message = f"Interrupted; resumed by run {new_run.pk}"
+            self.run.save(update_fields=['status', 'completed_at', 'error_message'])
+
+        new_run.resumed_from = self.run
+        new_run.save(update_fields=['resumed_from'])
+
+        progress = self.progress()
+        logger.info(
+            f"Resuming sync run {self.run.pk} in run {new_run.pk}: "
+            f"{progress.get('completed', 0)} units completed, "
+            f"{sum(progress.get(status, 0) for status in UNFINISHED)} left"
+        )
+        return SyncRunManifest(new_run)
+
+    def track(self, mappings):
+        """
+        Record a project unit for each mapping and return the mappings still to sync.
+
+        Mappings already in the manifest keep their state, so on resume only
+        projects without a completed unit are returned.
+        """
+        mappings = list(mappings)
+        SyncWorkUnit.objects.bulk_create([
+            SyncWorkUnit(run=self.run, project_name=mapping.project_name, sql_server_db=mapping.sql_server_db)
+            for mapping in mappings
+        ], ignore_conflicts=True)
+
+        completed = set(self._project_units().filter(status='completed').values_list(
+            'project_name', 'sql_server_db'
+        ))
+        return [mapping for mapping in mappings if (mapping.project_name, mapping.sql_server_db) not in completed]
+
+    def start_project(self, project_name):
+        self._project_units().filter(project_name=project_name).update(
+            status='running', attempts=F('attempts') + 1, started_at=timezone.now(), error_message=None
+        )
+
+    def finish_project(self, project_name, success, error=None):
+        """Close a project unit; it stays unfinished while any of its periods failed"""
+        if success and self._period_units(project_name).exclude(status='completed').exists():
+            success, error = False, 'Some fiscal periods failed'
+        self._project_units().filter(project_name=project_name).update(
+            status='completed' if success else 'failed', completed_at=timezone.now(), error_message=error
+        )
+
+    def track_periods(self, project_name, sql_server_db, fiscal_combinations):
+        """Record a unit per fiscal period and return the (fiscal_year, fiscal_period) pairs already completed"""
+        SyncWorkUnit.objects.bulk_create([
+            SyncWorkUnit(
+                run=self.run, project_name=project_name, sql_server_db=sql_server_db,
+                fiscal_year=fiscal_year, fiscal_period=fiscal_period
+            )
+            for fiscal_year, fiscal_period in fiscal_combinations
+        ], ignore_conflicts=True)
+
+        return set(self._period_units(project_name).filter(status='completed').values_list(
+            'fiscal_year', 'fiscal_period'
+        ))
+
+    def finish_period(self, project_name, fiscal_year, fiscal_period, success, error=None):
+        self._period_units(project_name).filter(fiscal_year=fiscal_year, fiscal_period=fiscal_period).update(
+            status='completed' if success else 'failed', attempts=F('attempts') + 1,
+            completed_at=timezone.now(), error_message=error
+        )
+
+    def progress(self):
+        """Number of units per status"""
+        return dict(
+            SyncWorkUnit.objects.filter(run=self.run).values_list('status').annotate(units=Count('pk')).order_by()
+        )
+
+    def _project_units(self):
+        return SyncWorkUnit.objects.filter(run=self.run, fiscal_year='', fiscal_period='')
+
+    def _period_units(self, project_name):
+        return SyncWorkUnit.objects.filter(run=self.run, project_name=project_name).exclude(fiscal_year='')
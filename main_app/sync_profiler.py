@@ -0,0 +1,376 @@
+"""
+Per-stage instrumentation of project syncs.
+
+A SyncProfiler is active on the thread running one project sync. The sync
+code marks its stages with the module functions (sync_stage, profile_rows,
+add_rows), which do nothing when no profiler is active:
+
+    extract    reading Sage rows and the local documents the stats start from
+    transform  in-memory aggregation and diffing
+    load       SupportingDocument and glpost replica writes
+    stats      ProjectPeriodStats and fingerprint writes
+
+Stage times are exclusive: a nested stage pauses the one around it, and the
+time spent fetching rows through profile_rows is charged to its own stage.
+Every query on the profiled aliases is counted against the innermost stage.
+Peak memory is recorded while tracemalloc is tracing (PROFILE_MEMORY); it is
+exact for sequential syncs and an upper bound when projects sync in threads.
+"""
+import functools
+import logging
+import threading
+import time
+import tracemalloc
+from contextlib import ExitStack, contextmanager, nullcontext
+from datetime import timedelta
+
+from django.db import connections
+from django.db.models import Avg, Count, Max, Sum
+from django.utils import timezone
+
+from audit_management_system.settings import SYNC_CONFIG
+from main_app.metrics import sync_project_seconds, sync_projects, sync_rows
+
+logger = logging.getLogger(__name__)
+
+STAGES = ('extract', 'transform', 'load', 'stats')
+
+_local = threading.local()
+
+# Highest traced memory peak a stage reset away, for traced_peak()
+_peak_seen = 0
+
+
+def ensure_memory_tracing():
+    """Start tracemalloc when PROFILE_MEMORY is on, so stage peaks are recorded"""
+    if SYNC_CONFIG.get('PROFILE_MEMORY', False) and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+class SyncProfiler:
+    """Stage timings, query counts, row counts and peak memory of one project sync"""
+
+    def __init__(self, project_name, aliases=('default',)):
+        self.project_name = project_name
+        self.aliases = tuple(dict.fromkeys(aliases))
+        self.sync_log = None
+        self.stages = {}
+        self.started = None
+        self.seconds = None
+        self._stack = []  # [name, resumed_at, memory_base, memory_peak]
+        self._exit_stack = None
+        self._previous = None
+
+    def __enter__(self):
+        self._previous = current_profiler()
+        _local.profiler = self
+        self._exit_stack = ExitStack()
+        for alias in self.aliases:
+            self._exit_stack.enter_context(connections[alias].execute_wrapper(self._count_query))
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.seconds = time.perf_counter() - self.started
+        self._exit_stack.close()
+        # Bookkeeping outside any stage: SyncLog and project status writes, mapping lookups
+        other = self._entry('other')
+        other['seconds'] = max(self.seconds - sum(entry['seconds'] for entry in self.stages.values()), 0)
+        _local.profiler = self._previous
+
+    def _entry(self, name):
+        entry = self.stages.get(name)
+        if entry is None:
+            entry = {'seconds': 0.0, 'calls': 0, 'queries': {}, 'rows': 0, 'peak_memory_kb': None}
+            self.stages[name] = entry
+        return entry
+
+    def _count_query(self, execute, sql, params, many, context):
+        name = self._stack[-1][0] if self._stack else 'other'
+        queries = self._entry(name)['queries']
+        alias = context['connection'].alias
+        queries[alias] = queries.get(alias, 0) + 1
+        return execute(sql, params, many, context)
+
+    @contextmanager
+    def stage(self, name):
+        """Charge the block's time, queries and memory to stage name, pausing the enclosing stage"""
+        now = time.perf_counter()
+        tracing = tracemalloc.is_tracing()
+        base = peak = None
+        if tracing:
+            base, peak = tracemalloc.get_traced_memory()
+        if self._stack:
+            parent = self._stack[-1]
+            self._entry(parent[0])['seconds'] += now - parent[1]
+            if tracing and parent[3] is not None:
+                parent[3] = max(parent[3], peak)
+        if tracing:
+            _reset_peak(peak)
+        self._stack.append([name, now, base, base])
+
+        try:
+            yield self
+        finally:
+            name, resumed_at, base, observed = self._stack.pop()
+            now = time.perf_counter()
+            entry = self._entry(name)
+            entry['seconds'] += now - resumed_at
+            entry['calls'] += 1
+            if base is not None and tracemalloc.is_tracing():
+                peak = max(observed, tracemalloc.get_traced_memory()[1])
+                entry['peak_memory_kb'] = max(entry['peak_memory_kb'] or 0, (peak - base) // 1024)
+                if self._stack and self._stack[-1][3] is not None:
+                    self._stack[-1][3] = max(self._stack[-1][3], peak)
+            if self._stack:
+                self._stack[-1][1] = now
+
+    def iterate(self, name, rows):
+        """Yield rows, charging the time spent fetching them and their count to stage name"""
+        clock = time.perf_counter
+        stack = self._stack
+        fetching = [name, 0.0, None, None]
+        count = 0
+        started = clock()
+        # A queryset runs its query when iterated
+        stack.append(fetching)
+        try:
+            iterator = iter(rows)
+        finally:
+            stack.pop()
+            spent = clock() - started
+        while True:
+            started = clock()
+            # Queries issued while fetching count against the fetching stage
+            stack.append(fetching)
+            try:
+                row = next(iterator)
+            except StopIteration:
+                break
+            finally:
+                stack.pop()
+                spent += clock() - started
+            count += 1
+            yield row
+
+        entry = self._entry(name)
+        entry['seconds'] += spent
+        entry['rows'] += count
+        entry['calls'] += 1
+        if stack:
+            # The enclosing stage was timed through the fetches; take them back out
+            self._entry(stack[-1][0])['seconds'] -= spent
+
+    def add_rows(self, name, rows):
+        self._entry(name)['rows'] += rows
+
+    def summary(self):
+        """Stages in pipeline order, rounded for logs and API responses"""
+        order = {name: index for index, name in enumerate(STAGES)}
+        return {
+            name: {
+                **entry,
+                'seconds': round(entry['seconds'], 4),
+                'total_queries': sum(entry['queries'].values()),
+            }
+            for name, entry in sorted(self.stages.items(), key=lambda item: order.get(item[0], len(STAGES)))
+        }
+
+    def save(self, run=None):
+        """Store one SyncStageTiming per stage, attached to the sync's SyncLog and the run"""
+        from main_app.models import SyncStageTiming
+
+        if self.sync_log is None or not self.stages:
+            return []
+
+        timings = [
+            SyncStageTiming(
+                sync_log=self.sync_log,
+                run=run,
+                project_id=self.sync_log.project_id,
+                stage=name,
+                seconds=entry['seconds'],
+                calls=entry['calls'],
+                queries=sum(entry['queries'].values()),
+                query_counts=entry['queries'],
+                rows=entry['rows'],
+                peak_memory_kb=entry['peak_memory_kb'],
+            )
+            for name, entry in self.stages.items()
+        ]
+        return SyncStageTiming.objects.bulk_create(timings)
+
+
+def _reset_peak(peak):
+    global _peak_seen
+    _peak_seen = max(_peak_seen, peak)
+    tracemalloc.reset_peak()
+
+
+def traced_peak():
+    """Peak traced memory since reset_traced_peak(), including the peaks stages reset to measure their own"""
+    return max(_peak_seen, tracemalloc.get_traced_memory()[1])
+
+
+def reset_traced_peak():
+    global _peak_seen
+    _peak_seen = 0
+    tracemalloc.reset_peak()
+
+
+def current_profiler():
+    """SyncProfiler active on the calling thread, or None"""
+    return getattr(_local, 'profiler', None)
+
+
+def sync_stage(name):
+    """Context manager charging its block to stage name of the active profiler"""
+    profiler = current_profiler()
+    return profiler.stage(name) if profiler is not None else nullcontext()
+
+
+def in_stage(name):
+    """Decorator form of sync_stage"""
+    def decorate(func):
+        @functools.wraps(func)
+        def staged(*args, **kwargs):
+            with sync_stage(name):
+                return func(*args, **kwargs)
+        return staged
+    return decorate
+
+
+def profile_rows(name, rows):
+    """rows, with their fetching charged to stage name of the active profiler"""
+    profiler = current_profiler()
+    return profiler.iterate(name, rows) if profiler is not None else rows
+
+
+def add_rows(name, rows):
+    profiler = current_profiler()
+    if profiler is not None:
+        profiler.add_rows(name, rows)
+
+
+def track_sync_log(sync_log):
+    """Attach the SyncLog of the running project sync to the active profiler"""
+    profiler = current_profiler()
+    if profiler is not None:
+        profiler.sync_log = sync_log
+
+
+def profiled_sync(sync_func):
+    """
+    Decorate a TransactionSyncService per-project sync so it runs under a SyncProfiler.
+
+    The stage timings are stored with the SyncLog the sync tracks, kept in the
+    service's stage_profiles by project and added to the sync metrics.
+    """
+    mode = sync_func.__name__.replace('sync_single_project_', '')
+
+    @functools.wraps(sync_func)
+    def profiled(service, project_name, sql_server_db, *args, **kwargs):
+        profiler = SyncProfiler(project_name, aliases=(service.mysql_db, sql_server_db))
+        result = None
+        try:
+            with profiler:
+                result = sync_func(service, project_name, sql_server_db, *args, **kwargs)
+        finally:
+            if profiler.seconds is not None:
+                sync_project_seconds.observe(profiler.seconds, project=project_name, mode=mode)
+            sync_projects.inc(project=project_name, mode=mode, result='success' if result else 'failed')
+            for name, entry in profiler.stages.items():
+                if entry['rows']:
+                    sync_rows.inc(entry['rows'], project=project_name, stage=name)
+
+        service.stage_profiles[project_name] = profiler.summary()
+        logger.info(f"Sync stages of {project_name}: " + ", ".join(
+            f"{name} {stage['seconds']:.3f}s/{stage['total_queries']}q"
+            for name, stage in service.stage_profiles[project_name].items()
+        ))
+        try:
+            profiler.save(run=service.manifest.run if service.manifest is not None else None)
+        except Exception as e:
+            # Instrumentation never fails a sync
+            logger.error(f"Error saving sync stage timings for {project_name}: {str(e)}")
+        return result
+    return profiled
+
+
+def stage_report(hours=24, limit=10, project_name=None):
+    """
+    Slowest projects and stages over the last hours of stored stage timings.
+
+    Returns:
+        Dict with the window, the slowest projects (total stage time per project
+        and its slowest stage) and the per-stage totals, averages and maxima
+    """
+    from main_app.models import SyncStageTiming
+
+    since = timezone.now() - timedelta(hours=hours)
+    timings = SyncStageTiming.objects.filter(recorded_at__gte=since)
+    if project_name:
+        timings = timings.filter(project__project_name=project_name)
+
+    projects = list(
+        timings.values('project__project_name')
+        .annotate(
+            syncs=Count('sync_log', distinct=True),
+            total_seconds=Sum('seconds'),
+            total_queries=Sum('queries'),
+            total_rows=Sum('rows'),
+            max_memory_kb=Max('peak_memory_kb'),
+        )
+        .order_by('-total_seconds')[:limit]
+    )
+    slowest_stages = {}
+    for project_name_, stage, seconds in timings.filter(
+            project__project_name__in=[project['project__project_name'] for project in projects]
+    ).values_list('project__project_name', 'stage').annotate(total_seconds=Sum('seconds')).order_by():
+        if seconds > slowest_stages.get(project_name_, (None, -1))[1]:
+            slowest_stages[project_name_] = (stage, seconds)
+
+    stages = list(
+        timings.values('stage')
+        .annotate(
+            syncs=Count('sync_log', distinct=True),
+            total_seconds=Sum('seconds'),
+            avg_seconds=Avg('seconds'),
+            max_seconds=Max('seconds'),
+            total_queries=Sum('queries'),
+            total_rows=Sum('rows'),
+            max_memory_kb=Max('peak_memory_kb'),
+        )
+        .order_by('-total_seconds')
+    )
+
+    return {
+        'since': since.isoformat(),
+        'hours': hours,
+        'projects': [
+            {
+                'project': project['project__project_name'],
+                'syncs': project['syncs'],
+                'seconds': round(project['total_seconds'] or 0, 3),
+                'avg_seconds': round((project['total_seconds'] or 0) / max(project['syncs'], 1), 3),
+                'queries': project['total_queries'] or 0,
+                'rows': project['total_rows'] or 0,
+                'peak_memory_kb': project['max_memory_kb'],
+                'slowest_stage': slowest_stages.get(project['project__project_name'], (None, 0))[0],
+            }
+            for project in projects
+        ],
+        'stages': [
+            {
+                'stage': stage['stage'],
+                'syncs': stage['syncs'],
+                'seconds': round(stage['total_seconds'] or 0, 3),
+                'avg_seconds': round(stage['avg_seconds'] or 0, 4),
+                'max_seconds': round(stage['max_seconds'] or 0, 4),
+                'queries': stage['total_queries'] or 0,
+                'rows': stage['total_rows'] or 0,
+                'peak_memory_kb': stage['max_memory_kb'],
+            }
+            for stage in stages
+        ],
+    }
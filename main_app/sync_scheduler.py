@@ -0,0 +1,194 @@
+import logging
+import time
+from datetime import timedelta
+
+from audit_management_system.settings import SYNC_CONFIG
+from main_app.models import DatabaseMapping, ProjectSyncSchedule
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveSyncScheduler:
+    """
+    Decides which projects a sync tick runs: the hottest first, within a time budget.
+
+    A project's priority grows with its recent Sage change rate and with the time
+    since its last sync, and shrinks with what its syncs cost:
+
+        priority = (1 + change_rate) * staleness / (1 + avg_sync_seconds / 60)
+
+    where staleness is counted in sync intervals. Due projects are taken in
+    priority order while their estimated sync seconds fit in the budget (the top
+    one always runs); the rest are deferred and, being staler, rank higher on the
+    next tick. A project whose syncs keep finding no changes backs off: its next
+    due time doubles with each idle sync, up to max_backoff_minutes. So does a
+    project whose syncs keep failing, from its second failure in a row; its
+    first successful sync resets it.
+
+    Change counts are the Sage rows in an incremental sync's change window; with
+    full syncs projects are still ranked by staleness and cost, but never back
+    off. Local edits (uploads, support status) do not count as activity, since the
+    sync's own writes would look the same; they are picked up by the project's
+    next sync, at most max_backoff_minutes away.
+    """
+
+    SMOOTHING = 0.3  # Weight of the newest observation in change_rate and avg_sync_seconds
+    DEFAULT_SYNC_SECONDS = 30  # Cost estimate for a project that was never synced
+    NEVER_SYNCED_STALENESS = 1000  # In intervals, so never-synced projects go first
+
+    def __init__(self, interval_minutes=None, time_budget_seconds=None, max_backoff_minutes=None):
+        self.interval = timedelta(minutes=interval_minutes or SYNC_CONFIG['INTERVAL_MINUTES'])
+        # Project-seconds of sync work per tick; by default what MAX_WORKERS threads do in 80% of an interval
+        self.time_budget_seconds = (
+            time_budget_seconds
+            or SYNC_CONFIG.get('SCHEDULE_TIME_BUDGET_SECONDS')
+            or self.interval.total_seconds() * 0.8 * SYNC_CONFIG['MAX_WORKERS']
+        )
+        self.max_backoff = timedelta(
+            minutes=max_backoff_minutes or SYNC_CONFIG.get('SCHEDULE_MAX_BACKOFF_MINUTES', 120)
+        )
+        # Wall seconds of each project sync run through timed()
+        self.sync_seconds = {}
+
+    def plan(self, now):
+        """
+        Score every active project and split them into scheduled, deferred and backed off.
+
+        Returns:
+            Tuple of (list of scheduled ProjectSyncSchedule, list of decision dicts for SyncMetrics.schedule)
+        """
+        schedules = self._load_schedules()
+
+        due = []
+        decisions = []
+        for schedule in schedules:
+            schedule.priority = self.score(schedule, now)
+            if schedule.next_due_at is None or schedule.next_due_at <= now:
+                due.append(schedule)
+            else:
+                decisions.append(self._decision(schedule, 'backed_off'))
+
+        scheduled = []
+        budget_used = 0.0
+        for schedule in sorted(due, key=lambda s: s.priority, reverse=True):
+            estimated_seconds = self.estimated_seconds(schedule)
+            if scheduled and budget_used + estimated_seconds > self.time_budget_seconds:
+                decisions.append(self._decision(schedule, 'deferred'))
+                continue
+            scheduled.append(schedule)
+            budget_used += estimated_seconds
+            decisions.append(self._decision(schedule, 'scheduled'))
+
+        ProjectSyncSchedule.objects.bulk_update(schedules, ['priority'])
+        decisions.sort(key=lambda decision: decision['priority'], reverse=True)
+
+        logger.info(
+            f"Adaptive schedule: {len(scheduled)} scheduled (~{budget_used:.0f}s of "
+            f"{self.time_budget_seconds:.0f}s budget), {len(due) - len(scheduled)} deferred, "
+            f"{len(schedules) - len(due)} backed off"
+        )
+        return scheduled, decisions
+
+    def score(self, schedule, now):
+        """Priority of a project at now; higher syncs first"""
+        if schedule.last_synced_at is None:
+            staleness = self.NEVER_SYNCED_STALENESS
+        else:
+            staleness = (now - schedule.last_synced_at) / self.interval
+        return (1 + schedule.change_rate) * staleness / (1 + self.estimated_seconds(schedule) / 60)
+
+    def estimated_seconds(self, schedule):
+        if schedule.avg_sync_seconds is None:
+            return self.DEFAULT_SYNC_SECONDS
+        return schedule.avg_sync_seconds
+
+    def timed(self, sync_func):
+        """Wrap a project sync function so its wall time is recorded in sync_seconds"""
+        def timed_sync(project_name, sql_server_db):
+            started = time.perf_counter()
+            try:
+                return sync_func(project_name, sql_server_db)
+            finally:
+                self.sync_seconds[project_name] = time.perf_counter() - started
+        return timed_sync
+
+    def record(self, scheduled, results, change_counts, started):
+        """
+        Fold the outcome of this tick's syncs into the scheduled projects' state.
+
+        Args:
+            scheduled: ProjectSyncSchedules returned by plan()
+            results: Result dicts of the sync ({'project', 'database', 'success'})
+            change_counts: Changed Sage rows per project name, from incremental syncs
+            started: When the tick started; becomes last_synced_at
+        """
+        succeeded = {(result['project'], result['database']) for result in results if result.get('success')}
+        # Projects a concurrent run holds the lease of; that run records their outcome
+        skipped = {(result['project'], result['database']) for result in results if result.get('skipped')}
+        interval_hours = self.interval / timedelta(hours=1)
+
+        scheduled = [
+            schedule for schedule in scheduled
+            if (schedule.mapping.project_name, schedule.mapping.sql_server_db) not in skipped
+        ]
+        for schedule in scheduled:
+            mapping = schedule.mapping
+            seconds = self.sync_seconds.get(mapping.project_name)
+            if seconds is not None:
+                schedule.avg_sync_seconds = self._smooth(schedule.avg_sync_seconds, seconds)
+
+            if (mapping.project_name, mapping.sql_server_db) not in succeeded:
+                # A failure says nothing about how active the project is; retry on the next
+                # tick, then back off while it keeps failing, e.g. with its database down
+                schedule.failure_streak += 1
+                schedule.next_due_at = self._next_due(started, schedule.failure_streak - 1)
+                continue
+
+            schedule.failure_streak = 0
+            changes = change_counts.get(mapping.project_name)
+            if changes is not None:
+                hours = interval_hours
+                if schedule.last_synced_at is not None:
+                    hours = max((started - schedule.last_synced_at) / timedelta(hours=1), interval_hours)
+                schedule.change_rate = self._smooth(schedule.change_rate, changes / hours)
+                schedule.last_change_count = changes
+                schedule.idle_streak = 0 if changes else schedule.idle_streak + 1
+
+            schedule.last_synced_at = started
+            schedule.next_due_at = self._next_due(started, schedule.idle_streak)
+
+        ProjectSyncSchedule.objects.bulk_update(scheduled, [
+            'avg_sync_seconds', 'change_rate', 'last_change_count', 'idle_streak', 'failure_streak',
+            'last_synced_at', 'next_due_at'
+        ])
+
+    def _next_due(self, started, streak):
+        """Next due time after a sync started at started, doubling the interval with each sync of the streak"""
+        backoff = min(self.interval * 2 ** min(streak, 16), self.max_backoff)
+        # Half an interval of slack so a project not backed off is due again on the next tick
+        return started + backoff - self.interval / 2
+
+    def _load_schedules(self):
+        """Schedules of every active mapping, created for mappings seen for the first time"""
+        mappings = DatabaseMapping.objects.filter(is_active=True)
+        known = set(ProjectSyncSchedule.objects.filter(mapping__in=mappings).values_list('mapping_id', flat=True))
+        missing = [ProjectSyncSchedule(mapping=mapping) for mapping in mappings if mapping.pk not in known]
+        if missing:
+            ProjectSyncSchedule.objects.bulk_create(missing, ignore_conflicts=True)
+
+        # Re-read rather than trust bulk_create, which does not set primary keys on MySQL
+        return list(ProjectSyncSchedule.objects.filter(mapping__is_active=True).select_related('mapping'))
+
+    def _smooth(self, average, value):
+        if average is None:
+            return value
+        return self.SMOOTHING * value + (1 - self.SMOOTHING) * average
+
+    def _decision(self, schedule, decision):
+        return {
+            'project': schedule.mapping.project_name,
+            'database': schedule.mapping.sql_server_db,
+            'priority': round(schedule.priority, 3),
+            'estimated_seconds': round(self.estimated_seconds(schedule), 1),
+            'decision': decision,
+        }
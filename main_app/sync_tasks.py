@@ -4,15 +4,20 @@ import threading
 from datetime import datetime, timedelta
 
 from django.utils import timezone
-from django.core.cache import cache
 from django.conf import settings
 # Add these missing imports:
 from apscheduler.schedulers.background import BackgroundScheduler
 from django_apscheduler.jobstores import DjangoJobStore
 
 from audit_management_system.settings import SYNC_CONFIG
+from main_app.connection_pool import pool_stats
+from main_app.db_guard import breaker_states
+from main_app.metrics import sync_run_seconds
 from main_app.models import SyncMetrics
 from main_app.services import TransactionSyncService  # Your service import
+from main_app.sync_leases import SyncLeaseManager
+from main_app.sync_manifest import SyncRunManifest
+from main_app.sync_profiler import ensure_memory_tracing
 
 # Configure logger
 logger = logging.getLogger(__name__)
@@ -68,37 +73,24 @@ def sync_transactions():
     """
     Enhanced scheduled transaction sync with:
     - Exception handling
-    - Overlap prevention
+    - Per-project lease locks (overlapping runs split the remaining projects)
+    - Checkpoints, so a crashed or failed run is resumed rather than redone
     - Performance monitoring
     - Failure tracking
     - Alerting
     """
-    lock_key = 'sync_transactions_lock'
     start_time = time.time()
     start_timestamp = timezone.now()
     sync_metric = None
-
-    # Check if sync is already running
-    if cache.get(lock_key):
-        logger.warning("Sync already running, skipping this execution")
-
-        # Create skipped metric record
-        SyncMetrics.objects.create(
-            started_at=start_timestamp,
-            completed_at=timezone.now(),
-            status='skipped',
-            error_message='Previous sync still running'
-        )
-
-        return {
-            'status': 'skipped',
-            'reason': 'already_running',
-            'timestamp': start_timestamp.isoformat()
-        }
+    ensure_memory_tracing()
+    # Database-backed, so runs in other workers and processes see the same leases
+    leases = SyncLeaseManager()
 
     try:
-        # Set lock (longer than expected execution time)
-        cache.set(lock_key, True, timeout=SYNC_CONFIG['LOCK_TIMEOUT_MINUTES'] * 60)
+        # Look for an interrupted run before this one is recorded as running
+        interrupted = None
+        if SYNC_CONFIG.get('RESUME_INTERRUPTED_RUNS', False):
+            interrupted = SyncRunManifest.find_interrupted()
 
         # Create initial metric record
         sync_metric = SyncMetrics.objects.create(
@@ -106,7 +98,13 @@ def sync_transactions():
             status='running'
         )
 
-        logger.info("Starting scheduled transaction sync")
+        if interrupted is not None:
+            # Finish the interrupted run's unfinished projects and periods only
+            manifest = interrupted.resume_in(sync_metric)
+            logger.info(f"Resuming interrupted sync run {interrupted.run.pk}")
+        else:
+            manifest = SyncRunManifest(sync_metric)
+            logger.info("Starting scheduled transaction sync")
 
         # Check for consecutive failures before proceeding
         if check_consecutive_failures():
@@ -118,11 +116,34 @@ def sync_transactions():
             )
 
         # Execute the actual sync
-        service = TransactionSyncService()
-        results = service.sync_all_projects(
-            use_threading=True,
-            max_workers=SYNC_CONFIG['MAX_WORKERS']
-        )
+        service = TransactionSyncService(leases=leases, manifest=manifest)
+        if SYNC_CONFIG.get('ADAPTIVE_SCHEDULING', False) and interrupted is None:
+            # Only the hottest projects that fit the time budget; dormant ones back off
+            results, decisions = service.sync_adaptive(
+                use_threading=True,
+                max_workers=SYNC_CONFIG['MAX_WORKERS'],
+                incremental=SYNC_CONFIG.get('INCREMENTAL', False),
+                batched_periods=SYNC_CONFIG.get('BATCHED_PERIODS', False)
+            )
+            sync_metric.scheduled_count = len(results)
+            sync_metric.deferred_count = len(decisions) - len(results)
+            sync_metric.schedule = decisions
+            logger.info(
+                f"Adaptive scheduling: {sync_metric.scheduled_count} projects scheduled, "
+                f"{sync_metric.deferred_count} deferred or backed off"
+            )
+        else:
+            results = service.sync_all_projects(
+                use_threading=True,
+                max_workers=SYNC_CONFIG['MAX_WORKERS'],
+                incremental=SYNC_CONFIG.get('INCREMENTAL', False),
+                batched_periods=SYNC_CONFIG.get('BATCHED_PERIODS', False),
+                use_asyncio=SYNC_CONFIG.get('USE_ASYNCIO', False)
+            )
+
+        # Projects a concurrent run was already syncing are neither successes nor failures
+        skipped = sum(1 for r in results if r.get('skipped', False))
+        results = [r for r in results if not r.get('skipped', False)]
 
         # Calculate metrics
         successful = sum(1 for r in results if r.get('success', False))
@@ -132,9 +153,22 @@ def sync_transactions():
         # Log results
         logger.info(
             f"Scheduled sync completed in {execution_time:.2f}s: "
-            f"{successful} successful, {failed} failed out of {len(results)} total"
+            f"{successful} successful, {failed} failed out of {len(results)} total, "
+            f"{skipped} left to a concurrent run"
         )
 
+        for alias, stats in pool_stats()['pools'].items():
+            logger.info(
+                f"Connection pool {alias}: {stats['checkouts']} checkouts, {stats['creations']} created, "
+                f"{stats['waits']} waits ({stats['wait_seconds']}s), {stats['evictions']} evicted"
+            )
+
+        for alias, breaker in breaker_states().items():
+            logger.warning(
+                f"Database {alias} circuit {breaker['state']}: {breaker['consecutive_failures']} consecutive failures, "
+                f"{breaker['rejected']} calls rejected, last error: {breaker['last_error']}"
+            )
+
         # Log failed projects for debugging
         if failed > 0:
             failed_projects = [
@@ -159,8 +193,10 @@ def sync_transactions():
         sync_metric.successful_count = successful
         sync_metric.failed_count = failed
         sync_metric.total_projects = len(results)
+        sync_metric.skipped_count = skipped
         sync_metric.status = 'completed'
         sync_metric.save()
+        sync_run_seconds.observe(execution_time, status='completed')
 
         # Performance warning
         if execution_time > SYNC_CONFIG['TIMEOUT_MINUTES'] * 60 * 0.8:  # 80% of timeout
@@ -174,6 +210,8 @@ def sync_transactions():
             'successful': successful,
             'failed': failed,
             'total': len(results),
+            'skipped': skipped,
+            'resumed_from': interrupted.run.pk if interrupted is not None else None,
             'execution_time': execution_time,
             'failure_rate': failed / len(results) if results else 0,
             'timestamp': start_timestamp.isoformat(),
@@ -185,6 +223,7 @@ def sync_transactions():
         error_msg = f"Critical error in scheduled sync: {str(e)}"
 
         logger.error(error_msg, exc_info=True)
+        sync_run_seconds.observe(execution_time, status='failed')
 
         # Update metric record with error
         if sync_metric:
@@ -209,17 +248,64 @@ def sync_transactions():
         }
 
     finally:
-        # Always release the lock
-        cache.delete(lock_key)
-        logger.debug("Sync lock released")
+        # Always release the leases still held
+        leases.close()
+        logger.debug("Sync leases released")
+
+
+def sync_eneba_documents():
+    """
+    Scheduled single-pass ENEBA sync: attachments and comments from one Sage scan per project.
+
+    Registered when SYNC_CONFIG['ENEBA_PIPELINE_INTERVAL_MINUTES'] is set.
+    """
+    from transactions.pipeline import run_eneba_pipeline
+
+    start_time = time.time()
+    with SyncLeaseManager() as leases:
+        try:
+            results = run_eneba_pipeline(leases=leases)
+        except Exception as e:
+            logger.error(f"Critical error in ENEBA pipeline: {str(e)}", exc_info=True)
+            return {'status': 'failed', 'error': str(e), 'execution_time': time.time() - start_time}
+
+    successful = sum(1 for r in results if r['success'])
+    skipped = sum(1 for r in results if r.get('skipped', False))
+    failed = len(results) - successful - skipped
+    execution_time = time.time() - start_time
+    logger.info(
+        f"ENEBA pipeline completed in {execution_time:.2f}s: {successful} successful, {failed} failed, "
+        f"{skipped} left to a concurrent run"
+    )
+    return {
+        'status': 'completed',
+        'successful': successful,
+        'failed': failed,
+        'skipped': skipped,
+        'execution_time': execution_time,
+        'results': results[:5] if len(results) > 5 else results
+    }
+
+
+if SYNC_CONFIG.get('ENEBA_PIPELINE_INTERVAL_MINUTES'):
+    scheduler.add_job(
+        sync_eneba_documents,
+        'interval',
+        minutes=SYNC_CONFIG['ENEBA_PIPELINE_INTERVAL_MINUTES'],
+        id='sync_eneba_documents',
+        replace_existing=True
+    )
 
 
 def get_sync_health_status():
     """
     Get the current health status of the sync process
-    Returns: dict with status and details
+    Returns: dict with status and details; 'databases' holds the circuit breakers
+    of this process that are open or probing a database
     """
     try:
+        databases = breaker_states()
+
         # Get latest sync
         latest_sync = SyncMetrics.objects.first()
 
@@ -227,7 +313,8 @@ def get_sync_health_status():
             return {
                 'status': 'unknown',
                 'reason': 'no_sync_history',
-                'last_sync': None
+                'last_sync': None,
+                'databases': databases
             }
 
         current_time = timezone.now()
@@ -240,7 +327,8 @@ def get_sync_health_status():
                 'status': 'unhealthy',
                 'reason': 'sync_overdue',
                 'last_sync': latest_sync.started_at.isoformat(),
-                'overdue_by_minutes': int(time_since_last.total_seconds() / 60)
+                'overdue_by_minutes': int(time_since_last.total_seconds() / 60),
+                'databases': databases
             }
 
         # Check recent failure rate
@@ -259,7 +347,8 @@ def get_sync_health_status():
                     'status': 'degraded',
                     'reason': 'high_failure_rate',
                     'failure_rate': f"{failure_rate:.1%}",
-                    'last_sync': latest_sync.started_at.isoformat()
+                    'last_sync': latest_sync.started_at.isoformat(),
+                    'databases': databases
                 }
 
         # Check if current sync is running too long
@@ -270,14 +359,27 @@ def get_sync_health_status():
                     'status': 'unhealthy',
                     'reason': 'sync_timeout',
                     'running_for_minutes': int(running_time.total_seconds() / 60),
-                    'last_sync': latest_sync.started_at.isoformat()
+                    'last_sync': latest_sync.started_at.isoformat(),
+                    'databases': databases
                 }
 
+        # Projects on these databases are failing fast until their circuits close
+        unavailable = [alias for alias, breaker in databases.items() if breaker['state'] == 'open']
+        if unavailable:
+            return {
+                'status': 'degraded',
+                'reason': 'database_unavailable',
+                'unavailable_databases': unavailable,
+                'last_sync': latest_sync.started_at.isoformat(),
+                'databases': databases
+            }
+
         return {
             'status': 'healthy',
             'last_sync': latest_sync.started_at.isoformat(),
             'last_status': latest_sync.status,
-            'recent_success_rate': f"{((latest_sync.successful_count or 0) / max(latest_sync.total_projects or 1, 1)):.1%}"
+            'recent_success_rate': f"{((latest_sync.successful_count or 0) / max(latest_sync.total_projects or 1, 1)):.1%}",
+            'databases': databases
         }
 
     except Exception as e:
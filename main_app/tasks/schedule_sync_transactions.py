@@ -1,25 +1,244 @@
-# Celery task for scheduled sync
-from celery import shared_task
+# Celery tasks for scheduled sync
 import logging
+
+from celery import chord, shared_task
+from django.conf import settings
+from django.utils import timezone
+
+from audit_management_system.settings import SYNC_CONFIG
+from main_app.connection_pool import server_of
+from main_app.db_guard import CancellationToken, StatementCancelled, cancellation_scope
+from main_app.metrics import sync_run_seconds
+from main_app.models import DatabaseMapping, Project, SyncLog, SyncMetrics
 from main_app.services import TransactionSyncService
+from main_app.sync_leases import LeaseHeld, SyncLeaseManager, host_slot_keys
+from main_app.sync_manifest import SyncRunManifest
+
 logger = logging.getLogger(__name__)
 
 
 @shared_task
-def scheduled_sync_transactions():
-    """Celery task for scheduled transaction sync"""
+def scheduled_sync_transactions(per_period=False):
+    """Celery task for scheduled transaction sync: fans the run out into one task per project"""
     logger.info("Starting scheduled transaction sync")
 
+    run, tasks = dispatch_sync_run(per_period=per_period)
+
+    logger.info(f"Scheduled sync run {run.pk} dispatched: {tasks} tasks")
+
+    return {
+        'run': run.pk,
+        'tasks': tasks
+    }
+
+
+def dispatch_sync_run(incremental=None, batched_periods=None, per_period=False):
+    """
+    Start a distributed sync run: one Celery task per active DatabaseMapping, or per
+    project fiscal period with per_period=True, joined by a chord whose callback
+    writes the run's SyncMetrics.
+
+    Projects are checkpointed in the run manifest, so an interrupted run can be
+    resumed like a threaded one. Per-period runs recalculate period stats only;
+    incremental loading and the glpost replica are left to per-project runs.
+
+    Returns:
+        Tuple of (SyncMetrics run, number of tasks dispatched)
+    """
+    if incremental is None:
+        incremental = SYNC_CONFIG.get('INCREMENTAL', False)
+    if batched_periods is None:
+        batched_periods = SYNC_CONFIG.get('BATCHED_PERIODS', False)
+
+    run = SyncMetrics.objects.create(started_at=timezone.now(), status='running')
+    manifest = SyncRunManifest(run)
+    mappings = manifest.track(DatabaseMapping.objects.filter(is_active=True))
+
     service = TransactionSyncService()
-    results = service.sync_all_projects(use_threading=True, max_workers=5)
+    if per_period:
+        header = []
+        for mapping in mappings:
+            fiscal_combinations = service._get_fiscal_combinations(mapping.project_name)
+            manifest.start_project(mapping.project_name)
+            if not fiscal_combinations:
+                # No period task would close it; done, as a comprehensive sync of the project is
+                logger.warning(f"No fiscal combinations found for project {mapping.project_name}")
+                manifest.finish_project(mapping.project_name, True)
+                continue
+            manifest.track_periods(mapping.project_name, mapping.sql_server_db, fiscal_combinations)
+            header.extend(
+                sync_period_task.s(run.pk, mapping.project_name, mapping.sql_server_db, fiscal_year, fiscal_period)
+                for fiscal_year, fiscal_period in fiscal_combinations
+            )
+    else:
+        header = [
+            sync_project_task.s(run.pk, mapping.project_name, mapping.sql_server_db, incremental, batched_periods)
+            for mapping in mappings
+        ]
+
+    callback = finish_sync_run.s(run.pk, per_period)
+    if header:
+        chord(header)(callback)
+    else:
+        # A chord needs at least one task in its header
+        callback.delay([])
+    return run, len(header)
+
+
+def _host_slot(leases, sql_server_db):
+    """Claim a sync slot on the SQL Server host of sql_server_db; None when the host is at its limit"""
+    return leases.acquire_any(host_slot_keys(server_of(settings.DATABASES.get(sql_server_db, {}))))
+
+
+def _retry_countdown():
+    return SYNC_CONFIG.get('HOST_SLOT_RETRY_SECONDS', 15)
+
+
+def _host_slot_max_retries():
+    return SYNC_CONFIG.get('HOST_SLOT_MAX_RETRIES', 40)
 
-    successful = sum(1 for r in results if r['success'])
+
+def _host_slot_exhausted(task, sql_server_db):
+    """The error to fail a task with once it has retried HOST_SLOT_MAX_RETRIES times for a host slot, else None"""
+    if task.request.retries < _host_slot_max_retries():
+        return None
+    return (f"SQL Server host of {sql_server_db} had no free sync slot after "
+            f"{task.request.retries} retries")
+
+
+@shared_task(bind=True, acks_late=True, max_retries=SYNC_CONFIG.get('HOST_SLOT_MAX_RETRIES', 40))
+def sync_project_task(self, run_id, project_name, sql_server_db, incremental=False, batched_periods=False):
+    """Sync one project of a distributed run, once its SQL Server host has a free slot"""
+    with SyncLeaseManager() as leases:
+        if _host_slot(leases, sql_server_db) is None:
+            error = _host_slot_exhausted(self, sql_server_db)
+            if error is not None:
+                # Returned, not raised, so the chord callback still closes the run
+                logger.error(f"Giving up on {project_name}: {error}")
+                SyncRunManifest(SyncMetrics.objects.get(pk=run_id)).finish_project(project_name, False, error)
+                return {'project': project_name, 'database': sql_server_db, 'success': False, 'error': error}
+            logger.info(f"SQL Server host of {sql_server_db} is at its sync limit; retrying {project_name}")
+            raise self.retry(countdown=_retry_countdown(), max_retries=_host_slot_max_retries())
+
+        service = TransactionSyncService(
+            leases=leases, manifest=SyncRunManifest(SyncMetrics.objects.get(pk=run_id))
+        )
+        if incremental:
+            sync_func = service.sync_single_project_incremental
+        elif batched_periods:
+            sync_func = service.sync_single_project_batched
+        else:
+            sync_func = service.sync_single_project_comprehensive
+
+        try:
+            success = service._cancellable(service._leased(service._checkpointed(sync_func)))(
+                project_name, sql_server_db
+            )
+        except LeaseHeld as e:
+            logger.info(f"Skipping {project_name}: {str(e)}")
+            return {'project': project_name, 'database': sql_server_db, 'success': False, 'skipped': True,
+                    'error': str(e)}
+        except StatementCancelled as e:
+            # Past PROJECT_TIMEOUT_SECONDS: reported like the threaded and asyncio runs do
+            logger.error(f"Exception for {project_name}: {str(e)}")
+            return {'project': project_name, 'database': sql_server_db, 'success': False, 'error': str(e)}
+
+    return {'project': project_name, 'database': sql_server_db, 'success': bool(success)}
+
+
+@shared_task(bind=True, acks_late=True, max_retries=SYNC_CONFIG.get('HOST_SLOT_MAX_RETRIES', 40))
+def sync_period_task(self, run_id, project_name, sql_server_db, fiscal_year, fiscal_period):
+    """Recalculate one project fiscal period of a distributed run, once its SQL Server host has a free slot"""
+    with SyncLeaseManager() as leases:
+        if _host_slot(leases, sql_server_db) is None:
+            error = _host_slot_exhausted(self, sql_server_db)
+            if error is not None:
+                logger.error(f"Giving up on {project_name} FY {fiscal_year} Period {fiscal_period}: {error}")
+                SyncRunManifest(SyncMetrics.objects.get(pk=run_id)).finish_period(
+                    project_name, fiscal_year, fiscal_period, False, error
+                )
+                return {'project': project_name, 'database': sql_server_db, 'fiscal_year': fiscal_year,
+                        'fiscal_period': fiscal_period, 'success': False, 'records': 0, 'unchanged': False,
+                        'error': error}
+            logger.info(f"SQL Server host of {sql_server_db} is at its sync limit; retrying {project_name} "
+                        f"FY {fiscal_year} Period {fiscal_period}")
+            raise self.retry(countdown=_retry_countdown(), max_retries=_host_slot_max_retries())
+
+        service = TransactionSyncService(manifest=SyncRunManifest(SyncMetrics.objects.get(pk=run_id)))
+        with cancellation_scope(CancellationToken(SYNC_CONFIG.get('PROJECT_TIMEOUT_SECONDS'))):
+            result = service.sync_single_period(project_name, sql_server_db, fiscal_year, fiscal_period)
+
+    return {'project': project_name, 'database': sql_server_db, 'fiscal_year': fiscal_year,
+            'fiscal_period': fiscal_period, **result}
+
+
+@shared_task
+def finish_sync_run(results, run_id, per_period=False):
+    """Chord callback: combine the task results of a distributed run into its SyncMetrics row"""
+    run = SyncMetrics.objects.get(pk=run_id)
+    if per_period:
+        results = _finish_period_projects(run, results)
+
+    skipped = sum(1 for r in results if r.get('skipped', False))
+    results = [r for r in results if not r.get('skipped', False)]
+    successful = sum(1 for r in results if r.get('success', False))
     failed = len(results) - successful
 
-    logger.info(f"Scheduled sync completed: {successful} successful, {failed} failed")
+    run.completed_at = timezone.now()
+    run.execution_time = (run.completed_at - run.started_at).total_seconds()
+    run.successful_count = successful
+    run.failed_count = failed
+    run.total_projects = len(results)
+    run.skipped_count = skipped
+    run.status = 'completed'
+    run.save()
+    sync_run_seconds.observe(run.execution_time, status='completed')
 
+    logger.info(
+        f"Distributed sync run {run.pk} completed in {run.execution_time:.2f}s: "
+        f"{successful} successful, {failed} failed out of {len(results)} total, {skipped} left to a concurrent run"
+    )
     return {
+        'run': run.pk,
         'successful': successful,
         'failed': failed,
-        'results': results
+        'skipped': skipped,
+        'execution_time': run.execution_time
     }
+
+
+def _finish_period_projects(run, period_results):
+    """Close the projects of a per-period run: SyncLog, sync status and manifest unit, one result each"""
+    by_project = {}
+    for result in period_results:
+        by_project.setdefault((result['project'], result['database']), []).append(result)
+
+    manifest = SyncRunManifest(run)
+    projects = {project.project_name: project for project in Project.objects.filter(
+        project_name__in=[project_name for project_name, _ in by_project]
+    )}
+
+    project_results = []
+    for (project_name, sql_server_db), results in by_project.items():
+        success = all(result['success'] for result in results)
+        records = sum(result['records'] for result in results)
+        unchanged = sum(1 for result in results if result.get('unchanged'))
+
+        project_obj = projects[project_name]
+        SyncLog.objects.create(
+            project=project_obj,
+            status='completed' if success else 'failed',
+            sync_started=run.started_at,
+            sync_completed=timezone.now(),
+            records_processed=records,
+            periods_skipped=unchanged,
+            error_message=None if success else 'Some fiscal periods failed'
+        )
+        if success:
+            project_obj.last_synced = timezone.now()
+        project_obj.sync_status = 'completed' if success else 'error'
+        project_obj.save()
+
+        manifest.finish_project(project_name, success)
+        project_results.append({'project': project_name, 'database': sql_server_db, 'success': success})
+    return project_results
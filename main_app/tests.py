@@ -1,3 +1,1308 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from celery import current_app
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connections
+from django.db.backends.sqlite3.base import DatabaseWrapper as SqliteDatabaseWrapper
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from audit_management_system.settings import METRICS_CONFIG, SYNC_CONFIG
+from main_app import metrics
+from main_app.async_engine import AsyncExtractionEngine
+from main_app.connection_pool import PoolRegistry, PoolTimeout
+from main_app.dashboard_benchmark import DashboardBenchmark, _percentile, local_counts, seed_dashboard_data
+from main_app.db_guard import (
+    CancellationToken, CircuitBreaker, CircuitOpen, GuardedDatabaseWrapperMixin, StatementCancelled, StatementTimeout,
+    breaker_registry, cancellation_scope, current_token
+)
+from main_app.models import (
+    CustomUser, DatabaseMapping, Project, ProjectPeriodStats, ProjectSyncSchedule, SyncLease, SyncLog, SyncMetrics,
+    SyncStageTiming, SyncWorkUnit
+)
+from main_app.management.commands.benchmark_unsupported_aggregation import (
+    Command as BenchmarkUnsupportedAggregation, legacy_unsupported_totals
+)
+from main_app.management.commands.generate_sage_dataset import row_count
+from main_app.sage_dataset import SageDatasetGenerator, load_manifest
+from main_app.services import (
+    TransactionSyncService, _aggregate_unsupported, _get_aggregated_data, _get_aggregated_data_by_period
+)
+from main_app.sync_leases import LeaseHeld, SyncLeaseManager, project_lease_key
+from main_app.sync_benchmark import SyncBenchmark, compare_reports
+from main_app.sync_manifest import SyncRunManifest
+from main_app.sync_profiler import SyncProfiler, profile_rows, stage_report, sync_stage
+from main_app.sync_scheduler import AdaptiveSyncScheduler
+from main_app.tasks.schedule_sync_transactions import dispatch_sync_run, sync_project_task
+from transactions.models import Eneba, Enpjd, Glpost, SupportingDocument
+from transactions.services import GlpostReplicaService, ProjectSyncService
+from transactions.tests import SageCompanyTestCase
+
+
+def _server(alias):
+    # Fake aliases are 'server/database'
+    return alias.split('/')[0]
+
+
+class AsyncExtractionEngineTests(SimpleTestCase):
+    """The engine driven by fake callables, so no database is involved"""
+
+    def test_calls_stay_within_the_global_and_per_server_limits(self):
+        engine = AsyncExtractionEngine(global_limit=4, per_server_limit=2, server_resolver=_server)
+        lock = threading.Lock()
+        in_flight = {}
+        peaks = {}
+
+        def query(alias, value):
+            server = _server(alias)
+            with lock:
+                in_flight[server] = in_flight.get(server, 0) + 1
+                peaks[server] = max(peaks.get(server, 0), in_flight[server])
+            time.sleep(0.02)
+            with lock:
+                in_flight[server] -= 1
+            return value
+
+        async def run_queries(engine):
+            return await asyncio.gather(*(
+                engine.run(alias, query, alias, index)
+                for index, alias in enumerate(['a/one', 'a/two', 'b/one'] * 6)
+            ))
+
+        results = engine.run_all(run_queries)
+
+        self.assertEqual(list(results), list(range(18)))
+        self.assertLessEqual(max(peaks.values()), 2)
+        self.assertLessEqual(engine.stats['max_in_flight'], 4)
+        self.assertEqual(engine.stats['calls'], 18)
+
+    @mock.patch.dict(SYNC_CONFIG, {'PROJECT_TIMEOUT_SECONDS': 0.2})
+    def test_slow_project_times_out_without_stalling_the_others(self):
+        tokens = {}
+
+        def sync_project(project_name, sql_server_db):
+            tokens[project_name] = token = current_token()
+            if project_name == 'Slow':
+                # Stands in for a Sage statement the token's watchdog would interrupt
+                while not token.cancelled:
+                    time.sleep(0.01)
+                token.raise_if_cancelled()
+            return True
+
+        mappings = [
+            SimpleNamespace(project_name=name, sql_server_db=f'{server}/{name.lower()}')
+            for name, server in (('Fast', 'a'), ('Slow', 'b'), ('Other', 'a'))
+        ]
+        engine = AsyncExtractionEngine(global_limit=3, per_server_limit=2, server_resolver=_server)
+
+        started = time.monotonic()
+        results = {
+            result['project']: result
+            for result in TransactionSyncService()._sync_with_asyncio(mappings, engine, sync_project)
+        }
+
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertTrue(results['Fast']['success'])
+        self.assertTrue(results['Other']['success'])
+        self.assertFalse(results['Slow']['success'])
+        self.assertEqual(results['Slow']['error'], 'deadline exceeded')
+        # Every project ran under its own token, on the engine's worker threads
+        self.assertEqual(len({id(token) for token in tokens.values() if token is not None}), 3)
+
+
+class SyncRunManifestTests(TestCase):
+    def test_resumed_run_checkpoints_against_its_own_units(self):
+        interrupted = SyncRunManifest(SyncMetrics.objects.create(started_at=timezone.now(), status='running'))
+        mappings = [
+            SimpleNamespace(project_name=name, sql_server_db=name.lower()) for name in ('Done', 'Failed', 'Pending')
+        ]
+        interrupted.track(mappings)
+        interrupted.start_project('Done')
+        interrupted.finish_project('Done', True)
+        interrupted.start_project('Failed')
+        interrupted.finish_project('Failed', False, 'Sage unavailable')
+
+        run = SyncMetrics.objects.create(started_at=timezone.now(), status='running')
+        manifest = interrupted.resume_in(run)
+
+        self.assertEqual(manifest.run, run)
+        self.assertEqual(manifest.progress(), {'completed': 1, 'pending': 2})
+        self.assertEqual([mapping.project_name for mapping in manifest.track(mappings)], ['Failed', 'Pending'])
+
+        manifest.start_project('Failed')
+        manifest.finish_project('Failed', True)
+        self.assertEqual(SyncWorkUnit.objects.get(run=run, project_name='Failed').attempts, 2)
+        # The interrupted run is closed and keeps its own state
+        interrupted.run.refresh_from_db()
+        self.assertEqual(interrupted.run.status, 'failed')
+        self.assertEqual(interrupted.progress(), {'completed': 1, 'failed': 1, 'pending': 1})
+        self.assertIsNone(SyncRunManifest.find_interrupted())
+
+
+@mock.patch.dict(SYNC_CONFIG, {'SKIP_UNCHANGED_PERIODS': True})
+class UnchangedPeriodTests(SageCompanyTestCase):
+    def test_skipped_periods_stay_fresh_for_get_stats(self):
+        ProjectSyncService(extraction_mode='bulk', load_mode='bulk').sync_transactions(self.project.project_name)
+        service = TransactionSyncService()
+        self.assertTrue(service.sync_single_project_comprehensive(self.project.project_name, self.alias))
+
+        stats = ProjectPeriodStats.objects.filter(project=self.project)
+        stats.update(last_calculated=timezone.now() - timedelta(hours=2))
+        with mock.patch('main_app.services._get_aggregated_data') as get_aggregated_data:
+            self.assertTrue(service.sync_single_project_comprehensive(self.project.project_name, self.alias))
+
+        get_aggregated_data.assert_not_called()
+        period = stats.first()
+        with mock.patch.object(type(self.project), '_calculate_real_time_stats') as calculate_real_time_stats:
+            self.project.get_stats(fiscal_year=period.fiscal_year, fiscal_period=period.fiscal_period)
+        calculate_real_time_stats.assert_not_called()
+
+    def test_later_date_earlier_time_edit_resyncs_the_period(self):
+        ProjectSyncService(extraction_mode='bulk', load_mode='bulk').sync_transactions(self.project.project_name)
+        expenses = Glpost.objects.using(self.alias).filter(srceledger='EN', transamt__gt=0)
+        latest, edited = expenses.filter(
+            fiscalyr=expenses.first().fiscalyr, fiscalperd=expenses.first().fiscalperd
+        ).order_by('-audtdate', '-audttime')[:2]
+        period = (latest.fiscalyr, latest.fiscalperd)
+
+        def stamp(glpost, audtdate, audttime):
+            Glpost.objects.using(self.alias).filter(
+                acctid=glpost.acctid, fiscalyr=glpost.fiscalyr, fiscalperd=glpost.fiscalperd,
+                postingseq=glpost.postingseq, cntdetail=glpost.cntdetail
+            ).update(audtdate=audtdate, audttime=audttime)
+
+        # The period's latest stamp is late in the day (AUDTTIME is HHMMSSss)
+        stamp(latest, latest.audtdate, 19000000)
+        service = TransactionSyncService()
+        self.assertTrue(service.sync_single_project_comprehensive(self.project.project_name, self.alias))
+
+        # Edited the next day, earlier in the day than the latest stamp
+        stamp(edited, latest.audtdate + 1, 6000000)
+        with mock.patch(
+                'main_app.services._get_aggregated_data', wraps=_get_aggregated_data
+        ) as get_aggregated_data:
+            self.assertTrue(service.sync_single_project_comprehensive(self.project.project_name, self.alias))
+
+        self.assertEqual([call.args[2:4] for call in get_aggregated_data.call_args_list], [period])
+
+
+class DistributedSyncRunTests(SageCompanyTestCase):
+    """The Celery chord of a distributed run, executed eagerly in the test process"""
+
+    def setUp(self):
+        super().setUp()
+        eager = {'task_always_eager': True, 'task_eager_propagates': True}
+        previous = {name: current_app.conf[name] for name in eager}
+        current_app.conf.update(eager)
+        self.addCleanup(current_app.conf.update, previous)
+
+    def test_chord_callback_aggregates_the_project_results(self):
+        ProjectSyncService(extraction_mode='bulk', load_mode='bulk').sync_transactions(self.project.project_name)
+        # A mapping whose project does not exist fails its task
+        DatabaseMapping.objects.create(project_name='Missing', sql_server_db=self.alias)
+
+        run, dispatched = dispatch_sync_run(incremental=False, batched_periods=True)
+
+        run.refresh_from_db()
+        self.assertEqual(dispatched, 2)
+        self.assertEqual(run.status, 'completed')
+        self.assertIsNotNone(run.completed_at)
+        self.assertEqual(run.total_projects, 2)
+        self.assertEqual(run.successful_count, 1)
+        self.assertEqual(run.failed_count, 1)
+        self.assertEqual(
+            dict(SyncWorkUnit.objects.filter(run=run).values_list('project_name', 'status')),
+            {self.project.project_name: 'completed', 'Missing': 'failed'}
+        )
+        self.assertTrue(ProjectPeriodStats.objects.filter(project=self.project).exists())
+
+    def test_per_period_run_closes_projects_without_periods(self):
+        ProjectSyncService(extraction_mode='bulk', load_mode='bulk').sync_transactions(self.project.project_name)
+        Project.objects.create(project_name='Empty', description='')
+        DatabaseMapping.objects.create(project_name='Empty', sql_server_db=self.alias)
+
+        run, dispatched = dispatch_sync_run(per_period=True)
+
+        run.refresh_from_db()
+        self.assertGreater(dispatched, 0)
+        self.assertEqual(run.status, 'completed')
+        units = SyncWorkUnit.objects.filter(run=run, fiscal_year='')
+        self.assertEqual(
+            dict(units.values_list('project_name', 'status')),
+            {self.project.project_name: 'completed', 'Empty': 'completed'}
+        )
+        self.assertIsNotNone(units.get(project_name='Empty').completed_at)
+
+    @mock.patch.dict(SYNC_CONFIG, {'HOST_SLOT_MAX_RETRIES': 2, 'HOST_SLOT_RETRY_SECONDS': 0})
+    def test_task_fails_its_project_once_out_of_host_slot_retries(self):
+        run = SyncMetrics.objects.create(started_at=timezone.now(), status='running')
+        SyncRunManifest(run).track(DatabaseMapping.objects.filter(is_active=True))
+
+        with mock.patch('main_app.tasks.schedule_sync_transactions._host_slot', return_value=None) as host_slot:
+            # Eagerly, retry() runs the next attempt in place: its last retry gives up instead of retrying again
+            result = sync_project_task.apply(args=(run.pk, self.project.project_name, self.alias), retries=1,
+                                             throw=False)
+
+        error = f"SQL Server host of {self.alias} had no free sync slot after 2 retries"
+        self.assertEqual(host_slot.call_count, 2)
+        self.assertEqual(result.get(), {
+            'project': self.project.project_name, 'database': self.alias, 'success': False, 'error': error
+        })
+        unit = SyncWorkUnit.objects.get(run=run, project_name=self.project.project_name)
+        self.assertEqual((unit.status, unit.error_message), ('failed', error))
+
+
+def _statement_past_the_deadline(*args, **kwargs):
+    """Stands in for a Sage statement the token's watchdog interrupts at the project's deadline"""
+    token = current_token()
+    while not token.cancelled:
+        time.sleep(0.01)
+    token.raise_if_cancelled()
+
+
+@mock.patch.dict(SYNC_CONFIG, {'PROJECT_TIMEOUT_SECONDS': 0.2})
+class ProjectTimeoutTests(SageCompanyTestCase):
+    def setUp(self):
+        super().setUp()
+        ProjectSyncService(extraction_mode='bulk', load_mode='bulk').sync_transactions(self.project.project_name)
+        self.run = SyncMetrics.objects.create(started_at=timezone.now(), status='running')
+
+    def assertTimedOut(self, result):
+        # Every sync path reports a timed-out project the same way
+        self.assertEqual(result, {
+            'project': self.project.project_name, 'database': self.alias, 'success': False,
+            'error': 'deadline exceeded'
+        })
+        self.assertProjectFailed('deadline exceeded')
+
+    def assertProjectFailed(self, error):
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.sync_status, 'error')
+        sync_log = SyncLog.objects.filter(project=self.project).latest('sync_started')
+        self.assertEqual(sync_log.status, 'failed')
+        self.assertEqual(sync_log.error_message, error)
+        unit = SyncWorkUnit.objects.get(run=self.run, project_name=self.project.project_name, fiscal_year='')
+        self.assertEqual(unit.status, 'failed')
+        self.assertEqual(unit.error_message, error)
+
+    @mock.patch('main_app.services._get_aggregated_data', side_effect=_statement_past_the_deadline)
+    def test_timed_out_comprehensive_sync_fails_the_project(self, get_aggregated_data):
+        service = TransactionSyncService(manifest=SyncRunManifest(self.run))
+
+        results = service.sync_all_projects(use_threading=False)
+
+        # The remaining periods are given up instead of each failing in turn
+        get_aggregated_data.assert_called_once()
+        self.assertTimedOut(results[0])
+
+    @mock.patch('main_app.services._get_aggregated_data', side_effect=_statement_past_the_deadline)
+    def test_threaded_sync_reports_the_timeout(self, get_aggregated_data):
+        service = TransactionSyncService(manifest=SyncRunManifest(self.run))
+
+        results = service.sync_all_projects(use_threading=True)
+
+        self.assertTimedOut(results[0])
+
+    @mock.patch('main_app.services._get_aggregated_data', side_effect=_statement_past_the_deadline)
+    def test_asyncio_sync_reports_the_timeout(self, get_aggregated_data):
+        service = TransactionSyncService(manifest=SyncRunManifest(self.run))
+
+        results = service.sync_all_projects(use_asyncio=True)
+
+        self.assertTimedOut(results[0])
+
+    @mock.patch('main_app.services._get_aggregated_data', side_effect=_statement_past_the_deadline)
+    def test_celery_project_task_reports_the_timeout(self, get_aggregated_data):
+        SyncRunManifest(self.run).track(DatabaseMapping.objects.filter(project_name=self.project.project_name))
+
+        result = sync_project_task.apply(args=(self.run.pk, self.project.project_name, self.alias)).get()
+
+        self.assertTimedOut(result)
+
+    @mock.patch.dict(SYNC_CONFIG, {'GLPOST_REPLICA': True})
+    @mock.patch('main_app.services.GlpostReplicaService.refresh', side_effect=_statement_past_the_deadline)
+    def test_timed_out_replica_refresh_fails_the_incremental_sync(self, refresh):
+        service = TransactionSyncService(manifest=SyncRunManifest(self.run))
+
+        results = service.sync_all_projects(use_threading=False, incremental=True)
+
+        self.assertTimedOut(results[0])
+
+
+class FakeConnection:
+    """DB-API connection stand-in; a broken one fails its pre-ping"""
+
+    def __init__(self):
+        self.broken = False
+        self.closed = False
+
+    def cursor(self):
+        if self.broken:
+            raise ConnectionError('connection reset by peer')
+        return mock.Mock()
+
+    def close(self):
+        self.closed = True
+
+
+def _pool_settings(host='sage-server', **pool):
+    return {'HOST': host, 'PORT': '1433', 'POOL': {'ACQUIRE_TIMEOUT_SECONDS': 0.2, **pool}}
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    def setUp(self):
+        self.registry = PoolRegistry()
+        self.created = []
+
+    def factory(self):
+        connection = FakeConnection()
+        self.created.append(connection)
+        return connection
+
+    def test_released_connection_is_checked_out_again(self):
+        pool = self.registry.get_pool('A', _pool_settings())
+
+        connection = pool.acquire(self.factory)
+        pool.release(connection)
+
+        self.assertIs(pool.acquire(self.factory), connection)
+        self.assertEqual(len(self.created), 1)
+        self.assertEqual(pool.snapshot()['checkouts'], 2)
+        self.assertEqual(pool.snapshot()['in_use'], 1)
+
+    def test_full_pool_blocks_until_a_connection_is_released(self):
+        pool = self.registry.get_pool('A', _pool_settings(MAX_SIZE=1, ACQUIRE_TIMEOUT_SECONDS=5))
+        connection = pool.acquire(self.factory)
+        threading.Timer(0.1, pool.release, args=(connection,)).start()
+
+        started = time.monotonic()
+        self.assertIs(pool.acquire(self.factory), connection)
+
+        self.assertGreaterEqual(time.monotonic() - started, 0.05)
+        self.assertEqual(pool.snapshot()['waits'], 1)
+        self.assertEqual(len(self.created), 1)
+
+    def test_full_pool_times_out(self):
+        pool = self.registry.get_pool('A', _pool_settings(MAX_SIZE=1))
+        pool.acquire(self.factory)
+
+        with self.assertRaises(PoolTimeout):
+            pool.acquire(self.factory)
+
+    def test_broken_connections_are_discarded(self):
+        pool = self.registry.get_pool('A', _pool_settings(MAX_SIZE=1))
+        broken = pool.acquire(self.factory)
+        pool.release(broken)
+        broken.broken = True
+
+        # The pre-ping fails, so the slot goes to a new connection
+        connection = pool.acquire(self.factory)
+        self.assertIsNot(connection, broken)
+        self.assertTrue(broken.closed)
+        self.assertEqual(pool.snapshot()['ping_failures'], 1)
+
+        # A connection released with discard is closed, not idled
+        pool.release(connection, discard=True)
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.snapshot()['size'], 0)
+
+    def test_failed_connect_frees_its_slot(self):
+        pool = self.registry.get_pool('A', _pool_settings(MAX_SIZE=1))
+
+        with self.assertRaises(ConnectionError):
+            pool.acquire(mock.Mock(side_effect=ConnectionError('login timeout')))
+
+        self.assertIsInstance(pool.acquire(self.factory), FakeConnection)
+
+    def test_server_limit_is_shared_by_its_aliases(self):
+        settings_dict = _pool_settings(MAX_PER_SERVER=2)
+        first, second = self.registry.get_pool('A', settings_dict), self.registry.get_pool('B', settings_dict)
+        other_server = self.registry.get_pool('C', _pool_settings(host='other-server', MAX_PER_SERVER=2))
+
+        first.acquire(self.factory)
+        second.acquire(self.factory)
+        with self.assertRaises(PoolTimeout):
+            second.acquire(self.factory)
+        other_server.acquire(self.factory)
+
+        self.assertEqual(self.registry.stats()['servers']['sage-server:1433']['open'], 2)
+        self.assertEqual(self.registry.stats()['servers']['other-server:1433']['open'], 1)
+
+    def test_idle_sibling_connections_make_room_on_a_full_server(self):
+        settings_dict = _pool_settings(MAX_PER_SERVER=1)
+        first, second = self.registry.get_pool('A', settings_dict), self.registry.get_pool('B', settings_dict)
+        idle = first.acquire(self.factory)
+        first.release(idle)
+
+        connection = second.acquire(self.factory)
+
+        self.assertIsNot(connection, idle)
+        self.assertTrue(idle.closed)
+        self.assertEqual(first.snapshot()['evictions'], 1)
+
+
+class SyncLeaseTests(TestCase):
+    def setUp(self):
+        self.key = project_lease_key('P1')
+        self.first = self.leases('first')
+        self.second = self.leases('second')
+
+    def leases(self, owner):
+        leases = SyncLeaseManager(ttl_seconds=600, owner=owner)
+        self.addCleanup(leases.close)
+        return leases
+
+    def test_held_lease_cannot_be_acquired_by_another_run(self):
+        self.assertTrue(self.first.acquire(self.key))
+
+        self.assertFalse(self.second.acquire(self.key))
+        with self.assertRaises(LeaseHeld):
+            with self.second.hold(self.key):
+                pass
+        self.assertEqual(SyncLease.objects.get(key=self.key).owner, 'first')
+
+    def test_expired_lease_is_taken_over(self):
+        self.first.acquire(self.key)
+        # Its holder stopped renewing it, e.g. the process died
+        SyncLease.objects.filter(key=self.key).update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        self.assertTrue(self.second.acquire(self.key))
+        self.assertEqual(self.first.renew(), set())
+        self.assertEqual(self.first.held(), set())
+        self.assertEqual(SyncLease.objects.get(key=self.key).owner, 'second')
+
+    def test_renewal_extends_the_expiry(self):
+        self.first.acquire(self.key)
+        SyncLease.objects.filter(key=self.key).update(expires_at=timezone.now() + timedelta(seconds=5))
+
+        self.assertEqual(self.first.renew(), {self.key})
+
+        self.assertGreater(SyncLease.objects.get(key=self.key).expires_at, timezone.now() + timedelta(seconds=500))
+
+    def test_lease_is_released_when_the_sync_raises(self):
+        def failing_sync(project_name, sql_server_db):
+            raise RuntimeError('Sage unavailable')
+
+        with self.assertRaises(RuntimeError):
+            TransactionSyncService(leases=self.first)._leased(failing_sync)('P1', 'sage')
+
+        self.assertEqual(self.first.held(), set())
+        self.assertTrue(self.second.acquire(self.key))
+
+    def test_project_leased_by_another_run_is_not_synced(self):
+        sync = mock.Mock(return_value=True)
+        self.second.acquire(self.key)
+
+        with self.assertRaises(LeaseHeld):
+            TransactionSyncService(leases=self.first)._leased(sync)('P1', 'sage')
+
+        sync.assert_not_called()
+
+
+class AdaptiveSyncSchedulerTests(TestCase):
+    def setUp(self):
+        self.started = timezone.now()
+        self.interval = timedelta(minutes=10)
+        self.scheduler = AdaptiveSyncScheduler(interval_minutes=10, time_budget_seconds=50, max_backoff_minutes=60)
+        DatabaseMapping.objects.create(project_name='Hot', sql_server_db='hot')
+
+    def tick(self, success, changes=None, project_name='Hot'):
+        """Plan a tick, then record one sync of project_name with the given outcome"""
+        scheduled, _ = self.scheduler.plan(self.started)
+        scheduled = [schedule for schedule in scheduled if schedule.mapping.project_name == project_name]
+        self.assertEqual(len(scheduled), 1, f'{project_name} was not due')
+        results = [{'project': project_name, 'database': project_name.lower(), 'success': success}]
+        self.scheduler.record(scheduled, results, {} if changes is None else {project_name: changes}, self.started)
+        schedule = ProjectSyncSchedule.objects.get(mapping__project_name=project_name)
+        self.started = schedule.next_due_at
+        return schedule
+
+    def test_due_projects_are_scheduled_by_priority_within_the_budget(self):
+        for name in ('Cold', 'Idle'):
+            DatabaseMapping.objects.create(project_name=name, sql_server_db=name.lower())
+        self.scheduler.plan(self.started)
+        last_synced_at = self.started - timedelta(minutes=30)
+        ProjectSyncSchedule.objects.filter(mapping__project_name='Hot').update(
+            last_synced_at=last_synced_at, change_rate=100, avg_sync_seconds=30
+        )
+        ProjectSyncSchedule.objects.filter(mapping__project_name='Cold').update(
+            last_synced_at=last_synced_at, change_rate=0, avg_sync_seconds=30
+        )
+        ProjectSyncSchedule.objects.filter(mapping__project_name='Idle').update(
+            next_due_at=self.started + timedelta(hours=1)
+        )
+
+        scheduled, decisions = self.scheduler.plan(self.started)
+
+        self.assertEqual([schedule.mapping.project_name for schedule in scheduled], ['Hot'])
+        self.assertEqual(
+            {decision['project']: decision['decision'] for decision in decisions},
+            {'Hot': 'scheduled', 'Cold': 'deferred', 'Idle': 'backed_off'}
+        )
+
+    def test_failing_project_backs_off(self):
+        failure_started = self.started
+        first = self.tick(success=False)
+        # A single failure is retried on the next tick
+        self.assertEqual(first.failure_streak, 1)
+        self.assertEqual(first.next_due_at, failure_started + self.interval / 2)
+
+        failure_started = self.started
+        second = self.tick(success=False)
+        self.assertEqual(second.failure_streak, 2)
+        self.assertEqual(second.next_due_at, failure_started + 2 * self.interval - self.interval / 2)
+
+        failure_started = self.started
+        third = self.tick(success=False)
+        self.assertEqual(third.next_due_at, failure_started + 4 * self.interval - self.interval / 2)
+        scheduled, _ = self.scheduler.plan(failure_started + self.interval)
+        self.assertNotIn('Hot', [schedule.mapping.project_name for schedule in scheduled])
+
+    def test_success_resets_the_back_off(self):
+        self.tick(success=False)
+        self.tick(success=False)
+
+        success_started = self.started
+        schedule = self.tick(success=True, changes=25)
+
+        self.assertEqual(schedule.failure_streak, 0)
+        self.assertEqual(schedule.idle_streak, 0)
+        self.assertEqual(schedule.last_synced_at, success_started)
+        self.assertEqual(schedule.next_due_at, success_started + self.interval / 2)
+
+    def test_idle_project_backs_off_up_to_the_limit(self):
+        next_due = []
+        for _ in range(4):
+            started = self.started
+            schedule = self.tick(success=True, changes=0)
+            next_due.append(schedule.next_due_at - started)
+
+        self.assertEqual(schedule.idle_streak, 4)
+        self.assertEqual(next_due, [
+            2 * self.interval - self.interval / 2,
+            4 * self.interval - self.interval / 2,
+            timedelta(minutes=60) - self.interval / 2,
+            timedelta(minutes=60) - self.interval / 2,
+        ])
+
+
+class GuardedSqliteDatabaseWrapper(GuardedDatabaseWrapperMixin, SqliteDatabaseWrapper):
+    """SQLite behind the statement guard, so a real statement can be interrupted"""
+
+
+# Never finishes on its own
+ENDLESS_QUERY = 'WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c) SELECT MAX(x) FROM c'
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        self.breaker = CircuitBreaker('sage', failure_threshold=2, cooloff_seconds=0.1)
+
+    def trip(self):
+        for _ in range(self.breaker.failure_threshold):
+            self.breaker.before_call()
+            self.breaker.record_failure(ConnectionError('login timeout'))
+
+    def test_opens_after_consecutive_failures(self):
+        self.breaker.before_call()
+        self.breaker.record_failure(ConnectionError('login timeout'))
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+        self.breaker.record_failure(ConnectionError('login timeout'))
+
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        with self.assertRaises(CircuitOpen):
+            self.breaker.before_call()
+
+    def test_success_resets_the_failure_count(self):
+        self.breaker.record_failure(ConnectionError('login timeout'))
+        self.breaker.record_success()
+        self.breaker.record_failure(ConnectionError('login timeout'))
+
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_one_probe_after_the_cooloff_closes_it(self):
+        self.trip()
+        time.sleep(0.15)
+
+        self.breaker.before_call()
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        # Only one probe at a time
+        with self.assertRaises(CircuitOpen):
+            self.breaker.before_call()
+
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.breaker.before_call()
+
+    def test_failed_probe_reopens_it(self):
+        self.trip()
+        time.sleep(0.15)
+        self.breaker.before_call()
+
+        self.breaker.record_failure(ConnectionError('login timeout'))
+
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(self.breaker.stats['trips'], 2)
+        with self.assertRaises(CircuitOpen):
+            self.breaker.before_call()
+
+
+class StatementWatchdogTests(SimpleTestCase):
+    def setUp(self):
+        self.alias = 'guarded'
+        self.addCleanup(breaker_registry.discard, self.alias)
+        settings_dict = {
+            **connections['default'].settings_dict,
+            'NAME': ':memory:', 'OPTIONS': {}, 'GUARD': {'STATEMENT_TIMEOUT_SECONDS': 0.2},
+        }
+        self.connection = GuardedSqliteDatabaseWrapper(settings_dict, alias=self.alias)
+        self.addCleanup(self.connection.close)
+
+    def test_statement_past_its_timeout_is_interrupted(self):
+        started = time.monotonic()
+        with self.assertRaises(StatementTimeout), self.connection.cursor() as cursor:
+            cursor.execute(ENDLESS_QUERY)
+
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual(breaker_registry.get(self.alias).failures, 1)
+
+    def test_cancelled_token_interrupts_the_statement(self):
+        token = CancellationToken()
+        threading.Timer(0.05, token.cancel, args=('sync cancelled',)).start()
+
+        with self.assertRaisesMessage(StatementCancelled, 'sync cancelled'), cancellation_scope(token):
+            with self.connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+                cursor.execute(ENDLESS_QUERY)
+
+        # Cancelling says nothing about the database's health
+        self.assertEqual(breaker_registry.get(self.alias).failures, 0)
+        self.assertNotIsInstance(StatementCancelled('x'), StatementTimeout)
+
+
+class UnavailableDatabaseStatsTests(TestCase):
+    def setUp(self):
+        self.project = Project.objects.create(project_name='P1', description='')
+        DatabaseMapping.objects.create(project_name='P1', sql_server_db='sage-down')
+        # Supported documents alone would otherwise make the project look fully supported
+        SupportingDocument.objects.create(
+            project=self.project, fiscal_year='2024', fiscal_period='01', supported=True, transaction_value=100
+        )
+        breaker = breaker_registry.get('sage-down', settings_dict={})
+        self.addCleanup(breaker_registry.discard, 'sage-down')
+        for _ in range(breaker.failure_threshold):
+            breaker.record_failure(ConnectionError('login timeout'))
+
+    def test_stats_are_flagged_unavailable_while_the_circuit_is_open(self):
+        with self.assertLogs('main_app.models', 'WARNING') as logs:
+            stats = self.project.get_stats()
+
+        self.assertIn('database sage-down is unavailable', logs.output[0])
+        self.assertTrue(stats['unavailable'])
+        self.assertEqual(stats['unsupported_count'], 0)
+        self.assertEqual(stats['total_count'], 1)
+
+    def test_dashboard_does_not_count_the_project_as_fully_supported(self):
+        self.client.force_login(CustomUser.objects.create(username='auditor'))
+
+        data = self.client.get(reverse('main_app:projects_data_api')).json()['data']
+
+        self.assertIn('sage-down', data['unavailable_databases'])
+        self.assertTrue(data['top_projects'][0]['database_unavailable'])
+        self.assertFalse(data['top_projects'][0]['is_fully_supported'])
+
+
+# Just enough T-SQL -> SQLite for the #supported_pairs statements of Project._get_unsupported_stats
+TSQL_TO_SQLITE = (
+    (r"IF OBJECT_ID\('tempdb\.\.#(\w+)'\) IS NOT NULL DROP TABLE #\w+", r"DROP TABLE IF EXISTS temp.\1"),
+    (r"SELECT TOP 0 (.+) INTO #(\w+) FROM (.+)", r"CREATE TEMP TABLE \2 AS SELECT \1 FROM \3 LIMIT 0"),
+    (r"CREATE CLUSTERED INDEX", "CREATE INDEX"),
+    (r"\[\w+\]\.dbo\.", ""),
+    (r"#(\w+)", r"\1"),
+)
+
+
+def tsql_on_sqlite(execute, sql, params, many, context):
+    for pattern, replacement in TSQL_TO_SQLITE:
+        sql = re.sub(pattern, replacement, sql)
+    return execute(sql, params, many, context)
+
+
+class UnsupportedStatsTests(SageCompanyTestCase):
+    def setUp(self):
+        super().setUp()
+        ProjectSyncService(extraction_mode='bulk', load_mode='bulk').sync_transactions(self.project.project_name)
+        documents = SupportingDocument.objects.filter(project=self.project)
+        documents.filter(pk__in=documents.values_list('pk', flat=True)[::2]).update(supported=True)
+
+    def python_unsupported_totals(self, fiscal_year=None, fiscal_period=None):
+        """The unsupported figures worked out row by row, as the per-pair OR'd predicates did"""
+        supported = SupportingDocument.objects.filter(project=self.project, supported=True)
+        glposts = Glpost.objects.using(self.alias).filter(
+            companyid=self.alias, transamt__gt=0, srceledger='EN', srcetype='EV'
+        )
+        if fiscal_year:
+            supported = supported.filter(fiscal_year=fiscal_year, fiscal_period=fiscal_period)
+            glposts = glposts.filter(fiscalyr=fiscal_year, fiscalperd=fiscal_period)
+        supported_pairs = set(supported.values_list('batchnbr', 'entrynbr'))
+
+        unsupported_pairs, unsupported_value = set(), Decimal('0')
+        for batchnbr, entrynbr, transamt in glposts.values_list('batchnbr', 'entrynbr', 'transamt'):
+            if (batchnbr, entrynbr) not in supported_pairs:
+                unsupported_pairs.add((batchnbr, entrynbr))
+                unsupported_value += transamt
+        return len(unsupported_pairs), unsupported_value
+
+    def test_temp_table_anti_join_matches_the_row_by_row_totals(self):
+        periods = sorted(SupportingDocument.objects.filter(project=self.project).values_list(
+            'fiscal_year', 'fiscal_period'
+        ).distinct())
+        self.assertGreater(len(periods), 1)
+
+        with connections[self.alias].execute_wrapper(tsql_on_sqlite):
+            for fiscal_year, fiscal_period in periods + [(None, None)]:
+                supporting_docs_filter = {'project': self.project}
+                if fiscal_year:
+                    supporting_docs_filter.update(fiscal_year=fiscal_year, fiscal_period=fiscal_period)
+                with self.subTest(fiscal_year=fiscal_year, fiscal_period=fiscal_period):
+                    count, value = self.project._get_unsupported_stats(
+                        fiscal_year, fiscal_period, supporting_docs_filter
+                    )
+                    expected_count, expected_value = self.python_unsupported_totals(fiscal_year, fiscal_period)
+                    self.assertEqual(count, expected_count)
+                    # SQLite sums the raw DECIMAL column as a float
+                    self.assertAlmostEqual(value, expected_value, places=3)
+
+        with connections[self.alias].cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM sqlite_temp_master WHERE name = 'supported_pairs'")
+            self.assertEqual(cursor.fetchone(), (0,))
+
+    def test_unsupported_figures_stay_the_same_read_from_the_replica(self):
+        GlpostReplicaService().refresh(self.project.project_name)
+        fiscal_year, fiscal_period = SupportingDocument.objects.filter(project=self.project).values_list(
+            'fiscal_year', 'fiscal_period'
+        ).first()
+
+        with mock.patch.dict(SYNC_CONFIG, {'READ_FROM_REPLICA': True}):
+            stats = self.project._get_unsupported_stats(fiscal_year, fiscal_period, {
+                'project': self.project, 'fiscal_year': fiscal_year, 'fiscal_period': fiscal_period
+            })
+
+        self.assertEqual(stats, self.python_unsupported_totals(fiscal_year, fiscal_period))
+
+
+class MetricsExpositionTests(SimpleTestCase):
+    def setUp(self):
+        self.registry = metrics.MetricsRegistry()
+
+    def test_histogram_buckets_are_cumulative_with_sum_and_count(self):
+        histogram = self.registry.register(metrics.Histogram(
+            'sync_seconds', 'Sync wall time.', ('project',), buckets=(1, 0.5, 5)
+        ))
+        for value in (0.2, 0.5, 3, 7.5):
+            histogram.observe(value, project='P1')
+
+        self.assertEqual(self.registry.render().splitlines(), [
+            '# HELP sync_seconds Sync wall time.',
+            '# TYPE sync_seconds histogram',
+            'sync_seconds_bucket{project="P1",le="0.5"} 2',
+            'sync_seconds_bucket{project="P1",le="1"} 2',
+            'sync_seconds_bucket{project="P1",le="5"} 3',
+            'sync_seconds_bucket{project="P1",le="+Inf"} 4',
+            'sync_seconds_sum{project="P1"} 11.2',
+            'sync_seconds_count{project="P1"} 4',
+        ])
+        self.assertEqual(histogram.snapshot(), {('P1',): (4, 11.2)})
+
+    def test_label_values_are_escaped(self):
+        counter = self.registry.register(metrics.Counter('syncs_total', 'Syncs.', ('project',)))
+        counter.inc(project='C:\\Sage "main"\nledger')
+        counter.inc(2, project='C:\\Sage "main"\nledger')
+
+        self.assertIn('syncs_total{project="C:\\\\Sage \\"main\\"\\nledger"} 3', self.registry.render())
+
+    def test_labels_must_match_the_metric(self):
+        counter = self.registry.register(metrics.Counter('syncs_total', 'Syncs.', ('project',)))
+
+        with self.assertRaises(ValueError):
+            counter.inc(database='sage')
+        with self.assertRaises(ValueError):
+            self.registry.register(metrics.Counter('syncs_total', 'Syncs again.'))
+
+    def test_gauge_function_is_read_at_scrape_time(self):
+        ratio = []
+        self.registry.register(metrics.Gauge('hit_ratio', 'Hits.', function=lambda: ratio[-1] if ratio else None))
+        self.assertEqual(self.registry.render(), '# HELP hit_ratio Hits.\n# TYPE hit_ratio gauge\n')
+
+        ratio.append(0.25)
+        self.assertTrue(self.registry.render().endswith('\nhit_ratio 0.25\n'))
+
+
+@mock.patch.dict(METRICS_CONFIG, {'ENABLED': True, 'BEARER_TOKEN': 's3cret'})
+class MetricsViewTests(TestCase):
+    def setUp(self):
+        self.url = reverse('main_app:metrics')
+
+    def test_unauthenticated_scrape_is_refused(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 401)
+        self.assertNotIn(b'audit_sync', response.content)
+
+    def test_wrong_bearer_token_is_refused(self):
+        self.assertEqual(self.client.get(self.url, HTTP_AUTHORIZATION='Bearer wrong').status_code, 401)
+        self.assertEqual(self.client.get(self.url, HTTP_AUTHORIZATION='s3cret').status_code, 401)
+
+    def test_bearer_token_reads_the_metrics(self):
+        response = self.client.get(self.url, HTTP_AUTHORIZATION='Bearer s3cret')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+        self.assertIn(b'# TYPE audit_sync_projects_total counter', response.content)
+
+    def test_only_staff_sessions_read_the_metrics(self):
+        user = CustomUser.objects.create(username='auditor')
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+        user.is_staff = True
+        user.save()
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    def test_without_a_token_only_staff_can_read(self):
+        with mock.patch.dict(METRICS_CONFIG, {'BEARER_TOKEN': None}):
+            self.assertEqual(self.client.get(self.url, HTTP_AUTHORIZATION='Bearer None').status_code, 401)
+            self.assertEqual(self.client.get(self.url, HTTP_AUTHORIZATION='Bearer ').status_code, 401)
+
+    def test_disabled_endpoint_is_not_found(self):
+        with mock.patch.dict(METRICS_CONFIG, {'ENABLED': False}):
+            self.assertEqual(self.client.get(self.url, HTTP_AUTHORIZATION='Bearer s3cret').status_code, 404)
+
+
+
+class AggregateUnsupportedTests(SimpleTestCase):
+    def test_single_pass_matches_the_legacy_rescan(self):
+        for supported_ratio in (0, 0.5, 1):
+            rows, supported_pairs = BenchmarkUnsupportedAggregation().generate_rows(
+                random.Random(7), 2000, supported_ratio
+            )
+            with self.subTest(supported_ratio=supported_ratio):
+                self.assertEqual(
+                    _aggregate_unsupported(
+                        ((row['batchnbr'], row['entrynbr'], row['transamt']) for row in rows), supported_pairs
+                    ),
+                    legacy_unsupported_totals(rows, supported_pairs)
+                )
+
+    def test_entries_count_once_and_floats_add_up_exactly(self):
+        rows = [('000001', '00001', 0.1), ('000001', '00001', 0.2), ('000001', '00002', Decimal('5')),
+                ('000002', '00001', 7)]
+
+        self.assertEqual(_aggregate_unsupported(iter(rows), {('000002', '00001')}), (2, Decimal('5.3')))
+
+
+class AggregatedDataTests(SageCompanyTestCase):
+    def test_period_totals_match_the_legacy_rescan(self):
+        ProjectSyncService(extraction_mode='bulk', load_mode='bulk').sync_transactions(self.project.project_name)
+        documents = SupportingDocument.objects.filter(project=self.project)
+        periods = sorted(documents.values_list('fiscal_year', 'fiscal_period').distinct())
+        # Periods with supported entries take the single-pass path
+        self.assertTrue(documents.filter(supported=True).exists())
+        fields = ('batchnbr', 'entrynbr', 'transamt', 'acctid', 'fiscalyr', 'fiscalperd', 'srcecurn', 'srceledger',
+                  'srcetype', 'postingseq', 'cntdetail')
+
+        for fiscal_year, fiscal_period in periods:
+            with self.subTest(fiscal_year=fiscal_year, fiscal_period=fiscal_period):
+                aggregated = _get_aggregated_data(
+                    self.alias, self.project.project_name, fiscal_year, fiscal_period, fiscal_period, chunk_size=7
+                )
+                current_transactions = list(Glpost.objects.using(self.alias).filter(
+                    companyid=self.alias, transamt__gt=0, srceledger='EN', fiscalyr=fiscal_year,
+                    fiscalperd=fiscal_period
+                ).values(*fields))
+                supported_pairs = set(documents.filter(
+                    fiscal_year=fiscal_year, fiscal_period=fiscal_period, supported=True
+                ).values_list('batchnbr', 'entrynbr'))
+
+                self.assertEqual(
+                    (aggregated['unsupported_transactions_number'], aggregated['unsupported_transactions_value']),
+                    legacy_unsupported_totals(current_transactions, supported_pairs)
+                )
+
+
+
+class AggregatedByPeriodTests(SageCompanyTestCase):
+    STAT_FIELDS = ('fiscal_year', 'fiscal_period', 'supported_transactions_number', 'supported_transactions_value',
+                   'unsupported_transactions_number', 'unsupported_transactions_value')
+
+    def setUp(self):
+        super().setUp()
+        ProjectSyncService(extraction_mode='bulk', load_mode='bulk').sync_transactions(self.project.project_name)
+        self.periods = TransactionSyncService()._get_fiscal_combinations(self.project.project_name)
+
+    def period_stats(self):
+        return sorted(ProjectPeriodStats.objects.filter(project=self.project).values_list(*self.STAT_FIELDS))
+
+    def test_grouped_figures_match_the_per_period_ones(self):
+        period_data = _get_aggregated_data_by_period(self.alias, self.project.project_name, chunk_size=7)
+
+        self.assertEqual(sorted(period_data), self.periods)
+        for fiscal_year, fiscal_period in self.periods:
+            with self.subTest(fiscal_year=fiscal_year, fiscal_period=fiscal_period):
+                per_period = _get_aggregated_data(
+                    self.alias, self.project.project_name, fiscal_year, fiscal_period, fiscal_period
+                )
+                grouped = period_data[(fiscal_year, fiscal_period)]
+                self.assertEqual(set(grouped), set(per_period))
+                for name, value in per_period.items():
+                    # SQLite sums the Sage amounts as floats
+                    self.assertAlmostEqual(grouped[name], value, places=2, msg=name)
+
+    def test_batched_sync_writes_the_comprehensive_stats_in_constant_queries(self):
+        service = TransactionSyncService()
+        self.assertTrue(service.sync_single_project_comprehensive(self.project.project_name, self.alias))
+        comprehensive_stats = self.period_stats()
+        ProjectPeriodStats.objects.filter(project=self.project).delete()
+
+        with CaptureQueriesContext(connections[self.alias]) as sage_queries, \
+                CaptureQueriesContext(connections['default']) as local_queries:
+            self.assertTrue(service.sync_single_project_batched(self.project.project_name, self.alias))
+
+        self.assertGreater(len(self.periods), 10)
+        self.assertEqual(len(sage_queries), 1)
+        self.assertLess(len(local_queries), len(self.periods))
+        self.assertEqual(self.period_stats(), comprehensive_stats)
+
+
+
+class SyncProfilerTests(TestCase):
+    def test_nested_stages_are_timed_exclusively(self):
+        with SyncProfiler('P1') as profiler:
+            with profiler.stage('load'):
+                time.sleep(0.02)
+                with profiler.stage('stats'):
+                    time.sleep(0.05)
+                    CustomUser.objects.count()
+
+        self.assertGreaterEqual(profiler.stages['stats']['seconds'], 0.05)
+        self.assertLess(profiler.stages['load']['seconds'], 0.05)
+        self.assertAlmostEqual(
+            sum(entry['seconds'] for entry in profiler.stages.values()), profiler.seconds, places=6
+        )
+        self.assertEqual(profiler.stages['stats']['queries'], {'default': 1})
+        self.assertEqual(profiler.stages['load']['queries'], {})
+
+    def test_fetched_rows_are_charged_to_their_own_stage(self):
+        def rows():
+            for row in range(3):
+                time.sleep(0.02)
+                yield row
+
+        with SyncProfiler('P1') as profiler:
+            with sync_stage('transform'):
+                self.assertEqual(list(profile_rows('extract', rows())), [0, 1, 2])
+
+        self.assertEqual(profiler.stages['extract']['rows'], 3)
+        self.assertGreaterEqual(profiler.stages['extract']['seconds'], 0.06)
+        self.assertLess(profiler.stages['transform']['seconds'], 0.02)
+
+    def test_stage_helpers_do_nothing_without_a_profiler(self):
+        rows = [1, 2]
+
+        self.assertIs(profile_rows('extract', rows), rows)
+        with sync_stage('load'):
+            pass
+
+
+class SyncStageTimingTests(SageCompanyTestCase):
+    def setUp(self):
+        super().setUp()
+        ProjectSyncService(extraction_mode='bulk', load_mode='bulk').sync_transactions(self.project.project_name)
+
+    def test_project_sync_stores_its_stage_timings(self):
+        service = TransactionSyncService()
+        tracemalloc.start()
+        try:
+            with CaptureQueriesContext(connections[self.alias]) as sage_queries:
+                self.assertTrue(service.sync_single_project_comprehensive(self.project.project_name, self.alias))
+        finally:
+            tracemalloc.stop()
+
+        sync_log = SyncLog.objects.get(project=self.project)
+        timings = {timing.stage: timing for timing in SyncStageTiming.objects.filter(sync_log=sync_log)}
+        self.assertTrue({'extract', 'transform', 'stats', 'other'} <= set(timings))
+        self.assertEqual(set(service.stage_profiles[self.project.project_name]), set(timings))
+        self.assertEqual(sum(timing.query_counts.get(self.alias, 0) for timing in timings.values()), len(sage_queries))
+        self.assertEqual(timings['extract'].query_counts.get(self.alias, 0), len(sage_queries))
+        self.assertGreater(timings['extract'].rows, 0)
+        for timing in timings.values():
+            self.assertEqual(timing.queries, sum(timing.query_counts.values()))
+            self.assertEqual(timing.project, self.project)
+        self.assertIsNotNone(timings['extract'].peak_memory_kb)
+
+    def test_report_ranks_projects_and_stages(self):
+        service = TransactionSyncService()
+        for _ in range(2):
+            self.assertTrue(service.sync_single_project_comprehensive(self.project.project_name, self.alias))
+        timings = SyncStageTiming.objects.filter(project=self.project)
+
+        report = stage_report(hours=1)
+
+        [project] = report['projects']
+        self.assertEqual(project['project'], self.project.project_name)
+        self.assertEqual(project['syncs'], 2)
+        self.assertEqual(project['queries'], sum(timing.queries for timing in timings))
+        stage_seconds = {stage['stage']: stage['seconds'] for stage in report['stages']}
+        self.assertEqual(project['slowest_stage'], max(stage_seconds, key=stage_seconds.get))
+        self.assertEqual([stage['seconds'] for stage in report['stages']], sorted(stage_seconds.values(), reverse=True))
+
+        timings.update(recorded_at=timezone.now() - timedelta(hours=2))
+        self.assertEqual(stage_report(hours=1)['projects'], [])
+
+        out = StringIO()
+        call_command('sync_stage_report', '--hours', '3', '--json', stdout=out)
+        self.assertEqual(json.loads(out.getvalue())['projects'][0]['syncs'], 2)
+
+    def test_report_endpoint_is_staff_only(self):
+        service = TransactionSyncService()
+        self.assertTrue(service.sync_single_project_comprehensive(self.project.project_name, self.alias))
+        url = reverse('main_app:sync_stage_report_api')
+        user = CustomUser.objects.create(username='auditor')
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        user.is_staff = True
+        user.save()
+        response = self.client.get(url, {'hours': 1, 'project': self.project.project_name})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['projects'][0]['syncs'], 1)
+        self.assertEqual(self.client.get(url, {'hours': 'day'}).status_code, 400)
+
+
+
+class SageDatasetTests(SageCompanyTestCase):
+    def dump(self):
+        """Every row of the company's Sage tables, in key order"""
+        tables = {}
+        with connections[self.alias].cursor() as cursor:
+            for model in (Glpost, Enpjd, Eneba):
+                cursor.execute(f'SELECT * FROM {model._meta.db_table} ORDER BY 1, 2, 3, 4, 5')
+                tables[model._meta.db_table] = cursor.fetchall()
+        return tables
+
+    def generate_into(self, seed=7, **options):
+        data_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(data_dir.cleanup)
+        manifest = SageDatasetGenerator(data_dir.name, rows=self.rows, seed=seed, **options).generate()
+        return manifest, self.dump()
+
+    def test_same_parameters_generate_the_same_company(self):
+        first_manifest, first_tables = self.generate_into()
+        second_manifest, second_tables = self.generate_into()
+        _, other_seed_tables = self.generate_into(seed=8)
+
+        self.assertEqual(first_tables, second_tables)
+        self.assertNotEqual(first_tables, other_seed_tables)
+        counts = [
+            {name: count for name, count in company.items() if name != 'path'}
+            for company in (first_manifest['company_counts'][0], second_manifest['company_counts'][0])
+        ]
+        self.assertEqual(counts[0], counts[1])
+
+    def test_counts_and_entries_match_the_tables(self):
+        company = self.company
+        glposts = Glpost.objects.using(self.alias)
+
+        self.assertGreaterEqual(company['glpost'], self.rows)
+        self.assertEqual(glposts.count(), company['glpost'])
+        self.assertEqual(Enpjd.objects.using(self.alias).count(), company['enpjd'])
+        self.assertEqual(Eneba.objects.using(self.alias).count(), company['eneba'])
+        self.assertEqual(glposts.values('batchnbr', 'entrynbr').distinct().count(), company['entries'])
+        self.assertEqual(
+            glposts.filter(srceledger='EN').values('jnldtlref').distinct().count(), company['expense_documents']
+        )
+        self.assertEqual(
+            Eneba.objects.using(self.alias).exclude(notes='').count(), company['notes']
+        )
+        # Every journal entry balances
+        totals = {}
+        for batchnbr, entrynbr, amount in glposts.values_list('batchnbr', 'entrynbr', 'transamt'):
+            totals[batchnbr, entrynbr] = totals.get((batchnbr, entrynbr), 0) + amount
+        self.assertEqual(set(totals.values()), {0})
+        self.assertEqual(load_manifest(self.data_dir.name)['company_counts'][0], company)
+
+    def test_ratios_shape_the_attachments_and_notes(self):
+        _, tables = self.generate_into(attachment_ratio=0, note_ratio=0)
+
+        self.assertEqual(tables['ENEBA'], [])
+        self.assertGreater(len(tables['ENPJD']), 0)
+
+    def test_row_counts_accept_suffixes(self):
+        self.assertEqual(row_count('10k'), 10000)
+        self.assertEqual(row_count('1M'), 1000000)
+        self.assertEqual(row_count('2500'), 2500)
+
+
+class SyncBenchmarkTests(SageCompanyTestCase):
+    def setUp(self):
+        super().setUp()
+        override = override_settings(BENCHMARK_DATA_DIR=self.data_dir.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_repeated_runs_report_the_same_work(self):
+        first = SyncBenchmark(repeat=2).run()
+        second = SyncBenchmark(repeat=1, trace_memory=False).run()
+
+        self.assertEqual(list(first['scenarios']), ['project_sync', 'sync_all_projects', 'sync_comments'])
+        self.assertEqual(first['dataset']['company_counts'][0], self.company)
+        for name, scenario in first['scenarios'].items():
+            with self.subTest(scenario=name):
+                self.assertEqual(len(scenario['wall_seconds_runs']), 2)
+                self.assertEqual(scenario['result'], second['scenarios'][name]['result'])
+                self.assertEqual(scenario['queries_by_alias'], second['scenarios'][name]['queries_by_alias'])
+                self.assertEqual(scenario['queries'], sum(scenario['queries_by_alias'].values()))
+                self.assertGreater(scenario['peak_memory_kb'], 0)
+                self.assertIsNone(second['scenarios'][name]['peak_memory_kb'])
+        self.assertIn(self.alias, first['scenarios']['project_sync']['queries_by_alias'])
+        self.assertEqual(first['scenarios']['sync_all_projects']['result'], {'projects': 1, 'successful': 1})
+        self.assertEqual(
+            first['scenarios']['project_sync']['result']['synced'], SupportingDocument.objects.count()
+        )
+
+    def test_command_writes_and_compares_reports(self):
+        with tempfile.TemporaryDirectory() as output_dir:
+            baseline = os.path.join(output_dir, 'before.json')
+            call_command(
+                'benchmark_sync', '--scenario', 'project_sync', '--no-memory', '--output', baseline, stdout=StringIO()
+            )
+            out = StringIO()
+            call_command('benchmark_sync', '--scenario', 'project_sync', '--compare', baseline, stdout=out)
+            with open(baseline) as baseline_file:
+                before = json.load(baseline_file)
+
+        report = json.loads(out.getvalue()[:out.getvalue().rindex('}') + 1])
+        self.assertEqual(list(report['scenarios']), ['project_sync'])
+        self.assertEqual(report['scenarios']['project_sync']['queries'], before['scenarios']['project_sync']['queries'])
+        [row] = compare_reports(report, before)
+        self.assertEqual(row['baseline_queries'], row['queries'])
+        self.assertIsNone(row['baseline_peak_memory_kb'])
+        self.assertIn('project_sync', out.getvalue().splitlines()[-1])
+
+    def test_benchmarks_refuse_other_settings(self):
+        with override_settings(BENCHMARK_DATA_DIR=None), self.assertRaises(CommandError):
+            call_command('benchmark_sync', stdout=StringIO())
+
+
+
+class DashboardBudgetTests(SimpleTestCase):
+    def test_percentiles_are_nearest_rank(self):
+        latencies = list(range(20, 0, -1))
+
+        self.assertEqual(_percentile(latencies, 50), 10)
+        self.assertEqual(_percentile(latencies, 95), 19)
+        self.assertEqual(_percentile(latencies, 100), 20)
+        self.assertEqual(_percentile([7], 95), 7)
+
+    def test_cases_over_budget_are_violations(self):
+        benchmark = DashboardBenchmark(budgets={
+            'projects_data_api': {'p95_ms': 100, 'max_queries': 10},
+            'admin_home_api': {'p95_ms': None, 'max_queries': 5},
+        })
+        results = {
+            'projects_data_api': {'p95_ms': 100.5, 'queries': 10},
+            'admin_home_api': {'p95_ms': 9000, 'queries': 5},
+            'project_report_view': {'p95_ms': 9000, 'queries': 900},
+        }
+
+        self.assertEqual(benchmark.check_budgets(results), [
+            {'case': 'projects_data_api', 'metric': 'p95_ms', 'value': 100.5, 'budget': 100},
+        ])
+        results['admin_home_api']['queries'] = 6
+        self.assertEqual(
+            [violation['case'] for violation in benchmark.check_budgets(results)],
+            ['projects_data_api', 'admin_home_api']
+        )
+
+
+class DashboardBenchmarkTests(SageCompanyTestCase):
+    cases = ['project_dashboard_api_period', 'projects_data_api', 'project_report_view']
+
+    def setUp(self):
+        super().setUp()
+        override = override_settings(BENCHMARK_DATA_DIR=self.data_dir.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_seeding_syncs_every_local_table(self):
+        with mock.patch.dict(SYNC_CONFIG, {'GLPOST_REPLICA': False}):
+            manifest = seed_dashboard_data(projects=1, rows=self.rows)
+            self.assertFalse(SYNC_CONFIG['GLPOST_REPLICA'])
+
+        counts = manifest['local_counts']
+        self.assertEqual(counts, local_counts())
+        self.assertEqual(counts['projects'], 1)
+        for name in ('supporting_documents', 'supporting_document_files', 'comments', 'period_stats',
+                     'glpost_replica'):
+            self.assertGreater(counts[name], 0, msg=name)
+        # The replica holds the EN-ledger rows
+        self.assertEqual(counts['glpost_replica'], Glpost.objects.using(self.alias).filter(srceledger='EN').count())
+        self.assertEqual(manifest['company_counts'][0]['alias'], self.alias)
+
+    def test_cases_are_measured_against_their_budgets(self):
+        seed_dashboard_data(projects=1, rows=self.rows)
+        budgets = {'projects_data_api': {'max_queries': 0}}
+
+        with mock.patch.dict(SYNC_CONFIG, {'READ_FROM_REPLICA': False}):
+            report = DashboardBenchmark(iterations=3, cases=self.cases, budgets=budgets).run()
+            self.assertFalse(SYNC_CONFIG['READ_FROM_REPLICA'])
+
+        self.assertEqual(list(report['cases']), self.cases)
+        for name, case in report['cases'].items():
+            with self.subTest(case=name):
+                self.assertEqual(case['statuses'], {200: 3})
+                self.assertGreater(case['queries'], 0)
+                self.assertLessEqual(case['p50_ms'], case['p95_ms'])
+                self.assertLessEqual(case['p95_ms'], case['max_ms'])
+        queries = report['cases']['projects_data_api']['queries']
+        self.assertEqual(
+            report['violations'], [{'case': 'projects_data_api', 'metric': 'queries', 'value': queries, 'budget': 0}]
+        )
+
+    def test_command_fails_over_budget(self):
+        seed_dashboard_data(projects=1, rows=self.rows)
+        with tempfile.TemporaryDirectory() as budgets_dir:
+            budgets = os.path.join(budgets_dir, 'budgets.json')
+            with open(budgets, 'w') as budgets_file:
+                json.dump({'projects_data_api': {'p95_ms': 60000, 'max_queries': 1000}}, budgets_file)
+            out = StringIO()
+            call_command(
+                'benchmark_dashboards', '--skip-seed', '--case', 'projects_data_api', '--iterations', '2',
+                '--budgets', budgets, stdout=out
+            )
+            self.assertIn('projects_data_api', out.getvalue())
+
+            with open(budgets, 'w') as budgets_file:
+                json.dump({'projects_data_api': {'max_queries': 0}}, budgets_file)
+            with self.assertRaisesMessage(CommandError, '1 budget(s) exceeded'):
+                call_command(
+                    'benchmark_dashboards', '--skip-seed', '--case', 'projects_data_api', '--iterations', '2',
+                    '--budgets', budgets, stdout=StringIO(), stderr=StringIO()
+                )
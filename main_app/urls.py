@@ -10,4 +10,7 @@ urlpatterns = [
     path('api/projects-data/', views.projects_data_api, name='projects_data_api'),
     path('home/', views.projects_overview, name="landing_dashboard"),
     path('ajax/project-search/', views.ajax_project_search, name='ajax_project_search'),
+    path('api/sync-stages/', views.sync_stage_report_api, name='sync_stage_report_api'),
+    # No trailing slash: the path Prometheus scrapes by default
+    path('metrics', views.metrics_view, name='metrics'),
 ]
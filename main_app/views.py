@@ -1,15 +1,21 @@
+import hmac
+
 from django.core.paginator import Paginator
 from django.db.models import Q
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
 from django.shortcuts import render, redirect
 from django.urls import reverse
 
+from audit_management_system.settings import METRICS_CONFIG
 from transactions.models import SupportingDocument
+from . import metrics
+from .db_guard import breaker_states
 from .models import Project
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth import authenticate, login, logout
 
 from .services import TransactionSyncService
+from .sync_profiler import stage_report
 from .sync_tasks import sync_transactions
 
 import logging
@@ -24,6 +30,11 @@ def is_staff(user):
     return user.is_staff
 
 
+def _unavailable_databases():
+    """Sage databases whose circuit is open, with their breaker state"""
+    return {alias: breaker for alias, breaker in breaker_states().items() if breaker['state'] == 'open'}
+
+
 # Login view
 def login_view(request):
     if request.method == 'POST':
@@ -131,6 +142,7 @@ def projects_data_api(request):
         fully_supported_projects = 0
 
         project_stats = []
+        unavailable_databases = _unavailable_databases()
 
         # Process projects with progress updates
         for i, project in enumerate(projects_queryset):
@@ -143,7 +155,9 @@ def projects_data_api(request):
                 total_unsupported_value += stats['unsupported_value']
 
                 # Check if project is fully supported
-                if stats['unsupported_count'] == 0 and stats['total_count'] > 0:
+                is_fully_supported = (stats['unsupported_count'] == 0 and stats['total_count'] > 0
+                                      and not stats['unavailable'])
+                if is_fully_supported:
                     fully_supported_projects += 1
 
                 project_data = {
@@ -153,7 +167,9 @@ def projects_data_api(request):
                     'supported_transactions_value': stats['supported_value'],
                     'unsupported_transactions_value': stats['unsupported_value'],
                     'total_transactions': stats['total_count'],
-                    'is_fully_supported': stats['unsupported_count'] == 0 and stats['total_count'] > 0,
+                    'is_fully_supported': is_fully_supported,
+                    # Unsupported figures are missing while the project's database is unavailable
+                    'database_unavailable': stats['unavailable'],
                     # Add URL for project detail
                     'project_url': f"/projects/project/{project.project_name}/"
                 }
@@ -180,6 +196,7 @@ def projects_data_api(request):
                 'total_supported_value': total_supported_value,
                 'total_unsupported_value': total_unsupported_value,
                 'top_projects': top_projects,
+                'unavailable_databases': unavailable_databases,
             }
         })
 
@@ -250,6 +267,7 @@ def project_dashboard_api(request):
         project_stats = []
         failed_projects = []
         fully_supported_projects = 0
+        unavailable_databases = _unavailable_databases()
 
         for project in projects_queryset:
             try:
@@ -257,7 +275,8 @@ def project_dashboard_api(request):
                 stats = project.get_stats(fiscal_year=fiscal_year, fiscal_period=fiscal_period)
 
                 # Check if project is fully supported
-                is_fully_supported = stats['unsupported_count'] == 0 and stats['total_count'] > 0
+                is_fully_supported = (stats['unsupported_count'] == 0 and stats['total_count'] > 0
+                                      and not stats['unavailable'])
                 if is_fully_supported:
                     fully_supported_projects += 1
 
@@ -273,6 +292,7 @@ def project_dashboard_api(request):
                     'sync_status': project.sync_status,
                     'last_synced': project.last_synced.isoformat() if project.last_synced else None,
                     'is_fully_supported': is_fully_supported,
+                    'database_unavailable': stats['unavailable'],
                     'project_url': f"/projects/project/{project.project_name}/"
                 }
                 project_stats.append(project_data)
@@ -351,6 +371,7 @@ def project_dashboard_api(request):
                 'total_unsupported_transactions': sum(p['unsupported_transactions_number'] for p in project_stats),
                 'total_supported_value': sum(p['supported_transactions_value'] for p in project_stats),
                 'total_unsupported_value': sum(p['unsupported_transactions_value'] for p in project_stats),
+                'unavailable_databases': unavailable_databases,
             },
             'filters': {
                 'fiscal_year': fiscal_year,
@@ -401,3 +422,33 @@ def ajax_project_search(request):
     ]
 
     return JsonResponse({'results': results})
+
+
+@login_required
+@user_passes_test(is_staff)
+def sync_stage_report_api(request):
+    """Slowest projects and sync stages over the last ?hours= (default 24)"""
+    try:
+        hours = float(request.GET.get('hours', 24))
+        limit = int(request.GET.get('limit', 10))
+    except ValueError:
+        return JsonResponse({'error': 'hours and limit must be numbers'}, status=400)
+
+    return JsonResponse(stage_report(hours=hours, limit=limit, project_name=request.GET.get('project') or None))
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint: the metrics of this process in the text format
+
+    Readable with the METRICS_CONFIG bearer token, or by staff users that are logged in.
+    """
+    if not METRICS_CONFIG.get('ENABLED', True):
+        return HttpResponse(status=404)
+
+    token = METRICS_CONFIG.get('BEARER_TOKEN')
+    authorization = request.headers.get('Authorization', '')
+    authorized = bool(token) and hmac.compare_digest(authorization, f'Bearer {token}')
+    if not authorized and not (request.user.is_authenticated and request.user.is_staff):
+        return HttpResponse('Unauthorized\n', status=401, content_type='text/plain')
+
+    return HttpResponse(metrics.registry.render(), content_type=metrics.CONTENT_TYPE)
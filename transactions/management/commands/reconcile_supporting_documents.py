@@ -0,0 +1,64 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from transactions.reconciliation import ReconciliationEngine
+
+
+class Command(BaseCommand):
+    help = 'Reconcile SupportingDocuments with the Sage GL posts, repairing only the keys that differ'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--project',
+            type=str,
+            action='append',
+            help='Reconcile a specific project only (repeatable)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report the differences without repairing them',
+        )
+        parser.add_argument(
+            '--delete-orphans',
+            action='store_true',
+            help='Delete SupportingDocuments whose GL post no longer exists in Sage',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='SupportingDocuments created per bulk insert',
+        )
+        parser.add_argument(
+            '--output',
+            type=str,
+            help='Write the JSON summary to this file instead of stdout',
+        )
+
+    def handle(self, *args, **options):
+        engine = ReconciliationEngine(
+            repair=not options['dry_run'],
+            delete_orphans=options['delete_orphans'],
+            batch_size=options['batch_size'],
+        )
+        summary = engine.reconcile_all(project_names=options['project'])
+
+        report = json.dumps(summary, indent=2, default=str)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(report)
+        else:
+            self.stdout.write(report)
+
+        totals = summary['totals']
+        message = (
+            f"Reconciled {totals['projects']} projects in {totals['elapsed_seconds']:.2f}s: "
+            f"{totals['in_sync']} in sync, {totals['missing']} missing and {totals['orphaned']} orphaned keys, "
+            f"{totals['created']} created, {totals['deleted']} deleted"
+        )
+        if totals['failed']:
+            self.stderr.write(self.style.ERROR(f"{message}; {totals['failed']} projects failed"))
+        else:
+            self.stderr.write(self.style.SUCCESS(message))
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+
+from main_app.models import DatabaseMapping
+from transactions.services import GlpostReplicaService
+
+
+class Command(BaseCommand):
+    help = 'Refresh the local glpost replica from the Sage databases'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--project',
+            type=str,
+            help='Refresh the replica of a specific project only',
+        )
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Drop and reload the replica slice instead of pulling changes since the watermark',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Rows per upsert',
+        )
+
+    def handle(self, *args, **options):
+        mappings = DatabaseMapping.objects.filter(is_active=True)
+        if options['project']:
+            mappings = mappings.filter(project_name=options['project'])
+
+        service = GlpostReplicaService(batch_size=options['batch_size'])
+        total = deleted = 0
+        for mapping in mappings:
+            try:
+                refreshed_count = service.refresh(mapping.project_name, full=options['full'])
+                total += refreshed_count
+                deleted += service.deleted_rows[mapping.project_name]
+                self.stdout.write(
+                    f'{mapping.project_name} ({mapping.sql_server_db}): {refreshed_count} rows, '
+                    f'{service.deleted_rows[mapping.project_name]} deleted'
+                )
+            except Exception as e:
+                self.stdout.write(
+                    self.style.ERROR(f'Error refreshing replica for {mapping.project_name}: {str(e)}')
+                )
+
+        self.stdout.write(self.style.SUCCESS(f'Replica refreshed: {total} rows upserted, {deleted} deleted'))
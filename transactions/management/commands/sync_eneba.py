@@ -0,0 +1,96 @@
+from django.core.management.base import BaseCommand
+
+from audit_management_system.settings import SYNC_CONFIG
+from transactions.pipeline import AttachmentSink, CommentSink, EnebaPipeline, run_eneba_pipeline
+
+
+class Command(BaseCommand):
+    help = 'Sync ENEBA attachments and comments in a single pass over the Sage tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--project',
+            type=str,
+            action='append',
+            help='Sync a specific project only (repeatable)',
+        )
+        parser.add_argument(
+            '--fiscal-year',
+            type=str,
+            help='Sync specific fiscal year (e.g., 2024)',
+        )
+        parser.add_argument(
+            '--fiscal-period',
+            type=str,
+            help='Sync specific fiscal period (e.g., 01)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show what would be synced without making changes',
+        )
+        parser.add_argument(
+            '--skip-attachments',
+            action='store_true',
+            help='Leave out the attachment sink',
+        )
+        parser.add_argument(
+            '--skip-comments',
+            action='store_true',
+            help='Leave out the comment sink',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=SYNC_CONFIG.get('LOAD_BATCH_SIZE', 500),
+            help='Rows per bulk insert',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=SYNC_CONFIG.get('STREAM_CHUNK_SIZE', 2000),
+            help='GL posts per pipeline chunk',
+        )
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING('DRY RUN MODE - No changes will be made'))
+
+        def pipeline_factory():
+            sinks = []
+            if not options['skip_attachments']:
+                sinks.append(AttachmentSink(batch_size=options['batch_size']))
+            if not options['skip_comments']:
+                sinks.append(CommentSink(batch_size=options['batch_size']))
+            return EnebaPipeline(chunk_size=options['chunk_size'], sinks=sinks)
+
+        results = run_eneba_pipeline(
+            project_names=options['project'],
+            fiscal_year=options['fiscal_year'],
+            fiscal_period=options['fiscal_period'],
+            dry_run=options['dry_run'],
+            pipeline_factory=pipeline_factory,
+        )
+
+        failed = 0
+        for result in results:
+            if not result['success']:
+                failed += 1
+                self.stdout.write(self.style.ERROR(f"{result['project']}: {result.get('error', 'skipped')}"))
+                continue
+
+            stats = result['stats']
+            self.stdout.write(
+                f"{result['project']}: {stats.get('glposts', 0)} GL posts, {stats.get('eneba_rows', 0)} ENEBA rows, "
+                f"{stats.get('documents', 0)} documents, {stats.get('files', 0)} files, "
+                f"{stats.get('comments', 0)} comments in {stats['elapsed']:.2f}s "
+                f"({stats['rows_per_second']:.0f} rows/sec)"
+            )
+            for name, timing in stats['stages'].items():
+                self.stdout.write(f"  {name}: {timing['seconds']:.3f}s, {timing['calls']} calls, {timing['rows']} rows")
+
+        message = f'ENEBA pipeline finished for {len(results) - failed} of {len(results)} projects'
+        if failed:
+            self.stdout.write(self.style.WARNING(message))
+        else:
+            self.stdout.write(self.style.SUCCESS(message))
@@ -1,7 +1,7 @@
 from django.core.management.base import BaseCommand
 
-from main_app.models import DatabaseMapping
-from ...models import Eneba, Enpjd, Glpost, SupportingDocument, SupportingDocumentFile, Project
+from transactions.services import ProjectSyncService
+from ...models import Project
 
 
 class Command(BaseCommand):
@@ -28,12 +28,40 @@ class Command(BaseCommand):
             action='store_true',
             help='Show what would be synced without making changes',
         )
+        parser.add_argument(
+            '--extraction-mode',
+            choices=ProjectSyncService.EXTRACTION_MODES,
+            default='row',
+            help='row: per-transaction ENPJD/ENEBA lookups; bulk: three set-based queries per project',
+        )
+        parser.add_argument(
+            '--load-mode',
+            choices=ProjectSyncService.LOAD_MODES,
+            default='row',
+            help='row: create and re-save each document; bulk: batched bulk_create of documents then files',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Rows per bulk insert when --load-mode=bulk',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=2000,
+            help='GL post rows fetched per round-trip while streaming the glpost scan',
+        )
 
     def handle(self, *args, **options):
         fiscal_year = options.get('fiscal_year')
         fiscal_period = options.get('fiscal_period')
         project_id = options.get('project_id')
         dry_run = options.get('dry_run')
+        extraction_mode = options.get('extraction_mode')
+        load_mode = options.get('load_mode')
+        batch_size = options.get('batch_size')
+        chunk_size = options.get('chunk_size')
 
         if dry_run:
             self.stdout.write(self.style.WARNING('DRY RUN MODE - No changes will be made'))
@@ -43,7 +71,11 @@ class Command(BaseCommand):
                 fiscal_year=fiscal_year,
                 fiscal_period=fiscal_period,
                 project_id=project_id,
-                dry_run=dry_run
+                dry_run=dry_run,
+                extraction_mode=extraction_mode,
+                load_mode=load_mode,
+                batch_size=batch_size,
+                chunk_size=chunk_size
             )
 
             if dry_run:
@@ -60,147 +92,35 @@ class Command(BaseCommand):
                 self.style.ERROR(f'Error syncing transactions: {str(e)}')
             )
 
-    def sync_transactions(self, project_id: int, fiscal_year=None, fiscal_period=None, dry_run=False):
+    def sync_transactions(self, project_id: int, fiscal_year=None, fiscal_period=None, dry_run=False,
+                          extraction_mode='row', load_mode='row', batch_size=500, chunk_size=2000):
         """
         Sync expense transactions from SQL Server tables to Django models
         """
-        db = [project_name.project_name for project_name in DatabaseMapping.objects.filter(is_active=True)]
-        projects = Project.objects.filter(project_name__in=db)
+        project_name = None
+        if project_id:
+            project_name = Project.objects.get(project_id=project_id).project_name
 
-        synced_count = 0
-
-        for project in projects:
-            sql_server_db = DatabaseMapping.objects.get(project_name=project.project_name)
-
-            # First, get existing records from supportingdocuments table for this project
-            existing_records_query = SupportingDocument.objects.filter(project=project)
-
-            if fiscal_year:
-                existing_records_query = existing_records_query.filter(fiscal_year=fiscal_year)
-            if fiscal_period:
-                existing_records_query = existing_records_query.filter(fiscal_period=fiscal_period.zfill(2))
+        service = ProjectSyncService(
+            extraction_mode=extraction_mode, load_mode=load_mode, batch_size=batch_size, chunk_size=chunk_size
+        )
+        synced_count = service.sync_transactions(
+            project_name=project_name,
+            fiscal_year=fiscal_year,
+            fiscal_period=fiscal_period,
+            dry_run=dry_run
+        )
 
-            # Create a set of (batchnbr, entrynbr) tuples for quick lookup
-            existing_records = set(
-                existing_records_query.values_list('batchnbr', 'entrynbr')
+        for name, stats in service.round_trip_stats.items():
+            self.stdout.write(
+                f"{name}: {stats['round_trips']} round-trips for {stats['glpost_rows']} new GL posts "
+                f"({stats['round_trips_saved']} saved vs row-by-row)"
             )
 
-            self.stdout.write(f'Found {len(existing_records)} existing records for project: {project.project_name}')
-
-            # Build the glpost query
-            glpost_query = Glpost.objects.using(sql_server_db.sql_server_db).filter(
-                transamt__gt=0,
-                srceledger='EN',
-                srcetype='EV'
+        for name, stats in service.load_stats.items():
+            self.stdout.write(
+                f"{name}: loaded {stats['documents']} documents and {stats['files']} files "
+                f"in {stats['elapsed']:.2f}s ({stats['rows_per_second']:.0f} rows/sec)"
             )
 
-            if fiscal_year:
-                glpost_query = glpost_query.filter(fiscalyr=fiscal_year)
-            if fiscal_period:
-                glpost_query = glpost_query.filter(fiscalperd=fiscal_period.zfill(2))
-
-            # Get all glpost records first, then filter in Python
-            # This avoids complex SQL generation issues with ODBC driver
-            project_glposts = glpost_query.all()
-
-            # Filter out existing records in Python
-            if existing_records:
-                filtered_glposts = []
-                for glpost in project_glposts:
-                    if (glpost.batchnbr, glpost.entrynbr) not in existing_records:
-                        filtered_glposts.append(glpost)
-                project_glposts = filtered_glposts
-
-            # Get GL posts for this project and filter out existing records
-            project_glposts = glpost_query.all()
-
-            # Filter out existing records in Python
-            if existing_records:
-                filtered_glposts = []
-                for glpost in project_glposts:
-                    if (glpost.batchnbr, glpost.entrynbr) not in existing_records:
-                        filtered_glposts.append(glpost)
-                project_glposts = filtered_glposts
-
-            self.stdout.write(f'Processing {len(project_glposts)} new records (after filtering existing)')
-
-            for glpost in project_glposts:
-                try:
-                    enpjd_records = Enpjd.objects.using(sql_server_db.sql_server_db).filter(iddoc=glpost.jnldtlref)
-                    if not enpjd_records.exists():
-                        continue
-
-                    # Deduplicate eneba records
-                    eneba_records_set = set()
-                    eneba_records_list = []
-
-                    for enpjd in enpjd_records:
-                        enebas = Eneba.objects.using(sql_server_db.sql_server_db).filter(
-                            cntbtch=enpjd.cntbtch,
-                            cntitem=enpjd.cntitem
-                        )
-                        for eneba in enebas:
-                            if eneba.id not in eneba_records_set:
-                                eneba_records_set.add(eneba.id)
-                                eneba_records_list.append(eneba)
-
-                    supporting_doc_data = {
-                        'project': project,
-                        'batchnbr': glpost.batchnbr,
-                        'entrynbr': glpost.entrynbr,
-                        'iddoc': glpost.jnldtlref,
-                        'fiscal_year': glpost.fiscalyr,
-                        'fiscal_period': glpost.fiscalperd,
-                        'transaction_value': abs(glpost.transamt),
-                        'support_count': 0,  # Initialize to 0, update later
-                        'supported': False,
-                    }
-
-                    if not dry_run:
-                        supporting_doc = SupportingDocument.objects.create(**supporting_doc_data)
-
-                        # Sync attachments
-                        self.sync_eneba_attachments(supporting_doc, eneba_records_list)
-
-                        # Update support_count after syncing attachments
-                        actual_support_count = supporting_doc.documents.count()  # adjust related_name if needed
-                        supporting_doc.support_count = actual_support_count
-                        supporting_doc.supported = actual_support_count > 0
-                        supporting_doc.save()
-
-                        synced_count += 1
-                    else:
-                        self.stdout.write(f'Would sync: {supporting_doc_data}')
-                        synced_count += 1
-
-                except Exception as e:
-                    self.stdout.write(
-                        self.style.ERROR(f'Error syncing transaction {glpost.batchnbr}-{glpost.entrynbr}: {str(e)}')
-                    )
-                    continue
-
         return synced_count
-
-    def sync_eneba_attachments(self, supporting_doc, eneba_records):
-        """
-        Sync attachment information from ENEBA records
-        """
-        for eneba in eneba_records:
-            if eneba.docname and eneba.docpath:
-                # Check if this document reference already exists
-                existing_doc = SupportingDocumentFile.objects.filter(
-                    batch_support=supporting_doc,
-                    document_name=eneba.docname,
-                    document=eneba.docpath
-                ).first()
-
-                if not existing_doc:
-                    # Create a placeholder document record
-                    # Note: The actual file won't be available, but we track the reference
-                    SupportingDocumentFile.objects.create(
-                        document=eneba.docpath,
-                        batch_support=supporting_doc,
-                        document_name=eneba.docname,
-                        source='SQL Server Reference',
-                        # document field will be empty since we don't have the actual file
-                    )
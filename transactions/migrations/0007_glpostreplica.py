@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0006_comments_project'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GlpostReplica',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source_db', models.CharField(max_length=100)),
+                ('acctid', models.CharField(max_length=45)),
+                ('fiscalyr', models.CharField(max_length=4)),
+                ('fiscalperd', models.CharField(max_length=2)),
+                ('srcecurn', models.CharField(max_length=3)),
+                ('srceledger', models.CharField(max_length=2)),
+                ('srcetype', models.CharField(max_length=2)),
+                ('postingseq', models.DecimalField(decimal_places=0, max_digits=7)),
+                ('cntdetail', models.DecimalField(decimal_places=0, max_digits=7)),
+                ('audtdate', models.DecimalField(decimal_places=0, max_digits=9)),
+                ('audttime', models.DecimalField(decimal_places=0, max_digits=9)),
+                ('jrnldate', models.DecimalField(decimal_places=0, max_digits=9)),
+                ('batchnbr', models.CharField(max_length=6)),
+                ('entrynbr', models.CharField(max_length=5)),
+                ('companyid', models.CharField(max_length=8)),
+                ('jnldtldesc', models.CharField(max_length=60)),
+                ('jnldtlref', models.CharField(max_length=60)),
+                ('transamt', models.DecimalField(decimal_places=3, max_digits=19)),
+                ('drilapp', models.CharField(max_length=2)),
+            ],
+            options={
+                'db_table': 'glpost_replica',
+                'indexes': [models.Index(fields=['source_db', 'fiscalyr', 'fiscalperd'], name='glpost_repl_source__bf8215_idx'), models.Index(fields=['source_db', 'batchnbr', 'entrynbr'], name='glpost_repl_source__6d8a49_idx')],
+                'unique_together': {('source_db', 'acctid', 'fiscalyr', 'fiscalperd', 'srcecurn', 'srceledger', 'srcetype', 'postingseq', 'cntdetail')},
+            },
+        ),
+    ]
@@ -199,6 +199,47 @@ class Enpjd(models.Model):
 """ transactions/models.py"""
 
 
+class GlpostReplica(models.Model):
+    """
+    Local copy of the EN-ledger glpost columns the app reads, one slice per Sage database.
+    Kept fresh from Sage AUDTDATE/AUDTTIME by GlpostReplicaService.
+    """
+    source_db = models.CharField(max_length=100)  # DatabaseMapping.sql_server_db the row came from
+    acctid = models.CharField(max_length=45)
+    fiscalyr = models.CharField(max_length=4)
+    fiscalperd = models.CharField(max_length=2)
+    srcecurn = models.CharField(max_length=3)
+    srceledger = models.CharField(max_length=2)
+    srcetype = models.CharField(max_length=2)
+    postingseq = models.DecimalField(max_digits=7, decimal_places=0)
+    cntdetail = models.DecimalField(max_digits=7, decimal_places=0)
+    audtdate = models.DecimalField(max_digits=9, decimal_places=0)
+    audttime = models.DecimalField(max_digits=9, decimal_places=0)
+    jrnldate = models.DecimalField(max_digits=9, decimal_places=0)
+    batchnbr = models.CharField(max_length=6)
+    entrynbr = models.CharField(max_length=5)
+    companyid = models.CharField(max_length=8)
+    jnldtldesc = models.CharField(max_length=60)
+    jnldtlref = models.CharField(max_length=60)
+    transamt = models.DecimalField(max_digits=19, decimal_places=3)
+    drilapp = models.CharField(max_length=2)
+
+    class Meta:
+        db_table = 'glpost_replica'
+        # Sage's composite glpost key, scoped to the source database
+        unique_together = [
+            ['source_db', 'acctid', 'fiscalyr', 'fiscalperd', 'srcecurn', 'srceledger', 'srcetype',
+             'postingseq', 'cntdetail']
+        ]
+        indexes = [
+            models.Index(fields=['source_db', 'fiscalyr', 'fiscalperd']),
+            models.Index(fields=['source_db', 'batchnbr', 'entrynbr']),
+        ]
+
+    def __str__(self):
+        return f"{self.source_db} - Batch {self.batchnbr}-{self.entrynbr} - FY{self.fiscalyr}P{self.fiscalperd}"
+
+
 class SupportingDocument(models.Model):
     supporting_docs_id = models.AutoField(primary_key=True)
     project = models.ForeignKey(Project, on_delete=models.CASCADE)
@@ -0,0 +1,360 @@
+import logging
+import time
+from collections import namedtuple
+
+from main_app.models import CustomUser, DatabaseMapping, Project
+from transactions.models import Comments, Eneba, Enpjd, Glpost, SupportingDocument
+from transactions.projections import columns, project
+from transactions.services import CommentSyncService, SupportingDocumentLoader, _item_key, _join_key
+
+logger = logging.getLogger(__name__)
+
+# A GL post with the ENEBA rows behind it, deduplicated on (CNTBTCH, CNTITEM, DOCLINE)
+EnebaTransaction = namedtuple('EnebaTransaction', ('glpost', 'enebas'))
+
+
+class PipelineContext:
+    """State shared by the stages of one project run"""
+
+    def __init__(self, project, db_alias, fiscal_year=None, fiscal_period=None, dry_run=False):
+        self.project = project
+        self.db_alias = db_alias
+        self.fiscal_year = fiscal_year
+        self.fiscal_period = fiscal_period.zfill(2) if fiscal_period else None
+        self.dry_run = dry_run
+        self.counters = {}
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+
+class PipelineStage:
+    """
+    One step of an EnebaPipeline.
+
+    start() runs once before the first chunk, process() once per chunk of
+    records and returns the chunk for the next stage, finish() once at the end.
+    Sinks are stages at the end of the pipeline whose output is not used.
+    """
+
+    name = 'stage'
+
+    def start(self, context):
+        pass
+
+    def process(self, chunk, context):
+        return chunk
+
+    def finish(self, context):
+        pass
+
+
+class SageExtractor(PipelineStage):
+    """
+    Reads a project's positive GL posts and the ENPJD and ENEBA rows behind them.
+
+    ENPJD and ENEBA are each read once, in start(); the GL posts are streamed
+    in chunks by chunks(). Every ENEBA row of the period is read a single time
+    whichever sinks use it.
+    """
+
+    name = 'extract'
+
+    def __init__(self, chunk_size=2000):
+        self.chunk_size = chunk_size
+        self.glpost_query = None
+
+    def start(self, context):
+        self.glpost_query = Glpost.objects.using(context.db_alias).filter(transamt__gt=0)
+        if context.fiscal_year:
+            self.glpost_query = self.glpost_query.filter(fiscalyr=context.fiscal_year)
+        if context.fiscal_period:
+            self.glpost_query = self.glpost_query.filter(fiscalperd=context.fiscal_period)
+
+        enpjd_query = Enpjd.objects.using(context.db_alias).filter(iddoc__in=self.glpost_query.values('jnldtlref'))
+        items_by_iddoc = {}
+        for iddoc, cntbtch, cntitem in enpjd_query.values_list(*columns('enpjd', 'sync')):
+            items_by_iddoc.setdefault(_join_key(iddoc), []).append(_item_key(cntbtch, cntitem))
+            context.count('enpjd_rows')
+
+        enebas_by_item = {}
+        for eneba in project(Eneba.objects.using(context.db_alias).filter(
+                cntbtch__in=enpjd_query.values('cntbtch')
+        ), 'sync'):
+            enebas_by_item.setdefault(_item_key(eneba.cntbtch, eneba.cntitem), []).append(eneba)
+            context.count('eneba_rows')
+
+        context.items_by_iddoc = items_by_iddoc
+        context.enebas_by_item = enebas_by_item
+
+    def chunks(self, context):
+        """Yield the GL posts as lists of at most chunk_size rows"""
+        chunk = []
+        for glpost in project(self.glpost_query, 'pipeline', chunk_size=self.chunk_size):
+            chunk.append(glpost)
+            if len(chunk) >= self.chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+class JoinStage(PipelineStage):
+    """Pairs each GL post with its ENEBA rows; GL posts without ENPJD detail are dropped"""
+
+    name = 'join'
+
+    def start(self, context):
+        # The ENEBA rows of one reference are joined once, however many GL lines share it
+        self._enebas_by_iddoc = {}
+
+    def process(self, chunk, context):
+        transactions = []
+        for glpost in chunk:
+            enebas = self._enebas(_join_key(glpost.jnldtlref), context)
+            if enebas is not None:
+                transactions.append(EnebaTransaction(glpost, enebas))
+        return transactions
+
+    def _enebas(self, iddoc, context):
+        if iddoc in self._enebas_by_iddoc:
+            return self._enebas_by_iddoc[iddoc]
+
+        items = context.items_by_iddoc.get(iddoc)
+        enebas = None
+        if items is not None:
+            enebas = []
+            seen = set()
+            for item in items:
+                for eneba in context.enebas_by_item.get(item, ()):
+                    eneba_key = (eneba.cntbtch, eneba.cntitem, eneba.docline)
+                    if eneba_key not in seen:
+                        seen.add(eneba_key)
+                        enebas.append(eneba)
+        self._enebas_by_iddoc[iddoc] = enebas
+        return enebas
+
+
+class AttachmentSink(PipelineStage):
+    """
+    Creates the SupportingDocuments (and attachment files) of new expense transactions.
+
+    Same rules as ProjectSyncService.sync_transactions: only EN/EV GL posts,
+    and only keys without a SupportingDocument in the synced scope.
+    """
+
+    name = 'attachments'
+
+    def __init__(self, batch_size=500):
+        self.batch_size = batch_size
+
+    def start(self, context):
+        existing = SupportingDocument.objects.filter(project=context.project)
+        if context.fiscal_year:
+            existing = existing.filter(fiscal_year=context.fiscal_year)
+        if context.fiscal_period:
+            existing = existing.filter(fiscal_period=context.fiscal_period)
+        self._existing = set(existing.values_list('batchnbr', 'entrynbr'))
+        self._loader = SupportingDocumentLoader(context.project, batch_size=self.batch_size, dry_run=context.dry_run)
+
+    def process(self, chunk, context):
+        for transaction in chunk:
+            glpost = transaction.glpost
+            if glpost.srceledger != 'EN' or glpost.srcetype != 'EV':
+                continue
+            if (glpost.batchnbr, glpost.entrynbr) in self._existing:
+                continue
+            self._loader.add(glpost, transaction.enebas)
+            if len(self._loader) >= self.batch_size:
+                self._loader.flush()
+        return chunk
+
+    def finish(self, context):
+        stats = self._loader.flush()
+        context.count('documents', stats['documents'])
+        context.count('files', stats['files'])
+
+
+class CommentSink(PipelineStage):
+    """Posts each non-blank ENEBA note as a Comment from the system user, once per transaction"""
+
+    name = 'comments'
+
+    def __init__(self, batch_size=1000):
+        self.batch_size = batch_size
+
+    def start(self, context):
+        self._user = CustomUser.objects.filter(username=CommentSyncService.SYSTEM_USERNAME).first()
+        if self._user is None and not context.dry_run:
+            raise CustomUser.DoesNotExist(f"System user '{CommentSyncService.SYSTEM_USERNAME}' not found")
+
+        existing = Comments.objects.filter(project=context.project)
+        if self._user is not None:
+            existing = existing.filter(user=self._user)
+        self._posted = set(existing.values_list('batchnbr', 'entrynbr', 'text'))
+        self._pending = []
+
+    def process(self, chunk, context):
+        for transaction in chunk:
+            glpost = transaction.glpost
+            for eneba in transaction.enebas:
+                if not eneba.notes or not eneba.notes.strip():
+                    continue
+                key = (glpost.batchnbr, glpost.entrynbr, eneba.notes)
+                if key in self._posted:
+                    continue
+                self._posted.add(key)
+                context.count('comments')
+                if context.dry_run:
+                    continue
+
+                self._pending.append(Comments(
+                    project=context.project,
+                    batchnbr=glpost.batchnbr,
+                    entrynbr=glpost.entrynbr,
+                    text=eneba.notes,
+                    user=self._user,
+                    source=CommentSyncService.SOURCE,
+                ))
+                if len(self._pending) >= self.batch_size:
+                    self._flush()
+        return chunk
+
+    def finish(self, context):
+        self._flush()
+
+    def _flush(self):
+        if self._pending:
+            Comments.objects.bulk_create(self._pending, batch_size=self.batch_size)
+            self._pending = []
+
+
+class EnebaPipeline:
+    """
+    Single-pass extract -> transform -> load of the Sage Glpost -> ENPJD -> ENEBA graph.
+
+    The extractor reads a project's Sage rows once and streams the GL posts in
+    chunks through the transform stages and into every sink, so attachments
+    and comments come out of the same scan instead of one scan each. Stages
+    are pluggable (see PipelineStage) and the wall time, calls and rows of each
+    are reported in the run stats.
+    """
+
+    def __init__(self, extractor=None, transforms=None, sinks=None, chunk_size=2000, batch_size=500):
+        self.extractor = extractor or SageExtractor(chunk_size=chunk_size)
+        self.transforms = transforms if transforms is not None else [JoinStage()]
+        self.sinks = sinks if sinks is not None else [AttachmentSink(batch_size=batch_size), CommentSink()]
+
+    def run(self, project, db_alias, fiscal_year=None, fiscal_period=None, dry_run=False):
+        """
+        Run every stage over one project.
+
+        Returns:
+            Dict of the counters the stages recorded (glposts, eneba_rows,
+            documents, files, comments, ...), per-stage timings and the elapsed time
+        """
+        started = time.perf_counter()
+        context = PipelineContext(project, db_alias, fiscal_year, fiscal_period, dry_run)
+        stages = [self.extractor] + list(self.transforms) + list(self.sinks)
+        timings = {stage.name: {'seconds': 0.0, 'calls': 0, 'rows': 0} for stage in stages}
+
+        def timed(stage, method, *args):
+            stage_started = time.perf_counter()
+            result = method(*args)
+            timing = timings[stage.name]
+            timing['seconds'] += time.perf_counter() - stage_started
+            timing['calls'] += 1
+            return result
+
+        for stage in stages:
+            timed(stage, stage.start, context)
+
+        chunks = self.extractor.chunks(context)
+        while True:
+            chunk = timed(self.extractor, next, chunks, None)
+            if chunk is None:
+                break
+            timings[self.extractor.name]['rows'] += len(chunk)
+            context.count('glposts', len(chunk))
+
+            for stage in self.transforms:
+                chunk = timed(stage, stage.process, chunk, context)
+                timings[stage.name]['rows'] += len(chunk)
+            for sink in self.sinks:
+                timed(sink, sink.process, chunk, context)
+                timings[sink.name]['rows'] += len(chunk)
+
+        for stage in stages:
+            timed(stage, stage.finish, context)
+
+        for timing in timings.values():
+            timing['seconds'] = round(timing['seconds'], 3)
+        elapsed = time.perf_counter() - started
+
+        stats = dict(context.counters)
+        stats['stages'] = timings
+        stats['elapsed'] = round(elapsed, 3)
+        stats['rows_per_second'] = round(stats.get('glposts', 0) / elapsed, 1) if elapsed else 0.0
+        return stats
+
+
+def eneba_lease_key(project_name):
+    return f"eneba:{project_name}"
+
+
+def run_eneba_pipeline(project_names=None, fiscal_year=None, fiscal_period=None, dry_run=False,
+                       pipeline_factory=EnebaPipeline, leases=None):
+    """
+    Scheduler entry point: run the ENEBA pipeline over every active project.
+
+    Each project gets a fresh pipeline from pipeline_factory (stages keep
+    per-project state), and a failing project does not stop the others. With
+    a SyncLeaseManager, projects another run is processing are skipped.
+
+    Returns:
+        List of result dicts ({'project', 'database', 'success', 'stats' or 'error'[, 'skipped']})
+    """
+    mappings = DatabaseMapping.objects.filter(is_active=True)
+    if project_names:
+        mappings = mappings.filter(project_name__in=project_names)
+    projects = {
+        project.project_name: project
+        for project in Project.objects.filter(project_name__in=[mapping.project_name for mapping in mappings])
+    }
+
+    results = []
+    for mapping in mappings:
+        project = projects.get(mapping.project_name)
+        if project is None:
+            continue
+
+        if leases is not None and not leases.acquire(eneba_lease_key(mapping.project_name)):
+            logger.info(f"ENEBA pipeline for {mapping.project_name} is already running elsewhere; skipped")
+            results.append({
+                'project': mapping.project_name, 'database': mapping.sql_server_db, 'success': False, 'skipped': True
+            })
+            continue
+
+        try:
+            stats = pipeline_factory().run(project, mapping.sql_server_db, fiscal_year, fiscal_period, dry_run)
+        except Exception as e:
+            logger.error(f"ENEBA pipeline failed for {mapping.project_name}: {str(e)}")
+            results.append({
+                'project': mapping.project_name, 'database': mapping.sql_server_db, 'success': False, 'error': str(e)
+            })
+            continue
+        finally:
+            if leases is not None:
+                leases.release(eneba_lease_key(mapping.project_name))
+
+        stage_times = ', '.join(f"{name} {timing['seconds']:.2f}s" for name, timing in stats['stages'].items())
+        logger.info(
+            f"ENEBA pipeline for {mapping.project_name}: {stats.get('glposts', 0)} GL posts, "
+            f"{stats.get('eneba_rows', 0)} ENEBA rows, {stats.get('documents', 0)} documents, "
+            f"{stats.get('files', 0)} files, {stats.get('comments', 0)} comments in {stats['elapsed']:.2f}s "
+            f"({stage_times})"
+        )
+        results.append({
+            'project': mapping.project_name, 'database': mapping.sql_server_db, 'success': True, 'stats': stats
+        })
+    return results
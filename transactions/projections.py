@@ -0,0 +1,100 @@
+"""
+Slim, tuple-backed records for reading the Sage tables.
+
+Glpost has 45 columns and Enpjd and Eneba about 30 each, while the sync,
+listing and stats code reads fewer than ten of them. Querying through a
+profile selects only that profile's columns from SQL Server, and each row
+comes back as a namedtuple: no per-instance __dict__, no model state, and
+attribute access like a model instance for templates and sync code.
+"""
+from collections import namedtuple
+
+from transactions.models import Eneba, Enpjd, Glpost, GlpostReplica
+
+# Named column profiles per Sage table
+PROFILES = {
+    'glpost': {
+        # What a SupportingDocument sync reads
+        'sync': ('batchnbr', 'entrynbr', 'jnldtlref', 'fiscalyr', 'fiscalperd', 'transamt'),
+        # Sync plus the ledger, to tell expense posts apart in the ENEBA pipeline
+        'pipeline': ('batchnbr', 'entrynbr', 'jnldtlref', 'fiscalyr', 'fiscalperd', 'transamt',
+                     'srceledger', 'srcetype'),
+        # Columns of the GL transactions table
+        'listing': ('batchnbr', 'entrynbr', 'jnldtlref', 'fiscalyr', 'fiscalperd', 'drilapp', 'jrnldate',
+                    'acctid', 'jnldtldesc', 'postingseq', 'transamt'),
+        # Unsupported-transaction totals
+        'stats': ('batchnbr', 'entrynbr', 'transamt'),
+    },
+    'enpjd': {
+        'sync': ('iddoc', 'cntbtch', 'cntitem'),
+    },
+    'eneba': {
+        'sync': ('cntbtch', 'cntitem', 'docline', 'docname', 'docpath', 'notes'),
+    },
+}
+
+_TABLES = {
+    Glpost: 'glpost',
+    GlpostReplica: 'glpost',
+    Enpjd: 'enpjd',
+    Eneba: 'eneba',
+}
+
+_record_types = {}
+
+
+def columns(table, profile):
+    """Columns of a named profile, e.g. columns('glpost', 'listing')"""
+    try:
+        return PROFILES[table][profile]
+    except KeyError:
+        raise ValueError(f"Unknown projection profile {table}/{profile}") from None
+
+
+def record_type(table, fields):
+    """
+    The namedtuple class for a table and a column tuple, created once and reused.
+
+    Record types are named after the table (GlpostRecord, EnebaRecord...), and
+    one column set always maps to the same class.
+    """
+    fields = tuple(fields)
+    key = (table, fields)
+    row_type = _record_types.get(key)
+    if row_type is None:
+        row_type = namedtuple(f"{table.capitalize()}Record", fields)
+        _record_types[key] = row_type
+    return row_type
+
+
+def _resolve(queryset, profile):
+    table = _TABLES[queryset.model]
+    fields = columns(table, profile) if isinstance(profile, str) else tuple(profile)
+    return record_type(table, fields), fields
+
+
+def project(queryset, profile, chunk_size=2000):
+    """
+    Iterate queryset as slim records of a profile (or an explicit column tuple).
+
+    Rows are fetched chunk_size at a time from an open cursor and never cached
+    on the queryset, so memory stays flat whatever the scan size. The cursor
+    stays busy until the iteration is exhausted, so do not query the same Sage
+    alias while consuming it.
+    """
+    row_type, fields = _resolve(queryset, profile)
+    for row in queryset.values_list(*fields).iterator(chunk_size=chunk_size):
+        yield row_type._make(row)
+
+
+def project_list(queryset, profile):
+    """All rows of queryset (typically a slice or a page) as slim records of a profile"""
+    row_type, fields = _resolve(queryset, profile)
+    return [row_type._make(row) for row in queryset.values_list(*fields)]
+
+
+def first(queryset, profile):
+    """First row of queryset as a slim record of a profile, or None"""
+    row_type, fields = _resolve(queryset, profile)
+    row = queryset.values_list(*fields).first()
+    return row_type._make(row) if row is not None else None
@@ -0,0 +1,261 @@
+import logging
+import time
+
+from django.db import transaction
+from django.db.models import BigIntegerField, Count, Sum
+from django.db.models.functions import Cast
+
+from main_app.models import DatabaseMapping, Project
+from transactions.models import Enpjd, SupportingDocument
+from transactions.services import ProjectSyncService, SupportingDocumentLoader, _join_key, stream_glposts
+
+logger = logging.getLogger(__name__)
+
+# Bucket levels, coarsest first, as (glpost field, SupportingDocument field)
+LEVELS = (
+    ('fiscalyr', 'fiscal_year'),
+    ('fiscalperd', 'fiscal_period'),
+    ('batchnbr', 'batchnbr'),
+)
+
+
+def _key_number(batch_field, entry_field):
+    """(BATCHNBR, ENTRYNBR) as one integer; Sage batch and entry numbers are zero-padded numerals"""
+    return Cast(batch_field, BigIntegerField()) * 100000 + Cast(entry_field, BigIntegerField())
+
+
+def bucket_fingerprints(queryset, group_field, batch_field='batchnbr', entry_field='entrynbr'):
+    """
+    Fingerprint of each group_field bucket of queryset, computed server-side.
+
+    A fingerprint is the number of distinct (batch, entry) keys in the bucket, the
+    sum of their key numbers and the sum of their squares modulo HASH_MODULUS.
+    Only integer arithmetic over DISTINCT keys is used, so SQL Server and MySQL
+    produce the same values for the same key set, and the several glpost lines of
+    one entry count once, as they do in SupportingDocument.
+
+    Returns:
+        Dict of {bucket value: (keys, key_sum, key_square_sum)}
+    """
+    key = _key_number(batch_field, entry_field)
+    key_hash = key % ReconciliationEngine.HASH_MODULUS
+    rows = queryset.values_list(group_field).annotate(
+        keys=Count(key, distinct=True),
+        key_sum=Sum(key, distinct=True),
+        key_square_sum=Sum(key_hash * key_hash, distinct=True),
+    ).order_by()
+    return {bucket: (keys, int(key_sum or 0), int(key_square_sum or 0)) for bucket, keys, key_sum, key_square_sum in rows}
+
+
+class ReconciliationEngine:
+    """
+    Checks that a project's SupportingDocuments match the expense GL posts of its Sage database.
+
+    Both sides are compared bucket by bucket, Merkle style: fiscal years first,
+    then the periods of the years that differ, then the batches of the periods
+    that differ. Only the keys of mismatched batches are read and compared row by
+    row, so a project in step costs one grouped query per side and the work grows
+    with the drift rather than with the ledger.
+
+    The Sage side is every positive EN/EV GL post with ENPJD detail, the rows a
+    sync turns into SupportingDocuments. Keys missing locally are repaired by
+    loading them as a sync would, with their ENEBA attachments. Local documents
+    whose GL post no longer exists are reported, and only deleted with
+    delete_orphans, since they may carry uploaded files and review history.
+    """
+
+    HASH_MODULUS = 1000003  # Keeps the sum of squared key hashes within BIGINT for ~9M keys per bucket
+    MAX_REPORTED_KEYS = 200  # Per project, in each of the missing and orphaned key lists
+
+    def __init__(self, repair=True, delete_orphans=False, batch_size=500, chunk_size=2000):
+        self.repair = repair
+        self.delete_orphans = delete_orphans
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
+
+    def reconcile_all(self, project_names=None):
+        """
+        Reconcile every active project, or only project_names.
+
+        Returns:
+            Dict with a summary per project (see reconcile) and the totals over all of them
+        """
+        mappings = DatabaseMapping.objects.filter(is_active=True)
+        if project_names:
+            mappings = mappings.filter(project_name__in=project_names)
+
+        started = time.perf_counter()
+        projects = []
+        for mapping in mappings:
+            try:
+                projects.append(self.reconcile(mapping.project_name))
+            except Exception as e:
+                logger.error(f"Error reconciling {mapping.project_name}: {str(e)}")
+                projects.append({
+                    'project': mapping.project_name,
+                    'database': mapping.sql_server_db,
+                    'success': False,
+                    'error': str(e),
+                })
+
+        totals = {'projects': len(projects), 'in_sync': 0, 'failed': 0, 'missing': 0, 'orphaned': 0,
+                  'created': 0, 'deleted': 0, 'buckets_compared': 0}
+        for summary in projects:
+            if not summary['success']:
+                totals['failed'] += 1
+                continue
+            totals['in_sync'] += summary['in_sync']
+            totals['buckets_compared'] += sum(summary['buckets_compared'].values())
+            for name in ('missing', 'orphaned', 'created', 'deleted'):
+                totals[name] += summary[name]
+        totals['elapsed_seconds'] = round(time.perf_counter() - started, 3)
+
+        return {'repair': self.repair, 'delete_orphans': self.delete_orphans, 'totals': totals, 'projects': projects}
+
+    def reconcile(self, project_name):
+        """
+        Compare one project with its Sage database and repair the keys that differ.
+
+        Returns:
+            Summary dict: buckets compared per level, the mismatched buckets, the
+            missing and orphaned keys, what was created or deleted and the fiscal
+            periods touched (whose stats need recalculating)
+        """
+        started = time.perf_counter()
+        project = Project.objects.get(project_name=project_name)
+        db_alias = DatabaseMapping.objects.get(project_name=project_name, is_active=True).sql_server_db
+
+        source = self._source_query(db_alias)
+        local = SupportingDocument.objects.filter(project=project)
+
+        summary = {
+            'project': project_name,
+            'database': db_alias,
+            'success': True,
+            'buckets_compared': {sage_field: 0 for sage_field, _ in LEVELS},
+            'mismatched_buckets': [],
+            'missing': 0,
+            'orphaned': 0,
+            'created': 0,
+            'deleted': 0,
+            'missing_keys': [],
+            'orphaned_keys': [],
+            'touched_periods': [],
+        }
+
+        mismatched_batches = self._drill_down(source, local, summary)
+
+        loader = None
+        if self.repair:
+            loader = SupportingDocumentLoader(project, batch_size=self.batch_size)
+
+        touched_periods = set()
+        with transaction.atomic():
+            for fiscal_year, fiscal_period, batchnbr in mismatched_batches:
+                missing, orphaned = self._compare_batch(source, local, fiscal_year, fiscal_period, batchnbr)
+                summary['missing'] += len(missing)
+                summary['orphaned'] += len(orphaned)
+                self._report_keys(summary['missing_keys'], fiscal_year, fiscal_period, batchnbr, missing)
+                self._report_keys(summary['orphaned_keys'], fiscal_year, fiscal_period, batchnbr, orphaned)
+
+                if not self.repair:
+                    continue
+                if missing:
+                    self._queue_missing(db_alias, source, loader, fiscal_year, fiscal_period, batchnbr, missing)
+                    touched_periods.add((fiscal_year, fiscal_period))
+                if orphaned and self.delete_orphans:
+                    summary['deleted'] += local.filter(pk__in=orphaned.values()).delete()[1].get(
+                        SupportingDocument._meta.label, 0
+                    )
+                    touched_periods.add((fiscal_year, fiscal_period))
+
+            if loader is not None:
+                summary['created'] = loader.flush()['documents']
+
+        summary['touched_periods'] = sorted(touched_periods)
+        summary['in_sync'] = not mismatched_batches
+        summary['elapsed_seconds'] = round(time.perf_counter() - started, 3)
+
+        logger.info(
+            f"Reconciled {project_name} ({db_alias}): {sum(summary['buckets_compared'].values())} buckets compared, "
+            f"{len(mismatched_batches)} batches differ, {summary['missing']} missing, {summary['orphaned']} orphaned, "
+            f"{summary['created']} created, {summary['deleted']} deleted in {summary['elapsed_seconds']:.2f}s"
+        )
+        return summary
+
+    def _drill_down(self, source, local, summary):
+        """
+        Walk the bucket levels, descending only into buckets whose fingerprints differ.
+
+        Returns:
+            List of (fiscal_year, fiscal_period, batchnbr) batches that differ
+        """
+        scopes = [()]
+        for sage_field, local_field in LEVELS:
+            next_scopes = []
+            for scope in scopes:
+                sage_filter = {field: value for (field, _), value in zip(LEVELS, scope)}
+                local_filter = {field: value for (_, field), value in zip(LEVELS, scope)}
+
+                sage_buckets = bucket_fingerprints(source.filter(**sage_filter), sage_field)
+                local_buckets = bucket_fingerprints(local.filter(**local_filter), local_field)
+
+                buckets = set(sage_buckets) | set(local_buckets)
+                summary['buckets_compared'][sage_field] += len(buckets)
+                for bucket in sorted(buckets):
+                    if sage_buckets.get(bucket) != local_buckets.get(bucket):
+                        next_scopes.append(scope + (bucket,))
+                        summary['mismatched_buckets'].append({
+                            'level': sage_field,
+                            'bucket': '/'.join(scope + (bucket,)),
+                            'sage': sage_buckets.get(bucket),
+                            'local': local_buckets.get(bucket),
+                        })
+            scopes = next_scopes
+        return scopes
+
+    def _compare_batch(self, source, local, fiscal_year, fiscal_period, batchnbr):
+        """
+        Keys of one batch present on only one side.
+
+        Returns:
+            Tuple of (set of entrynbr missing locally, {entrynbr: SupportingDocument pk} orphaned locally)
+        """
+        sage_entries = set(source.filter(
+            fiscalyr=fiscal_year, fiscalperd=fiscal_period, batchnbr=batchnbr
+        ).values_list('entrynbr', flat=True).distinct())
+        local_entries = dict(local.filter(
+            fiscal_year=fiscal_year, fiscal_period=fiscal_period, batchnbr=batchnbr
+        ).values_list('entrynbr', 'pk'))
+
+        missing = sage_entries - set(local_entries)
+        orphaned = {entrynbr: pk for entrynbr, pk in local_entries.items() if entrynbr not in sage_entries}
+        return missing, orphaned
+
+    def _queue_missing(self, db_alias, source, loader, fiscal_year, fiscal_period, batchnbr, entries):
+        """Queue the missing entries of a batch, with their ENEBA attachments, for loading"""
+        glpost_query = source.filter(
+            fiscalyr=fiscal_year, fiscalperd=fiscal_period, batchnbr=batchnbr, entrynbr__in=entries
+        )
+        enebas_by_iddoc, _ = ProjectSyncService._bulk_extract_enebas(db_alias, glpost_query)
+
+        queued = set()
+        for glpost in stream_glposts(glpost_query, chunk_size=self.chunk_size):
+            # The loader keeps the first GL line of an entry, like a sync does
+            if glpost.entrynbr in queued:
+                continue
+            queued.add(glpost.entrynbr)
+            loader.add(glpost, enebas_by_iddoc.get(_join_key(glpost.jnldtlref), []))
+            if len(loader) >= self.batch_size:
+                loader.flush()
+
+    def _report_keys(self, reported, fiscal_year, fiscal_period, batchnbr, entries):
+        for entrynbr in sorted(entries)[:max(self.MAX_REPORTED_KEYS - len(reported), 0)]:
+            reported.append([fiscal_year, fiscal_period, batchnbr, entrynbr])
+
+    @staticmethod
+    def _source_query(db_alias):
+        """Sage GL posts a sync turns into SupportingDocuments: expense posts with ENPJD detail"""
+        return ProjectSyncService._build_glpost_query(db_alias).filter(
+            jnldtlref__in=Enpjd.objects.using(db_alias).values('iddoc')
+        )
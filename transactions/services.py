@@ -1,250 +1,719 @@
 import logging
+import time
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Dict, List, Optional, Tuple
 
+from django.db import IntegrityError, connections, transaction
+from django.db.models import Count, Q
+from django.db.models.functions import Trim
+from django.utils import timezone
+
+from audit_management_system.settings import SYNC_CONFIG
 from main_app.models import *
 from transactions.models import *
+from main_app.sync_profiler import add_rows, profile_rows, sync_stage
+from transactions.projections import columns, project, project_list, record_type
 
 logger = logging.getLogger(__name__)
 
 
+def _join_key(value):
+    """
+    Normalise a Sage document reference for in-memory joins.
+
+    SQL Server compares CHAR columns ignoring trailing blanks and the Sage
+    tables use a case-insensitive collation, so GLPOST.JNLDTLREF (padded to
+    60 chars) matches ENPJD.IDDOC (22 chars) on the server. Python string
+    equality does not, so both sides are normalised the same way here.
+    """
+    return (value or '').rstrip().upper()
+
+
+def _item_key(cntbtch, cntitem):
+    """(CNTBTCH, CNTITEM) key shared by ENPJD (decimal) and ENEBA (int) rows"""
+    return int(cntbtch), int(cntitem)
+
+
+# The GL post columns a sync reads; the other ~40 glpost columns are never needed
+GLPOST_SYNC_COLUMNS = columns('glpost', 'sync')
+
+GlpostRow = record_type('glpost', GLPOST_SYNC_COLUMNS)
+
+
+def stream_glposts(glpost_query, columns=GLPOST_SYNC_COLUMNS, chunk_size=2000):
+    """
+    Iterate a glpost queryset as slim records of the given columns or projection profile.
+
+    Rows are fetched chunk_size at a time from an open cursor (Django's
+    iterator() fetchmany loop) and never cached on the queryset, so memory stays
+    flat whatever the period size. The cursor stays busy until the stream is
+    exhausted, so do not query the same Sage alias while consuming it.
+    """
+    return project(glpost_query, columns, chunk_size=chunk_size)
+
+
+def _audit_window(lower, upper):
+    """Q for Sage rows whose (AUDTDATE, AUDTTIME) stamp falls in (lower, upper]"""
+    low_date, low_time = lower
+    high_date, high_time = upper
+    return (
+        (Q(audtdate__gt=low_date) | Q(audtdate=low_date, audttime__gt=low_time)) &
+        (Q(audtdate__lt=high_date) | Q(audtdate=high_date, audttime__lte=high_time))
+    )
+
+
+class SupportingDocumentLoader:
+    """
+    Batched load stage for SupportingDocument and SupportingDocumentFile rows.
+
+    Transactions are queued with add() and written by flush(): support_count
+    and supported are computed from the ENEBA attachments before insert, the
+    documents go in with bulk_create, and their files follow in a second bulk
+    pass. Transactions that already have a SupportingDocument only receive the
+    attachment references they are missing.
+    """
+
+    def __init__(self, project, batch_size=500, dry_run=False):
+        self.project = project
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self._pending = []
+        self.stats = {'documents': 0, 'files': 0, 'updated': 0, 'elapsed': 0.0, 'rows_per_second': 0.0}
+
+    def __len__(self):
+        return len(self._pending)
+
+    @staticmethod
+    def _key(document):
+        """A document's unique key within its project"""
+        return document.batchnbr, document.entrynbr, document.fiscal_year, document.fiscal_period
+
+    def add(self, glpost, eneba_records_list, existing_doc=None):
+        """Queue a GL post (and its ENEBA rows) for the next flush"""
+        # Same de-duplication sync_eneba_attachments applies: one file per (DOCNAME, DOCPATH)
+        attachments = []
+        seen = set()
+        for eneba in eneba_records_list:
+            if eneba.docname and eneba.docpath and (eneba.docname, eneba.docpath) not in seen:
+                seen.add((eneba.docname, eneba.docpath))
+                attachments.append((eneba.docname, eneba.docpath))
+
+        if existing_doc is None:
+            document = SupportingDocument(
+                project=self.project,
+                batchnbr=glpost.batchnbr,
+                entrynbr=glpost.entrynbr,
+                iddoc=glpost.jnldtlref,
+                fiscal_year=glpost.fiscalyr,
+                fiscal_period=glpost.fiscalperd,
+                transaction_value=abs(glpost.transamt),
+                support_count=len(attachments),
+                supported=len(attachments) > 0,
+            )
+            if self.dry_run:
+                logger.info(f'Would sync: {document}')
+        else:
+            document = existing_doc
+
+        self._pending.append((document, attachments))
+
+    def flush(self):
+        """Write every queued transaction and return the cumulative load stats"""
+        pending, self._pending = self._pending, []
+        if not pending or self.dry_run:
+            self.stats['documents'] += len({self._key(document) for document, _ in pending if document.pk is None})
+            return self.stats
+
+        started = time.perf_counter()
+
+        new_documents = [document for document, _ in pending if document.pk is None]
+        batchnbrs = {document.batchnbr for document in new_documents}
+        stored_keys = set(SupportingDocument.objects.filter(
+            project=self.project, batchnbr__in=batchnbrs
+        ).values_list('batchnbr', 'entrynbr', 'fiscal_year', 'fiscal_period'))
+
+        # The lines of a multi-line entry queue the same document; insert each missing key once
+        to_insert = {}
+        for document in new_documents:
+            key = self._key(document)
+            if key not in stored_keys:
+                to_insert.setdefault(key, document)
+        SupportingDocument.objects.bulk_create(
+            list(to_insert.values()), batch_size=self.batch_size, ignore_conflicts=True
+        )
+
+        # MySQL does not return primary keys from bulk inserts, so read them back by the unique key
+        doc_ids = {
+            (batchnbr, entrynbr, fiscal_year, fiscal_period): pk
+            for pk, batchnbr, entrynbr, fiscal_year, fiscal_period in SupportingDocument.objects.filter(
+                project=self.project, batchnbr__in=batchnbrs
+            ).values_list('pk', 'batchnbr', 'entrynbr', 'fiscal_year', 'fiscal_period')
+        }
+        for document in new_documents:
+            document.pk = doc_ids.get(self._key(document))
+        # Count the keys the insert added, not the documents queued
+        inserted = len(doc_ids) - len(stored_keys)
+
+        # Second pass: attachment references, skipping those already stored
+        documents = [document for document, _ in pending if document.pk is not None]
+        existing_files = {}
+        for batch_support_id, document_name, document_path in SupportingDocumentFile.objects.filter(
+                batch_support_id__in=[document.pk for document in documents]
+        ).values_list('batch_support_id', 'document_name', 'document'):
+            existing_files.setdefault(batch_support_id, set()).add((document_name, document_path))
+
+        new_files = []
+        for document, attachments in pending:
+            if document.pk is None:
+                continue
+            stored = existing_files.setdefault(document.pk, set())
+            for document_name, document_path in attachments:
+                if (document_name, document_path) not in stored:
+                    stored.add((document_name, document_path))
+                    new_files.append(SupportingDocumentFile(
+                        document=document_path,
+                        batch_support_id=document.pk,
+                        document_name=document_name,
+                        source='SQL Server Reference',
+                    ))
+        SupportingDocumentFile.objects.bulk_create(new_files, batch_size=self.batch_size)
+
+        # Only documents that already had files (conflicts, refreshes) can end up with a stale count
+        stale_documents = []
+        seen_ids = set()
+        for document in documents:
+            if document.pk in seen_ids:
+                continue
+            seen_ids.add(document.pk)
+            support_count = len(existing_files[document.pk])
+            if document.support_count != support_count:
+                document.support_count = support_count
+                document.supported = support_count > 0
+                # bulk_update() skips auto_now, and incremental stats key off updated_at
+                document.updated_at = timezone.now()
+                stale_documents.append(document)
+        SupportingDocument.objects.bulk_update(
+            stale_documents, ['support_count', 'supported', 'updated_at'], batch_size=self.batch_size
+        )
+
+        elapsed = time.perf_counter() - started
+        self.stats['documents'] += inserted
+        self.stats['files'] += len(new_files)
+        self.stats['updated'] += len(stale_documents)
+        self.stats['elapsed'] += elapsed
+        rows = self.stats['documents'] + self.stats['files'] + self.stats['updated']
+        self.stats['rows_per_second'] = rows / self.stats['elapsed'] if self.stats['elapsed'] else 0.0
+
+        return self.stats
+
+
 class ProjectSyncService:
-    def __init__(self):
+    # 'row' issues one ENPJD query per GL post and one ENEBA query per ENPJD row.
+    # 'bulk' loads the period's GLPOST, ENPJD and ENEBA rows in three queries
+    # and joins them in memory.
+    EXTRACTION_MODES = ('row', 'bulk')
+
+    # Sage tables tracked by SyncWatermark for incremental syncs
+    WATERMARK_TABLES = {
+        'glpost': Glpost,
+        'ENPJD': Enpjd,
+        'ENEBA': Eneba,
+    }
+
+    # 'row' creates and re-saves each SupportingDocument individually.
+    # 'bulk' queues them in a SupportingDocumentLoader and writes in batches.
+    LOAD_MODES = ('row', 'bulk')
+
+    def __init__(self, extraction_mode='row', load_mode='row', batch_size=500, chunk_size=2000):
+        if extraction_mode not in self.EXTRACTION_MODES:
+            raise ValueError(f"Unknown extraction mode: {extraction_mode}")
+        if load_mode not in self.LOAD_MODES:
+            raise ValueError(f"Unknown load mode: {load_mode}")
         self.executor = ThreadPoolExecutor(max_workers=5)
+        self.extraction_mode = extraction_mode
+        self.load_mode = load_mode
+        self.batch_size = batch_size
+        # Rows fetched per round-trip when streaming glpost scans
+        self.chunk_size = chunk_size
+        # Per-project SupportingDocumentLoader stats from the last bulk load
+        self.load_stats = {}
+        # Per-project round-trip accounting from the last sync_transactions call
+        self.round_trip_stats = {}
+        # Per-project (fiscal_year, fiscal_period) pairs changed by the last sync_incremental call
+        self.touched_periods = {}
+        # Per-project number of GL posts in the change window of the last sync_incremental call
+        self.changed_rows = {}
 
-    def sync_transactions(self, project_name: None, fiscal_year=None, fiscal_period=None, dry_run=False):
+    def sync_transactions(self, project_name: None, fiscal_year=None, fiscal_period=None, dry_run=False,
+                          extraction_mode=None):
         """
         Sync expense transactions from SQL Server tables to Django models
         """
+        extraction_mode = extraction_mode or self.extraction_mode
+        if extraction_mode not in self.EXTRACTION_MODES:
+            raise ValueError(f"Unknown extraction mode: {extraction_mode}")
+
         db = [project_name.project_name for project_name in DatabaseMapping.objects.filter(is_active=True)]
         projects = Project.objects.filter(project_name__in=db)
         logger.info(f'Found {projects.count()} active projects for syncing')
-        synced_count = 0
+
         if project_name:
-            project = projects.get(project_name=project_name)
-            sql_server_db = DatabaseMapping.objects.get(project_name=project_name)
+            projects = [projects.get(project_name=project_name)]
 
-            # First, get existing records from supportingdocuments table for this project
-            existing_records_query = SupportingDocument.objects.filter(project=project)
+        synced_count = 0
+        for project in projects:
+            synced_count += self._sync_project(project, fiscal_year, fiscal_period, dry_run, extraction_mode)
 
-            if fiscal_year:
-                existing_records_query = existing_records_query.filter(fiscal_year=fiscal_year)
-            if fiscal_period:
-                existing_records_query = existing_records_query.filter(fiscal_period=fiscal_period.zfill(2))
+        return synced_count
 
-            # Create a set of (batchnbr, entrynbr) tuples for quick lookup
-            existing_records = set(
-                existing_records_query.values_list('batchnbr', 'entrynbr')
-            )
+    def _sync_project(self, project, fiscal_year, fiscal_period, dry_run, extraction_mode):
+        """Sync the new GL posts of a single project"""
+        sql_server_db = DatabaseMapping.objects.get(project_name=project.project_name)
+        db_alias = sql_server_db.sql_server_db
 
-            logger.info(f'Found {len(existing_records)} existing records for project: {project.project_name}')
+        # First, get existing records from supportingdocuments table for this project
+        existing_records_query = SupportingDocument.objects.filter(project=project)
 
-            # Build the glpost query
-            glpost_query = Glpost.objects.using(sql_server_db.sql_server_db).filter(
-                transamt__gt=0,
-                srceledger='EN',
-                srcetype='EV'
-            )
+        if fiscal_year:
+            existing_records_query = existing_records_query.filter(fiscal_year=fiscal_year)
+        if fiscal_period:
+            existing_records_query = existing_records_query.filter(fiscal_period=fiscal_period.zfill(2))
 
-            if fiscal_year:
-                glpost_query = glpost_query.filter(fiscalyr=fiscal_year)
-            if fiscal_period:
-                glpost_query = glpost_query.filter(fiscalperd=fiscal_period.zfill(2))
-
-            # Get all glpost records first, then filter in Python
-            # This avoids complex SQL generation issues with ODBC driver
-            project_glposts = glpost_query.all()
-
-            # Filter out existing records in Python
-            if existing_records:
-                filtered_glposts = []
-                for glpost in project_glposts:
-                    if (glpost.batchnbr, glpost.entrynbr) not in existing_records:
-                        filtered_glposts.append(glpost)
-                project_glposts = filtered_glposts
-
-            # Get GL posts for this project and filter out existing records
-            project_glposts = glpost_query.all()
-
-            # Filter out existing records in Python
-            if existing_records:
-                filtered_glposts = []
-                for glpost in project_glposts:
-                    if (glpost.batchnbr, glpost.entrynbr) not in existing_records:
-                        filtered_glposts.append(glpost)
-                project_glposts = filtered_glposts
-
-            logger.info(f'Processing {len(project_glposts)} new records (after filtering existing)')
-
-            for glpost in project_glposts:
-                try:
-                    enpjd_records = Enpjd.objects.using(sql_server_db.sql_server_db).filter(iddoc=glpost.jnldtlref)
-                    if not enpjd_records.exists():
-                        continue
+        # Create a set of (batchnbr, entrynbr) tuples for quick lookup
+        existing_records = set(
+            existing_records_query.values_list('batchnbr', 'entrynbr')
+        )
 
-                    # Deduplicate eneba records
-                    eneba_records_set = set()
-                    eneba_records_list = []
-
-                    for enpjd in enpjd_records:
-                        enebas = Eneba.objects.using(sql_server_db.sql_server_db).filter(
-                            cntbtch=enpjd.cntbtch,
-                            cntitem=enpjd.cntitem
-                        )
-                        for eneba in enebas:
-                            if eneba.id not in eneba_records_set:
-                                eneba_records_set.add(eneba.id)
-                                eneba_records_list.append(eneba)
-
-                    supporting_doc_data = {
-                        'project': project,
-                        'batchnbr': glpost.batchnbr,
-                        'entrynbr': glpost.entrynbr,
-                        'iddoc': glpost.jnldtlref,
-                        'fiscal_year': glpost.fiscalyr,
-                        'fiscal_period': glpost.fiscalperd,
-                        'transaction_value': abs(glpost.transamt),
-                        'support_count': 0,  # Initialize to 0, update later
-                        'supported': False,
-                    }
-
-                    if not dry_run:
-                        supporting_doc = SupportingDocument.objects.create(**supporting_doc_data)
-
-                        # Sync attachments
-                        self.sync_eneba_attachments(supporting_doc, eneba_records_list)
-
-                        # Update support_count after syncing attachments
-                        actual_support_count = supporting_doc.documents.count()  # adjust related_name if needed
-                        supporting_doc.support_count = actual_support_count
-                        supporting_doc.supported = actual_support_count > 0
-                        supporting_doc.save()
-
-                        synced_count += 1
-                    else:
-                        logger.info(f'Would sync: {supporting_doc_data}')
-                        synced_count += 1
+        logger.info(f'Found {len(existing_records)} existing records for project: {project.project_name}')
 
-                except Exception as e:
-                    logger.error(
-                       f'Error syncing transaction {glpost.batchnbr}-{glpost.entrynbr}: {str(e)}')
+        glpost_query = self._build_glpost_query(db_alias, fiscal_year, fiscal_period)
+
+        if extraction_mode == 'bulk':
+            enebas_by_iddoc, enpjd_counts = self._bulk_extract_enebas(db_alias, glpost_query)
+            glposts = stream_glposts(glpost_query, chunk_size=self.chunk_size)
+        else:
+            enebas_by_iddoc = enpjd_counts = None
+            # Row mode queries Sage per GL post, which a connection cannot do mid-stream
+            glposts = list(stream_glposts(glpost_query, chunk_size=self.chunk_size))
 
+        loader = None
+        if self.load_mode == 'bulk':
+            loader = SupportingDocumentLoader(project, batch_size=self.batch_size, dry_run=dry_run)
+
+        # Filter existing records out in Python as the rows stream in
+        # This avoids complex SQL generation issues with ODBC driver
+        new_count = 0
+        row_mode_round_trips = 1
+        synced_count = 0
+        for glpost in glposts:
+            if (glpost.batchnbr, glpost.entrynbr) in existing_records:
+                continue
+            new_count += 1
+            if enpjd_counts is not None:
+                row_mode_round_trips += self._row_mode_round_trips(glpost, enpjd_counts)
+
+            try:
+                if enebas_by_iddoc is not None:
+                    eneba_records_list = enebas_by_iddoc.get(_join_key(glpost.jnldtlref))
+                else:
+                    eneba_records_list = self._fetch_enebas(db_alias, glpost)
+
+                # GL posts without an ENPJD detail are not expense transactions
+                if eneba_records_list is None:
                     continue
 
-        else:
-            for project in projects:
-                sql_server_db = DatabaseMapping.objects.get(project_name=project.project_name)
+                if loader is not None:
+                    loader.add(glpost, eneba_records_list)
+                    if len(loader) >= self.batch_size:
+                        self._flush_loader(loader)
+                else:
+                    self._load_supporting_document(project, glpost, eneba_records_list, dry_run)
+                    synced_count += 1
+
+            except Exception as e:
+                logger.error(
+                    f'Error syncing transaction {glpost.batchnbr}-{glpost.entrynbr}: {str(e)}')
+
+                continue
+
+        if loader is not None:
+            try:
+                self._flush_loader(loader)
+            except Exception as e:
+                logger.error(f'Error loading batch for project {project.project_name}: {str(e)}')
+            synced_count = loader.stats['documents']
+
+        logger.info(f'Processed {new_count} new records (after filtering existing)')
+        if enpjd_counts is not None:
+            self._record_round_trips(project, new_count, row_mode_round_trips)
+
+        return synced_count
+
+    def _flush_loader(self, loader):
+        """Flush a SupportingDocumentLoader and log its throughput"""
+        pending = len(loader)
+        stats = loader.flush()
+        self.load_stats[loader.project.project_name] = stats
+        if pending and not loader.dry_run:
+            logger.info(
+                f"Loaded {pending} transactions for {loader.project.project_name}: "
+                f"{stats['documents']} documents, {stats['files']} files, "
+                f"{stats['rows_per_second']:.0f} rows/sec"
+            )
+        return stats
 
-                # First, get existing records from supportingdocuments table for this project
-                existing_records_query = SupportingDocument.objects.filter(project=project)
+    def _load_supporting_document(self, project, glpost, eneba_records_list, dry_run=False):
+        """Create the SupportingDocument for a new GL post together with its ENEBA attachments"""
+        supporting_doc_data = {
+            'project': project,
+            'batchnbr': glpost.batchnbr,
+            'entrynbr': glpost.entrynbr,
+            'iddoc': glpost.jnldtlref,
+            'fiscal_year': glpost.fiscalyr,
+            'fiscal_period': glpost.fiscalperd,
+            'transaction_value': abs(glpost.transamt),
+            'support_count': 0,  # Initialize to 0, update later
+            'supported': False,
+        }
 
-                if fiscal_year:
-                    existing_records_query = existing_records_query.filter(fiscal_year=fiscal_year)
-                if fiscal_period:
-                    existing_records_query = existing_records_query.filter(fiscal_period=fiscal_period.zfill(2))
+        if dry_run:
+            logger.info(f'Would sync: {supporting_doc_data}')
+            return None
 
-                # Create a set of (batchnbr, entrynbr) tuples for quick lookup
-                existing_records = set(
-                    existing_records_query.values_list('batchnbr', 'entrynbr')
+        supporting_doc = SupportingDocument.objects.create(**supporting_doc_data)
+
+        # Sync attachments
+        self.sync_eneba_attachments(supporting_doc, eneba_records_list)
+
+        # Update support_count after syncing attachments
+        actual_support_count = supporting_doc.documents.count()  # adjust related_name if needed
+        supporting_doc.support_count = actual_support_count
+        supporting_doc.supported = actual_support_count > 0
+        supporting_doc.save()
+
+        return supporting_doc
+
+    def _load_or_refresh(self, project, glpost, eneba_records_list, existing_docs, dry_run=False):
+        """
+        Create the SupportingDocument of a GL post, or refresh the one its entry already has.
+
+        existing_docs maps (batchnbr, entrynbr, fiscal_year, fiscal_period) to the project's
+        documents and gains every document created here, so the other expense lines of a
+        multi-line entry refresh that document instead of colliding with its unique key.
+
+        Returns:
+            'created', 'refreshed', or None when the document was already up to date
+        """
+        key = (glpost.batchnbr, glpost.entrynbr, glpost.fiscalyr, glpost.fiscalperd)
+        if key not in existing_docs:
+            try:
+                with transaction.atomic():
+                    existing_docs[key] = self._load_supporting_document(project, glpost, eneba_records_list, dry_run)
+                return 'created'
+            except IntegrityError:
+                # Created since existing_docs was read, e.g. by a concurrent full sync of the project
+                existing_docs[key] = SupportingDocument.objects.get(
+                    project=project, batchnbr=glpost.batchnbr, entrynbr=glpost.entrynbr,
+                    fiscal_year=glpost.fiscalyr, fiscal_period=glpost.fiscalperd
                 )
 
-                logger.info(f'Found {len(existing_records)} existing records for project: {project.project_name}')
+        if not dry_run and self._refresh_supporting_document(existing_docs[key], eneba_records_list):
+            return 'refreshed'
+        return None
+
+    def _refresh_supporting_document(self, supporting_doc, eneba_records_list):
+        """Attach ENEBA documents added after the SupportingDocument was first synced"""
+        self.sync_eneba_attachments(supporting_doc, eneba_records_list)
+
+        actual_support_count = supporting_doc.documents.count()
+        if actual_support_count != supporting_doc.support_count:
+            supporting_doc.support_count = actual_support_count
+            supporting_doc.supported = actual_support_count > 0
+            supporting_doc.save()
+            return True
+        return False
 
-                # Build the glpost query
-                glpost_query = Glpost.objects.using(sql_server_db.sql_server_db).filter(
-                    transamt__gt=0,
-                    srceledger='EN',
-                    srcetype='EV'
+    def sync_incremental(self, project_name=None, dry_run=False):
+        """
+        Sync only the Sage rows changed since each project's committed watermarks.
+
+        Changed GLPOST rows are picked up directly; changed ENPJD and ENEBA rows
+        pull in the GL posts they belong to, so attachments added to an already
+        synced transaction are attached to its existing SupportingDocument.
+        """
+        db = [mapping.project_name for mapping in DatabaseMapping.objects.filter(is_active=True)]
+        projects = Project.objects.filter(project_name__in=db)
+
+        if project_name:
+            projects = [projects.get(project_name=project_name)]
+
+        synced_count = 0
+        for project in projects:
+            project_synced, touched_periods = self._sync_project_incremental(project, dry_run)
+            self.touched_periods[project.project_name] = touched_periods
+            synced_count += project_synced
+
+        return synced_count
+
+    def _sync_project_incremental(self, project, dry_run=False):
+        """
+        Incremental sync of one project.
+
+        The change window per table is (committed watermark, current high-water
+        mark], so rows written while the sync runs are left for the next run.
+        Watermarks only advance inside the same transaction as the load, and not
+        at all when any transaction in the window failed to load.
+
+        Returns:
+            Tuple of (number of SupportingDocuments created, set of touched (fiscal_year, fiscal_period))
+        """
+        db_alias = DatabaseMapping.objects.get(project_name=project.project_name).sql_server_db
+
+        committed = {
+            watermark.table_name: (watermark.audtdate, watermark.audttime)
+            for watermark in SyncWatermark.objects.filter(project=project)
+        }
+
+        windows = {}
+        high_water = {}
+        with sync_stage('extract'):
+            for table_name, model in self.WATERMARK_TABLES.items():
+                lower = committed.get(table_name, (0, 0))
+                upper = model.objects.using(db_alias).order_by(
+                    '-audtdate', '-audttime'
+                ).values_list('audtdate', 'audttime').first()
+                if upper and tuple(upper) > tuple(lower):
+                    windows[table_name] = _audit_window(lower, upper)
+                    high_water[table_name] = tuple(upper)
+
+        if not windows:
+            logger.info(f'No Sage changes since last sync for project: {project.project_name}')
+            self.changed_rows[project.project_name] = 0
+            return 0, set()
+
+        # GL posts affected by the change window, directly or through their ENPJD/ENEBA rows
+        affected_q = windows.get('glpost', Q(pk__in=[]))
+        enpjd_q = windows.get('ENPJD', Q(pk__in=[]))
+        if 'ENEBA' in windows:
+            enpjd_q |= Q(cntbtch__in=Eneba.objects.using(db_alias).filter(windows['ENEBA']).values('cntbtch'))
+        if 'ENPJD' in windows or 'ENEBA' in windows:
+            affected_q |= Q(jnldtlref__in=Enpjd.objects.using(db_alias).filter(enpjd_q).values('iddoc'))
+
+        glpost_query = self._build_glpost_query(db_alias).filter(affected_q)
+        # Change windows are small; keep the slim rows since they are walked more than once
+        affected_glposts = list(profile_rows('extract', stream_glposts(glpost_query, chunk_size=self.chunk_size)))
+        self.changed_rows[project.project_name] = len(affected_glposts)
+
+        # Unsupported totals cover every positive EN posting, not only EV ones with ENPJD detail
+        touched_periods = {(glpost.fiscalyr, glpost.fiscalperd) for glpost in affected_glposts}
+        with sync_stage('extract'):
+            if 'glpost' in windows:
+                touched_periods.update(
+                    Glpost.objects.using(db_alias).filter(
+                        windows['glpost'], transamt__gt=0, srceledger='EN'
+                    ).values_list('fiscalyr', 'fiscalperd').distinct()
+                )
+
+            enebas_by_iddoc, enpjd_counts = self._bulk_extract_enebas(db_alias, glpost_query)
+
+            existing_docs = {
+                (doc.batchnbr, doc.entrynbr, doc.fiscal_year, doc.fiscal_period): doc
+                for doc in SupportingDocument.objects.filter(
+                    project=project,
+                    batchnbr__in={glpost.batchnbr for glpost in affected_glposts}
                 )
+            }
+
+        logger.info(
+            f'Incremental sync for {project.project_name}: {len(affected_glposts)} affected GL posts '
+            f'in tables {sorted(windows)}'
+        )
+
+        synced_count = 0
+        refreshed_count = 0
+        failed_count = 0
+        with sync_stage('load'), transaction.atomic():
+            if self.load_mode == 'bulk':
+                loader = SupportingDocumentLoader(project, batch_size=self.batch_size, dry_run=dry_run)
+                for glpost in affected_glposts:
+                    eneba_records_list = enebas_by_iddoc.get(_join_key(glpost.jnldtlref))
+                    if eneba_records_list is not None:
+                        loader.add(glpost, eneba_records_list, existing_docs.get(
+                            (glpost.batchnbr, glpost.entrynbr, glpost.fiscalyr, glpost.fiscalperd)
+                        ))
+
+                pending = len(loader)
+                try:
+                    with transaction.atomic():
+                        stats = self._flush_loader(loader)
+                    synced_count = stats['documents']
+                    refreshed_count = stats['updated']
+                except Exception as e:
+                    failed_count += pending
+                    logger.error(f'Error loading batch for project {project.project_name}: {str(e)}')
+            else:
+                for glpost in affected_glposts:
+                    eneba_records_list = enebas_by_iddoc.get(_join_key(glpost.jnldtlref))
+                    if eneba_records_list is None:
+                        continue
 
-                if fiscal_year:
-                    glpost_query = glpost_query.filter(fiscalyr=fiscal_year)
-                if fiscal_period:
-                    glpost_query = glpost_query.filter(fiscalperd=fiscal_period.zfill(2))
-
-                # Get all glpost records first, then filter in Python
-                # This avoids complex SQL generation issues with ODBC driver
-                project_glposts = glpost_query.all()
-
-                # Filter out existing records in Python
-                if existing_records:
-                    filtered_glposts = []
-                    for glpost in project_glposts:
-                        if (glpost.batchnbr, glpost.entrynbr) not in existing_records:
-                            filtered_glposts.append(glpost)
-                    project_glposts = filtered_glposts
-
-                # Get GL posts for this project and filter out existing records
-                project_glposts = glpost_query.all()
-
-                # Filter out existing records in Python
-                if existing_records:
-                    filtered_glposts = []
-                    for glpost in project_glposts:
-                        if (glpost.batchnbr, glpost.entrynbr) not in existing_records:
-                            filtered_glposts.append(glpost)
-                    project_glposts = filtered_glposts
-
-                logger.info(f'Processing {len(project_glposts)} new records (after filtering existing)')
-
-                for glpost in project_glposts:
                     try:
-                        enpjd_records = Enpjd.objects.using(sql_server_db.sql_server_db).filter(iddoc=glpost.jnldtlref)
-                        if not enpjd_records.exists():
-                            continue
-
-                        # Deduplicate eneba records
-                        eneba_records_set = set()
-                        eneba_records_list = []
-
-                        for enpjd in enpjd_records:
-                            enebas = Eneba.objects.using(sql_server_db.sql_server_db).filter(
-                                cntbtch=enpjd.cntbtch,
-                                cntitem=enpjd.cntitem
+                        # Savepoint per transaction so one bad row does not abort the batch
+                        with transaction.atomic():
+                            outcome = self._load_or_refresh(
+                                project, glpost, eneba_records_list, existing_docs, dry_run
                             )
-                            for eneba in enebas:
-                                if eneba.id not in eneba_records_set:
-                                    eneba_records_set.add(eneba.id)
-                                    eneba_records_list.append(eneba)
-
-                        supporting_doc_data = {
-                            'project': project,
-                            'batchnbr': glpost.batchnbr,
-                            'entrynbr': glpost.entrynbr,
-                            'iddoc': glpost.jnldtlref,
-                            'fiscal_year': glpost.fiscalyr,
-                            'fiscal_period': glpost.fiscalperd,
-                            'transaction_value': abs(glpost.transamt),
-                            'support_count': 0,  # Initialize to 0, update later
-                            'supported': False,
-                        }
-
-                        if not dry_run:
-                            supporting_doc = SupportingDocument.objects.create(**supporting_doc_data)
-
-                            # Sync attachments
-                            self.sync_eneba_attachments(supporting_doc, eneba_records_list)
-
-                            # Update support_count after syncing attachments
-                            actual_support_count = supporting_doc.documents.count()  # adjust related_name if needed
-                            supporting_doc.support_count = actual_support_count
-                            supporting_doc.supported = actual_support_count > 0
-                            supporting_doc.save()
-
+                        if outcome == 'created':
                             synced_count += 1
-                        else:
-                            logger.info(f'Would sync: {supporting_doc_data}')
-                            synced_count += 1
-
+                        elif outcome == 'refreshed':
+                            refreshed_count += 1
                     except Exception as e:
+                        failed_count += 1
                         logger.error(
-                         f'Error syncing transaction {glpost.batchnbr}-{glpost.entrynbr}: {str(e)}')
+                            f'Error syncing transaction {glpost.batchnbr}-{glpost.entrynbr}: {str(e)}')
 
-                        continue
+            if dry_run:
+                pass
+            elif failed_count:
+                logger.warning(
+                    f'{failed_count} transactions failed for {project.project_name}; '
+                    f'watermarks not advanced so they are retried next run'
+                )
+            else:
+                for table_name, (audtdate, audttime) in high_water.items():
+                    SyncWatermark.objects.update_or_create(
+                        project=project,
+                        table_name=table_name,
+                        defaults={'audtdate': audtdate, 'audttime': audttime}
+                    )
 
-        return synced_count
+        add_rows('load', synced_count + refreshed_count)
+        logger.info(
+            f'Incremental sync for {project.project_name}: {synced_count} created, '
+            f'{refreshed_count} refreshed, {len(touched_periods)} periods touched'
+        )
+        return synced_count, touched_periods
+
+    @staticmethod
+    def _build_glpost_query(db_alias, fiscal_year=None, fiscal_period=None):
+        """Expense GL posts (EN/EV, positive amounts) for the requested period"""
+        glpost_query = Glpost.objects.using(db_alias).filter(
+            transamt__gt=0,
+            srceledger='EN',
+            srcetype='EV'
+        )
+
+        if fiscal_year:
+            glpost_query = glpost_query.filter(fiscalyr=fiscal_year)
+        if fiscal_period:
+            glpost_query = glpost_query.filter(fiscalperd=fiscal_period.zfill(2))
+
+        return glpost_query
+
+    @staticmethod
+    def _fetch_enebas(db_alias, glpost):
+        """
+        Row-by-row extraction of the ENEBA records behind a single GL post.
+        Returns None when the GL post has no ENPJD detail.
+        """
+        enpjd_records = Enpjd.objects.using(db_alias).filter(iddoc=glpost.jnldtlref)
+        if not enpjd_records.exists():
+            return None
+
+        # Deduplicate eneba records
+        eneba_records_set = set()
+        eneba_records_list = []
+
+        for enpjd in project_list(enpjd_records, 'sync'):
+            enebas = Eneba.objects.using(db_alias).filter(
+                cntbtch=enpjd.cntbtch,
+                cntitem=enpjd.cntitem
+            )
+            for eneba in project_list(enebas, 'sync'):
+                eneba_key = (eneba.cntbtch, eneba.cntitem, eneba.docline)
+                if eneba_key not in eneba_records_set:
+                    eneba_records_set.add(eneba_key)
+                    eneba_records_list.append(eneba)
+
+        return eneba_records_list
+
+    @staticmethod
+    def _bulk_extract_enebas(db_alias, glpost_query):
+        """
+        Set-based extraction of the ENEBA records behind every GL post in glpost_query.
+
+        ENPJD and ENEBA are each loaded in a single query, restricted to the
+        period through subqueries on the same database, and joined in memory on
+        JNLDTLREF -> IDDOC and (CNTBTCH, CNTITEM).
+
+        Returns:
+            Tuple of ({iddoc key: [EnebaRecord, ...]}, {iddoc key: ENPJD row count}).
+            A GL post whose reference is missing from the first dict has no ENPJD detail.
+        """
+        enpjd_query = Enpjd.objects.using(db_alias).filter(
+            iddoc__in=glpost_query.values('jnldtlref')
+        )
+        enpjd_rows = list(enpjd_query.values_list(*columns('enpjd', 'sync')))
+
+        eneba_query = Eneba.objects.using(db_alias).filter(
+            cntbtch__in=enpjd_query.values('cntbtch')
+        )
+
+        # ENEBA is filtered on CNTBTCH only, the CNTITEM half of the join happens here
+        enebas_by_item = {}
+        for eneba in project(eneba_query, 'sync'):
+            enebas_by_item.setdefault(_item_key(eneba.cntbtch, eneba.cntitem), []).append(eneba)
+
+        enebas_by_iddoc = {}
+        seen_by_iddoc = {}
+        enpjd_counts = {}
+        for iddoc, cntbtch, cntitem in enpjd_rows:
+            key = _join_key(iddoc)
+            enpjd_counts[key] = enpjd_counts.get(key, 0) + 1
+            eneba_records_list = enebas_by_iddoc.setdefault(key, [])
+            eneba_records_set = seen_by_iddoc.setdefault(key, set())
+
+            for eneba in enebas_by_item.get(_item_key(cntbtch, cntitem), []):
+                eneba_key = (eneba.cntbtch, eneba.cntitem, eneba.docline)
+                if eneba_key not in eneba_records_set:
+                    eneba_records_set.add(eneba_key)
+                    eneba_records_list.append(eneba)
+
+        return enebas_by_iddoc, enpjd_counts
 
     @staticmethod
+    def _row_mode_round_trips(glpost, enpjd_counts):
+        """
+        Sage round-trips row mode would spend on one new GL post.
+
+        Row mode issues one ENPJD existence check, then one ENPJD fetch and
+        one ENEBA query per ENPJD row when the check succeeds.
+        """
+        enpjd_count = enpjd_counts.get(_join_key(glpost.jnldtlref), 0)
+        if enpjd_count:
+            return 2 + enpjd_count
+        return 1
+
+    def _record_round_trips(self, project, glpost_rows, row_mode_round_trips):
+        """
+        Record how many Sage round-trips the bulk extraction saved for a project.
+
+        row_mode_round_trips includes the GLPOST scan both modes share.
+        """
+        bulk_round_trips = 3
+        stats = {
+            'glpost_rows': glpost_rows,
+            'round_trips': bulk_round_trips,
+            'row_mode_round_trips': row_mode_round_trips,
+            'round_trips_saved': max(row_mode_round_trips - bulk_round_trips, 0),
+        }
+        self.round_trip_stats[project.project_name] = stats
+
+        logger.info(
+            f"Bulk extraction for {project.project_name}: {stats['round_trips']} round-trips "
+            f"instead of {stats['row_mode_round_trips']} ({stats['round_trips_saved']} saved)"
+        )
+
     def sync_eneba_attachments(self, supporting_doc, eneba_records):
         """
         Sync attachment information from ENEBA records
@@ -268,3 +737,300 @@ class ProjectSyncService:
                         source='SQL Server Reference',
                         # document field will be empty since we don't have the actual file
                     )
+
+
+class CommentSyncService:
+    """
+    Set-based ingestion of ENEBA notes as Comments on their transactions.
+
+    Per project the GL posts, ENPJD rows and non-blank ENEBA notes are read in
+    three queries and joined in memory, the comments the system user already
+    posted are loaded once into a set of (batchnbr, entrynbr, text) keys, and the
+    new ones are written with bulk_create every batch_size comments.
+    """
+
+    SYSTEM_USERNAME = 'sysadmin'
+    SOURCE = 'SQL Server Reference'
+
+    def __init__(self, batch_size=1000, chunk_size=2000):
+        self.batch_size = batch_size
+        # Rows fetched per round-trip when streaming glpost scans
+        self.chunk_size = chunk_size
+        # Per-project and overall counters of the last sync() call
+        self.project_stats = {}
+        self.stats = {}
+
+    def sync(self, project_id=None, fiscal_year=None, fiscal_period=None, dry_run=False):
+        """
+        Create a Comment for every ENEBA note not yet posted on its transaction.
+
+        Returns:
+            Number of comments created (or that would be, with dry_run)
+        """
+        mappings = {mapping.project_name: mapping for mapping in DatabaseMapping.objects.filter(is_active=True)}
+        projects = Project.objects.filter(project_name__in=mappings)
+        if project_id:
+            projects = projects.filter(project_id=project_id)
+
+        # A dry run only counts, so it can go without the system user
+        system_user = CustomUser.objects.filter(username=self.SYSTEM_USERNAME).first()
+        if system_user is None and not dry_run:
+            raise CustomUser.DoesNotExist(f"System user '{self.SYSTEM_USERNAME}' not found")
+
+        started = time.perf_counter()
+        self.project_stats = {}
+        for project in projects:
+            try:
+                self.project_stats[project.project_name] = self.sync_project(
+                    project, mappings[project.project_name].sql_server_db, system_user,
+                    fiscal_year, fiscal_period, dry_run
+                )
+            except Exception as e:
+                logger.error(f'Error syncing comments for project {project.project_name}: {str(e)}')
+
+        elapsed = time.perf_counter() - started
+        self.stats = {
+            name: sum(stats[name] for stats in self.project_stats.values())
+            for name in ('glposts', 'notes', 'skipped', 'created')
+        }
+        self.stats['projects'] = len(self.project_stats)
+        self.stats['elapsed'] = elapsed
+        self.stats['rows_per_second'] = self.stats['glposts'] / elapsed if elapsed else 0.0
+        return self.stats['created']
+
+    def sync_project(self, project, db_alias, system_user, fiscal_year=None, fiscal_period=None, dry_run=False):
+        """Ingest the notes of one project and return its counters"""
+        started = time.perf_counter()
+
+        glpost_query = Glpost.objects.using(db_alias).filter(transamt__gt=0)
+        if fiscal_year:
+            glpost_query = glpost_query.filter(fiscalyr=fiscal_year)
+        if fiscal_period:
+            glpost_query = glpost_query.filter(fiscalperd=fiscal_period.zfill(2))
+
+        notes_by_iddoc = self._extract_notes(db_alias, glpost_query)
+
+        existing = Comments.objects.filter(project=project)
+        if system_user is not None:
+            existing = existing.filter(user=system_user)
+        posted = set(existing.values_list('batchnbr', 'entrynbr', 'text'))
+
+        stats = {'glposts': 0, 'notes': 0, 'skipped': 0, 'created': 0}
+        pending = []
+        for glpost in stream_glposts(glpost_query, ('batchnbr', 'entrynbr', 'jnldtlref'), self.chunk_size):
+            stats['glposts'] += 1
+            for text in notes_by_iddoc.get(_join_key(glpost.jnldtlref), ()):
+                stats['notes'] += 1
+                key = (glpost.batchnbr, glpost.entrynbr, text)
+                if key in posted:
+                    stats['skipped'] += 1
+                    continue
+                posted.add(key)
+                stats['created'] += 1
+                if dry_run:
+                    continue
+
+                pending.append(Comments(
+                    project=project,
+                    batchnbr=glpost.batchnbr,
+                    entrynbr=glpost.entrynbr,
+                    text=text,
+                    user=system_user,
+                    source=self.SOURCE,
+                ))
+                if len(pending) >= self.batch_size:
+                    Comments.objects.bulk_create(pending, batch_size=self.batch_size)
+                    pending = []
+
+        if pending:
+            Comments.objects.bulk_create(pending, batch_size=self.batch_size)
+
+        elapsed = time.perf_counter() - started
+        stats['elapsed'] = elapsed
+        stats['rows_per_second'] = stats['glposts'] / elapsed if elapsed else 0.0
+        logger.info(
+            f"Comments for {project.project_name}: {stats['glposts']} GL posts, {stats['notes']} notes, "
+            f"{stats['created']} new in {elapsed:.2f}s ({stats['rows_per_second']:.0f} rows/sec)"
+        )
+        return stats
+
+    @staticmethod
+    def _extract_notes(db_alias, glpost_query):
+        """
+        Non-blank ENEBA notes behind every GL post in glpost_query, keyed by _join_key(iddoc).
+
+        Blank notes are dropped in SQL; the strip() check only catches tabs and
+        line breaks, which TRIM leaves in place.
+        """
+        enpjd_query = Enpjd.objects.using(db_alias).filter(iddoc__in=glpost_query.values('jnldtlref'))
+        eneba_rows = Eneba.objects.using(db_alias).filter(
+            cntbtch__in=enpjd_query.values('cntbtch')
+        ).annotate(trimmed_notes=Trim('notes')).exclude(trimmed_notes='').values_list('cntbtch', 'cntitem', 'notes')
+
+        notes_by_item = {}
+        for cntbtch, cntitem, notes in eneba_rows:
+            if notes.strip():
+                notes_by_item.setdefault(_item_key(cntbtch, cntitem), []).append(notes)
+
+        notes_by_iddoc = {}
+        for iddoc, cntbtch, cntitem in enpjd_query.values_list('iddoc', 'cntbtch', 'cntitem'):
+            notes = notes_by_item.get(_item_key(cntbtch, cntitem))
+            if notes:
+                notes_by_iddoc.setdefault(_join_key(iddoc), []).extend(notes)
+        return notes_by_iddoc
+
+
+def glpost_queryset(db_alias, use_replica=None):
+    """
+    glpost rows of one Sage database, read from the local GlpostReplica when enabled.
+
+    GlpostReplica only holds the EN ledger and the columns the app reads (see
+    GlpostReplica), so callers must stay within those. use_replica defaults to
+    SYNC_CONFIG['READ_FROM_REPLICA'].
+    """
+    if use_replica is None:
+        use_replica = SYNC_CONFIG.get('READ_FROM_REPLICA', False)
+    if use_replica:
+        return GlpostReplica.objects.filter(source_db=db_alias)
+    return Glpost.objects.using(db_alias)
+
+
+class GlpostReplicaService:
+    """
+    Keeps GlpostReplica in step with the glpost table of each project's Sage database.
+
+    Each refresh pulls the EN-ledger rows stamped in (watermark, current high-water
+    mark] and upserts them, so a steady-state refresh is one windowed glpost query.
+    The 'glpost_replica' SyncWatermark advances in the same transaction as the upsert.
+
+    Rows deleted from Sage leave no stamp behind, so each refresh also counts the
+    rows of every fiscal period on both sides and deletes the replica rows of the
+    periods where the replica has more (see _prune_deleted).
+    """
+    COLUMNS = (
+        'acctid', 'fiscalyr', 'fiscalperd', 'srcecurn', 'srceledger', 'srcetype', 'postingseq', 'cntdetail',
+        'audtdate', 'audttime', 'jrnldate', 'batchnbr', 'entrynbr', 'companyid', 'jnldtldesc', 'jnldtlref',
+        'transamt', 'drilapp',
+    )
+    KEY_COLUMNS = (
+        'source_db', 'acctid', 'fiscalyr', 'fiscalperd', 'srcecurn', 'srceledger', 'srcetype', 'postingseq',
+        'cntdetail',
+    )
+    WATERMARK_TABLE = 'glpost_replica'
+
+    def __init__(self, batch_size=1000):
+        self.batch_size = batch_size
+        self.deleted_rows = {}  # project_name -> replica rows deleted by the last refresh
+
+    def refresh(self, project_name, full=False):
+        """
+        Bring the replica slice of a project's Sage database up to date.
+
+        With full=True the slice is dropped and reloaded from scratch. Replica
+        rows whose glpost row was deleted are removed either way; their number
+        is kept in deleted_rows[project_name].
+
+        Returns:
+            Number of glpost rows upserted
+        """
+        project = Project.objects.get(project_name=project_name)
+        db_alias = DatabaseMapping.objects.get(project_name=project_name, is_active=True).sql_server_db
+
+        watermark = SyncWatermark.objects.filter(project=project, table_name=self.WATERMARK_TABLE).first()
+        lower = (0, 0) if full or watermark is None else (watermark.audtdate, watermark.audttime)
+
+        source = Glpost.objects.using(db_alias).filter(srceledger='EN')
+        upper = source.order_by('-audtdate', '-audttime').values_list('audtdate', 'audttime').first()
+        if not upper or (not full and tuple(upper) <= tuple(lower)):
+            with transaction.atomic():
+                self.deleted_rows[project_name] = self._prune_deleted(db_alias, source)
+            logger.info(f'glpost replica for {project_name} is up to date, '
+                        f'{self.deleted_rows[project_name]} deleted rows removed')
+            return 0
+
+        started = time.perf_counter()
+        rows = source.filter(_audit_window(lower, upper)).values_list(*self.COLUMNS).iterator(
+            chunk_size=self.batch_size
+        )
+
+        refreshed_count = 0
+        with transaction.atomic():
+            if full:
+                GlpostReplica.objects.filter(source_db=db_alias).delete()
+
+            batch = []
+            for row in rows:
+                batch.append(GlpostReplica(source_db=db_alias, **dict(zip(self.COLUMNS, row))))
+                if len(batch) >= self.batch_size:
+                    refreshed_count += self._upsert(batch)
+                    batch = []
+            if batch:
+                refreshed_count += self._upsert(batch)
+
+            # Rows stamped after upper are not in the replica yet and must not be counted
+            self.deleted_rows[project_name] = 0 if full else self._prune_deleted(
+                db_alias, source.filter(_audit_window((0, 0), upper))
+            )
+
+            SyncWatermark.objects.update_or_create(
+                project=project,
+                table_name=self.WATERMARK_TABLE,
+                defaults={'audtdate': upper[0], 'audttime': upper[1]}
+            )
+
+        logger.info(
+            f'glpost replica for {project_name}: {refreshed_count} rows upserted and '
+            f'{self.deleted_rows[project_name]} deleted from {db_alias} in {time.perf_counter() - started:.2f}s'
+        )
+        return refreshed_count
+
+    def _prune_deleted(self, db_alias, source):
+        """
+        Delete the replica rows of db_alias whose glpost row is no longer in source.
+
+        Every source row is in the replica once it has been refreshed up to the
+        source's high-water mark, so a fiscal period holding more replica rows
+        than source rows lost some in Sage. Only the keys of those periods are
+        read and compared; the others cost one grouped count on each side.
+
+        Returns:
+            Number of replica rows deleted
+        """
+        replica = GlpostReplica.objects.filter(source_db=db_alias)
+        source_counts = {
+            (fiscalyr, fiscalperd): rows
+            for fiscalyr, fiscalperd, rows in source.values_list('fiscalyr', 'fiscalperd').annotate(
+                rows=Count('*')
+            ).order_by()
+        }
+        replica_counts = replica.values_list('fiscalyr', 'fiscalperd').annotate(rows=Count('*')).order_by()
+
+        key_columns = self.KEY_COLUMNS[1:]
+        deleted = 0
+        for fiscalyr, fiscalperd, rows in replica_counts:
+            if rows <= source_counts.get((fiscalyr, fiscalperd), 0):
+                continue
+            period = {'fiscalyr': fiscalyr, 'fiscalperd': fiscalperd}
+            source_keys = set(source.filter(**period).values_list(*key_columns))
+            gone = [
+                pk for pk, *key in replica.filter(**period).values_list('pk', *key_columns)
+                if tuple(key) not in source_keys
+            ]
+            for start in range(0, len(gone), self.batch_size):
+                deleted += replica.filter(pk__in=gone[start:start + self.batch_size]).delete()[0]
+        return deleted
+
+    def _upsert(self, replica_rows):
+        """Insert new replica rows and overwrite the ones already present"""
+        # MySQL upserts on any unique key and rejects an explicit conflict target
+        unique_fields = None
+        if connections['default'].features.supports_update_conflicts_with_target:
+            unique_fields = list(self.KEY_COLUMNS)
+
+        GlpostReplica.objects.bulk_create(
+            replica_rows,
+            update_conflicts=True,
+            unique_fields=unique_fields,
+            update_fields=[column for column in self.COLUMNS if column not in self.KEY_COLUMNS]
+        )
+        return len(replica_rows)
@@ -1,3 +1,436 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connections
+from django.db.models.sql import compiler
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from main_app.models import CustomUser, Project, SyncWatermark
+from main_app.sync_tasks import sync_eneba_documents
+from main_app.sage_dataset import SageDatasetGenerator
+from transactions.models import (
+    Comments, Eneba, Enpjd, Glpost, GlpostReplica, SupportingDocument, SupportingDocumentFile
+)
+from transactions.pipeline import EnebaPipeline, run_eneba_pipeline
+from transactions.projections import columns, first, project, project_list, record_type
+from transactions.reconciliation import ReconciliationEngine
+from transactions.services import (
+    GLPOST_SYNC_COLUMNS, CommentSyncService, GlpostReplicaService, GlpostRow, ProjectSyncService, stream_glposts
+)
+
+# The generated Sage companies are SQLite files, whatever the default database is
+SQLITE_SAGE_DATABASE = {'ENGINE': 'django.db.backends.sqlite3', 'HOST': '', 'PORT': '', 'OPTIONS': {'timeout': 30}}
+
+
+@override_settings(SAGE_DATABASE_DEFAULTS=SQLITE_SAGE_DATABASE)
+class SageCompanyTestCase(TransactionTestCase):
+    """
+    Runs against one small generated Sage company (main_app/sage_dataset.py).
+
+    The company is regenerated for every test, since each test flushes the
+    project and mapping rows. Its alias only exists once the mapping does, so
+    setUpClass generates it once and then allows it alongside the default.
+    """
+
+    rows = 600
+    alias = SageDatasetGenerator.company_alias(1)
+
+    @classmethod
+    def setUpClass(cls):
+        cls.data_dir = tempfile.TemporaryDirectory()
+        with override_settings(SAGE_DATABASE_DEFAULTS=SQLITE_SAGE_DATABASE):
+            cls.generate()
+        cls.databases = {'default', cls.alias}
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        settings.DATABASES.evict(cls.alias)
+        cls.data_dir.cleanup()
+
+    @classmethod
+    def generate(cls):
+        manifest = SageDatasetGenerator(cls.data_dir.name, rows=cls.rows, companies=1, seed=7).generate()
+        return manifest['company_counts'][0]
+
+    def setUp(self):
+        self.company = self.generate()
+        self.project = Project.objects.get(project_name=self.company['project'])
+
+
+class IncrementalSyncTests(SageCompanyTestCase):
+    def test_row_load_advances_watermarks_and_second_run_pulls_nothing(self):
+        service = ProjectSyncService(load_mode='row')
+
+        created = service.sync_incremental(self.project.project_name)
+
+        # Multi-line entries share a SupportingDocument; their other lines must not count as failures
+        self.assertEqual(created, SupportingDocument.objects.filter(project=self.project).count())
+        # One document per expense entry with ENPJD detail
+        self.assertEqual(created, Enpjd.objects.using(self.alias).values('iddoc').distinct().count())
+        self.assertEqual(
+            set(SyncWatermark.objects.filter(project=self.project).values_list('table_name', flat=True)),
+            set(ProjectSyncService.WATERMARK_TABLES)
+        )
+
+        self.assertEqual(service.sync_incremental(self.project.project_name), 0)
+        self.assertEqual(service.changed_rows[self.project.project_name], 0)
+        self.assertEqual(service.touched_periods[self.project.project_name], set())
+
+    def test_row_and_bulk_load_create_the_same_documents(self):
+        ProjectSyncService(load_mode='row').sync_incremental(self.project.project_name)
+        row_documents = sorted(SupportingDocument.objects.filter(project=self.project).values_list(
+            'batchnbr', 'entrynbr', 'fiscal_year', 'fiscal_period', 'support_count'
+        ))
+
+        SupportingDocument.objects.filter(project=self.project).delete()
+        SyncWatermark.objects.filter(project=self.project).delete()
+        ProjectSyncService(load_mode='bulk').sync_incremental(self.project.project_name)
+        bulk_documents = sorted(SupportingDocument.objects.filter(project=self.project).values_list(
+            'batchnbr', 'entrynbr', 'fiscal_year', 'fiscal_period', 'support_count'
+        ))
+
+        self.assertEqual(row_documents, bulk_documents)
+
+
+
+class ExtractionModeTests(SageCompanyTestCase):
+    def synced_documents(self):
+        return sorted(
+            (doc.batchnbr, doc.entrynbr, doc.fiscal_year, doc.fiscal_period, doc.transaction_value,
+             doc.support_count, doc.supported, tuple(sorted(doc.documents.values_list('document_name', flat=True))))
+            for doc in SupportingDocument.objects.filter(project=self.project).prefetch_related('documents')
+        )
+
+    def test_bulk_extraction_matches_row_extraction_in_three_sage_queries(self):
+        with CaptureQueriesContext(connections[self.alias]) as row_queries:
+            ProjectSyncService(extraction_mode='row', load_mode='bulk').sync_transactions(self.project.project_name)
+        row_documents = self.synced_documents()
+
+        SupportingDocument.objects.filter(project=self.project).delete()
+        service = ProjectSyncService(extraction_mode='bulk', load_mode='bulk')
+        with CaptureQueriesContext(connections[self.alias]) as bulk_queries:
+            service.sync_transactions(self.project.project_name)
+
+        self.assertEqual(self.synced_documents(), row_documents)
+        self.assertTrue(any(files for *_, files in row_documents))
+
+        stats = service.round_trip_stats[self.project.project_name]
+        self.assertEqual(len(bulk_queries), stats['round_trips'])
+        self.assertEqual(len(row_queries), stats['row_mode_round_trips'])
+        self.assertEqual(stats['round_trips_saved'], len(row_queries) - len(bulk_queries))
+
+    def test_unknown_extraction_mode_is_rejected(self):
+        with self.assertRaises(ValueError):
+            ProjectSyncService(extraction_mode='batch')
+        with self.assertRaises(ValueError):
+            ProjectSyncService().sync_transactions(self.project.project_name, extraction_mode='batch')
+
+
+
+class GlpostStreamTests(SageCompanyTestCase):
+    def test_scan_is_projected_and_fetched_in_chunks(self):
+        glpost_query = Glpost.objects.using(self.alias).filter(transamt__gt=0)
+
+        with CaptureQueriesContext(connections[self.alias]) as queries, \
+                mock.patch.object(compiler, 'cursor_iter', wraps=compiler.cursor_iter) as cursor_iter:
+            rows = list(stream_glposts(glpost_query, chunk_size=50))
+
+        self.assertEqual(len(rows), glpost_query.count())
+        self.assertGreater(len(rows), 50)
+        self.assertIs(type(rows[0]), GlpostRow)
+        self.assertEqual(rows[0]._fields, GLPOST_SYNC_COLUMNS)
+        # One statement, read 50 rows at a time, selecting only the sync columns
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(cursor_iter.call_args.args[-1], 50)
+        self.assertNotIn('JNLDTLDESC', queries[0]['sql'])
+        self.assertIsNone(glpost_query._result_cache)
+
+    def test_chunk_size_does_not_change_the_sync(self):
+        out = StringIO()
+        call_command('sync_expense_transactions', project_id=self.project.project_id, extraction_mode='bulk',
+                     load_mode='bulk', chunk_size=7, stdout=out)
+        small_chunks = sorted(SupportingDocument.objects.filter(project=self.project).values_list(
+            'batchnbr', 'entrynbr', 'fiscal_year', 'fiscal_period', 'support_count'
+        ))
+
+        SupportingDocument.objects.filter(project=self.project).delete()
+        call_command('sync_expense_transactions', project_id=self.project.project_id, extraction_mode='bulk',
+                     load_mode='bulk', stdout=StringIO())
+
+        self.assertIn(f'Successfully synced {len(small_chunks)} transactions', out.getvalue())
+        self.assertEqual(small_chunks, sorted(SupportingDocument.objects.filter(project=self.project).values_list(
+            'batchnbr', 'entrynbr', 'fiscal_year', 'fiscal_period', 'support_count'
+        )))
+
+
+class SupportingDocumentLoaderTests(SageCompanyTestCase):
+    def test_bulk_load_counts_the_documents_inserted(self):
+        service = ProjectSyncService(extraction_mode='bulk', load_mode='bulk')
+
+        synced = service.sync_transactions(self.project.project_name)
+
+        # Every expense line of an entry is queued; the entry gets one document
+        self.assertEqual(synced, SupportingDocument.objects.filter(project=self.project).count())
+        self.assertEqual(service.load_stats[self.project.project_name]['documents'], synced)
+        self.assertEqual(service.sync_transactions(self.project.project_name), 0)
+
+
+class ReconciliationTests(SageCompanyTestCase):
+    def setUp(self):
+        super().setUp()
+        ProjectSyncService(extraction_mode='bulk', load_mode='bulk').sync_transactions(self.project.project_name)
+        self.documents = SupportingDocument.objects.filter(project=self.project)
+
+    def snapshot(self):
+        return {
+            (doc.fiscal_year, doc.fiscal_period, doc.batchnbr, doc.entrynbr): (doc.pk, doc.updated_at)
+            for doc in self.documents.all()
+        }
+
+    def test_in_sync_project_is_left_alone(self):
+        before = self.snapshot()
+
+        summary = ReconciliationEngine(delete_orphans=True).reconcile(self.project.project_name)
+
+        self.assertTrue(summary['in_sync'])
+        self.assertEqual(summary['mismatched_buckets'], [])
+        self.assertEqual(self.snapshot(), before)
+
+    def test_command_restores_missing_and_deletes_orphaned_documents(self):
+        missing = self.documents.order_by('pk').first()
+        missing_key = (missing.fiscal_year, missing.fiscal_period, missing.batchnbr, missing.entrynbr)
+        missing.delete()
+        # A document whose GL post no longer exists in Sage
+        orphan = SupportingDocument.objects.create(
+            project=self.project, fiscal_year=missing.fiscal_year, fiscal_period=missing.fiscal_period,
+            batchnbr=missing.batchnbr, entrynbr='99999'
+        )
+        untouched = {key: value for key, value in self.snapshot().items() if value[0] != orphan.pk}
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            output = os.path.join(output_dir, 'summary.json')
+            call_command('reconcile_supporting_documents', project=[self.project.project_name],
+                         delete_orphans=True, output=output, stderr=open(os.devnull, 'w'))
+            with open(output) as summary_file:
+                summary = json.load(summary_file)
+
+        totals = summary['totals']
+        self.assertEqual((totals['missing'], totals['created']), (1, 1))
+        self.assertEqual((totals['orphaned'], totals['deleted']), (1, 1))
+        self.assertEqual(summary['projects'][0]['touched_periods'], [[missing.fiscal_year, missing.fiscal_period]])
+
+        after = self.snapshot()
+        self.assertIn(missing_key, after)
+        self.assertFalse(SupportingDocument.objects.filter(pk=orphan.pk).exists())
+        # Only the mismatched batch was read; every other document keeps its row
+        self.assertEqual({key: after[key] for key in untouched}, untouched)
+        self.assertTrue(ReconciliationEngine().reconcile(self.project.project_name)['in_sync'])
+
+    def test_dry_run_reports_without_repairing(self):
+        self.documents.order_by('pk').first().delete()
+        count = self.documents.count()
+
+        summary = ReconciliationEngine(repair=False).reconcile(self.project.project_name)
+
+        self.assertEqual((summary['missing'], summary['created']), (1, 0))
+        self.assertEqual(len(summary['missing_keys']), 1)
+        self.assertEqual(self.documents.count(), count)
+
+
+class EnebaPipelineTests(SageCompanyTestCase):
+    def written(self):
+        return (
+            SupportingDocument.objects.filter(project=self.project).count(),
+            SupportingDocumentFile.objects.filter(batch_support__project=self.project).count(),
+            Comments.objects.filter(project=self.project).count(),
+        )
+
+    def test_one_pass_creates_the_documents_files_and_comments(self):
+        results = run_eneba_pipeline(project_names=[self.project.project_name])
+
+        self.assertEqual([result['success'] for result in results], [True])
+        stats = results[0]['stats']
+        self.assertEqual(stats['glposts'], self.company['glpost'] - self.company['entries'])
+        self.assertEqual(stats['enpjd_rows'], self.company['enpjd'])
+        self.assertEqual(stats['eneba_rows'], self.company['eneba'])
+        self.assertEqual((stats['documents'], stats['files'], stats['comments']), self.written())
+        self.assertGreater(stats['files'], 0)
+        self.assertGreater(stats['comments'], 0)
+        self.assertEqual(
+            set(stats['stages']), {'extract', 'join', 'attachments', 'comments'}
+        )
+        self.assertEqual(stats['stages']['join']['rows'], stats['stages']['attachments']['rows'])
+
+        # The same documents the table-by-table sync creates
+        pipeline_documents = sorted(SupportingDocument.objects.filter(project=self.project).values_list(
+            'batchnbr', 'entrynbr', 'fiscal_year', 'fiscal_period', 'support_count'
+        ))
+        SupportingDocument.objects.filter(project=self.project).delete()
+        ProjectSyncService(extraction_mode='bulk', load_mode='bulk').sync_transactions(self.project.project_name)
+        self.assertEqual(pipeline_documents, sorted(SupportingDocument.objects.filter(
+            project=self.project
+        ).values_list('batchnbr', 'entrynbr', 'fiscal_year', 'fiscal_period', 'support_count')))
+
+    def test_second_scheduled_run_writes_nothing(self):
+        first = sync_eneba_documents()
+        written = self.written()
+
+        second = sync_eneba_documents()
+
+        self.assertEqual((first['status'], first['successful'], first['failed']), ('completed', 1, 0))
+        self.assertEqual((second['status'], second['successful'], second['failed']), ('completed', 1, 0))
+        stats = second['results'][0]['stats']
+        self.assertEqual((stats['documents'], stats['files'], stats.get('comments', 0)), (0, 0, 0))
+        self.assertEqual(self.written(), written)
+
+    def test_dry_run_counts_without_writing(self):
+        stats = EnebaPipeline().run(self.project, self.alias, dry_run=True)
+
+        self.assertGreater(stats['documents'], 0)
+        self.assertGreater(stats['comments'], 0)
+        self.assertEqual(self.written(), (0, 0, 0))
+
+
+class GlpostReplicaTests(SageCompanyTestCase):
+    def setUp(self):
+        super().setUp()
+        self.service = GlpostReplicaService(batch_size=100)
+        self.service.refresh(self.project.project_name)
+        self.replica = GlpostReplica.objects.filter(source_db=self.alias)
+
+    def keys(self, queryset):
+        return set(queryset.values_list(*GlpostReplicaService.KEY_COLUMNS[1:]))
+
+    def delete_entry(self, glpost):
+        """Delete a whole entry from Sage; glpost's model key is not unique, so not through the ORM"""
+        with connections[self.alias].cursor() as cursor:
+            cursor.execute(
+                'DELETE FROM glpost WHERE FISCALYR = %s AND FISCALPERD = %s AND BATCHNBR = %s AND ENTRYNBR = %s',
+                [glpost.fiscalyr, glpost.fiscalperd, glpost.batchnbr, glpost.entrynbr]
+            )
+            return cursor.rowcount
+
+    def test_refresh_removes_rows_deleted_from_sage(self):
+        source = Glpost.objects.using(self.alias).filter(srceledger='EN')
+        self.assertEqual(self.keys(self.replica), self.keys(source))
+        deleted = self.delete_entry(source.order_by('audtdate', 'audttime').first())
+
+        # No row was written since the last refresh: the audit window alone would see nothing
+        self.assertEqual(self.service.refresh(self.project.project_name), 0)
+
+        self.assertGreater(deleted, 0)
+        self.assertEqual(self.service.deleted_rows[self.project.project_name], deleted)
+        self.assertEqual(self.keys(self.replica), self.keys(source))
+
+    def test_refresh_upserts_and_prunes_in_one_pass(self):
+        source = Glpost.objects.using(self.alias).filter(srceledger='EN')
+        deleted = self.delete_entry(source.order_by('audtdate', 'audttime').first())
+        edited = source.order_by('-audtdate', '-audttime').first()
+        source.filter(batchnbr=edited.batchnbr, entrynbr=edited.entrynbr, fiscalyr=edited.fiscalyr).update(
+            audttime=edited.audttime + 1, jnldtldesc='Edited'
+        )
+
+        upserted = self.service.refresh(self.project.project_name)
+
+        self.assertGreater(upserted, 0)
+        self.assertEqual(self.service.deleted_rows[self.project.project_name], deleted)
+        self.assertEqual(self.keys(self.replica), self.keys(source))
+        self.assertEqual(set(self.replica.filter(batchnbr=edited.batchnbr, entrynbr=edited.entrynbr,
+                                                 fiscalyr=edited.fiscalyr).values_list('jnldtldesc', flat=True)),
+                         {'Edited'})
+        self.assertEqual(self.service.refresh(self.project.project_name), 0)
+        self.assertEqual(self.service.deleted_rows[self.project.project_name], 0)
+
+
+
+class CommentSyncTests(SageCompanyTestCase):
+    def expected_comments(self):
+        """The comments the old command posted, walking GL post -> ENPJD -> ENEBA one row at a time"""
+        expected = set()
+        for glpost in Glpost.objects.using(self.alias).filter(transamt__gt=0):
+            for enpjd in Enpjd.objects.using(self.alias).filter(iddoc=glpost.jnldtlref.strip()):
+                for eneba in Eneba.objects.using(self.alias).filter(cntbtch=enpjd.cntbtch, cntitem=enpjd.cntitem):
+                    if eneba.notes and eneba.notes.strip():
+                        expected.add((glpost.batchnbr, glpost.entrynbr, eneba.notes))
+        return expected
+
+    def posted(self):
+        return set(Comments.objects.filter(project=self.project).values_list('batchnbr', 'entrynbr', 'text'))
+
+    def test_command_posts_every_note_once(self):
+        # Whitespace-only notes are not comments
+        with connections[self.alias].cursor() as cursor:
+            cursor.execute(
+                "UPDATE ENEBA SET NOTES = ' \t ' WHERE rowid = (SELECT MIN(rowid) FROM ENEBA WHERE NOTES <> '')"
+            )
+        expected = self.expected_comments()
+        out = StringIO()
+
+        call_command('sync_comments', project_id=self.project.project_id, batch_size=5, stdout=out)
+
+        self.assertGreater(len(expected), 5)
+        self.assertEqual(self.posted(), expected)
+        self.assertEqual(Comments.objects.filter(project=self.project).count(), len(expected))
+        self.assertEqual(
+            set(Comments.objects.filter(project=self.project).values_list('user__username', 'source')),
+            {(CommentSyncService.SYSTEM_USERNAME, CommentSyncService.SOURCE)}
+        )
+        self.assertIn(f'Successfully synced {len(expected)} comments', out.getvalue())
+        self.assertIn('rows/sec', out.getvalue())
+
+        service = CommentSyncService()
+        self.assertEqual(service.sync(project_id=self.project.project_id), 0)
+        self.assertEqual(service.stats['skipped'], service.stats['notes'])
+        self.assertEqual(self.posted(), expected)
+
+    def test_dry_run_needs_no_system_user(self):
+        CustomUser.objects.filter(username=CommentSyncService.SYSTEM_USERNAME).delete()
+
+        self.assertEqual(CommentSyncService().sync(dry_run=True), len(self.expected_comments()))
+        self.assertEqual(self.posted(), set())
+        with self.assertRaises(CustomUser.DoesNotExist):
+            CommentSyncService().sync()
+
+
+
+class ProjectionTests(SageCompanyTestCase):
+    def test_records_carry_the_profile_columns_of_the_model_rows(self):
+        glposts = Glpost.objects.using(self.alias).filter(transamt__gt=0).order_by('batchnbr', 'entrynbr', 'cntdetail')
+        fields = columns('glpost', 'listing')
+
+        with CaptureQueriesContext(connections[self.alias]) as queries:
+            records = project_list(glposts[:8], 'listing')
+
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('SRCELEDGER', queries[0]['sql'].upper())
+        self.assertEqual(len(records), 8)
+        for record, glpost in zip(records, glposts[:8]):
+            self.assertEqual(record, tuple(getattr(glpost, field) for field in fields))
+            self.assertFalse(hasattr(record, '__dict__'))
+        self.assertEqual(first(glposts, 'listing'), records[0])
+        self.assertIsNone(first(glposts.filter(batchnbr='999999'), 'listing'))
+
+    def test_explicit_columns_and_profiles_share_record_types(self):
+        enebas = Eneba.objects.using(self.alias).order_by('cntbtch', 'cntitem', 'docline')
+
+        records = list(project(enebas, 'sync', chunk_size=10))
+        explicit = list(project(enebas, columns('eneba', 'sync')))
+
+        self.assertEqual(records, explicit)
+        self.assertIs(type(records[0]), record_type('eneba', columns('eneba', 'sync')))
+        self.assertEqual(type(records[0]).__name__, 'EnebaRecord')
+        self.assertEqual(len(records), enebas.count())
+
+    def test_unknown_profile_is_rejected(self):
+        with self.assertRaises(ValueError):
+            columns('glpost', 'everything')
+        with self.assertRaises(ValueError):
+            project_list(Glpost.objects.using(self.alias).all(), 'everything')
@@ -14,7 +14,8 @@ from django.db.models import Q
 from datetime import datetime
 from collections import defaultdict
 
-from transactions.services import ProjectSyncService
+from transactions.projections import first, project_list
+from transactions.services import ProjectSyncService, glpost_queryset
 
 
 # Updated view function with multi-filter support
@@ -33,7 +34,7 @@ def admin_home_api(request, project_name):
     # Start with base queryset
 
     db = DatabaseMapping.objects.get(project_name=project_name)
-    gl_transactions_list = Glpost.objects.using(f'{db.sql_server_db}').filter(fiscalyr=year, srceledger='EN').order_by(
+    gl_transactions_list = glpost_queryset(db.sql_server_db).filter(fiscalyr=year, srceledger='EN').order_by(
         '-jrnldate', 'batchnbr')
 
     comments = Comments.objects.all()
@@ -191,6 +192,8 @@ def admin_home_api(request, project_name):
         gl_transactions = paginator.page(1)
     except EmptyPage:
         gl_transactions = paginator.page(paginator.num_pages)
+    # Only the columns the table shows, as slim records instead of 45-column model instances
+    gl_transactions.object_list = project_list(gl_transactions.object_list, 'listing')
 
     # Calculate statistics
     total_transactions = gl_transactions_list.count()
@@ -561,13 +564,13 @@ def upload_file(request, batchnbr, entrynbr, project_name):
     if not reference:
         return JsonResponse({"response": "error", "errors": "Reference is required"}, status=400)
 
-    # Find the first matching GL transaction (model instance)
-    gl_transaction_first = Glpost.objects.using(db.sql_server_db).filter(
+    # Find the first matching GL transaction
+    gl_transaction_first = first(Glpost.objects.using(db.sql_server_db).filter(
         batchnbr=batchnbr,
         entrynbr=entrynbr,
         jnldtlref=reference,
         transamt__gt=0
-    ).first()
+    ), 'sync')
 
     if not gl_transaction_first:
         # Strict: do not proceed if no GL transaction found